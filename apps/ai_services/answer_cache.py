@@ -0,0 +1,122 @@
+"""
+Semantic answer cache of the knowledge chatbot.
+
+Helpdesk questions repeat with small variations ("cara mengajukan cuti?",
+"bagaimana cara mengajukan cuti"). The cache keeps the normalized embedding
+of every answered question in one float32 matrix; a lookup is a single
+matrix-vector product and returns the closest entry of the same scope (the
+answer language) when its cosine similarity reaches the threshold.
+
+An entry records the documents the answer was generated from and their
+version (``updated_at``); the chatbot checks them with one query before
+serving it, so an edited, unpublished or deleted document makes the answers
+built on it miss. Entries expire after ``ttl`` seconds and the least
+recently used one makes room for a new question when the cache is full.
+
+The index lives in the process, next to the embedding model.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """Fixed-capacity vector index of answers with LRU and TTL eviction"""
+
+    def __init__(self, capacity: int = 1000, ttl: float = 3600, threshold: float = 0.92):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.vectors = None  # (capacity, dimension), allocated on the first store
+        self.scope_codes: Dict[str, int] = {}
+        self.scopes = np.full(capacity, -1, dtype=np.int32)
+        self.entries = [None] * capacity
+        self.expires = np.zeros(capacity)
+        self.last_used = np.zeros(capacity)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _live(self, now: float) -> np.ndarray:
+        return self.expires > now
+
+    def _best(self, vector: np.ndarray, scope: str, now: float) -> Tuple[int, float]:
+        """Slot and similarity of the closest live entry of ``scope``, (-1, 0) if none"""
+        if self.vectors is None or self.vectors.shape[1] != vector.shape[0]:
+            return -1, 0.0
+        code = self.scope_codes.get(scope, -1)
+        candidates = np.nonzero(self._live(now) & (self.scopes == code))[0]
+        if not len(candidates):
+            return -1, 0.0
+        similarities = self.vectors[candidates] @ vector
+        best = int(np.argmax(similarities))
+        return int(candidates[best]), float(similarities[best])
+
+    def lookup(self, embedding, scope: str) -> Optional[Tuple[int, Dict[str, Any], float]]:
+        """``(slot, entry, similarity)`` of a cached answer to a similar question"""
+        vector = self.normalize(embedding)
+        now = time.time()
+        with self.lock:
+            slot, similarity = self._best(vector, scope, now)
+            if slot < 0 or similarity < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.last_used[slot] = now
+            return slot, self.entries[slot], similarity
+
+    def store(self, embedding, scope: str, entry: Dict[str, Any]) -> int:
+        """Caches ``entry``, replacing the answer of an equivalent question"""
+        vector = self.normalize(embedding)
+        now = time.time()
+        with self.lock:
+            if self.vectors is None or self.vectors.shape[1] != vector.shape[0]:
+                # first entry, or another embedding model
+                self.vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+                self.expires[:] = 0
+            slot, similarity = self._best(vector, scope, now)
+            if slot < 0 or similarity < self.threshold:
+                free = np.nonzero(~self._live(now))[0]
+                slot = int(free[0]) if len(free) else int(np.argmin(self.last_used))
+            self.vectors[slot] = vector
+            self.scopes[slot] = self.scope_codes.setdefault(scope, len(self.scope_codes))
+            self.entries[slot] = entry
+            self.expires[slot] = now + self.ttl
+            self.last_used[slot] = now
+            return slot
+
+    def discard(self, slot: int, entry: Dict[str, Any]):
+        """Drops a stale entry returned by ``lookup``, the hit becomes a miss"""
+        with self.lock:
+            self.hits -= 1
+            self.misses += 1
+            if self.entries[slot] is entry:
+                self.entries[slot] = None
+                self.scopes[slot] = -1
+                self.expires[slot] = 0
+
+    def clear(self):
+        with self.lock:
+            self.entries = [None] * self.capacity
+            self.scopes[:] = -1
+            self.expires[:] = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': int(self._live(time.time()).sum()),
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
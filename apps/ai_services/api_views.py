@@ -16,12 +16,6 @@ import asyncio
 from concurrent.futures import ThreadPoolExecutor
 import os
 
-from .budget_ai import BudgetAIService
-from .knowledge_ai import KnowledgeAIService
-from .indonesian_nlp import IndonesianNLPService
-from .rag_n8n_integration import RAGN8NIntegrationService
-from .document_classifier import DocumentClassifierService
-from .intelligent_search import IntelligentSearchService
 from .exceptions import AIServiceError, ValidationError, PredictionError
 from .performance import (
     get_system_health,
@@ -33,64 +27,18 @@ from .monitoring import ai_monitor, PerformanceAnalyzer
 from .cache import AICache
 from .models import AIServiceLog, AIAnalytics
 from .preprocessing import DataPreprocessor, create_preprocessing_pipeline
+from .warmup import get_service, readiness
 
 logger = logging.getLogger(__name__)
 
-# Initialize AI services
-budget_ai_service = None
-knowledge_ai_service = None
-indonesian_nlp_service = None
-rag_n8n_service = None
-document_classifier_service = None
-intelligent_search_service = None
-
 def get_or_initialize_service(service_type: str):
     """
     Get atau initialize AI service berdasarkan type.
-    """
-    global budget_ai_service, knowledge_ai_service, indonesian_nlp_service
-    global rag_n8n_service, document_classifier_service, intelligent_search_service
     
+    Services are shared per process and initialized once, see warmup.py.
+    """
     try:
-        if service_type == 'budget_ai':
-            if budget_ai_service is None:
-                budget_ai_service = BudgetAIService()
-                budget_ai_service.load_model()
-            return budget_ai_service
-        
-        elif service_type == 'knowledge_ai':
-            if knowledge_ai_service is None:
-                knowledge_ai_service = KnowledgeAIService()
-                knowledge_ai_service.load_model()
-            return knowledge_ai_service
-        
-        elif service_type == 'indonesian_nlp':
-            if indonesian_nlp_service is None:
-                indonesian_nlp_service = IndonesianNLPService()
-                indonesian_nlp_service.load_model()
-            return indonesian_nlp_service
-        
-        elif service_type == 'rag_n8n':
-            if rag_n8n_service is None:
-                rag_n8n_service = RAGN8NIntegrationService()
-                rag_n8n_service.load_model()
-            return rag_n8n_service
-        
-        elif service_type == 'document_classifier':
-            if document_classifier_service is None:
-                document_classifier_service = DocumentClassifierService()
-                document_classifier_service.load_model()
-            return document_classifier_service
-        
-        elif service_type == 'intelligent_search':
-            if intelligent_search_service is None:
-                intelligent_search_service = IntelligentSearchService()
-                intelligent_search_service.load_model()
-            return intelligent_search_service
-        
-        else:
-            raise ValueError(f"Unknown service type: {service_type}")
-    
+        return get_service(service_type)
     except Exception as e:
         logger.error(f"Failed to initialize {service_type} service: {str(e)}")
         raise AIServiceError(f"Service initialization failed: {str(e)}")
@@ -658,31 +606,37 @@ def batch_ai_request(request):
 def ai_health_check(request):
     """
     Health check endpoint untuk AI services.
+    
+    Reports the warmup state of every service without loading any of them;
+    ``?readiness=1`` answers 503 until all services are ready, for load
+    balancer readiness probes.
     """
     try:
+        warmup_status = readiness()
         health_status = {
             'status': 'healthy',
+            'readiness': warmup_status['status'],
             'timestamp': datetime.now().isoformat(),
             'services': {}
         }
         
-        service_types = ['budget_ai', 'knowledge_ai', 'indonesian_nlp', 'rag_n8n', 'document_classifier', 'intelligent_search']
-        
-        for service_type in service_types:
-            try:
-                # Try to initialize service
-                service = get_or_initialize_service(service_type)
-                health_status['services'][service_type] = {
-                    'status': 'healthy',
-                    'loaded': service.is_loaded
-                }
-            except Exception as e:
+        for service_type, service_status in warmup_status['services'].items():
+            if service_status['state'] == 'failed':
                 health_status['services'][service_type] = {
                     'status': 'unhealthy',
-                    'error': str(e)
+                    'error': service_status.get('error')
                 }
                 health_status['status'] = 'degraded'
+            else:
+                health_status['services'][service_type] = {
+                    'status': 'healthy',
+                    'state': service_status['state'],
+                    'loaded': service_status.get('loaded', False),
+                    'load_seconds': service_status.get('duration')
+                }
         
+        if request.GET.get('readiness') and warmup_status['status'] != 'ready':
+            return Response(health_status, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         return Response(health_status, status=status.HTTP_200_OK)
     
     except Exception as e:
@@ -700,17 +654,15 @@ def public_system_health(request):
     """
     try:
         health_data = get_system_health()
+        warmup_status = readiness()
         return Response({
             'status': 'healthy',
+            'readiness': warmup_status['status'],
             'timestamp': datetime.now().isoformat(),
             'system_health': health_data,
             'services': {
-                'budget_ai': 'active' if budget_ai_service else 'inactive',
-                'knowledge_ai': 'active' if knowledge_ai_service else 'inactive',
-                'indonesian_nlp': 'active' if indonesian_nlp_service else 'inactive',
-                'document_classifier': 'active' if document_classifier_service else 'inactive',
-                'intelligent_search': 'active' if intelligent_search_service else 'inactive',
-                'rag_n8n': 'active' if rag_n8n_service else 'inactive'
+                service_type: 'active' if service_status['state'] == 'ready' else 'inactive'
+                for service_type, service_status in warmup_status['services'].items()
             }
         })
     except Exception as e:
@@ -16,11 +16,18 @@ class AiServicesConfig(AppConfig):
         # Import signal handlers
         from . import signals
         
+        # Invalidate the HR assistant snapshots when their data changes
+        from .hr_snapshot import connect_signals
+        connect_signals()
+        
         # Connect post-migrate signal
         post_migrate.connect(self.create_default_data, sender=self)
         
         # Initialize AI services on startup
         self.initialize_ai_services()
+        
+        # Load the AI services ahead of the first request (opt-in)
+        self.start_warmup()
     
     def create_default_data(self, sender, **kwargs):
         """Create default data after migrations."""
@@ -151,6 +158,24 @@ class AiServicesConfig(AppConfig):
         except Exception as e:
             logger.error(f"Error initializing AI services: {str(e)}")
     
+    def start_warmup(self):
+        """Warm the AI services up in a background thread when enabled."""
+        import sys
+        from django.conf import settings
+        
+        if not getattr(settings, 'AI_SERVICES_WARMUP_ON_STARTUP', False):
+            return
+        # Only in processes that serve requests, not in management commands
+        if len(sys.argv) > 1 and sys.argv[1] not in ('runserver',) and 'manage.py' in sys.argv[0]:
+            return
+        
+        try:
+            from .warmup import start_background_warmup
+            start_background_warmup()
+            logger.info("AI services warmup started")
+        except Exception as e:
+            logger.error(f"Error starting AI services warmup: {str(e)}")
+    
     def create_database_indexes(self):
         """Create additional database indexes for performance."""
         try:
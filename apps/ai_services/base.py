@@ -1,15 +1,162 @@
 import logging
 import json
+import hashlib
+import threading
 import time
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 from datetime import datetime
-from django.core.cache import cache
 from django.conf import settings
+from django.db import close_old_connections
+from horilla.cache_namespaces import cache_namespace
 from .exceptions import AIServiceError, ModelNotFoundError, PredictionError
 
 logger = logging.getLogger(__name__)
 
+
+class SingleFlight:
+    """
+    Menjalankan satu komputasi per key; pemanggil lain dengan key yang sama
+    menunggu dan menerima hasil (atau error) yang sama.
+    """
+    
+    class _Flight:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+    
+    def in_flight(self, key: str) -> bool:
+        with self.lock:
+            return key in self.flights
+    
+    def do(self, key: str, compute: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Returns ``(result, leader)``, leader is False for a coalesced call.
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = self._Flight()
+        
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, False
+        
+        try:
+            flight.result = compute()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                self.flights.pop(key, None)
+            flight.done.set()
+        return flight.result, True
+
+
+class PredictionCache:
+    """
+    Cache prediksi per model: tier LRU in-process di depan shared cache,
+    single flight untuk prediksi identik yang sedang berjalan, dan
+    stale-while-revalidate untuk model yang lambat.
+    
+    Entry disimpan sebagai ``{'value': ..., 'fresh_until': ...}`` selama
+    ``timeout + stale_timeout``; entry yang sudah lewat ``fresh_until`` masih
+    dikembalikan sementara satu thread menghitung ulang di background.
+    """
+    
+    _flights = SingleFlight()
+    
+    def __init__(self, service_name: str, timeout: int, stale_timeout: int = 0):
+        self.service_name = service_name
+        self.timeout = timeout
+        self.stale_timeout = stale_timeout
+        self.namespace = cache_namespace(
+            f"ai_prediction:{service_name}",
+            timeout=timeout + stale_timeout,
+            local_timeout=getattr(settings, 'AI_PREDICTION_LOCAL_TIMEOUT', 60),
+        )
+    
+    @staticmethod
+    def make_key(input_data: Any) -> str:
+        data_str = json.dumps(input_data, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.blake2b(data_str.encode(), digest_size=16).hexdigest()
+    
+    def _record(self, operation: str, hit: bool, started: float) -> None:
+        try:
+            from .metrics import ai_metrics
+            ai_metrics.record_cache_operation(
+                operation, hit, self.service_name, time.monotonic() - started
+            )
+        except Exception as e:
+            logger.debug(f"Cache metrics unavailable: {str(e)}")
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Fresh or stale cached value, None on a miss"""
+        entry, _ = self.namespace.lookup(key)
+        return self._copy(entry['value']) if entry else None
+    
+    def set(self, key: str, value: Any) -> None:
+        self.namespace.set(key, {
+            'value': value,
+            'fresh_until': time.time() + self.timeout,
+        })
+    
+    def clear(self) -> None:
+        self.namespace.invalidate()
+    
+    @staticmethod
+    def _copy(value: Any) -> Any:
+        # the local tier hands out the same object to every caller
+        return dict(value) if isinstance(value, dict) else value
+    
+    def _compute_and_store(self, key: str, compute: Callable[[], Any]) -> Any:
+        value = compute()
+        self.set(key, value)
+        return value
+    
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        started = time.monotonic()
+        entry, tier = self.namespace.lookup(key)
+        
+        if tier is not None:
+            self._record(f'prediction_{tier}', True, started)
+            if entry['fresh_until'] < time.time():
+                self._record('prediction_stale', True, started)
+                self._revalidate(key, compute)
+            return self._copy(entry['value'])
+        
+        value, leader = self._flights.do(
+            f"{self.namespace.name}:{key}",
+            lambda: self._compute_and_store(key, compute),
+        )
+        # a coalesced call waited for another one instead of running the model
+        self._record('prediction' if leader else 'prediction_coalesced', not leader, started)
+        return self._copy(value)
+    
+    def _revalidate(self, key: str, compute: Callable[[], Any]) -> None:
+        flight_key = f"{self.namespace.name}:{key}"
+        if self._flights.in_flight(flight_key):
+            return
+        
+        def refresh():
+            try:
+                self._flights.do(flight_key, lambda: self._compute_and_store(key, compute))
+            except Exception as e:
+                logger.warning(f"Background refresh failed for {self.service_name}: {str(e)}")
+            finally:
+                close_old_connections()
+        
+        threading.Thread(target=refresh, daemon=True).start()
+
 class BaseAIService(ABC):
     """
     Base class untuk semua AI services di Horilla HR System.
@@ -23,6 +170,11 @@ class BaseAIService(ABC):
         self.max_retries = getattr(settings, 'AI_MAX_RETRIES', 3)
         self.model = None
         self.is_loaded = False
+        self.prediction_cache = PredictionCache(
+            model_name,
+            self.cache_timeout,
+            getattr(settings, 'AI_CACHE_STALE_TIMEOUT', 0),
+        )
         
     @abstractmethod
     def load_model(self) -> None:
@@ -51,17 +203,13 @@ class BaseAIService(ABC):
         """
         Generate cache key for input data.
         """
-        import hashlib
-        data_str = json.dumps(input_data, sort_keys=True, default=str)
-        hash_obj = hashlib.md5(data_str.encode())
-        return f"ai_prediction_{self.model_name}_{hash_obj.hexdigest()}"
+        return PredictionCache.make_key(input_data)
     
     def get_cached_prediction(self, input_data: Any) -> Optional[Dict[str, Any]]:
         """
         Get cached prediction if available.
         """
-        cache_key = self.get_cache_key(input_data)
-        cached_result = cache.get(cache_key)
+        cached_result = self.prediction_cache.get(self.get_cache_key(input_data))
         
         if cached_result:
             logger.info(f"Cache hit for {self.model_name} prediction")
@@ -73,13 +221,59 @@ class BaseAIService(ABC):
         """
         Cache prediction result.
         """
-        cache_key = self.get_cache_key(input_data)
-        cache.set(cache_key, prediction, self.cache_timeout)
+        self.prediction_cache.set(self.get_cache_key(input_data), prediction)
         logger.info(f"Cached prediction for {self.model_name}")
     
+    def _add_prediction_metadata(self, prediction: Dict[str, Any], elapsed: float) -> Dict[str, Any]:
+        """
+        Add the model and timing metadata every cached prediction carries.
+        """
+        prediction.update({
+            'model_name': self.model_name,
+            'model_version': self.version,
+            'prediction_time': datetime.now().isoformat(),
+            'processing_time_ms': round(elapsed * 1000, 2)
+        })
+        return prediction
+    
+    def _predict_with_retries(self, input_data: Any, start_time: float) -> Dict[str, Any]:
+        """
+        Load the model if needed and predict with retries.
+        """
+        # Load model if not loaded
+        if not self.is_loaded:
+            self.load_model()
+        
+        # Make prediction with retries
+        prediction = None
+        last_error = None
+        
+        for attempt in range(self.max_retries):
+            try:
+                prediction = self.predict(input_data)
+                break
+            except Exception as e:
+                last_error = e
+                logger.warning(f"Prediction attempt {attempt + 1} failed: {str(e)}")
+                if attempt < self.max_retries - 1:
+                    time.sleep(0.5 * (attempt + 1))  # Exponential backoff
+        
+        if prediction is None:
+            raise PredictionError(f"All prediction attempts failed: {str(last_error)}")
+        
+        self._add_prediction_metadata(prediction, time.time() - start_time)
+        
+        # Log success
+        logger.info(f"Successful prediction with {self.model_name} in {prediction['processing_time_ms']}ms")
+        
+        return prediction
+    
     def safe_predict(self, input_data: Any, use_cache: bool = True) -> Dict[str, Any]:
         """
         Safe prediction with error handling, caching, and retries.
+        
+        With the cache, identical predictions in progress are computed once
+        and stale entries are served while they are refreshed.
         """
         start_time = time.time()
         
@@ -88,49 +282,13 @@ class BaseAIService(ABC):
             if not self.validate_input(input_data):
                 raise PredictionError(f"Invalid input data for {self.model_name}")
             
-            # Check cache first
-            if use_cache:
-                cached_result = self.get_cached_prediction(input_data)
-                if cached_result:
-                    return cached_result
-            
-            # Load model if not loaded
-            if not self.is_loaded:
-                self.load_model()
-            
-            # Make prediction with retries
-            prediction = None
-            last_error = None
-            
-            for attempt in range(self.max_retries):
-                try:
-                    prediction = self.predict(input_data)
-                    break
-                except Exception as e:
-                    last_error = e
-                    logger.warning(f"Prediction attempt {attempt + 1} failed: {str(e)}")
-                    if attempt < self.max_retries - 1:
-                        time.sleep(0.5 * (attempt + 1))  # Exponential backoff
-            
-            if prediction is None:
-                raise PredictionError(f"All prediction attempts failed: {str(last_error)}")
-            
-            # Add metadata
-            prediction.update({
-                'model_name': self.model_name,
-                'model_version': self.version,
-                'prediction_time': datetime.now().isoformat(),
-                'processing_time_ms': round((time.time() - start_time) * 1000, 2)
-            })
-            
-            # Cache result
-            if use_cache:
-                self.cache_prediction(input_data, prediction)
-            
-            # Log success
-            logger.info(f"Successful prediction with {self.model_name} in {prediction['processing_time_ms']}ms")
+            if not use_cache:
+                return self._predict_with_retries(input_data, start_time)
             
-            return prediction
+            return self.prediction_cache.get_or_compute(
+                self.get_cache_key(input_data),
+                lambda: self._predict_with_retries(input_data, time.time()),
+            )
             
         except Exception as e:
             logger.error(f"Prediction failed for {self.model_name}: {str(e)}")
@@ -175,7 +333,7 @@ class BaseAIService(ABC):
         """
         Clear all cached predictions for this model.
         """
-        # This is a simplified version - in production you'd want more sophisticated cache management
+        self.prediction_cache.clear()
         logger.info(f"Cache cleared for {self.model_name}")
     
     def __str__(self) -> str:
@@ -20,11 +20,97 @@ from .performance_optimizer import (
     monitor_ai_performance,
     optimize_ai_service
 )
+from budget.cache import BudgetCacheManager
 from budget.models import BudgetPlan, BudgetCategory, Expense, ExpenseType
 from employee.models import Employee
 
 logger = logging.getLogger(__name__)
 
+CATEGORY_MAPPING = {
+    'operational': 1, 'capital': 2, 'personnel': 3,
+    'marketing': 4, 'research': 5, 'other': 0
+}
+
+
+def _department_key(department_id) -> int:
+    try:
+        return int(department_id) if department_id else 0
+    except (TypeError, ValueError):
+        return 0
+
+
+class BudgetFeatureStore:
+    """
+    Feature table per department dan budget category.
+    
+    Dibangun dengan satu grouped query atas BudgetPlan (plus satu untuk jumlah
+    employee per department) dan disimpan di cache; signals di budget/cache.py
+    menghapusnya saat budget plan atau category berubah.
+    """
+    
+    HISTORY_DAYS = 90
+    
+    def build(self) -> Dict[str, Any]:
+        now = timezone.now()
+        recent_start = now - timedelta(days=self.HISTORY_DAYS)
+        year_start = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+        
+        rows = BudgetPlan.objects.filter(
+            created_at__gte=min(recent_start, year_start)
+        ).values(
+            'created_by__employee_work_info__department_id', 'category__name'
+        ).annotate(
+            recent_sum=Sum('allocated_amount', filter=Q(created_at__range=[recent_start, now])),
+            recent_count=Count('allocated_amount', filter=Q(created_at__range=[recent_start, now])),
+            year_total=Sum('allocated_amount', filter=Q(created_at__year=now.year)),
+        ).order_by()
+        
+        spending = {}
+        for row in rows:
+            department = _department_key(row['created_by__employee_work_info__department_id'])
+            spending.setdefault(department, {})[(row['category__name'] or '').lower()] = (
+                float(row['recent_sum'] or 0),
+                row['recent_count'],
+                float(row['year_total'] or 0),
+            )
+        
+        employees = dict(
+            Employee.objects.entire().filter(is_active=True)
+            .values('employee_work_info__department_id')
+            .annotate(count=Count('id'))
+            .values_list('employee_work_info__department_id', 'count')
+            .order_by()
+        )
+        return {
+            'spending': spending,
+            'employees': {_department_key(dept): count for dept, count in employees.items() if dept},
+        }
+    
+    def table(self) -> Dict[str, Any]:
+        return BudgetCacheManager.get_or_set_feature_table(self.build)
+    
+    def _matching(self, table, department_id, category: str):
+        # sama dengan category__name__icontains pada query per prediksi sebelumnya
+        category = (category or '').lower()
+        categories = table['spending'].get(_department_key(department_id), {})
+        return [values for name, values in categories.items() if category in name]
+    
+    def historical_spending(self, department_id, category: str, table=None) -> float:
+        """Rata-rata allocated_amount 3 bulan terakhir"""
+        matching = self._matching(table or self.table(), department_id, category)
+        total = sum(values[0] for values in matching)
+        count = sum(values[1] for values in matching)
+        return total / count if count else 0.0
+    
+    def current_allocation(self, department_id, category: str, table=None) -> float:
+        """Total allocated_amount tahun berjalan"""
+        matching = self._matching(table or self.table(), department_id, category)
+        return sum(values[2] for values in matching)
+    
+    def employee_count(self, department_id, table=None) -> int:
+        return (table or self.table())['employees'].get(_department_key(department_id), 0)
+
+
 @optimize_ai_service
 class BudgetAIService(BaseAIService, MLModelMixin):
     """
@@ -40,6 +126,7 @@ class BudgetAIService(BaseAIService, MLModelMixin):
         self.feature_names = config['FEATURES']
         self.prediction_horizon = config['PREDICTION_HORIZON_DAYS']
         self.anomaly_threshold = config['ANOMALY_THRESHOLD']
+        self.feature_store = BudgetFeatureStore()
         
     @cache_model_load
     def load_model(self) -> None:
@@ -106,79 +193,103 @@ class BudgetAIService(BaseAIService, MLModelMixin):
         Make budget prediction dengan confidence score dan recommendations.
         """
         try:
-            # Extract features
-            features = self._extract_features(input_data)
-            
-            # Scale features
-            features_scaled = self.scaler.transform([features])
-            
-            # Make prediction
-            prediction = self.model.predict(features_scaled)[0]
-            
-            # Calculate confidence (using prediction variance from ensemble)
-            if hasattr(self.model, 'estimators_'):
-                predictions = [estimator.predict(features_scaled)[0] for estimator in self.model.estimators_]
-                confidence = 1.0 - (np.std(predictions) / np.mean(predictions))
-                confidence = max(0.0, min(1.0, confidence))  # Clamp between 0 and 1
-            else:
-                confidence = 0.8  # Default confidence
-            
-            # Detect anomalies
-            anomaly_score = self._detect_anomaly(features)
-            is_anomaly = anomaly_score < -self.anomaly_threshold
-            
-            # Generate recommendations
-            recommendations = self._generate_recommendations(input_data, prediction, anomaly_score)
-            
-            # Calculate budget utilization alerts
-            alerts = self._calculate_alerts(input_data, prediction)
-            
-            return {
+            return self._predict_rows([input_data])[0]
+        except Exception as e:
+            raise PredictionError(f"Budget prediction failed: {str(e)}", self.model_name, input_data)
+    
+    @monitor_ai_performance
+    def predict_many(self, inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Prediksi untuk banyak department/category sekaligus, misalnya matriks
+        department x category di dashboard: features diambil dari feature table
+        yang sama dan model serta anomaly detector dipanggil sekali.
+        """
+        if not inputs:
+            return []
+        for input_data in inputs:
+            if not self.validate_input(input_data):
+                raise ValidationError(f"Invalid input data: {input_data}", input_data)
+        if not self.is_loaded:
+            self.load_model()
+        try:
+            return self._predict_rows(inputs)
+        except Exception as e:
+            raise PredictionError(f"Budget prediction failed: {str(e)}", self.model_name, inputs)
+    
+    def _predict_rows(self, inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        table = self.feature_store.table()
+        features = np.array([self._extract_features(input_data, table) for input_data in inputs])
+        
+        # Scale features
+        features_scaled = self.scaler.transform(features)
+        
+        # Make prediction
+        predictions = self.model.predict(features_scaled)
+        
+        # Calculate confidence (using prediction variance from ensemble)
+        if len(getattr(self.model, 'estimators_', [])):
+            estimator_predictions = np.array([
+                estimator.predict(features_scaled) for estimator in self.model.estimators_
+            ])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                confidences = 1.0 - (estimator_predictions.std(axis=0) / estimator_predictions.mean(axis=0))
+            confidences = np.clip(np.nan_to_num(confidences), 0.0, 1.0)  # Clamp between 0 and 1
+        else:
+            confidences = np.full(len(inputs), 0.8)  # Default confidence
+        
+        # Detect anomalies
+        anomaly_scores = self._detect_anomalies(features_scaled)
+        feature_importance = self.get_feature_importance()
+        
+        results = []
+        for input_data, prediction, confidence, anomaly_score in zip(
+            inputs, predictions, confidences, anomaly_scores
+        ):
+            prediction = float(prediction)
+            anomaly_score = float(anomaly_score)
+            results.append({
                 'predicted_amount': round(prediction, 2),
-                'confidence_score': round(confidence, 4),
+                'confidence_score': round(float(confidence), 4),
                 'anomaly_score': round(anomaly_score, 4),
-                'is_anomaly': is_anomaly,
-                'recommendations': recommendations,
-                'alerts': alerts,
-                'feature_importance': self.get_feature_importance(),
+                'is_anomaly': anomaly_score < -self.anomaly_threshold,
+                'recommendations': self._generate_recommendations(input_data, prediction, anomaly_score, table),
+                'alerts': self._calculate_alerts(input_data, prediction, table),
+                'feature_importance': feature_importance,
                 'prediction_horizon_days': self.prediction_horizon
-            }
-            
-        except Exception as e:
-            raise PredictionError(f"Budget prediction failed: {str(e)}", self.model_name, input_data)
+            })
+        return results
     
-    def _extract_features(self, input_data: Dict[str, Any]) -> List[float]:
+    def _extract_features(self, input_data: Dict[str, Any], table: Dict[str, Any] = None) -> List[float]:
         """
         Extract features dari input data untuk model prediction.
         """
         features = []
         
         try:
+            table = table or self.feature_store.table()
+            
             # Department ID (encoded)
             dept_id = int(input_data['department_id']) if input_data['department_id'] else 0
             features.append(dept_id)
             
             # Budget category (encoded)
-            category_mapping = {
-                'operational': 1, 'capital': 2, 'personnel': 3, 
-                'marketing': 4, 'research': 5, 'other': 0
-            }
-            category = category_mapping.get(input_data['budget_category'].lower(), 0)
+            category = CATEGORY_MAPPING.get(input_data['budget_category'].lower(), 0)
             features.append(category)
             
             # Historical spending (last 3 months average)
-            historical_spending = self._get_historical_spending(
+            historical_spending = self.feature_store.historical_spending(
                 input_data['department_id'], 
-                input_data['budget_category']
+                input_data['budget_category'],
+                table
             )
             features.append(historical_spending)
             
             # Employee count in department
-            employee_count = self._get_employee_count(input_data['department_id'])
+            employee_count = self.feature_store.employee_count(input_data['department_id'], table)
             features.append(employee_count)
             
             # Project count (active projects in department)
-            project_count = self._get_project_count(input_data['department_id'])
+            project_count = self._get_project_count(input_data['department_id'], employee_count)
             features.append(project_count)
             
             # Seasonal factor (month-based)
@@ -197,48 +308,35 @@ class BudgetAIService(BaseAIService, MLModelMixin):
             # Return default features if extraction fails
             return [0.0] * len(self.feature_names)
     
-    def _get_historical_spending(self, department_id: int, category: str) -> float:
+    def _get_historical_spending(self, department_id: int, category: str, table: Dict[str, Any] = None) -> float:
         """
         Get historical spending untuk department dan category.
         """
         try:
-            end_date = timezone.now()
-            start_date = end_date - timedelta(days=90)  # Last 3 months
-            
-            # Query budget plans for historical data
-            historical_budgets = BudgetPlan.objects.filter(
-                created_by__employee_work_info__department_id=department_id,
-                category__name__icontains=category,
-                created_at__range=[start_date, end_date]
-            ).aggregate(avg_amount=Avg('allocated_amount'))['avg_amount']
-            
-            return float(historical_budgets or 0.0)
-            
+            return self.feature_store.historical_spending(department_id, category, table)
         except Exception as e:
             logger.warning(f"Could not get historical spending: {str(e)}")
             return 0.0
     
-    def _get_employee_count(self, department_id: int) -> int:
+    def _get_employee_count(self, department_id: int, table: Dict[str, Any] = None) -> int:
         """
         Get jumlah employee di department.
         """
         try:
-            return Employee.objects.filter(
-                employee_work_info__department_id=department_id,
-                is_active=True
-            ).count()
+            return self.feature_store.employee_count(department_id, table)
         except Exception as e:
             logger.warning(f"Could not get employee count: {str(e)}")
             return 0
     
-    def _get_project_count(self, department_id: int) -> int:
+    def _get_project_count(self, department_id: int, employee_count: int = None) -> int:
         """
         Get jumlah active projects di department.
         """
         try:
             # Simplified - in real implementation, query actual project model
             # For now, return a reasonable estimate based on employee count
-            employee_count = self._get_employee_count(department_id)
+            if employee_count is None:
+                employee_count = self._get_employee_count(department_id)
             return max(1, employee_count // 5)  # Assume 1 project per 5 employees
         except Exception as e:
             logger.warning(f"Could not get project count: {str(e)}")
@@ -318,6 +416,7 @@ class BudgetAIService(BaseAIService, MLModelMixin):
             ).select_related('created_by__employee_work_info__department')
             
             X, y = [], []
+            table = self.feature_store.table()
             
             for budget in budgets:
                 # Extract features for each budget record
@@ -327,7 +426,7 @@ class BudgetAIService(BaseAIService, MLModelMixin):
                     'time_period': budget.created_at
                 }
                 
-                features = self._extract_features(input_data)
+                features = self._extract_features(input_data, table)
                 target = float(budget.allocated_amount or 0)
                 
                 if target > 0:  # Only include valid budget amounts
@@ -414,20 +513,26 @@ class BudgetAIService(BaseAIService, MLModelMixin):
         Detect anomaly dalam budget prediction.
         """
         try:
-            if self.anomaly_detector is None:
-                return 0.0
-            
-            features_scaled = self.scaler.transform([features])
-            anomaly_score = self.anomaly_detector.decision_function(features_scaled)[0]
-            
-            return anomaly_score
-            
+            return float(self._detect_anomalies(self.scaler.transform([features]))[0])
         except Exception as e:
             logger.warning(f"Anomaly detection failed: {str(e)}")
             return 0.0
     
+    def _detect_anomalies(self, features_scaled: np.ndarray) -> np.ndarray:
+        """
+        Anomaly scores untuk matrix features yang sudah di-scale.
+        """
+        try:
+            if self.anomaly_detector is None:
+                return np.zeros(len(features_scaled))
+            return self.anomaly_detector.decision_function(features_scaled)
+        except Exception as e:
+            logger.warning(f"Anomaly detection failed: {str(e)}")
+            return np.zeros(len(features_scaled))
+    
     def _generate_recommendations(self, input_data: Dict[str, Any], 
-                                prediction: float, anomaly_score: float) -> List[str]:
+                                prediction: float, anomaly_score: float,
+                                table: Dict[str, Any] = None) -> List[str]:
         """
         Generate budget recommendations berdasarkan prediction dan anomaly score.
         """
@@ -437,7 +542,8 @@ class BudgetAIService(BaseAIService, MLModelMixin):
             # Historical comparison
             historical_avg = self._get_historical_spending(
                 input_data['department_id'], 
-                input_data['budget_category']
+                input_data['budget_category'],
+                table
             )
             
             if historical_avg > 0:
@@ -486,7 +592,8 @@ class BudgetAIService(BaseAIService, MLModelMixin):
             logger.warning(f"Recommendation generation failed: {str(e)}")
             return ["Tidak dapat menggenerate rekomendasi saat ini."]
     
-    def _calculate_alerts(self, input_data: Dict[str, Any], prediction: float) -> List[Dict[str, Any]]:
+    def _calculate_alerts(self, input_data: Dict[str, Any], prediction: float,
+                          table: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """
         Calculate budget utilization alerts.
         """
@@ -496,7 +603,8 @@ class BudgetAIService(BaseAIService, MLModelMixin):
             # Get current budget allocation
             current_budget = self._get_current_budget_allocation(
                 input_data['department_id'], 
-                input_data['budget_category']
+                input_data['budget_category'],
+                table
             )
             
             if current_budget > 0:
@@ -532,21 +640,13 @@ class BudgetAIService(BaseAIService, MLModelMixin):
             logger.warning(f"Alert calculation failed: {str(e)}")
             return []
     
-    def _get_current_budget_allocation(self, department_id: int, category: str) -> float:
+    def _get_current_budget_allocation(self, department_id: int, category: str,
+                                       table: Dict[str, Any] = None) -> float:
         """
         Get current budget allocation untuk department dan category.
         """
         try:
-            current_year = datetime.now().year
-            
-            budget_allocation = BudgetPlan.objects.filter(
-                created_by__employee_work_info__department_id=department_id,
-                category__name__icontains=category,
-                created_at__year=current_year
-            ).aggregate(total=Sum('allocated_amount'))['total']
-            
-            return float(budget_allocation or 0.0)
-            
+            return self.feature_store.current_allocation(department_id, category, table)
         except Exception as e:
             logger.warning(f"Could not get current budget allocation: {str(e)}")
             return 0.0
@@ -677,23 +777,22 @@ class BudgetAIService(BaseAIService, MLModelMixin):
             if department_id:
                 query = query.filter(created_by__employee_work_info__department_id=department_id)
             
-            anomaly_count = 0
-            total_checked = 0
-            
-            for budget in query:
-                input_data = {
-                    'department_id': budget.created_by.employee_work_info.department_id if budget.created_by and hasattr(budget.created_by, 'employee_work_info') and budget.created_by.employee_work_info.department_id else 0,
+            table = self.feature_store.table()
+            features = [
+                self._extract_features({
+                    'department_id': department or 0,
                     'budget_category': 'operational',
-                    'time_period': budget.created_at
-                }
-                
-                features = self._extract_features(input_data)
-                anomaly_score = self._detect_anomaly(features)
-                
-                if anomaly_score < -self.anomaly_threshold:
-                    anomaly_count += 1
-                
-                total_checked += 1
+                }, table)
+                for department in query.values_list(
+                    'created_by__employee_work_info__department_id', flat=True
+                )
+            ]
+            
+            total_checked = len(features)
+            anomaly_count = 0
+            if features:
+                anomaly_scores = self._detect_anomalies(self.scaler.transform(features))
+                anomaly_count = int((anomaly_scores < -self.anomaly_threshold).sum())
             
             anomaly_rate = (anomaly_count / total_checked * 100) if total_checked > 0 else 0
             
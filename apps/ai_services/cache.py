@@ -1,4 +1,3 @@
-from django.core.cache import cache
 from django.conf import settings
 import json
 import hashlib
@@ -6,6 +5,8 @@ from functools import wraps
 from typing import Any, Optional, Callable
 import logging
 
+from horilla.cache_namespaces import cache_namespace
+
 logger = logging.getLogger(__name__)
 
 class AICache:
@@ -24,9 +25,21 @@ class AICache:
     }
     
     @staticmethod
-    def generate_cache_key(prefix: str, data: Any) -> str:
+    def namespace(prefix: str):
         """
-        Generate a consistent cache key from data
+        Namespace of the entries of a prefix, cleared together by clear_prefix
+        """
+        # embeddings are large and many, keep them out of the per-process tier
+        return cache_namespace(
+            f"ai_cache:{prefix}",
+            timeout=AICache.CACHE_TIMEOUTS.get(prefix, 3600),
+            local=prefix != 'embedding',
+        )
+    
+    @staticmethod
+    def hash_data(data: Any) -> str:
+        """
+        Generate a consistent hash of the cached data
         """
         if isinstance(data, dict):
             # Sort dict keys for consistent hashing
@@ -36,9 +49,14 @@ class AICache:
         else:
             data_str = str(data)
         
-        # Create hash of the data
-        data_hash = hashlib.md5(data_str.encode()).hexdigest()[:16]
-        return f"ai_cache:{prefix}:{data_hash}"
+        return hashlib.md5(data_str.encode()).hexdigest()[:16]
+    
+    @classmethod
+    def generate_cache_key(cls, prefix: str, data: Any) -> str:
+        """
+        Generate a consistent cache key from data
+        """
+        return cls.namespace(prefix).make_key(cls.hash_data(data))
     
     @classmethod
     def get(cls, prefix: str, data: Any) -> Optional[Any]:
@@ -46,12 +64,11 @@ class AICache:
         Get cached result
         """
         try:
-            cache_key = cls.generate_cache_key(prefix, data)
-            result = cache.get(cache_key)
+            result = cls.namespace(prefix).get(cls.hash_data(data))
             if result is not None:
-                logger.debug(f"Cache hit for {cache_key}")
+                logger.debug(f"Cache hit for {prefix}")
                 return result
-            logger.debug(f"Cache miss for {cache_key}")
+            logger.debug(f"Cache miss for {prefix}")
             return None
         except Exception as e:
             logger.error(f"Cache get error: {e}")
@@ -63,12 +80,11 @@ class AICache:
         Set cached result
         """
         try:
-            cache_key = cls.generate_cache_key(prefix, data)
             if timeout is None:
                 timeout = cls.CACHE_TIMEOUTS.get(prefix, 3600)
             
-            cache.set(cache_key, result, timeout)
-            logger.debug(f"Cache set for {cache_key} with timeout {timeout}s")
+            cls.namespace(prefix).set(cls.hash_data(data), result, timeout)
+            logger.debug(f"Cache set for {prefix} with timeout {timeout}s")
             return True
         except Exception as e:
             logger.error(f"Cache set error: {e}")
@@ -80,9 +96,8 @@ class AICache:
         Delete cached result
         """
         try:
-            cache_key = cls.generate_cache_key(prefix, data)
-            cache.delete(cache_key)
-            logger.debug(f"Cache deleted for {cache_key}")
+            cls.namespace(prefix).delete(cls.hash_data(data))
+            logger.debug(f"Cache deleted for {prefix}")
             return True
         except Exception as e:
             logger.error(f"Cache delete error: {e}")
@@ -94,11 +109,9 @@ class AICache:
         Clear all cache entries with given prefix
         """
         try:
-            # This is a simplified version - in production, you might want to use Redis SCAN
-            pattern = f"ai_cache:{prefix}:*"
-            if hasattr(cache, 'delete_pattern'):
-                cache.delete_pattern(pattern)
-            logger.info(f"Cleared cache for pattern {pattern}")
+            # moving to a new generation orphans every entry of the prefix
+            cls.namespace(prefix).invalidate()
+            logger.info(f"Cleared cache for prefix {prefix}")
             return True
         except Exception as e:
             logger.error(f"Cache clear error: {e}")
@@ -1,8 +1,8 @@
 import logging
 import time
 from typing import List, Dict, Any, Optional, Tuple
-from django.db.models import Q
 from django.contrib.auth.models import User
+from django.db.models import Exists, OuterRef
 from django.utils import timezone
 from django.conf import settings
 from sentence_transformers import SentenceTransformer
@@ -13,7 +13,12 @@ from knowledge.models import (
     KnowledgeDocument, ChatbotConversation, ChatbotMessage,
     DocumentCategory, DocumentTag
 )
+from knowledge import search_index, snippets
+from knowledge.chat_sessions import chat_sessions
+from .answer_cache import SemanticAnswerCache
 from .knowledge_ai import KnowledgeAIService
+from .metrics import ai_metrics
+from .retrieval import RetrievalOrchestrator, Strategy
 from .slm_service import slm_service
 
 logger = logging.getLogger(__name__)
@@ -42,8 +47,36 @@ class ChatbotSLMService:
             'use_indonesian': getattr(settings, 'SLM_USE_INDONESIAN', True)
         }
         
+        # Cache jawaban untuk pertanyaan yang mirip (berdasarkan embedding)
+        self.answer_cache = None
+        if getattr(settings, 'CHATBOT_ANSWER_CACHE_ENABLED', True):
+            self.answer_cache = SemanticAnswerCache(
+                capacity=getattr(settings, 'CHATBOT_ANSWER_CACHE_SIZE', 1000),
+                ttl=getattr(settings, 'CHATBOT_ANSWER_CACHE_TTL', 3600),
+                threshold=getattr(settings, 'CHATBOT_ANSWER_CACHE_THRESHOLD', 0.92),
+            )
+        
         # Initialize services
         self._initialize_services()
+        self.retrieval = self._build_retrieval()
+    
+    def _build_retrieval(self) -> RetrievalOrchestrator:
+        """Retrieval strategies that are available, in priority order, with their time budget"""
+        budgets = {'ai_semantic': 1.5, 'keyword': 0.5, 'embedding': 2.0}
+        budgets.update(getattr(settings, 'CHATBOT_RETRIEVAL_BUDGETS', {}))
+        strategies = []
+        if self.knowledge_ai:
+            strategies.append(Strategy('ai_semantic', self._semantic_search, budgets['ai_semantic']))
+        strategies.append(Strategy('keyword', self._keyword_search, budgets['keyword']))
+        if self.embedding_model:
+            strategies.append(Strategy('embedding', self._embedding_search, budgets['embedding']))
+        self.retrieval_priority = [strategy.name for strategy in strategies]
+        return RetrievalOrchestrator(
+            strategies,
+            max_workers=getattr(settings, 'CHATBOT_RETRIEVAL_WORKERS', 6),
+            rrf_k=getattr(settings, 'CHATBOT_RRF_K', 60),
+            max_abandoned=getattr(settings, 'CHATBOT_RETRIEVAL_MAX_ABANDONED', 1),
+        )
     
     def _initialize_services(self):
         """Initialize AI services and embedding model"""
@@ -65,247 +98,249 @@ class ChatbotSLMService:
     def retrieve_relevant_documents(self, query: str, user: User, max_results: int = 5) -> List[Dict[str, Any]]:
         """
         Retrieve dokumen yang relevan berdasarkan query menggunakan multiple strategies.
+        Strategi berjalan bersamaan dan peringkatnya digabung dengan reciprocal rank fusion.
         """
         try:
-            relevant_docs = []
-            
-            # Strategy 1: Semantic search using KnowledgeAI if available
-            if self.knowledge_ai:
-                try:
-                    ai_results = self.knowledge_ai.search_documents(query, max_results=max_results)
-                    for doc_data in ai_results:
-                        if 'document_id' in doc_data:
-                            try:
-                                doc = KnowledgeDocument.objects.get(
-                                    id=doc_data['document_id'],
-                                    status='published'
-                                )
-                                if self._user_can_access_document(user, doc):
-                                    relevant_docs.append({
-                                        'document': doc,
-                                        'similarity_score': doc_data.get('similarity_score', 0.0),
-                                        'snippet': doc_data.get('snippet', ''),
-                                        'method': 'ai_semantic'
-                                    })
-                            except KnowledgeDocument.DoesNotExist:
-                                continue
-                except Exception as e:
-                    logger.warning(f"AI search failed, falling back to traditional search: {e}")
-            
-            # Strategy 2: Traditional keyword search if AI search didn't return enough results
-            if len(relevant_docs) < max_results:
-                keyword_results = self._keyword_search(query, user, max_results - len(relevant_docs))
-                
-                # Avoid duplicates
-                existing_doc_ids = {doc['document'].id for doc in relevant_docs}
-                for doc_data in keyword_results:
-                    if doc_data['document'].id not in existing_doc_ids:
-                        relevant_docs.append(doc_data)
-            
-            # Strategy 3: Embedding-based search if available
-            if self.embedding_model and len(relevant_docs) < max_results:
-                embedding_results = self._embedding_search(query, user, max_results - len(relevant_docs))
-                
-                # Avoid duplicates
-                existing_doc_ids = {doc['document'].id for doc in relevant_docs}
-                for doc_data in embedding_results:
-                    if doc_data['document'].id not in existing_doc_ids:
-                        relevant_docs.append(doc_data)
-            
-            # Sort by similarity score
-            relevant_docs.sort(key=lambda x: x.get('similarity_score', 0), reverse=True)
-            
-            return relevant_docs[:max_results]
-            
-        except Exception as e:
-            logger.error(f"Document retrieval failed: {e}")
-            return []
-    
-    def _keyword_search(self, query: str, user: User, max_results: int) -> List[Dict[str, Any]]:
-        """Traditional keyword-based search"""
-        try:
-            # Split query into keywords
-            keywords = query.lower().split()
-            
-            # Build Q objects for search
-            q_objects = Q()
-            for keyword in keywords:
-                q_objects |= (
-                    Q(title__icontains=keyword) |
-                    Q(content__icontains=keyword) |
-                    Q(description__icontains=keyword) |
-                    Q(tags__name__icontains=keyword)
+            # More candidates than needed, some are filtered out by access
+            fused, report = self.retrieval.retrieve(query, user, max_results * 2)
+            for name, outcome in report.items():
+                ai_metrics.record_prediction_request(
+                    'chatbot_retrieval', name, outcome['status'] == 'ok', outcome['duration']
                 )
+            if not fused:
+                return []
             
-            # Execute search
-            documents = KnowledgeDocument.objects.filter(
-                q_objects,
+            # One query for the documents of every strategy, access included
+            documents = KnowledgeDocument.objects.accessible_to(user).filter(
                 status='published'
-            ).distinct()[:max_results * 2]  # Get more to filter by access
-            
-            results = []
-            for doc in documents:
-                if self._user_can_access_document(user, doc):
-                    relevance_score = self._calculate_keyword_relevance(query, doc)
-                    if relevance_score > 0.1:  # Minimum relevance threshold
-                        results.append({
-                            'document': doc,
-                            'similarity_score': relevance_score,
-                            'snippet': self._extract_snippet(query, doc),
-                            'method': 'keyword'
-                        })
+            ).select_related('category').in_bulk([hit.document_id for hit in fused])
+            
+            relevant_docs = []
+            for hit in fused:
+                doc = documents.get(hit.document_id)
+                if doc is None:
+                    continue
+                method, best = next(iter(hit.hits.items()))
+                # Snippet of the first strategy in priority order that has one
+                snippet = next(
+                    (hit.hits[name]['snippet'] for name in self.retrieval_priority
+                     if hit.hits.get(name, {}).get('snippet')),
+                    None
+                )
+                doc_data = {
+                    'document': doc,
+                    'similarity_score': best.get('similarity_score', 0.0),
+                    'snippet': snippet if snippet is not None else self._extract_snippet(query, doc),
+                    'method': method,
+                    'methods': list(hit.hits),
+                    'fusion_score': hit.score
+                }
+                if 'keyword' in hit.hits:
+                    doc_data['highlighted_snippet'] = hit.hits['keyword']['highlighted_snippet']
+                relevant_docs.append(doc_data)
                 
-                if len(results) >= max_results:
+                if len(relevant_docs) >= max_results:
                     break
             
-            return results
+            return relevant_docs
             
         except Exception as e:
-            logger.error(f"Keyword search failed: {e}")
+            logger.error(f"Document retrieval failed: {e}")
             return []
     
+    def _semantic_search(self, query: str, user: User, max_results: int) -> List[Dict[str, Any]]:
+        """Semantic search of KnowledgeAI"""
+        return [
+            {
+                'document_id': doc_data['document_id'],
+                'similarity_score': doc_data.get('similarity_score', 0.0),
+                'snippet': doc_data.get('snippet', '')
+            }
+            for doc_data in self.knowledge_ai.search_documents(query, max_results=max_results)
+            if 'document_id' in doc_data
+        ]
+    
+    def _keyword_search(self, query: str, user: User, max_results: int) -> List[Dict[str, Any]]:
+        """BM25 search in the full-text index of the published documents"""
+        return [
+            {
+                'document_id': hit.object_id,
+                'similarity_score': hit.score,
+                'snippet': search_index.strip_highlight(hit.snippet),
+                'highlighted_snippet': hit.snippet
+            }
+            for hit in search_index.search(search_index.DOCUMENT, query, max_results)
+        ]
+    
     def _embedding_search(self, query: str, user: User, max_results: int) -> List[Dict[str, Any]]:
         """Embedding-based semantic search"""
-        try:
-            if not self.embedding_model:
-                return []
-            
-            # Get query embedding
-            query_embedding = self.embedding_model.encode([query])
-            
-            # Get all accessible documents
-            documents = KnowledgeDocument.objects.filter(
+        # Get query embedding
+        query_embedding = self.embedding_model.encode([query])
+        
+        # Accessible documents only, as plain values
+        documents = list(
+            KnowledgeDocument.objects.accessible_to(user).filter(
                 status='published'
-            )[:100]  # Limit for performance
-            
-            results = []
-            doc_texts = []
-            valid_docs = []
-            
-            for doc in documents:
-                if self._user_can_access_document(user, doc):
-                    # Combine title, description, and content for embedding
-                    doc_text = f"{doc.title} {doc.description or ''} {doc.content[:500]}"
-                    doc_texts.append(doc_text)
-                    valid_docs.append(doc)
-            
-            if not doc_texts:
-                return []
-            
-            # Get document embeddings
-            doc_embeddings = self.embedding_model.encode(doc_texts)
-            
-            # Calculate similarities
-            similarities = cosine_similarity(query_embedding, doc_embeddings)[0]
-            
-            # Create results with similarity scores
-            for i, (doc, similarity) in enumerate(zip(valid_docs, similarities)):
-                if similarity > self.similarity_threshold:
-                    results.append({
-                        'document': doc,
-                        'similarity_score': float(similarity),
-                        'snippet': self._extract_snippet(query, doc),
-                        'method': 'embedding'
-                    })
-            
-            # Sort by similarity and return top results
-            results.sort(key=lambda x: x['similarity_score'], reverse=True)
-            return results[:max_results]
-            
-        except Exception as e:
-            logger.error(f"Embedding search failed: {e}")
+            ).values_list('id', 'title', 'description', 'content')[:100]  # Limit for performance
+        )
+        if not documents:
             return []
-    
-    def _user_can_access_document(self, user: User, document: KnowledgeDocument) -> bool:
-        """Check if user can access the document"""
-        try:
-            # Public documents are accessible to all
-            if document.is_public:
-                return True
-            
-            # Check if user is the author
-            if hasattr(document, 'author') and document.author == user:
-                return True
-            
-            # Check department access
-            if hasattr(user, 'employee_get') and hasattr(document, 'departments'):
-                user_department = getattr(user.employee_get, 'employee_work_info', None)
-                if user_department and hasattr(user_department, 'department'):
-                    if document.departments.filter(id=user_department.department.id).exists():
-                        return True
-            
-            # Default to accessible for now (can be customized based on requirements)
-            return True
-            
-        except Exception as e:
-            logger.warning(f"Access check failed for document {document.id}: {e}")
-            return True  # Default to accessible on error
-    
-    def _calculate_keyword_relevance(self, query: str, document: KnowledgeDocument) -> float:
-        """Calculate relevance score based on keyword matching"""
-        try:
-            query_words = set(query.lower().split())
-            
-            # Get document text
-            doc_text = f"{document.title} {document.description or ''} {document.content}".lower()
-            doc_words = set(doc_text.split())
-            
-            # Calculate Jaccard similarity
-            intersection = len(query_words.intersection(doc_words))
-            union = len(query_words.union(doc_words))
-            
-            if union == 0:
-                return 0.0
-            
-            jaccard_score = intersection / union
-            
-            # Boost score if keywords appear in title
-            title_boost = 0.0
-            title_words = set(document.title.lower().split())
-            title_matches = len(query_words.intersection(title_words))
-            if title_matches > 0:
-                title_boost = 0.3 * (title_matches / len(query_words))
-            
-            return min(jaccard_score + title_boost, 1.0)
-            
-        except Exception as e:
-            logger.warning(f"Relevance calculation failed: {e}")
-            return 0.0
+        
+        # Combine title, description, and content for embedding
+        doc_texts = [f"{title} {description or ''} {content[:500]}" for _, title, description, content in documents]
+        doc_embeddings = self.embedding_model.encode(doc_texts)
+        
+        # Calculate similarities
+        similarities = cosine_similarity(query_embedding, doc_embeddings)[0]
+        
+        results = [
+            {'document_id': doc_id, 'similarity_score': float(similarity), 'snippet': ''}
+            for (doc_id, _, _, _), similarity in zip(documents, similarities)
+            if similarity > self.similarity_threshold
+        ]
+        
+        # Sort by similarity and return top results
+        results.sort(key=lambda x: x['similarity_score'], reverse=True)
+        return results[:max_results]
     
     def _extract_snippet(self, query: str, document: KnowledgeDocument, max_length: int = 200) -> str:
         """Extract relevant snippet from document"""
         try:
-            content = document.content or ''
-            query_words = query.lower().split()
-            
-            # Find the best position to extract snippet
-            best_pos = 0
-            best_score = 0
-            
-            # Check different positions in the content
-            for i in range(0, len(content) - max_length, 50):
-                snippet = content[i:i + max_length].lower()
-                score = sum(1 for word in query_words if word in snippet)
-                
-                if score > best_score:
-                    best_score = score
-                    best_pos = i
-            
-            # Extract snippet
-            snippet = content[best_pos:best_pos + max_length]
-            
-            # Clean up snippet
-            if best_pos > 0:
-                snippet = '...' + snippet
-            if best_pos + max_length < len(content):
-                snippet = snippet + '...'
-            
-            return snippet.strip()
-            
+            return snippets.extract_snippet(document, query, max_length)
         except Exception as e:
             logger.warning(f"Snippet extraction failed: {e}")
             return document.description or document.title
     
+    def answer_query(self, query: str, user: User, conversation: ChatbotConversation,
+                     max_results: int = 5) -> Dict[str, Any]:
+        """
+        Jawab pertanyaan dari cache semantik jika ada pertanyaan serupa yang sudah
+        dijawab dari dokumen yang belum berubah, jika tidak retrieve dokumen dan
+        generate jawaban. Hasil generate_response ditambah 'relevant_docs',
+        'retrieval_time' dan 'cache_hit'.
+        
+        Jawaban dari percakapan yang punya riwayat dibentuk oleh riwayat itu,
+        jadi tidak diambil dari maupun disimpan ke cache yang dipakai bersama.
+        """
+        start_time = time.time()
+        embedding = None
+        if not self._has_history(query, conversation):
+            embedding = self._query_embedding(query)
+        scope = 'id' if self._detect_indonesian(query) else 'en'
+        
+        if embedding is not None:
+            cached = self._cached_answer(embedding, scope, user)
+            if cached is not None:
+                cached['processing_time'] = time.time() - start_time
+                return cached
+        
+        relevant_docs = self.retrieve_relevant_documents(query, user, max_results)
+        retrieval_time = time.time() - start_time
+        
+        response_data = self.generate_response(query, relevant_docs, conversation)
+        response_data.update({
+            'relevant_docs': relevant_docs,
+            'retrieval_time': retrieval_time,
+            'cache_hit': False,
+        })
+        
+        # Jawaban tanpa dokumen sumber tidak bisa di-invalidate oleh perubahan dokumen
+        if embedding is not None and response_data['success'] and relevant_docs:
+            self._cache_answer(embedding, scope, response_data, relevant_docs)
+        
+        return response_data
+    
+    def _recent_messages(self, conversation: ChatbotConversation) -> List[Tuple[str, str]]:
+        """Recent conversation history from the in-memory window (limited for SLM)"""
+        return chat_sessions.get(conversation).window(
+            5, max_age=timezone.timedelta(minutes=30)
+        )
+    
+    def _has_history(self, query: str, conversation: ChatbotConversation) -> bool:
+        """Whether the prompt will carry messages other than the query itself"""
+        messages = self._recent_messages(conversation)
+        if messages and messages[-1] == ('user', query):
+            messages = messages[:-1]
+        return bool(messages)
+    
+    def _query_embedding(self, query: str) -> Optional[np.ndarray]:
+        if not self.answer_cache or not self.embedding_model:
+            return None
+        try:
+            return self.embedding_model.encode([query])[0]
+        except Exception as e:
+            logger.warning(f"Query embedding failed: {e}")
+            return None
+    
+    def _cached_answer(self, embedding: np.ndarray, scope: str, user: User) -> Optional[Dict[str, Any]]:
+        """Cached answer whose source documents are unchanged and accessible"""
+        start_time = time.time()
+        found = self.answer_cache.lookup(embedding, scope)
+        if found is None:
+            ai_metrics.record_cache_operation('answer_lookup', False, 'chatbot_slm', time.time() - start_time)
+            return None
+        slot, entry, similarity = found
+        
+        # One query for every source document, to check its version, the
+        # access of the user and reuse it
+        documents = KnowledgeDocument.objects.filter(status='published').annotate(
+            accessible=Exists(KnowledgeDocument.objects.accessible_to(user).filter(pk=OuterRef('pk')))
+        ).select_related('category').in_bulk([source['id'] for source in entry['sources']])
+        
+        for source in entry['sources']:
+            doc = documents.get(source['id'])
+            if doc is None or doc.updated_at.isoformat() != source['version']:
+                self.answer_cache.discard(slot, entry)
+                ai_metrics.record_cache_operation('answer_lookup', False, 'chatbot_slm', time.time() - start_time)
+                return None
+        
+        if not all(documents[source['id']].accessible for source in entry['sources']):
+            # still valid for the users who can read the documents
+            ai_metrics.record_cache_operation('answer_lookup', False, 'chatbot_slm', time.time() - start_time)
+            return None
+        
+        relevant_docs = []
+        for source in entry['sources']:
+            doc = documents[source['id']]
+            relevant_docs.append({
+                'document': doc,
+                'similarity_score': source['similarity_score'],
+                'snippet': source['snippet'],
+                'method': source['method'],
+            })
+        
+        ai_metrics.record_cache_operation('answer_lookup', True, 'chatbot_slm', time.time() - start_time)
+        response_data = dict(entry['response'])
+        response_data.update({
+            'referenced_documents': [doc_data['document'] for doc_data in relevant_docs],
+            'relevant_docs': relevant_docs,
+            'retrieval_time': 0.0,
+            'cache_hit': True,
+            'cache_similarity': similarity,
+        })
+        return response_data
+    
+    def _cache_answer(self, embedding: np.ndarray, scope: str, response_data: Dict[str, Any],
+                      relevant_docs: List[Dict[str, Any]]):
+        entry = {
+            'response': {
+                key: response_data[key]
+                for key in ('success', 'response', 'confidence_score', 'context_used', 'model_used', 'approach')
+                if key in response_data
+            },
+            'sources': [
+                {
+                    'id': doc_data['document'].id,
+                    'version': doc_data['document'].updated_at.isoformat(),
+                    'similarity_score': doc_data.get('similarity_score', 0.0),
+                    'snippet': doc_data.get('snippet', ''),
+                    'method': doc_data.get('method', 'unknown'),
+                }
+                for doc_data in relevant_docs
+            ],
+        }
+        self.answer_cache.store(embedding, scope, entry)
+    
     def generate_response(self, query: str, relevant_docs: List[Dict[str, Any]], 
                          conversation: ChatbotConversation) -> Dict[str, Any]:
         """Generate AI response using SLM and retrieved documents as context"""
@@ -442,15 +477,12 @@ class ChatbotSLMService:
     
     def _build_slm_prompt(self, query: str, context: str, conversation: ChatbotConversation) -> str:
         """Build prompt optimized for small language models"""
-        # Get recent conversation history (limited for SLM)
-        recent_messages = conversation.messages.filter(
-            created_at__gte=timezone.now() - timezone.timedelta(minutes=30)
-        ).order_by('created_at')[:5]  # Reduced for SLM
+        recent_messages = self._recent_messages(conversation)
         
         conversation_history = ""
-        for msg in recent_messages:
-            role = "User" if msg.sender == 'user' else "AI"
-            conversation_history += f"{role}: {msg.content[:100]}\n"  # Truncate for SLM
+        for sender, content in recent_messages:
+            role = "User" if sender == 'user' else "AI"
+            conversation_history += f"{role}: {content[:100]}\n"  # Truncate for SLM
         
         # Build concise prompt for SLM
         prompt = f"""Konteks: {context[:800]}  
@@ -823,8 +855,10 @@ Thank you for your understanding."""
             )
             
             # Update conversation last activity
+            previous_activity = conversation.last_activity
             conversation.last_activity = timezone.now()
             conversation.save()
+            chat_sessions.message_added(conversation, message, previous_activity)
             
             return message
             
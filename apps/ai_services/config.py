@@ -120,7 +120,8 @@ class AIConfig:
             'other'
         ],
         'CONFIDENCE_THRESHOLD': 0.75,
-        'BATCH_PROCESSING': True
+        'BATCH_PROCESSING': True,
+        'EXTRACTION_WORKERS': 4,  # processes extracting file content in a batch
     }
     
     # Intelligent Search Configuration
@@ -5,6 +5,9 @@ from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
 import logging
 import hashlib
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 try:
@@ -49,6 +52,132 @@ from .exceptions import PredictionError, ModelLoadError, ValidationError
 
 logger = logging.getLogger(__name__)
 
+
+def extract_document_content(file_path: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Extract text content dari berbagai format dokumen. Module level so it
+    can run in a process pool.
+    """
+    try:
+        file_path = Path(file_path)
+        file_ext = file_path.suffix.lower()
+
+        file_info = {
+            'name': file_path.name,
+            'extension': file_ext,
+            'size': file_path.stat().st_size if file_path.exists() else 0
+        }
+
+        content = ""
+
+        if file_ext == '.pdf':
+            content = _extract_pdf_content(file_path)
+        elif file_ext in ['.doc', '.docx']:
+            content = _extract_word_content(file_path)
+        elif file_ext == '.txt':
+            content = _extract_text_content(file_path)
+        elif file_ext in ['.jpg', '.jpeg', '.png', '.tiff', '.bmp']:
+            content = _extract_image_content(file_path)
+        else:
+            # Try to read as text
+            content = _extract_text_content(file_path)
+
+        return content, file_info
+
+    except Exception as e:
+        logger.error(f"Content extraction failed: {str(e)}")
+        return "", {'name': str(file_path), 'error': str(e)}
+
+
+def _extract_pdf_content(file_path: Path) -> str:
+    """
+    Extract text dari PDF files.
+    """
+    try:
+        if PyPDF2 is None:
+            raise ImportError("PyPDF2 not available")
+
+        content = ""
+        with open(file_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+
+            for page in pdf_reader.pages:
+                content += page.extract_text() + "\n"
+
+        return content.strip()
+
+    except Exception as e:
+        logger.error(f"PDF extraction failed: {str(e)}")
+        return ""
+
+
+def _extract_word_content(file_path: Path) -> str:
+    """
+    Extract text dari Word documents.
+    """
+    try:
+        if docx is None:
+            raise ImportError("python-docx not available")
+
+        if file_path.suffix.lower() == '.docx':
+            doc = docx.Document(file_path)
+            content = "\n".join([paragraph.text for paragraph in doc.paragraphs])
+            return content
+        else:
+            # For .doc files, try to read as text (limited support)
+            return _extract_text_content(file_path)
+
+    except Exception as e:
+        logger.error(f"Word document extraction failed: {str(e)}")
+        return ""
+
+
+def _extract_text_content(file_path: Path) -> str:
+    """
+    Extract text dari plain text files.
+    """
+    try:
+        # Try different encodings
+        encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
+
+        for encoding in encodings:
+            try:
+                with open(file_path, 'r', encoding=encoding) as file:
+                    return file.read()
+            except UnicodeDecodeError:
+                continue
+
+        # If all encodings fail, read as binary and decode with errors='ignore'
+        with open(file_path, 'rb') as file:
+            return file.read().decode('utf-8', errors='ignore')
+
+    except Exception as e:
+        logger.error(f"Text extraction failed: {str(e)}")
+        return ""
+
+
+def _extract_image_content(file_path: Path) -> str:
+    """
+    Extract text dari images menggunakan OCR.
+    """
+    try:
+        if Image is None or pytesseract is None:
+            logger.warning("PIL or pytesseract not available for OCR")
+            return ""
+
+        # Open image
+        image = Image.open(file_path)
+
+        # Perform OCR
+        content = pytesseract.image_to_string(image)
+
+        return content.strip()
+
+    except Exception as e:
+        logger.error(f"OCR extraction failed: {str(e)}")
+        return ""
+
+
 class DocumentClassifierService(BaseAIService):
     """
     AI Service untuk Document Classification dengan akurasi tinggi.
@@ -66,6 +195,8 @@ class DocumentClassifierService(BaseAIService):
         self.classification_pipeline = None
         self.embedding_model = None
         self.traditional_classifier = None
+        # (embedding model, category names, normalized embeddings)
+        self._category_embedding_cache = None
         
         # Document categories dengan detailed descriptions
         self.document_categories = {
@@ -223,6 +354,7 @@ class DocumentClassifierService(BaseAIService):
             logger.info(f"Loading embedding model: {embedding_model_name}")
             
             self.embedding_model = SentenceTransformer(embedding_model_name)
+            self._category_embeddings()
             
             logger.info("Embedding model loaded successfully")
             
@@ -344,282 +476,204 @@ class DocumentClassifierService(BaseAIService):
             if not content:
                 return {'error': 'Could not extract document content'}
             
-            # Perform classification menggunakan multiple methods
-            results = {
+            return self._classify_contents([(content, file_info)], classification_methods)[0]
+            
+        except Exception as e:
+            raise PredictionError(f"Document classification failed: {str(e)}", self.model_name, input_data)
+    
+    def _classify_contents(self, items: List[Tuple[str, Dict[str, Any]]],
+                           classification_methods: List[str]) -> List[Dict[str, Any]]:
+        """
+        Classify a batch of (content, file_info); every model runs once on the whole batch.
+        """
+        contents = [content for content, _ in items]
+        batch_results = [
+            {
                 'document_info': file_info,
                 'content_preview': content[:200] + '...' if len(content) > 200 else content,
                 'content_length': len(content),
                 'word_count': len(content.split())
             }
-            
+            for content, file_info in items
+        ]
+        
+        def enabled(method):
+            return 'all' in classification_methods or method in classification_methods
+        
+        batch_methods = [
             # Method 1: Transformer-based classification
-            if ('all' in classification_methods or 'transformer' in classification_methods) and self.classification_pipeline:
-                transformer_result = self._classify_with_transformer(content)
-                results['transformer_classification'] = transformer_result
-            
+            ('transformer', 'transformer_classification', self.classification_pipeline,
+             self._classify_batch_with_transformer),
             # Method 2: Embedding-based classification
-            if ('all' in classification_methods or 'embedding' in classification_methods) and self.embedding_model:
-                embedding_result = self._classify_with_embeddings(content)
-                results['embedding_classification'] = embedding_result
-            
+            ('embedding', 'embedding_classification', self.embedding_model,
+             self._classify_batch_with_embeddings),
             # Method 3: Traditional ML classification
-            if ('all' in classification_methods or 'traditional' in classification_methods) and self.traditional_classifier:
-                traditional_result = self._classify_with_traditional_ml(content)
-                results['traditional_classification'] = traditional_result
-            
+            ('traditional', 'traditional_classification', self.traditional_classifier,
+             self._classify_batch_with_traditional_ml),
+        ]
+        for method, result_key, model, classify in batch_methods:
+            if enabled(method) and model:
+                for results, method_result in zip(batch_results, classify(contents)):
+                    results[result_key] = method_result
+        
+        for results, (content, file_info) in zip(batch_results, items):
             # Method 4: Rule-based classification (always available)
-            if 'all' in classification_methods or 'rule_based' in classification_methods:
-                rule_based_result = self._classify_with_rules(content, file_info)
-                results['rule_based_classification'] = rule_based_result
+            if enabled('rule_based'):
+                results['rule_based_classification'] = self._classify_with_rules(content, file_info)
             
             # Ensemble classification (combine all methods)
-            ensemble_result = self._ensemble_classification(results)
-            results['final_classification'] = ensemble_result
+            results['final_classification'] = self._ensemble_classification(results)
             
             # Add confidence metrics
             results['classification_confidence'] = self._calculate_classification_confidence(results)
-            
-            return results
-            
-        except Exception as e:
-            raise PredictionError(f"Document classification failed: {str(e)}", self.model_name, input_data)
+        
+        return batch_results
     
     def _extract_document_content(self, file_path: str) -> Tuple[str, Dict[str, Any]]:
         """
         Extract text content dari berbagai format dokumen.
         """
-        try:
-            file_path = Path(file_path)
-            file_ext = file_path.suffix.lower()
-            
-            file_info = {
-                'name': file_path.name,
-                'extension': file_ext,
-                'size': file_path.stat().st_size if file_path.exists() else 0
-            }
-            
-            content = ""
-            
-            if file_ext == '.pdf':
-                content = self._extract_pdf_content(file_path)
-            elif file_ext in ['.doc', '.docx']:
-                content = self._extract_word_content(file_path)
-            elif file_ext == '.txt':
-                content = self._extract_text_content(file_path)
-            elif file_ext in ['.jpg', '.jpeg', '.png', '.tiff', '.bmp']:
-                content = self._extract_image_content(file_path)
-            else:
-                # Try to read as text
-                content = self._extract_text_content(file_path)
-            
-            return content, file_info
-            
-        except Exception as e:
-            logger.error(f"Content extraction failed: {str(e)}")
-            return "", {'name': str(file_path), 'error': str(e)}
-    
-    def _extract_pdf_content(self, file_path: Path) -> str:
-        """
-        Extract text dari PDF files.
-        """
-        try:
-            if PyPDF2 is None:
-                raise ImportError("PyPDF2 not available")
-            
-            content = ""
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                for page in pdf_reader.pages:
-                    content += page.extract_text() + "\n"
-            
-            return content.strip()
-            
-        except Exception as e:
-            logger.error(f"PDF extraction failed: {str(e)}")
-            return ""
+        return extract_document_content(file_path)
     
-    def _extract_word_content(self, file_path: Path) -> str:
+    def _extract_contents(self, file_paths: List[str]) -> List[Tuple[str, Dict[str, Any]]]:
         """
-        Extract text dari Word documents.
+        Extract content dari banyak file sekaligus, parallel di process pool
+        (parsing PDF/Word dan OCR terikat CPU dan GIL).
         """
-        try:
-            if docx is None:
-                raise ImportError("python-docx not available")
-            
-            if file_path.suffix.lower() == '.docx':
-                doc = docx.Document(file_path)
-                content = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-                return content
-            else:
-                # For .doc files, try to read as text (limited support)
-                return self._extract_text_content(file_path)
-                
-        except Exception as e:
-            logger.error(f"Word document extraction failed: {str(e)}")
-            return ""
+        workers = min(self.config.get('EXTRACTION_WORKERS', 4), len(file_paths))
+        if workers > 1:
+            try:
+                # spawn: a forked child would inherit the loaded models and their threads
+                context = multiprocessing.get_context('spawn')
+                with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                    return list(executor.map(extract_document_content, file_paths))
+            except Exception as e:
+                logger.warning(f"Parallel content extraction failed, extracting sequentially: {str(e)}")
+        return [extract_document_content(file_path) for file_path in file_paths]
     
-    def _extract_text_content(self, file_path: Path) -> str:
-        """
-        Extract text dari plain text files.
-        """
-        try:
-            # Try different encodings
-            encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-            
-            for encoding in encodings:
-                try:
-                    with open(file_path, 'r', encoding=encoding) as file:
-                        return file.read()
-                except UnicodeDecodeError:
-                    continue
-            
-            # If all encodings fail, read as binary and decode with errors='ignore'
-            with open(file_path, 'rb') as file:
-                return file.read().decode('utf-8', errors='ignore')
-                
-        except Exception as e:
-            logger.error(f"Text extraction failed: {str(e)}")
-            return ""
+    @staticmethod
+    def _format_scores(predictions: Dict[str, float], method: str) -> Dict[str, Any]:
+        top_category = max(predictions, key=predictions.get)
+        return {
+            'predicted_category': top_category,
+            'confidence': round(float(predictions[top_category]), 4),
+            'all_scores': {k: round(float(v), 4) for k, v in predictions.items()},
+            'method': method
+        }
     
-    def _extract_image_content(self, file_path: Path) -> str:
+    def _classify_with_transformer(self, content: str) -> Dict[str, Any]:
         """
-        Extract text dari images menggunakan OCR.
+        Classify document menggunakan transformer model.
         """
-        try:
-            if Image is None or pytesseract is None:
-                logger.warning("PIL or pytesseract not available for OCR")
-                return ""
-            
-            # Open image
-            image = Image.open(file_path)
-            
-            # Perform OCR
-            content = pytesseract.image_to_string(image)
-            
-            return content.strip()
-            
-        except Exception as e:
-            logger.error(f"OCR extraction failed: {str(e)}")
-            return ""
+        return self._classify_batch_with_transformer([content])[0]
     
-    def _classify_with_transformer(self, content: str) -> Dict[str, Any]:
+    def _classify_batch_with_transformer(self, contents: List[str]) -> List[Dict[str, Any]]:
         """
-        Classify document menggunakan transformer model.
+        Classify documents dengan satu pipeline call; the tokenizer pads the batch.
         """
         try:
             # Truncate content if too long
             max_length = 512
-            words = content.split()
-            if len(words) > max_length:
-                content = ' '.join(words[:max_length])
+            texts = [' '.join(content.split()[:max_length]) for content in contents]
             
             # Get predictions
-            results = self.classification_pipeline(content)
-            
-            # Process results
-            predictions = {}
-            for result in results[0]:  # First (and only) text result
-                label = result['label']
-                score = result['score']
-                predictions[label] = score
-            
-            # Get top prediction
-            top_category = max(predictions, key=predictions.get)
-            confidence = predictions[top_category]
-            
-            return {
-                'predicted_category': top_category,
-                'confidence': round(confidence, 4),
-                'all_scores': {k: round(v, 4) for k, v in predictions.items()},
-                'method': 'transformer'
-            }
+            outputs = self.classification_pipeline(
+                texts,
+                batch_size=self.config.get('BATCH_SIZE', 8),
+                truncation=True,
+                max_length=max_length
+            )
+            
+            return [
+                self._format_scores({result['label']: result['score'] for result in output}, 'transformer')
+                for output in outputs
+            ]
             
         except Exception as e:
             logger.error(f"Transformer classification failed: {str(e)}")
-            return {'error': str(e), 'method': 'transformer'}
+            return [{'error': str(e), 'method': 'transformer'} for _ in contents]
     
-    def _classify_with_embeddings(self, content: str) -> Dict[str, Any]:
+    def _category_embeddings(self) -> Tuple[List[str], Any]:
         """
-        Classify document menggunakan embedding similarity.
+        Normalized embeddings of the category descriptions, encoded once per embedding model.
         """
-        try:
-            # Create embeddings untuk document content
-            content_embedding = self.embedding_model.encode([content])
-            
-            # Create embeddings untuk category descriptions
-            category_descriptions = []
+        if self._category_embedding_cache is None or self._category_embedding_cache[0] is not self.embedding_model:
             category_names = []
-            
+            category_descriptions = []
             for category, config in self.document_categories.items():
                 if category != 'other':
-                    description = config['description'] + ' ' + ' '.join(config['keywords'])
-                    category_descriptions.append(description)
                     category_names.append(category)
+                    category_descriptions.append(config['description'] + ' ' + ' '.join(config['keywords']))
             
-            category_embeddings = self.embedding_model.encode(category_descriptions)
-            
-            # Calculate similarities
-            from sklearn.metrics.pairwise import cosine_similarity
-            similarities = cosine_similarity(content_embedding, category_embeddings)[0]
-            
-            # Create predictions
-            predictions = {}
-            for i, category in enumerate(category_names):
-                predictions[category] = similarities[i]
+            embeddings = np.asarray(self.embedding_model.encode(category_descriptions), dtype=np.float32)
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+            self._category_embedding_cache = (self.embedding_model, category_names, embeddings)
+        
+        _, category_names, embeddings = self._category_embedding_cache
+        return category_names, embeddings
+    
+    def _classify_with_embeddings(self, content: str) -> Dict[str, Any]:
+        """
+        Classify document menggunakan embedding similarity.
+        """
+        return self._classify_batch_with_embeddings([content])[0]
+    
+    def _classify_batch_with_embeddings(self, contents: List[str]) -> List[Dict[str, Any]]:
+        """
+        Classify documents dengan satu encode call terhadap category embeddings yang sudah di-cache.
+        """
+        try:
+            category_names, category_embeddings = self._category_embeddings()
             
-            # Add 'other' category dengan lower score
-            predictions['other'] = max(0, 1 - max(similarities))
+            content_embeddings = np.asarray(
+                self.embedding_model.encode(contents, batch_size=self.config.get('BATCH_SIZE', 32)),
+                dtype=np.float32
+            )
+            content_embeddings /= np.maximum(np.linalg.norm(content_embeddings, axis=1, keepdims=True), 1e-12)
             
-            # Get top prediction
-            top_category = max(predictions, key=predictions.get)
-            confidence = predictions[top_category]
+            # Cosine similarities of every document to every category
+            similarities = content_embeddings @ category_embeddings.T
             
-            return {
-                'predicted_category': top_category,
-                'confidence': round(confidence, 4),
-                'all_scores': {k: round(v, 4) for k, v in predictions.items()},
-                'method': 'embedding_similarity'
-            }
+            results = []
+            for row in similarities:
+                predictions = dict(zip(category_names, row))
+                # Add 'other' category dengan lower score
+                predictions['other'] = max(0.0, 1 - float(row.max()))
+                results.append(self._format_scores(predictions, 'embedding_similarity'))
+            return results
             
         except Exception as e:
             logger.error(f"Embedding classification failed: {str(e)}")
-            return {'error': str(e), 'method': 'embedding_similarity'}
+            return [{'error': str(e), 'method': 'embedding_similarity'} for _ in contents]
     
     def _classify_with_traditional_ml(self, content: str) -> Dict[str, Any]:
         """
         Classify document menggunakan traditional ML model.
         """
+        return self._classify_batch_with_traditional_ml([content])[0]
+    
+    def _classify_batch_with_traditional_ml(self, contents: List[str]) -> List[Dict[str, Any]]:
+        """
+        Classify documents dengan satu predict_proba call.
+        """
         try:
-            # Get prediction
-            prediction = self.traditional_classifier.predict([content])[0]
-            
-            # Get prediction probabilities
             try:
-                probabilities = self.traditional_classifier.predict_proba([content])[0]
+                probabilities = self.traditional_classifier.predict_proba(contents)
                 classes = self.traditional_classifier.classes_
-                
-                predictions = {}
-                for i, class_name in enumerate(classes):
-                    predictions[class_name] = probabilities[i]
-                
-                confidence = predictions[prediction]
-                
-            except:
+                return [
+                    self._format_scores(dict(zip(classes, row)), 'traditional_ml')
+                    for row in probabilities
+                ]
+            except AttributeError:
                 # If probabilities not available
-                predictions = {prediction: 1.0}
-                confidence = 1.0
-            
-            return {
-                'predicted_category': prediction,
-                'confidence': round(confidence, 4),
-                'all_scores': {k: round(v, 4) for k, v in predictions.items()},
-                'method': 'traditional_ml'
-            }
+                return [
+                    self._format_scores({prediction: 1.0}, 'traditional_ml')
+                    for prediction in self.traditional_classifier.predict(contents)
+                ]
             
         except Exception as e:
             logger.error(f"Traditional ML classification failed: {str(e)}")
-            return {'error': str(e), 'method': 'traditional_ml'}
+            return [{'error': str(e), 'method': 'traditional_ml'} for _ in contents]
     
     def _classify_with_rules(self, content: str, file_info: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -803,28 +857,65 @@ class DocumentClassifierService(BaseAIService):
     def batch_classify_documents(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
         Classify multiple documents dalam batch untuk efficiency.
+        
+        Cached results are reused; the remaining files are extracted in a
+        process pool and each model classifies the whole batch at once.
         """
         try:
-            results = []
-            batch_size = self.config.get('BATCH_SIZE', 8)
+            results = [None] * len(documents)
+            pending = []
             
-            for i in range(0, len(documents), batch_size):
-                batch_docs = documents[i:i + batch_size]
-                batch_results = []
-                
-                for doc in batch_docs:
-                    try:
-                        input_data = {'document': doc}
-                        result = self.safe_predict(input_data, use_cache=True)
-                        batch_results.append(result)
-                    except Exception as e:
-                        logger.error(f"Batch classification failed for document: {str(e)}")
-                        batch_results.append({
-                            'error': str(e),
-                            'document_info': doc
-                        })
+            for index, doc in enumerate(documents):
+                input_data = {'document': doc}
+                if not self.validate_input(input_data):
+                    results[index] = {'error': 'Invalid document', 'document_info': doc}
+                    continue
+                key = self.get_cache_key(input_data)
+                cached = self.prediction_cache.get(key)
+                if cached is not None:
+                    results[index] = cached
+                else:
+                    pending.append((index, doc, key))
+            
+            # Extract content dari files (parallel)
+            file_indexes = [i for i, (_, doc, _) in enumerate(pending) if 'content' not in doc]
+            extracted = dict(zip(
+                file_indexes,
+                self._extract_contents([pending[i][1]['file_path'] for i in file_indexes])
+            ))
+            
+            items = []
+            for position, (index, doc, key) in enumerate(pending):
+                if 'content' in doc:
+                    content = doc['content']
+                    file_info = {'name': doc.get('name', 'unknown'), 'size': len(content)}
+                else:
+                    content, file_info = extracted[position]
+                if content:
+                    items.append((index, key, content, file_info))
+                else:
+                    results[index] = {'error': 'Could not extract document content', 'document_info': doc}
+            
+            batch_size = self.config.get('BATCH_SIZE', 8)
+            for start in range(0, len(items), batch_size):
+                batch = items[start:start + batch_size]
+                batch_start = time.time()
+                try:
+                    classified = self._classify_contents(
+                        [(content, file_info) for _, _, content, file_info in batch], ['all']
+                    )
+                except Exception as e:
+                    logger.error(f"Batch classification failed: {str(e)}")
+                    for index, _, _, _ in batch:
+                        results[index] = {'error': str(e), 'document_info': documents[index]}
+                    continue
                 
-                results.extend(batch_results)
+                # same metadata as safe_predict, the batch time is shared by its documents
+                elapsed = (time.time() - batch_start) / len(batch)
+                for (index, key, _, _), result in zip(batch, classified):
+                    self._add_prediction_metadata(result, elapsed)
+                    self.prediction_cache.set(key, result)
+                    results[index] = result
             
             return results
             
@@ -10,10 +10,16 @@ Arsitektur AI Assistant untuk HR yang terintegrasi dengan semua modul HR:
 """
 
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any, Optional
 from datetime import datetime, date
+from django.conf import settings
+from django.db import connection
 from django.db.models import QuerySet
 
+from horilla.horilla_middlewares import _thread_locals
+from .hr_snapshot import HRSnapshotCache
+
 # Import models HR
 from employee.models import Employee, EmployeeWorkInformation
 from leave.models import LeaveRequest, LeaveType, AvailableLeave
@@ -133,17 +139,22 @@ class EmployeeDataProcessor(HRDataProcessor):
     def get_data_summary(self, employee_id: Optional[int] = None) -> Dict[str, Any]:
         """Get employee data summary"""
         if employee_id:
-            employee = Employee.objects.get(id=employee_id)
+            employee = Employee.objects.select_related(
+                'employee_work_info__department_id',
+                'employee_work_info__job_position_id',
+                'employee_work_info__reporting_manager_id',
+                'employee_work_info__employee_type_id'
+            ).get(id=employee_id)
             work_info = employee.employee_work_info
             
             return {
                 'name': f"{employee.employee_first_name} {employee.employee_last_name}",
                 'email': employee.email,
-                'department': work_info.department.department if work_info.department else None,
-                'position': work_info.job_position.job_position if work_info.job_position else None,
-                'manager': work_info.reporting_manager.get_full_name() if work_info.reporting_manager else None,
+                'department': work_info.department_id.department if work_info.department_id else None,
+                'position': work_info.job_position_id.job_position if work_info.job_position_id else None,
+                'manager': work_info.reporting_manager_id.get_full_name() if work_info.reporting_manager_id else None,
                 'join_date': work_info.date_joining,
-                'employee_type': work_info.employee_type.employee_type if work_info.employee_type else None
+                'employee_type': work_info.employee_type_id.employee_type if work_info.employee_type_id else None
             }
         else:
             # Company-wide summary
@@ -1112,32 +1123,25 @@ class PerformanceDataProcessor(HRDataProcessor):
             from datetime import datetime, timedelta
             
             if employee_id:
-                # Individual performance summary
-                total_objectives = EmployeeObjective.objects.filter(employee_id=employee_id).count()
-                completed_objectives = EmployeeObjective.objects.filter(
-                    employee_id=employee_id,
-                    status='completed'
-                ).count()
-                
-                in_progress_objectives = EmployeeObjective.objects.filter(
-                    employee_id=employee_id,
-                    status='in_progress'
-                ).count()
-                
-                # Get average progress
-                avg_progress = EmployeeObjective.objects.filter(
+                # Individual performance summary, one aggregate per table
+                objectives = EmployeeObjective.objects.filter(
                     employee_id=employee_id
-                ).aggregate(avg=models.Avg('progress'))['avg'] or 0
+                ).aggregate(
+                    total=models.Count('id'),
+                    completed=models.Count('id', filter=models.Q(status='completed')),
+                    in_progress=models.Count('id', filter=models.Q(status='in_progress')),
+                    avg_progress=models.Avg('progress')
+                )
+                total_objectives = objectives['total']
+                completed_objectives = objectives['completed']
                 
                 # Get key results summary
-                total_key_results = KeyResult.objects.filter(
+                key_results = KeyResult.objects.filter(
                     employee_objective__employee_id=employee_id
-                ).count()
-                
-                completed_key_results = KeyResult.objects.filter(
-                    employee_objective__employee_id=employee_id,
-                    status='completed'
-                ).count()
+                ).aggregate(
+                    total=models.Count('id'),
+                    completed=models.Count('id', filter=models.Q(status='completed'))
+                )
                 
                 # Get recent feedback count
                 recent_feedbacks = Feedback.objects.filter(
@@ -1148,11 +1152,11 @@ class PerformanceDataProcessor(HRDataProcessor):
                 return {
                     'total_objectives': total_objectives,
                     'completed_objectives': completed_objectives,
-                    'in_progress_objectives': in_progress_objectives,
+                    'in_progress_objectives': objectives['in_progress'],
                     'completion_rate': (completed_objectives / total_objectives * 100) if total_objectives > 0 else 0,
-                    'average_progress': float(avg_progress),
-                    'total_key_results': total_key_results,
-                    'completed_key_results': completed_key_results,
+                    'average_progress': float(objectives['avg_progress'] or 0),
+                    'total_key_results': key_results['total'],
+                    'completed_key_results': key_results['completed'],
                     'recent_feedbacks_count': recent_feedbacks
                 }
             else:
@@ -1340,33 +1344,26 @@ class PayrollDataProcessor(HRDataProcessor):
                     contract_status='active'
                 ).first()
                 
-                # Get this year's total earnings
+                # This year's paid earnings and the pending payslips in one query
                 current_year = datetime.now().year
-                year_payslips = Payslip.objects.filter(
-                    employee_id=employee_id,
-                    start_date__year=current_year,
-                    status='paid'
+                payslips = Payslip.objects.filter(employee_id=employee_id).aggregate(
+                    total_earnings=models.Sum(
+                        'net_pay',
+                        filter=models.Q(start_date__year=current_year, status='paid')
+                    ),
+                    pending=models.Count(
+                        'id', filter=models.Q(status__in=['draft', 'review_ongoing'])
+                    )
                 )
-                
-                total_earnings = year_payslips.aggregate(
-                    total=models.Sum('net_pay')
-                )['total'] or 0
-                
-                # Get pending payslips
-                pending_payslips = Payslip.objects.filter(
-                    employee_id=employee_id,
-                    status__in=['draft', 'review_ongoing']
-                ).count()
+                total_earnings = payslips['total_earnings'] or 0
+                pending_payslips = payslips['pending']
                 
                 # Get active loans
                 active_loans = LoanAccount.objects.filter(
                     employee_id=employee_id,
                     status='active'
-                )
-                
-                total_loan_balance = active_loans.aggregate(
-                    total=models.Sum('balance')
-                )['total'] or 0
+                ).aggregate(count=models.Count('id'), total=models.Sum('balance'))
+                total_loan_balance = active_loans['total'] or 0
                 
                 # Get pending reimbursements
                 pending_reimbursements = Reimbursement.objects.filter(
@@ -1392,7 +1389,7 @@ class PayrollDataProcessor(HRDataProcessor):
                         'year': current_year
                     },
                     'loans': {
-                        'active_count': active_loans.count(),
+                        'active_count': active_loans['count'],
                         'total_balance': float(total_loan_balance)
                     },
                     'reimbursements': {
@@ -1670,16 +1667,48 @@ class HRAssistantOrchestrator:
         """Get general HR summary from all processors"""
         summary = {
             'success': True,
-            'data': {
-                'employee_summary': self.processors['employee'].get_data_summary(employee_id),
-                'leave_summary': self.processors['leave'].get_data_summary(employee_id),
-                'performance_summary': self.processors['performance'].get_data_summary(employee_id),
-                'payroll_summary': self.processors['payroll'].get_data_summary(employee_id)
-            }
+            'data': HRSnapshotCache.get_or_build(
+                employee_id, lambda: self._build_hr_snapshot(employee_id)
+            )
         }
         
         return summary
     
+    def _build_hr_snapshot(self, employee_id: Optional[int] = None) -> Dict[str, Any]:
+        """Compute the four summaries, concurrently when outside a transaction"""
+        processors = {
+            'employee_summary': self.processors['employee'],
+            'leave_summary': self.processors['leave'],
+            'performance_summary': self.processors['performance'],
+            'payroll_summary': self.processors['payroll']
+        }
+        workers = getattr(settings, 'HR_SNAPSHOT_WORKERS', 4)
+        
+        # Other connections would not see the uncommitted rows of this one
+        if workers <= 1 or connection.in_atomic_block:
+            return {
+                name: processor.get_data_summary(employee_id)
+                for name, processor in processors.items()
+            }
+        
+        request = getattr(_thread_locals, 'request', None)
+        
+        def summarize(processor):
+            # the company manager filters on the request of the thread
+            _thread_locals.request = request
+            try:
+                return processor.get_data_summary(employee_id)
+            finally:
+                del _thread_locals.request
+                connection.close()
+        
+        with ThreadPoolExecutor(max_workers=min(workers, len(processors))) as executor:
+            futures = {
+                name: executor.submit(summarize, processor)
+                for name, processor in processors.items()
+            }
+            return {name: future.result() for name, future in futures.items()}
+    
     def get_hr_insights(self, employee_id: Optional[int] = None) -> Dict[str, Any]:
         """Generate HR insights and recommendations"""
         summary = self._get_general_hr_summary(employee_id)
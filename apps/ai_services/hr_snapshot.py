@@ -0,0 +1,188 @@
+"""
+Versioned per-employee snapshot of the HR summaries.
+
+The HR assistant answers general questions with the summaries of the
+employee, leave, performance and payroll processors. They are built once
+per employee and cached under a version number kept in the cache; any
+change to a leave request, payslip, objective, ... of the employee bumps
+the version (after the transaction commits), which makes the old snapshot
+unreachable without having to know its key. A snapshot built while a
+change is committed is stored under the old version and never served.
+"""
+
+import logging
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from horilla.horilla_middlewares import _thread_locals
+from horilla.signals import post_bulk_update, pre_bulk_update
+
+logger = logging.getLogger(__name__)
+
+COMPANY_WIDE = "all"
+
+# (app_label, model, lookup of the employee the row belongs to)
+SNAPSHOT_SOURCES = [
+    ("employee", "Employee", "id"),
+    ("employee", "EmployeeWorkInformation", "employee_id"),
+    ("leave", "LeaveRequest", "employee_id"),
+    ("leave", "AvailableLeave", "employee_id"),
+    ("pms", "EmployeeObjective", "employee_id"),
+    ("pms", "EmployeeKeyResult", "employee_objective_id__employee_id"),
+    ("pms", "Feedback", "employee_id"),
+    ("payroll", "Payslip", "employee_id"),
+    ("payroll", "Contract", "employee_id"),
+    ("payroll", "LoanAccount", "employee_id"),
+    ("payroll", "Reimbursement", "employee_id"),
+]
+
+
+def _selected_company():
+    request = getattr(_thread_locals, "request", None)
+    if request is None or not hasattr(request, "session"):
+        return COMPANY_WIDE
+    return request.session.get("selected_company") or COMPANY_WIDE
+
+
+class HRSnapshotCache:
+    """Cache of the HR summaries keyed by employee, company and version"""
+
+    VERSION_KEY = "hr_snapshot_version:{owner}"
+    SNAPSHOT_KEY = "hr_snapshot:{owner}:{company}:{version}"
+
+    @staticmethod
+    def timeout():
+        return getattr(settings, "HR_SNAPSHOT_TIMEOUT", 900)
+
+    @classmethod
+    def version(cls, employee_id=None):
+        """Current version of the employee (or company-wide) snapshot"""
+        key = cls.VERSION_KEY.format(owner=employee_id or COMPANY_WIDE)
+        version = cache.get(key)
+        if version is None:
+            # a fresh number, an evicted counter must not bring back
+            # snapshots stored under its earlier values
+            cache.add(key, int(time.time() * 1000), None)
+            version = cache.get(key)
+        return version
+
+    @classmethod
+    def key(cls, employee_id, version):
+        return cls.SNAPSHOT_KEY.format(
+            owner=employee_id or COMPANY_WIDE,
+            company=_selected_company(),
+            version=version,
+        )
+
+    @classmethod
+    def get_or_build(cls, employee_id, builder):
+        """Returns the cached snapshot or builds and caches it"""
+        version = cls.version(employee_id)
+        key = cls.key(employee_id, version)
+        snapshot = cache.get(key)
+        if snapshot is None:
+            snapshot = builder()
+            cache.set(key, snapshot, cls.timeout())
+        return snapshot
+
+    @classmethod
+    def invalidate(cls, employee_ids):
+        """Bumps the snapshot version of the employees and the company-wide one"""
+        owners = {employee_id for employee_id in employee_ids if employee_id}
+        owners.add(COMPANY_WIDE)
+        for owner in owners:
+            try:
+                cache.incr(cls.VERSION_KEY.format(owner=owner))
+            except ValueError:
+                # no version yet, the next read starts a new one
+                pass
+
+
+def _employee_of(instance, lookup):
+    """Follows ``lookup`` from ``instance`` without loading the employee"""
+    if lookup == "id":
+        return instance.pk
+    *path, field = lookup.split("__")
+    obj = instance
+    for name in path:
+        obj = getattr(obj, name, None)
+        if obj is None:
+            return None
+    # the column of the foreign key, e.g. employee_id_id for employee_id
+    return getattr(obj, obj._meta.get_field(field).attname, None)
+
+
+def _invalidate_on_commit(employee_ids):
+    employee_ids = set(employee_ids)
+    transaction.on_commit(lambda: HRSnapshotCache.invalidate(employee_ids))
+
+
+def _receivers(lookup):
+    def before_save(sender, instance, raw=False, **kwargs):
+        # a row can move to another employee
+        if raw or instance.pk is None:
+            return
+        instance._hr_snapshot_previous_employee = (
+            sender._base_manager.filter(pk=instance.pk)
+            .values_list(lookup, flat=True)
+            .first()
+        )
+
+    def after_change(sender, instance, raw=False, **kwargs):
+        if raw:
+            return
+        _invalidate_on_commit(
+            [
+                _employee_of(instance, lookup),
+                getattr(instance, "_hr_snapshot_previous_employee", None),
+            ]
+        )
+
+    def before_bulk_update(sender, queryset, **kwargs):
+        queryset._hr_snapshot_employees = list(
+            sender._base_manager.filter(pk__in=queryset.values("pk")).values_list(
+                lookup, flat=True
+            )
+        )
+
+    def after_bulk_update(sender, queryset, **kwargs):
+        _invalidate_on_commit(getattr(queryset, "_hr_snapshot_employees", []))
+
+    return before_save, after_change, before_bulk_update, after_bulk_update
+
+
+def connect_signals():
+    """Connects the snapshot invalidation to the models of the installed apps"""
+    from django.db.models.signals import post_delete, post_save, pre_save
+
+    for app_label, model_name, lookup in SNAPSHOT_SOURCES:
+        if not apps.is_installed(app_label):
+            continue
+        model = apps.get_model(app_label, model_name)
+        before_save, after_change, before_bulk, after_bulk = _receivers(lookup)
+        uid = f"hr_snapshot_{app_label}_{model_name}"
+        pre_save.connect(
+            before_save, sender=model, weak=False, dispatch_uid=f"{uid}_pre_save"
+        )
+        post_save.connect(
+            after_change, sender=model, weak=False, dispatch_uid=f"{uid}_post_save"
+        )
+        post_delete.connect(
+            after_change, sender=model, weak=False, dispatch_uid=f"{uid}_post_delete"
+        )
+        pre_bulk_update.connect(
+            before_bulk,
+            sender=model,
+            weak=False,
+            dispatch_uid=f"{uid}_pre_bulk_update",
+        )
+        post_bulk_update.connect(
+            after_bulk,
+            sender=model,
+            weak=False,
+            dispatch_uid=f"{uid}_post_bulk_update",
+        )
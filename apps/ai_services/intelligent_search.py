@@ -45,6 +45,7 @@ from django.core.cache import cache
 
 from .base import BaseAIService
 from .config import AIConfig
+from .warmup import ArtifactStore
 from .exceptions import PredictionError, ModelLoadError, ValidationError
 
 logger = logging.getLogger(__name__)
@@ -247,6 +248,11 @@ class IntelligentSearchService(BaseAIService):
         Build search indices untuk all searchable models.
         """
         try:
+            store = ArtifactStore(self.model_name)
+            fingerprint = self._index_fingerprint()
+            if self._restore_search_indices(store, fingerprint):
+                return
+            
             logger.info("Building search indices...")
             
             all_documents = []
@@ -289,9 +295,64 @@ class IntelligentSearchService(BaseAIService):
             
             logger.info(f"Search indices built successfully with {len(all_documents)} total documents")
             
+            # Simpan artifacts supaya restart berikutnya tidak perlu encode ulang
+            store.save('search_indices', fingerprint, {
+                'document_metadata': self.document_metadata,
+                'embeddings': np.array(all_embeddings).astype('float32') if all_embeddings and np is not None else None,
+                'tfidf_vectorizer': self.tfidf_vectorizer if all_documents else None,
+            })
+            
         except Exception as e:
             logger.error(f"Failed to build search indices: {str(e)}")
     
+    def _index_fingerprint(self) -> str:
+        """
+        Fingerprint dari data yang di-index: jumlah, max pk dan last update per model.
+        """
+        parts = [self.config.get('EMBEDDING_MODEL', 'all-MiniLM-L6-v2'),
+                 self.embedding_model is not None,
+                 self.config.get('MAX_DOCUMENTS_PER_MODEL', 1000)]
+        for model_key, model_config in sorted(self.searchable_models.items()):
+            try:
+                app_label, model_name = model_config['model'].split('.')
+                model_class = apps.get_model(app_label, model_name)
+                aggregates = {'count': models.Count('pk'), 'max_pk': models.Max('pk')}
+                field_names = {field.name for field in model_class._meta.get_fields()}
+                for field_name in ('updated_at', 'modified_at'):
+                    if field_name in field_names:
+                        aggregates['updated'] = models.Max(field_name)
+                        break
+                values = model_class.objects.aggregate(**aggregates)
+                parts.append((model_key, sorted((k, str(v)) for k, v in values.items())))
+            except Exception:
+                parts.append((model_key, None))
+        return ArtifactStore.fingerprint(*parts)
+    
+    def _restore_search_indices(self, store: 'ArtifactStore', fingerprint: str) -> bool:
+        """
+        Load search indices yang sudah di-build sebelumnya jika datanya belum berubah.
+        """
+        artifacts = store.load('search_indices', fingerprint)
+        if not artifacts:
+            return False
+        
+        self.document_metadata = artifacts['document_metadata']
+        
+        embeddings = artifacts.get('embeddings')
+        if embeddings is not None and len(embeddings) and self.vector_index is not None:
+            if embeddings.shape[1] != self.vector_index.d:
+                return False
+            embeddings = embeddings.copy()
+            faiss.normalize_L2(embeddings)
+            self.vector_index.reset()
+            self.vector_index.add(embeddings)
+        
+        if artifacts.get('tfidf_vectorizer') is not None and self.tfidf_vectorizer is not None:
+            self.tfidf_vectorizer = artifacts['tfidf_vectorizer']
+        
+        logger.info(f"Search indices loaded from artifacts with {len(self.document_metadata)} documents")
+        return True
+    
     def _extract_model_documents(self, model_key: str, model_config: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
         Extract searchable documents dari Django model.
@@ -0,0 +1,67 @@
+import time
+
+import torch
+from django.core.management.base import BaseCommand
+
+from ai_services.slm_runtime import ModelRuntime
+from ai_services.slm_service import SLMService
+
+PROMPTS = [
+    "Kebijakan cuti tahunan karyawan adalah",
+    "The reimbursement process for business travel starts with",
+    "Prosedur pengajuan lembur melalui sistem HRIS",
+    "Employees on probation are evaluated by their manager",
+    "Tunjangan kesehatan karyawan mencakup",
+    "To request a new laptop, an employee should",
+    "Jadwal penggajian bulanan dilakukan pada",
+    "Performance reviews are held twice a year and",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure SLM generation throughput on CPU in tokens/second: one prompt per '
+        'generate call (the previous behaviour) against batched calls, with and '
+        'without int8 dynamic quantization (it applies to Linear layers, try --model t5-small)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default='gpt2', help='Model key (default: gpt2)')
+        parser.add_argument('--prompts', type=int, default=8, help='Prompts per run')
+        parser.add_argument('--max-length', type=int, default=64, help='Maximum length of a generation')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs of every mode')
+
+    def run(self, service, prompts, max_length, repeat, batched):
+        # Warm up the model outside of the measurement
+        service.generate_text(prompts[0], self.model_key, max_length)
+        tokens = 0
+        started = time.perf_counter()
+        for _ in range(repeat):
+            if batched:
+                results = service.generate_texts(prompts, self.model_key, max_length)
+            else:
+                results = [service.generate_text(prompt, self.model_key, max_length) for prompt in prompts]
+            tokens += sum(result.get('tokens_generated', 0) for result in results)
+        elapsed = time.perf_counter() - started
+        return tokens, elapsed
+
+    def handle(self, *args, **options):
+        self.model_key = options['model']
+        prompts = [PROMPTS[i % len(PROMPTS)] for i in range(options['prompts'])]
+
+        self.stdout.write(f"{'mode':<24} {'tokens':>8} {'seconds':>9} {'tokens/s':>9}")
+        baseline = None
+        for name, quantize, batched in [
+            ('sequential fp32', False, False),
+            ('batched fp32', False, True),
+            ('batched int8', True, True),
+        ]:
+            service = SLMService(ModelRuntime(max_models=1, quantize=quantize, device=torch.device('cpu')))
+            # Greedy decoding, so every mode generates comparable lengths
+            service.config['do_sample'] = False
+            tokens, elapsed = self.run(service, prompts, options['max_length'], options['repeat'], batched)
+            rate = tokens / elapsed if elapsed else 0.0
+            baseline = baseline or rate
+            speedup = f"  ({rate / baseline:.1f}x)" if baseline else ''
+            self.stdout.write(f"{name:<24} {tokens:>8} {elapsed:>9.2f} {rate:>9.1f}{speedup}")
+            service.clear_cache()
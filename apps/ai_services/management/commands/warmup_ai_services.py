@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from ai_services.warmup import SERVICE_TYPES, warmup
+
+
+class Command(BaseCommand):
+    help = (
+        'Initialize the AI services in parallel and persist their built artifacts, '
+        'so the web workers start from warm indexes (run it after deploys)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'services',
+            nargs='*',
+            help=f"Services to warm up (default: all of {', '.join(SERVICE_TYPES)})",
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Number of services initialized at the same time',
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options['services']) - set(SERVICE_TYPES)
+        if unknown:
+            raise CommandError(f"Unknown services: {', '.join(sorted(unknown))}")
+
+        result = warmup(options['services'] or SERVICE_TYPES, max_workers=options['workers'])
+
+        for service_type, status in result['services'].items():
+            if status['state'] == 'ready':
+                self.stdout.write(self.style.SUCCESS(
+                    f"{service_type:<22} ready in {status['duration']:.2f}s"
+                ))
+            elif status['state'] == 'failed':
+                self.stdout.write(self.style.ERROR(
+                    f"{service_type:<22} failed: {status.get('error')}"
+                ))
+
+        if result['status'] == 'degraded':
+            raise CommandError('Some AI services failed to initialize')
@@ -3,55 +3,55 @@ import psutil
 import threading
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
-from collections import defaultdict, deque
+from collections import defaultdict
 from django.core.cache import cache
 from django.conf import settings
 from django.db import connection
 import logging
 import json
 
+from .metrics_store import BUCKETS, COUNTER, GAUGE, HISTOGRAM, MetricsStore
+
 logger = logging.getLogger(__name__)
 
 class MetricsCollector:
     """
     Comprehensive metrics collector for AI services
     Compatible with Prometheus, Grafana, and other monitoring systems
+    
+    The series live in a MetricsStore (fixed histogram buckets, ring buffers
+    and per minute/hour rollups), merged across worker processes when
+    AI_METRICS_MULTIPROCESS_DIR is set.
     """
     
-    def __init__(self):
-        self.metrics = defaultdict(lambda: defaultdict(list))
-        self.counters = defaultdict(int)
-        self.gauges = defaultdict(float)
-        self.histograms = defaultdict(lambda: deque(maxlen=1000))
+    QUANTILES = (0.5, 0.9, 0.95, 0.99)
+    
+    def __init__(self, multiprocess_dir: str = None):
+        if multiprocess_dir is None:
+            multiprocess_dir = getattr(settings, 'AI_METRICS_MULTIPROCESS_DIR', None)
+        self.store = MetricsStore(
+            multiprocess_dir,
+            flush_interval=getattr(settings, 'AI_METRICS_FLUSH_INTERVAL', 5),
+        )
         self.start_time = time.time()
-        self.lock = threading.Lock()
         
     def increment_counter(self, name: str, value: int = 1, labels: Dict[str, str] = None):
         """
         Increment a counter metric
         """
-        with self.lock:
-            key = self._build_key(name, labels)
-            self.counters[key] += value
+        self.store.increment(name, value, labels)
             
     def set_gauge(self, name: str, value: float, labels: Dict[str, str] = None):
         """
         Set a gauge metric
         """
-        with self.lock:
-            key = self._build_key(name, labels)
-            self.gauges[key] = value
+        self.store.set(name, value, labels)
             
     def observe_histogram(self, name: str, value: float, labels: Dict[str, str] = None):
         """
         Add observation to histogram
         """
-        with self.lock:
-            key = self._build_key(name, labels)
-            self.histograms[key].append({
-                'value': value,
-                'timestamp': time.time()
-            })
+        self.store.observe(name, value, labels)
             
     def _build_key(self, name: str, labels: Dict[str, str] = None) -> str:
         """
@@ -62,37 +62,52 @@ class MetricsCollector:
         
         label_str = ','.join([f'{k}={v}' for k, v in sorted(labels.items())])
         return f'{name}{{{label_str}}}'
+    
+    @staticmethod
+    def _prometheus_labels(labels, extra: Dict[str, str] = None) -> str:
+        pairs = list(labels) + sorted((extra or {}).items())
+        if not pairs:
+            return ''
+        escaped = [
+            (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for k, v in pairs
+        ]
+        return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
         
     def get_prometheus_metrics(self) -> str:
         """
         Export metrics in Prometheus format
         """
         lines = []
+        series_by_name = defaultdict(list)
+        for series in self.store.collect():
+            series_by_name[(series.name, series.kind)].append(series)
         
-        # Counters
-        for key, value in self.counters.items():
-            lines.append(f'# TYPE {key.split("{")[0]} counter')
-            lines.append(f'{key} {value}')
-            
-        # Gauges
-        for key, value in self.gauges.items():
-            lines.append(f'# TYPE {key.split("{")[0]} gauge')
-            lines.append(f'{key} {value}')
-            
-        # Histograms
-        for key, observations in self.histograms.items():
-            if observations:
-                values = [obs['value'] for obs in observations]
-                lines.append(f'# TYPE {key.split("{")[0]} histogram')
-                lines.append(f'{key}_count {len(values)}')
-                lines.append(f'{key}_sum {sum(values)}')
+        for (name, kind), all_series in sorted(series_by_name.items()):
+            lines.append(f'# TYPE {name} {kind}')
+            for series in all_series:
+                if kind != HISTOGRAM:
+                    lines.append(f'{name}{self._prometheus_labels(series.labels)} {series.value}')
+                    continue
                 
-                # Calculate percentiles
-                sorted_values = sorted(values)
-                for percentile in [0.5, 0.9, 0.95, 0.99]:
-                    idx = int(len(sorted_values) * percentile)
-                    if idx < len(sorted_values):
-                        lines.append(f'{key}_bucket{{le="{percentile}"}} {sorted_values[idx]}')
+                cumulative = 0
+                for bound, count in zip(BUCKETS, series.buckets):
+                    cumulative += int(count)
+                    labels = self._prometheus_labels(series.labels, {'le': f'{bound:g}'})
+                    lines.append(f'{name}_bucket{labels} {cumulative}')
+                labels = self._prometheus_labels(series.labels, {'le': '+Inf'})
+                lines.append(f'{name}_bucket{labels} {series.count}')
+                lines.append(f'{name}_sum{self._prometheus_labels(series.labels)} {series.sum}')
+                lines.append(f'{name}_count{self._prometheus_labels(series.labels)} {series.count}')
+                        
+        # Per URL request profiles (only when QUERY_PROFILER_ENABLED)
+        try:
+            from base.query_profiler import get_query_profiler
+            profiler = get_query_profiler()
+            if profiler is not None:
+                lines.extend(profiler.get_prometheus_lines())
+        except Exception as e:
+            logger.error(f"Error exporting request profiles: {e}")
                         
         return '\n'.join(lines)
         
@@ -100,46 +115,80 @@ class MetricsCollector:
         """
         Export metrics in JSON format
         """
-        with self.lock:
-            return {
-                'counters': dict(self.counters),
-                'gauges': dict(self.gauges),
-                'histograms': {
-                    key: {
-                        'count': len(observations),
-                        'values': [obs['value'] for obs in observations[-100:]]  # Last 100 values
-                    }
-                    for key, observations in self.histograms.items()
-                },
-                'timestamp': datetime.now().isoformat(),
-                'uptime': time.time() - self.start_time
-            }
+        counters, gauges, histograms = {}, {}, {}
+        for series in self.store.collect():
+            key = self._build_key(series.name, dict(series.labels))
+            if series.kind == COUNTER:
+                counters[key] = series.value
+            elif series.kind == GAUGE:
+                gauges[key] = series.value
+            else:
+                histograms[key] = {
+                    'count': series.count,
+                    'sum': series.sum,
+                    'quantiles': {str(q): series.quantile(q) for q in self.QUANTILES},
+                    'values': series.recent_values(100).tolist()  # Last 100 values
+                }
+        return {
+            'counters': counters,
+            'gauges': gauges,
+            'histograms': histograms,
+            'timestamp': datetime.now().isoformat(),
+            'uptime': time.time() - self.start_time
+        }
     
     def get_counter(self, name: str, labels: Dict[str, str] = None) -> int:
         """
-        Get counter value
+        Get counter value, summed over the series having the given labels
         """
-        key = self._build_key(name, labels)
-        return self.counters.get(key, 0)
+        return sum(series.value for series in self.store.select(name, labels))
     
     def get_gauge(self, name: str, labels: Dict[str, str] = None) -> float:
         """
         Get gauge value
         """
-        key = self._build_key(name, labels)
-        return self.gauges.get(key, 0.0)
+        matches = self.store.select(name, labels)
+        if not matches:
+            return 0.0
+        return max(matches, key=lambda series: series.updated_at).value
     
     def get_histogram_avg(self, name: str, labels: Dict[str, str] = None) -> float:
         """
         Get histogram average
         """
-        key = self._build_key(name, labels)
-        observations = self.histograms.get(key, [])
-        if observations:
-            values = [obs['value'] for obs in observations]
-            return sum(values) / len(values)
+        matches = self.store.select(name, labels)
+        count = sum(series.count for series in matches)
+        if count:
+            return sum(series.sum for series in matches) / count
         return 0.0
     
+    def get_histogram_quantile(self, name: str, quantile: float,
+                               labels: Dict[str, str] = None) -> float:
+        """
+        Get a histogram quantile (e.g. 0.95) from the bucket counts
+        """
+        matches = self.store.select(name, labels)
+        if not matches:
+            return 0.0
+        combined = matches[0].copy()
+        for series in matches[1:]:
+            combined.merge(series)
+        return combined.quantile(quantile)
+    
+    def get_rollup(self, name: str, labels: Dict[str, str] = None,
+                   resolution: str = '1m') -> List[Dict[str, float]]:
+        """
+        Per minute ('1m', last hour) or per hour ('1h', last 48 hours) points
+        """
+        matches = self.store.select(name, labels)
+        if not matches:
+            return []
+        combined = matches[0].copy()
+        for series in matches[1:]:
+            combined.merge(series)
+        rollup = combined.minute if resolution == '1m' else combined.hour
+        return rollup.points(time.time())
+    
     def get_system_metrics(self) -> Dict[str, Any]:
         """
         Get current system metrics
@@ -173,6 +222,7 @@ class MetricsCollector:
             'cache_hits': self.get_counter('ai_cache_operations_total', {'result': 'hit'}),
             'cache_misses': self.get_counter('ai_cache_operations_total', {'result': 'miss'}),
             'models_loaded': self.get_counter('ai_model_loads_total'),
+            'avg_time_to_first_token': self.get_histogram_avg('ai_time_to_first_token_seconds'),
             'timestamp': datetime.now().isoformat()
         }
 
@@ -202,7 +252,8 @@ class AIServiceMetrics:
         if input_size:
             self.collector.observe_histogram('ai_input_size_bytes', input_size, labels)
             
-    def record_cache_operation(self, operation: str, hit: bool, service: str):
+    def record_cache_operation(self, operation: str, hit: bool, service: str,
+                               duration: float = None):
         """
         Record cache operation metrics
         """
@@ -214,6 +265,9 @@ class AIServiceMetrics:
         
         self.collector.increment_counter('ai_cache_operations_total', 1, labels)
         
+        if duration is not None:
+            self.collector.observe_histogram('ai_cache_operation_duration_seconds', duration, labels)
+        
     def record_model_load(self, model_name: str, load_time: float, success: bool):
         """
         Record model loading metrics
@@ -226,6 +280,22 @@ class AIServiceMetrics:
         self.collector.increment_counter('ai_model_loads_total', 1, labels)
         self.collector.observe_histogram('ai_model_load_duration_seconds', load_time, labels)
         
+    def record_time_to_first_token(self, service: str, model_name: str, duration: float,
+                                   reused_context: bool, prompt_tokens: int = None):
+        """
+        Record the latency until the first generated token of a streamed generation
+        """
+        labels = {
+            'service': service,
+            'model': model_name,
+            'prompt': 'delta' if reused_context else 'full'
+        }
+        
+        self.collector.observe_histogram('ai_time_to_first_token_seconds', duration, labels)
+        
+        if prompt_tokens is not None:
+            self.collector.observe_histogram('ai_prompt_tokens_evaluated', prompt_tokens, labels)
+        
     def record_batch_processing(self, service: str, batch_size: int, 
                               processing_time: float, success_count: int):
         """
@@ -0,0 +1,315 @@
+"""
+Compact time-series store behind ``MetricsCollector``.
+
+Every series (a metric name plus its labels) keeps fixed-size numpy arrays:
+
+- histograms count observations in fixed log-spaced buckets, so recording is
+  a bucket lookup and a quantile is read from the cumulative bucket counts,
+  both independent of the number of observations;
+- the latest raw observations of a histogram sit in a ring buffer;
+- counters, gauges and histograms are rolled up per minute (last hour) and
+  per hour (last two days) in slot arrays indexed by the time bucket.
+
+Each series has its own lock, recording never waits on an export.
+
+With ``AI_METRICS_MULTIPROCESS_DIR`` set, every process writes its series to
+``<dir>/<pid>.pkl`` at most every ``AI_METRICS_FLUSH_INTERVAL`` seconds and
+an export merges the files of all processes (counters and histograms are
+summed, the most recently set gauge wins), so gunicorn workers report one
+set of numbers. The directory should be emptied when the server is
+deployed, like the multiprocess directory of prometheus_client.
+"""
+
+import bisect
+import glob
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+# 1ms .. ~2.4 hours (or bytes, batch sizes, ...), doubling, plus +Inf
+BUCKETS = 0.001 * 2.0 ** np.arange(24)
+_BUCKET_BOUNDS = BUCKETS.tolist()
+RING_SIZE = 1000
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((str(k), str(v)) for k, v in (labels or {}).items()))
+
+
+class Rollup:
+    """Count, sum, min and max per time slot of ``width`` seconds"""
+
+    def __init__(self, slots: int, width: int):
+        self.slots = slots
+        self.width = width
+        self.slot_ids = np.full(slots, -1, dtype=np.int64)
+        self.count = np.zeros(slots, dtype=np.int64)
+        self.sum = np.zeros(slots)
+        self.min = np.full(slots, np.inf)
+        self.max = np.full(slots, -np.inf)
+
+    def add(self, timestamp: float, value: float, count: int = 1):
+        slot_id = int(timestamp // self.width)
+        index = slot_id % self.slots
+        if self.slot_ids[index] != slot_id:
+            self.slot_ids[index] = slot_id
+            self.count[index] = 0
+            self.sum[index] = 0.0
+            self.min[index] = np.inf
+            self.max[index] = -np.inf
+        self.count[index] += count
+        self.sum[index] += value
+        self.min[index] = min(self.min[index], value)
+        self.max[index] = max(self.max[index], value)
+
+    def merge(self, other: 'Rollup'):
+        for index in range(self.slots):
+            slot_id = other.slot_ids[index]
+            if slot_id < 0 or slot_id < self.slot_ids[index]:
+                continue
+            if slot_id > self.slot_ids[index]:
+                self.slot_ids[index] = slot_id
+                self.count[index] = other.count[index]
+                self.sum[index] = other.sum[index]
+                self.min[index] = other.min[index]
+                self.max[index] = other.max[index]
+            else:
+                self.count[index] += other.count[index]
+                self.sum[index] += other.sum[index]
+                self.min[index] = min(self.min[index], other.min[index])
+                self.max[index] = max(self.max[index], other.max[index])
+
+    def points(self, now: float) -> List[Dict[str, float]]:
+        oldest = int(now // self.width) - self.slots + 1
+        valid = np.nonzero(self.slot_ids >= oldest)[0]
+        valid = valid[np.argsort(self.slot_ids[valid])]
+        return [
+            {
+                'timestamp': float(self.slot_ids[i] * self.width),
+                'count': int(self.count[i]),
+                'sum': float(self.sum[i]),
+                'avg': float(self.sum[i] / self.count[i]) if self.count[i] else 0.0,
+                'min': float(self.min[i]) if self.count[i] else 0.0,
+                'max': float(self.max[i]) if self.count[i] else 0.0,
+            }
+            for i in valid
+        ]
+
+
+class Series:
+    """One metric name and label set"""
+
+    def __init__(self, name: str, labels: LabelKey, kind: str):
+        self.name = name
+        self.labels = labels
+        self.kind = kind
+        self.lock = threading.Lock()
+        self.value = 0
+        self.updated_at = 0.0
+        self.minute = Rollup(60, 60)
+        self.hour = Rollup(48, 3600)
+        if kind == HISTOGRAM:
+            self.buckets = np.zeros(len(BUCKETS) + 1, dtype=np.int64)
+            self.count = 0
+            self.sum = 0.0
+            self.min = np.inf
+            self.max = -np.inf
+            self.ring_times = np.zeros(RING_SIZE)
+            self.ring_values = np.zeros(RING_SIZE)
+            self.ring_position = 0
+            self.ring_length = 0
+
+    def increment(self, value: float, now: float):
+        with self.lock:
+            self.value += value
+            self.updated_at = now
+            self.minute.add(now, value)
+            self.hour.add(now, value)
+
+    def set(self, value: float, now: float):
+        with self.lock:
+            self.value = value
+            self.updated_at = now
+            self.minute.add(now, value)
+            self.hour.add(now, value)
+
+    def observe(self, value: float, now: float):
+        index = bisect.bisect_left(_BUCKET_BOUNDS, value)
+        with self.lock:
+            self.buckets[index] += 1
+            self.count += 1
+            self.sum += value
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+            self.updated_at = now
+            self.ring_times[self.ring_position] = now
+            self.ring_values[self.ring_position] = value
+            self.ring_position = (self.ring_position + 1) % RING_SIZE
+            self.ring_length = min(self.ring_length + 1, RING_SIZE)
+            self.minute.add(now, value)
+            self.hour.add(now, value)
+
+    def _recent(self, limit: int = RING_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+        length = min(limit, self.ring_length)
+        indexes = (self.ring_position - length + np.arange(length)) % RING_SIZE
+        return self.ring_times[indexes], self.ring_values[indexes]
+
+    def recent_values(self, limit: int = RING_SIZE) -> np.ndarray:
+        """Latest raw observations, oldest first"""
+        return self._recent(limit)[1]
+
+    def quantile(self, q: float) -> float:
+        """Quantile interpolated inside its bucket"""
+        if self.kind != HISTOGRAM or not self.count:
+            return 0.0
+        cumulative = np.cumsum(self.buckets)
+        rank = q * self.count
+        index = int(np.searchsorted(cumulative, rank, side='left'))
+        lower = BUCKETS[index - 1] if index > 0 else 0.0
+        upper = BUCKETS[index] if index < len(BUCKETS) else self.max
+        below = cumulative[index - 1] if index > 0 else 0
+        in_bucket = self.buckets[index]
+        fraction = (rank - below) / in_bucket if in_bucket else 0.0
+        value = lower + (upper - lower) * fraction
+        return float(min(max(value, self.min), self.max))
+
+    def copy(self) -> 'Series':
+        with self.lock:
+            return pickle.loads(pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def merge(self, other: 'Series'):
+        """Adds the series of another process into this one"""
+        if self.kind == GAUGE:
+            if other.updated_at > self.updated_at:
+                self.value = other.value
+        else:
+            self.value += other.value
+        self.updated_at = max(self.updated_at, other.updated_at)
+        self.minute.merge(other.minute)
+        self.hour.merge(other.hour)
+        if self.kind == HISTOGRAM:
+            self.buckets += other.buckets
+            self.count += other.count
+            self.sum += other.sum
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            own_times, own_values = self._recent()
+            other_times, other_values = other._recent()
+            times = np.concatenate([own_times, other_times])
+            values = np.concatenate([own_values, other_values])
+            order = np.argsort(times, kind='stable')[-RING_SIZE:]
+            self.ring_length = len(order)
+            self.ring_times[:self.ring_length] = times[order]
+            self.ring_values[:self.ring_length] = values[order]
+            self.ring_position = self.ring_length % RING_SIZE
+
+    def __getstate__(self):
+        return {k: v for k, v in self.__dict__.items() if k != 'lock'}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+class MetricsStore:
+    """Series of the process, optionally merged with the other processes"""
+
+    def __init__(self, multiprocess_dir: Optional[str] = None, flush_interval: float = 5.0):
+        self.series: Dict[Tuple[str, LabelKey], Series] = {}
+        self.lock = threading.Lock()
+        self.multiprocess_dir = multiprocess_dir
+        self.flush_interval = flush_interval
+        self.flushed_at = 0.0
+
+    def _series(self, name: str, labels: Optional[Dict[str, str]], kind: str) -> Series:
+        key = (name, label_key(labels))
+        series = self.series.get(key)
+        if series is None:
+            with self.lock:
+                series = self.series.setdefault(key, Series(name, key[1], kind))
+        return series
+
+    def increment(self, name: str, value: float = 1, labels: Optional[Dict[str, str]] = None):
+        now = time.time()
+        self._series(name, labels, COUNTER).increment(value, now)
+        self._maybe_flush(now)
+
+    def set(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        now = time.time()
+        self._series(name, labels, GAUGE).set(value, now)
+        self._maybe_flush(now)
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        now = time.time()
+        self._series(name, labels, HISTOGRAM).observe(value, now)
+        self._maybe_flush(now)
+
+    # multi-process mode
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.multiprocess_dir, f'{pid}.pkl')
+
+    def _maybe_flush(self, now: float):
+        if self.multiprocess_dir and now - self.flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Writes the series of this process for the other processes"""
+        if not self.multiprocess_dir:
+            return
+        self.flushed_at = time.time()
+        try:
+            os.makedirs(self.multiprocess_dir, exist_ok=True)
+            snapshot = [series.copy() for series in list(self.series.values())]
+            handle, temporary = tempfile.mkstemp(dir=self.multiprocess_dir, suffix='.tmp')
+            with os.fdopen(handle, 'wb') as file:
+                pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self._path(os.getpid()))
+        except Exception as e:
+            logger.error(f"Error flushing metrics: {e}")
+
+    def collect(self) -> List[Series]:
+        """Series of this process, merged with the other processes when enabled"""
+        merged = {key: series.copy() for key, series in list(self.series.items())}
+        if not self.multiprocess_dir:
+            return list(merged.values())
+
+        own = self._path(os.getpid())
+        for path in glob.glob(os.path.join(self.multiprocess_dir, '*.pkl')):
+            if path == own:
+                continue
+            try:
+                with open(path, 'rb') as file:
+                    snapshot = pickle.load(file)
+            except Exception as e:
+                logger.warning(f"Skipping unreadable metrics file {path}: {e}")
+                continue
+            for series in snapshot:
+                key = (series.name, series.labels)
+                if key in merged:
+                    merged[key].merge(series)
+                else:
+                    merged[key] = series
+        return list(merged.values())
+
+    def select(self, name: str, labels: Optional[Dict[str, str]] = None,
+               series: Optional[Iterable[Series]] = None) -> List[Series]:
+        """Series of ``name`` having at least the given labels"""
+        wanted = set(label_key(labels))
+        if series is None:
+            series = self.collect() if self.multiprocess_dir else list(self.series.values())
+        return [s for s in series if s.name == name and wanted.issubset(s.labels)]
@@ -68,6 +68,7 @@ class AIServiceMonitor:
                     'timestamp': timestamp,
                     'data': health_data
                 })
+                self._record_health_metrics(health_data)
                 
                 # Check for alerts
                 self._check_alerts(health_data, timestamp)
@@ -85,6 +86,29 @@ class AIServiceMonitor:
                 logger.error(f"Monitoring loop error: {e}")
                 time.sleep(interval)
     
+    def _record_health_metrics(self, health_data: Dict[str, Any]):
+        """Record the numeric health values as gauges of the metrics store"""
+        from .metrics import metrics_collector
+        
+        for key, value in health_data.get('system', {}).items():
+            if isinstance(value, (int, float)):
+                metrics_collector.set_gauge(f'ai_monitor_system_{key}', value)
+        
+        for service_name, stats in health_data.get('ai_services', {}).items():
+            if 'error' in stats:
+                continue
+            labels = {'service': service_name}
+            for key in ('success_rate', 'avg_execution_time', 'total_calls'):
+                if isinstance(stats.get(key), (int, float)):
+                    metrics_collector.set_gauge(f'ai_monitor_service_{key}', stats[key], labels)
+    
+    def get_metric_history(self, name: str, labels: Dict[str, str] = None,
+                           resolution: str = '1m') -> List[Dict[str, Any]]:
+        """Per minute or per hour rollup of a monitored metric, across workers"""
+        from .metrics import metrics_collector
+        
+        return metrics_collector.get_rollup(name, labels, resolution)
+    
     def _check_alerts(self, health_data: Dict[str, Any], timestamp: float):
         """Check for alert conditions"""
         alerts = []
@@ -35,7 +35,9 @@ class DataPreprocessor:
         self.vectorizers = {}
         self.imputers = {}
         self.feature_names = []
+        self.column_kinds = {}
         self.preprocessing_config = {}
+        self._compiled = None
         
     def fit_transform(self, data: Union[pd.DataFrame, Dict[str, Any]], 
                      target_column: Optional[str] = None) -> Tuple[np.ndarray, Optional[np.ndarray]]:
@@ -68,6 +70,8 @@ class DataPreprocessor:
                 
             # Store feature names
             self.feature_names = list(features_df.columns)
+            self.column_kinds = {}
+            self._compiled = None
             
             # Process different data types
             processed_features = []
@@ -89,6 +93,7 @@ class DataPreprocessor:
                     if len(processed_col.shape) == 1:
                         processed_col = processed_col.reshape(-1, 1)
                     processed_features.append(processed_col)
+                    self.column_kinds[column] = self._fitted_kind(column, processed_col)
                     
             # Combine all features
             if processed_features:
@@ -106,62 +111,39 @@ class DataPreprocessor:
             logger.error(f"Error in fit_transform: {str(e)}")
             raise
             
-    def transform(self, data: Union[pd.DataFrame, Dict[str, Any]]) -> np.ndarray:
+    def transform(self, data: Union[pd.DataFrame, Dict[str, Any], List[Dict[str, Any]]]) -> np.ndarray:
         """
         Transform new data using fitted preprocessing pipeline.
         
         Args:
-            data: Input data to transform
+            data: A record, a list of records, a DataFrame or a dict of columns
             
         Returns:
-            Transformed features as numpy array
+            Transformed features as float32 numpy array
         """
         try:
-            # Convert to DataFrame if needed
-            if isinstance(data, dict):
-                df = pd.DataFrame([data])
-            else:
-                df = data.copy()
-                
-            # Ensure all expected columns are present
-            missing_cols = set(self.feature_names) - set(df.columns)
-            if missing_cols:
-                logger.warning(f"Missing columns: {missing_cols}. Filling with default values.")
-                for col in missing_cols:
-                    df[col] = 0  # Default value
-                    
-            # Reorder columns to match training order
-            df = df[self.feature_names]
-            
-            # Process each column using fitted transformers
-            processed_features = []
-            
-            for column in self.feature_names:
-                column_data = df[column]
-                
-                if column_data.dtype == 'object':
-                    processed_col = self._process_categorical_column(column, column_data, fit=False)
-                elif pd.api.types.is_numeric_dtype(column_data):
-                    processed_col = self._process_numerical_column(column, column_data, fit=False)
-                else:
-                    processed_col = self._process_other_column(column, column_data, fit=False)
-                    
-                if processed_col is not None:
-                    if len(processed_col.shape) == 1:
-                        processed_col = processed_col.reshape(-1, 1)
-                    processed_features.append(processed_col)
-                    
-            # Combine all features
-            if processed_features:
-                features = np.hstack(processed_features)
-            else:
-                features = np.array([]).reshape(len(df), 0)
-                
-            return features
+            return self.compile().transform(data)
             
         except Exception as e:
             logger.error(f"Error in transform: {str(e)}")
             raise
+    
+    def compile(self) -> 'CompiledTransformer':
+        """
+        Compiled form of the fitted pipeline, built once after fitting.
+        """
+        if self._compiled is None:
+            self._compiled = CompiledTransformer.compile(self)
+        return self._compiled
+    
+    def _fitted_kind(self, column: str, processed_col: np.ndarray) -> str:
+        kind = CompiledTransformer._infer_kind(self, column)
+        if kind in (CompiledTransformer.RAW, CompiledTransformer.DATETIME):
+            # date parts, or a value that failed to process
+            if processed_col.shape[1] == CompiledTransformer.DATETIME_WIDTH:
+                return CompiledTransformer.DATETIME
+            return CompiledTransformer.RAW
+        return kind
             
     def _process_numerical_column(self, column_name: str, data: pd.Series, fit: bool = True) -> np.ndarray:
         """
@@ -328,6 +310,8 @@ class DataPreprocessor:
                 'vectorizers': {k: base64.b64encode(pickle.dumps(v)).decode() for k, v in self.vectorizers.items()},
                 'imputers': {k: base64.b64encode(pickle.dumps(v)).decode() for k, v in self.imputers.items()},
                 'feature_names': self.feature_names,
+                'column_kinds': self.column_kinds,
+                'compiled': base64.b64encode(pickle.dumps(self.compile())).decode(),
                 'service_type': self.service_type
             }
             
@@ -379,6 +363,9 @@ class DataPreprocessor:
             }
             
             preprocessor.feature_names = preprocessor_data.get('feature_names', [])
+            preprocessor.column_kinds = preprocessor_data.get('column_kinds', {})
+            if 'compiled' in preprocessor_data:
+                preprocessor._compiled = pickle.loads(base64.b64decode(preprocessor_data['compiled'].encode()))
             
             logger.info(f"Preprocessing pipeline loaded from session {session.id}")
             return preprocessor
@@ -402,6 +389,134 @@ class DataPreprocessor:
         }
 
 
+class CompiledTransformer:
+    """
+    Fitted DataPreprocessor compiled into a plan of column steps.
+
+    Every step writes into its slice of one preallocated float32 array:
+    numeric columns are imputed and scaled with the fitted statistics,
+    categories are looked up in a plain dict and dates are split into their
+    parts, all vectorized over the batch. Only text columns still call their
+    TF-IDF vectorizer. Records can be a dict, a list of dicts, a DataFrame
+    or a dict of columns.
+    """
+
+    NUMERIC = 'numeric'
+    RAW = 'raw'
+    CATEGORICAL = 'categorical'
+    TEXT = 'text'
+    DATETIME = 'datetime'
+    DATETIME_WIDTH = 5
+    TEXT_FALLBACK_WIDTH = 100
+
+    def __init__(self, steps: List[Tuple[str, str, int, int, Dict[str, Any]]]):
+        # (column, kind, offset, width, params)
+        self.steps = steps
+        self.feature_names = [step[0] for step in steps]
+        self.width = sum(step[3] for step in steps)
+
+    @classmethod
+    def compile(cls, preprocessor: 'DataPreprocessor') -> 'CompiledTransformer':
+        steps = []
+        offset = 0
+        for column in preprocessor.feature_names:
+            kind = preprocessor.column_kinds.get(column) or cls._infer_kind(preprocessor, column)
+            params: Dict[str, Any] = {}
+            if kind == cls.NUMERIC:
+                params = {
+                    'fill': float(preprocessor.imputers[column].statistics_[0]),
+                    'mean': float(preprocessor.scalers[column].mean_[0]),
+                    'scale': float(preprocessor.scalers[column].scale_[0]),
+                }
+                width = 1
+            elif kind == cls.CATEGORICAL:
+                params = {'index': {label: i for i, label in enumerate(preprocessor.encoders[column].classes_)}}
+                width = 1
+            elif kind == cls.TEXT:
+                vectorizer = preprocessor.vectorizers.get(column)
+                params = {'vectorizer': vectorizer}
+                width = len(vectorizer.vocabulary_) if vectorizer is not None else cls.TEXT_FALLBACK_WIDTH
+            elif kind == cls.DATETIME:
+                width = cls.DATETIME_WIDTH
+            else:
+                width = 1
+            steps.append((column, kind, offset, width, params))
+            offset += width
+        return cls(steps)
+
+    @classmethod
+    def _infer_kind(cls, preprocessor: 'DataPreprocessor', column: str) -> str:
+        """Kind of a column of a preprocessor fitted before column kinds were recorded"""
+        if column in preprocessor.vectorizers:
+            return cls.TEXT
+        if column in preprocessor.encoders:
+            return cls.CATEGORICAL
+        if column in preprocessor.scalers and column in preprocessor.imputers:
+            return cls.NUMERIC
+        if 'date' in column.lower():
+            return cls.DATETIME
+        return cls.RAW
+
+    @staticmethod
+    def _numbers(values) -> np.ndarray:
+        try:
+            return np.asarray(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float64)
+
+    @staticmethod
+    def _strings(values) -> List[str]:
+        return ['unknown' if value is None or value != value else str(value) for value in values]
+
+    def _columns(self, data) -> Tuple[Dict[str, Any], int]:
+        if isinstance(data, pd.DataFrame):
+            return {column: data[column].tolist() for column in data.columns if column in self.feature_names}, len(data)
+        if isinstance(data, dict):
+            if data and all(isinstance(value, (list, tuple, np.ndarray, pd.Series)) for value in data.values()):
+                lengths = {len(value) for value in data.values()}
+                if len(lengths) == 1:
+                    return data, lengths.pop()
+            data = [data]
+        records = list(data)
+        return {column: [record.get(column) for record in records] for column in self.feature_names}, len(records)
+
+    def transform(self, data) -> np.ndarray:
+        columns, count = self._columns(data)
+        output = np.zeros((count, self.width), dtype=np.float32)
+        missing = [None] * count
+        for column, kind, offset, width, params in self.steps:
+            values = columns.get(column)
+            if values is None:
+                values = missing
+            if kind == self.NUMERIC:
+                numbers = self._numbers(values)
+                numbers = np.where(np.isnan(numbers), params['fill'], numbers)
+                output[:, offset] = (numbers - params['mean']) / params['scale']
+            elif kind == self.RAW:
+                output[:, offset] = np.nan_to_num(self._numbers(values), nan=0.0)
+            elif kind == self.CATEGORICAL:
+                index = params['index']
+                # unseen categories map to 0, like DataPreprocessor
+                output[:, offset] = np.fromiter(
+                    (index.get(value, 0) for value in self._strings(values)), dtype=np.float32, count=count
+                )
+            elif kind == self.TEXT:
+                if params['vectorizer'] is not None:
+                    output[:, offset:offset + width] = params['vectorizer'].transform(self._strings(values)).toarray()
+            elif kind == self.DATETIME:
+                dates = pd.to_datetime(pd.Series(values), errors='coerce')
+                output[:, offset:offset + width] = np.column_stack([
+                    dates.dt.year.fillna(2000).to_numpy(),
+                    dates.dt.month.fillna(1).to_numpy(),
+                    dates.dt.day.fillna(1).to_numpy(),
+                    dates.dt.hour.fillna(0).to_numpy(),
+                    dates.dt.dayofweek.fillna(0).to_numpy(),
+                ])
+        return output
+
+    __call__ = transform
+
+
 def create_preprocessing_pipeline(service_type: str = 'budget_ai') -> DataPreprocessor:
     """
     Factory function to create preprocessing pipeline.
@@ -0,0 +1,180 @@
+"""
+Concurrent multi-strategy retrieval of the knowledge chatbot.
+
+The retrieval strategies (KnowledgeAI semantic search, BM25 keyword search,
+embedding search) used to run one after the other, so every question waited
+for the sum of their latencies. ``RetrievalOrchestrator`` starts them at the
+same time on a shared thread pool and waits for each at most its own time
+budget: a strategy that did not answer in time is left out (its thread
+finishes in the background and the result is dropped). A run that was cut off
+still holds its pool thread, so while ``max_abandoned`` cut off runs of a
+strategy are still going the strategy is skipped, and a hanging strategy
+cannot fill the pool and starve the others. Runs within their budget are not
+limited, concurrent questions all get the strategy.
+
+The rankings that arrived are combined with reciprocal rank fusion,
+``score(d) = sum(weight / (k + rank))`` over the strategies that returned
+``d``, which needs no calibration between cosine similarities and BM25
+scores. Strategies return document ids only; the caller loads the fused
+ranking with a single query.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class Strategy(NamedTuple):
+    """
+    ``search(query, user, limit)`` returns hits ordered best first, dicts
+    with at least ``document_id``
+    """
+    name: str
+    search: Callable[[str, Any, int], List[Dict[str, Any]]]
+    budget: float
+    weight: float = 1.0
+
+
+class FusedHit(NamedTuple):
+    document_id: Any
+    score: float
+    hits: Dict[str, Dict[str, Any]]  # strategy name -> its hit, best ranked strategy first
+
+
+def reciprocal_rank_fusion(rankings: Dict[str, List[Dict[str, Any]]],
+                           weights: Dict[str, float] = None, k: int = 60) -> List[FusedHit]:
+    """Fuses the rankings of the strategies, a document counts once per strategy"""
+    weights = weights or {}
+    scores: Dict[Any, float] = {}
+    ranked_hits: Dict[Any, List[Tuple[int, str, Dict[str, Any]]]] = {}
+    for name, hits in rankings.items():
+        weight = weights.get(name, 1.0)
+        seen = set()
+        for hit in hits:
+            document_id = hit['document_id']
+            if document_id in seen:
+                continue
+            rank = len(seen) + 1
+            seen.add(document_id)
+            scores[document_id] = scores.get(document_id, 0.0) + weight / (k + rank)
+            ranked_hits.setdefault(document_id, []).append((rank, name, hit))
+
+    fused = []
+    for document_id, score in scores.items():
+        by_rank = sorted(ranked_hits[document_id], key=lambda item: item[0])
+        fused.append(FusedHit(document_id, score, {name: hit for _, name, hit in by_rank}))
+    fused.sort(key=lambda hit: hit.score, reverse=True)
+    return fused
+
+
+class RetrievalOrchestrator:
+    """Runs the strategies concurrently within their budgets and fuses the rankings"""
+
+    def __init__(self, strategies: List[Strategy], max_workers: int = 4, rrf_k: int = 60,
+                 max_abandoned: int = 1):
+        self.strategies = list(strategies)
+        self.max_workers = max_workers
+        self.rrf_k = rrf_k
+        self.max_abandoned = max_abandoned
+        self._executor = None
+        self._lock = threading.Lock()
+        self._abandoned: Dict[str, int] = {}
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='chatbot-retrieval'
+                )
+            return self._executor
+
+    @staticmethod
+    def _run(strategy: Strategy, query: str, user: Any, limit: int) -> List[Dict[str, Any]]:
+        try:
+            return strategy.search(query, user, limit)
+        finally:
+            # the pool threads are not request threads, close their connections
+            close_old_connections()
+
+    def _is_busy(self, strategy: Strategy) -> bool:
+        """Whether too many cut off runs of the strategy are still going"""
+        with self._lock:
+            return self._abandoned.get(strategy.name, 0) >= self.max_abandoned
+
+    def _abandon(self, strategy: Strategy, future):
+        """Cuts off a run out of budget, one already running counts until it finishes"""
+        if future.cancel():
+            return
+        with self._lock:
+            self._abandoned[strategy.name] = self._abandoned.get(strategy.name, 0) + 1
+        # called right away when the run finished in the meantime
+        future.add_done_callback(lambda _: self._finished(strategy.name))
+
+    def _finished(self, name: str):
+        with self._lock:
+            self._abandoned[name] -= 1
+
+    def retrieve(self, query: str, user: Any, limit: int) -> Tuple[List[FusedHit], Dict[str, Dict[str, Any]]]:
+        """
+        Fused ranking of the strategies and a report of every strategy
+        (``status``: ok, error, timeout or busy, ``duration``, ``hits``)
+        """
+        rankings: Dict[str, List[Dict[str, Any]]] = {}
+        report: Dict[str, Dict[str, Any]] = {}
+        started = time.monotonic()
+
+        def collect(strategy: Strategy, call: Callable[[], List[Dict[str, Any]]]):
+            try:
+                hits = call()
+            except Exception as e:
+                logger.warning(f"Retrieval strategy {strategy.name} failed: {e}")
+                report[strategy.name] = {'status': 'error', 'duration': time.monotonic() - started, 'hits': 0}
+                return
+            rankings[strategy.name] = hits
+            report[strategy.name] = {'status': 'ok', 'duration': time.monotonic() - started, 'hits': len(hits)}
+
+        if self.max_workers <= 0:
+            # inline, one after the other, the budgets cannot be enforced
+            for strategy in self.strategies:
+                collect(strategy, lambda: self._run(strategy, query, user, limit))
+        else:
+            futures = {}
+            for strategy in self.strategies:
+                if self._is_busy(strategy):
+                    # its cut off runs are still going, most likely hanging
+                    report[strategy.name] = {'status': 'busy', 'duration': 0.0, 'hits': 0}
+                else:
+                    futures[self.executor.submit(self._run, strategy, query, user, limit)] = strategy
+            pending = set(futures)
+            while pending:
+                elapsed = time.monotonic() - started
+                for future in [f for f in pending if not f.done() and elapsed >= futures[f].budget]:
+                    # out of budget, cut off without waiting for it
+                    self._abandon(futures[future], future)
+                    pending.discard(future)
+                    report[futures[future].name] = {'status': 'timeout', 'duration': elapsed, 'hits': 0}
+                if not pending:
+                    break
+                timeout = max(0.0, min(futures[f].budget for f in pending) - elapsed)
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.discard(future)
+                    collect(futures[future], future.result)
+
+        # in the order of the strategies, not of their completion, so ties break the same way
+        rankings = {s.name: rankings[s.name] for s in self.strategies if s.name in rankings}
+        weights = {strategy.name: strategy.weight for strategy in self.strategies}
+        return reciprocal_rank_fusion(rankings, weights, self.rrf_k), report
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
@@ -8,6 +8,8 @@ import hashlib
 import json
 from datetime import timedelta
 
+from horilla.cache_namespaces import cache_namespace
+
 from .models import (
     AIModelRegistry,
     AIPrediction,
@@ -22,6 +24,8 @@ from .models import (
 
 logger = logging.getLogger(__name__)
 
+knowledge_base_cache = cache_namespace('knowledge_base', timeout=86400, local=False)
+
 # AI Model Registry Signals
 @receiver(post_save, sender=AIModelRegistry)
 def ai_model_registry_post_save(sender, instance, created, **kwargs):
@@ -154,9 +158,8 @@ def ai_prediction_post_save(sender, instance, created, **kwargs):
 def knowledge_base_post_save(sender, instance, created, **kwargs):
     """Handle knowledge base changes."""
     try:
-        # Clear knowledge base cache
-        cache.delete('knowledge_base_index')
-        cache.delete('knowledge_base_embeddings')
+        # Clear knowledge base cache (index and embeddings)
+        knowledge_base_cache.invalidate()
         
         # Generate text hash for caching
         if not instance.embedding_vector:
@@ -467,8 +470,7 @@ def workflow_execution_post_save(sender, instance, created, **kwargs):
 def knowledge_base_post_delete(sender, instance, **kwargs):
     """Clean up cache after knowledge base deletion."""
     try:
-        cache.delete('knowledge_base_index')
-        cache.delete('knowledge_base_embeddings')
+        knowledge_base_cache.invalidate()
         
         # Log deletion
         AIServiceLog.objects.create(
@@ -0,0 +1,188 @@
+"""
+Process-resident models of the SLM service.
+
+A HuggingFace model is loaded once per process, on first use, and stays in
+memory next to its tokenizer; it is never serialized into the Django cache
+(with Redis or memcached that meant pickling hundreds of MB per load, and
+every process still needed its own copy to run it).
+
+- loading is guarded per model, concurrent first requests wait for one load;
+- at most ``max_models`` models stay resident, the least recently used one is
+  dropped for a new one;
+- on CPU the ``nn.Linear`` layers can be quantized to int8 with PyTorch
+  dynamic quantization (T5 and BERT style models; the Conv1D projections of
+  GPT-2 are left as they are);
+- a model that failed to load is not tried again for ``retry_after`` seconds;
+- every model allows ``max_concurrent`` generations at a time, further
+  callers wait up to ``slot_timeout`` seconds so a burst of requests queues
+  instead of multiplying the memory and CPU of the generations.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationBusy(Exception):
+    """No generation slot of the model became free in time"""
+
+
+def quantize_dynamic(model):
+    """int8 weights for the Linear layers, activations stay float"""
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class ResidentModel:
+    """A loaded model, its tokenizer and the pipelines built on them"""
+
+    def __init__(self, key: str, model: Any, tokenizer: Any, max_concurrent: int, quantized: bool = False):
+        self.key = key
+        self.model = model
+        self.tokenizer = tokenizer
+        self.quantized = quantized
+        self.pipelines: Dict[str, Any] = {}
+        self.max_concurrent = max_concurrent
+        self.semaphore = threading.BoundedSemaphore(max_concurrent)
+        # guards the counters, the semaphore lets several generations run
+        self.lock = threading.Lock()
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.generations = 0
+        self.active = 0
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None):
+        """Holds one of the generation slots of the model"""
+        if not self.semaphore.acquire(timeout=timeout):
+            raise GenerationBusy(f"All {self.max_concurrent} generation slots of {self.key} are busy")
+        with self.lock:
+            self.active += 1
+            self.last_used = time.time()
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.generations += 1
+            self.semaphore.release()
+
+    def pipeline(self, task: str, factory: Callable[[], Any]):
+        """Pipeline of ``task`` built once on the resident model"""
+        if task not in self.pipelines:
+            self.pipelines[task] = factory()
+        return self.pipelines[task]
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = {
+                'quantized': self.quantized,
+                'loaded_at': self.loaded_at,
+                'last_used': self.last_used,
+                'generations': self.generations,
+                'active_generations': self.active,
+                'max_concurrent': self.max_concurrent,
+                'pipelines': sorted(self.pipelines),
+            }
+        if isinstance(self.model, torch.nn.Module):
+            stats['parameters'] = sum(p.numel() for p in self.model.parameters())
+        return stats
+
+
+class ModelRuntime:
+    """Models resident in this process, loaded lazily with LRU eviction"""
+
+    def __init__(self, max_models: int = 3, max_concurrent: int = 2, quantize: bool = False,
+                 slot_timeout: Optional[float] = 30.0, retry_after: float = 300.0,
+                 device: Optional[torch.device] = None):
+        self.max_models = max_models
+        self.max_concurrent = max_concurrent
+        self.quantize = quantize
+        self.slot_timeout = slot_timeout
+        self.retry_after = retry_after
+        self.device = device or torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.lock = threading.Lock()
+        self.models: 'OrderedDict[str, ResidentModel]' = OrderedDict()
+        self.loading: Dict[str, threading.Lock] = {}
+        self.failed: Dict[str, float] = {}
+
+    def peek(self, key: str) -> Optional[ResidentModel]:
+        return self.models.get(key)
+
+    def get(self, key: str, loader: Callable[[], Tuple[Any, Any]]) -> ResidentModel:
+        """
+        Resident model of ``key``; ``loader`` returns ``(model, tokenizer)``
+        and runs once even when several threads ask at the same time.
+        """
+        with self.lock:
+            resident = self.models.get(key)
+            if resident is not None:
+                self.models.move_to_end(key)
+                return resident
+            key_lock = self.loading.setdefault(key, threading.Lock())
+
+        with key_lock:
+            resident = self.models.get(key)
+            if resident is not None:
+                return resident
+
+            failed_at = self.failed.get(key)
+            if failed_at is not None and time.time() - failed_at < self.retry_after:
+                raise RuntimeError(f"{key} failed to load less than {self.retry_after:.0f}s ago")
+
+            started = time.time()
+            try:
+                model, tokenizer = loader()
+            except Exception:
+                self.failed[key] = time.time()
+                raise
+            quantized = False
+            if isinstance(model, torch.nn.Module):
+                model = model.to(self.device)
+                model.eval()
+                if self.quantize and self.device.type == 'cpu':
+                    model = quantize_dynamic(model)
+                    quantized = True
+            resident = ResidentModel(key, model, tokenizer, self.max_concurrent, quantized)
+            logger.info(f"Loaded {key} in {time.time() - started:.1f}s (quantized: {quantized})")
+
+            with self.lock:
+                self.models[key] = resident
+                self.loading.pop(key, None)
+                self.failed.pop(key, None)
+                while len(self.models) > self.max_models:
+                    evicted, _ = self.models.popitem(last=False)
+                    logger.info(f"Evicted {evicted} from the resident models")
+            return resident
+
+    @contextmanager
+    def generation(self, key: str, loader: Callable[[], Tuple[Any, Any]]):
+        """Resident model of ``key`` with one of its generation slots held"""
+        resident = self.get(key, loader)
+        with resident.slot(self.slot_timeout):
+            with torch.inference_mode():
+                yield resident
+
+    def evict(self, key: str) -> bool:
+        with self.lock:
+            return self.models.pop(key, None) is not None
+
+    def clear(self):
+        with self.lock:
+            self.models.clear()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'device': str(self.device),
+            'max_models': self.max_models,
+            'quantize': self.quantize,
+            'models': {key: resident.stats() for key, resident in list(self.models.items())},
+        }
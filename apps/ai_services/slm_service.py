@@ -1,28 +1,34 @@
 import logging
 import time
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from transformers import (
     AutoTokenizer, AutoModelForCausalLM, AutoModelForSequenceClassification,
     pipeline, GPT2LMHeadModel, GPT2Tokenizer, T5ForConditionalGeneration, T5Tokenizer
 )
-import torch
 from django.conf import settings
-from django.core.cache import cache
 import os
 
+from .slm_runtime import ModelRuntime, ResidentModel
+
 logger = logging.getLogger(__name__)
 
+# Models stay resident per process, shared by every SLMService instance
+runtime = ModelRuntime(
+    max_models=getattr(settings, 'SLM_MAX_RESIDENT_MODELS', 3),
+    max_concurrent=getattr(settings, 'SLM_MAX_CONCURRENT_GENERATIONS', 2),
+    quantize=getattr(settings, 'SLM_QUANTIZE_CPU', False),
+    slot_timeout=getattr(settings, 'SLM_GENERATION_TIMEOUT', 30),
+)
+
 class SLMService:
     """
     Small Language Model Service - Alternatif ringan untuk Ollama
     Menggunakan HuggingFace Transformers dengan model-model kecil yang efisien
     """
     
-    def __init__(self):
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.models = {}
-        self.tokenizers = {}
-        self.pipelines = {}
+    def __init__(self, model_runtime: Optional[ModelRuntime] = None):
+        self.runtime = model_runtime or runtime
+        self.device = self.runtime.device
         
         # Configuration
         self.config = {
@@ -32,7 +38,6 @@ class SLMService:
             'top_k': getattr(settings, 'SLM_TOP_K', 50),
             'do_sample': True,
             'pad_token_id': None,  # Will be set per model
-            'cache_timeout': 3600  # 1 hour
         }
         
         # Available small models
@@ -60,8 +65,9 @@ class SLMService:
             }
         }
         
-        # Initialize default models
-        self._initialize_default_models()
+        # Models load on first use unless preloading is enabled
+        if getattr(settings, 'SLM_PRELOAD_MODELS', False):
+            self._initialize_default_models()
     
     def _initialize_default_models(self):
         """Initialize default small models for common tasks"""
@@ -83,186 +89,165 @@ class SLMService:
         except Exception as e:
             logger.error(f"Failed to initialize default models: {e}")
     
-    def _load_model(self, model_key: str, task_type: str):
-        """Load a specific model and tokenizer"""
-        try:
-            model_name = None
-            
-            # Find model name from available models
-            for task, models in self.available_models.items():
-                if model_key in models:
-                    model_name = models[model_key]
-                    break
-            
-            if not model_name:
-                # If not found in available_models, use model_key as model_name directly
-                model_name = model_key
-            
-            cache_key = f"slm_model_{model_key}"
-            
-            # Check if already loaded
-            if model_key in self.models and model_key in self.tokenizers:
-                logger.info(f"Model {model_key} already loaded")
-                return
-            
-            logger.info(f"Loading model {model_name} for task {task_type}...")
-            
-            # Load tokenizer
-            if 't5' in model_name.lower():
-                tokenizer = T5Tokenizer.from_pretrained(model_name)
-                model = T5ForConditionalGeneration.from_pretrained(model_name)
-            elif 'gpt2' in model_name.lower():
-                tokenizer = GPT2Tokenizer.from_pretrained(model_name)
-                model = GPT2LMHeadModel.from_pretrained(model_name)
-                # Set pad token for GPT2
-                if tokenizer.pad_token is None:
-                    tokenizer.pad_token = tokenizer.eos_token
+    def _model_name(self, model_key: str) -> str:
+        """HuggingFace name of a model key"""
+        for task, models in self.available_models.items():
+            if model_key in models:
+                return models[model_key]
+        # If not found in available_models, use model_key as model_name directly
+        return model_key
+    
+    def _build_model(self, model_name: str, task_type: str) -> Tuple[Any, Any]:
+        """Load model and tokenizer from HuggingFace"""
+        logger.info(f"Loading model {model_name} for task {task_type}...")
+        
+        if 't5' in model_name.lower():
+            tokenizer = T5Tokenizer.from_pretrained(model_name)
+            model = T5ForConditionalGeneration.from_pretrained(model_name)
+        elif 'gpt2' in model_name.lower():
+            tokenizer = GPT2Tokenizer.from_pretrained(model_name)
+            model = GPT2LMHeadModel.from_pretrained(model_name)
+            # Set pad token for GPT2
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+        else:
+            # Use Auto classes for other models
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            if task_type == 'text_generation':
+                model = AutoModelForCausalLM.from_pretrained(model_name)
             else:
-                # Use Auto classes for other models
-                tokenizer = AutoTokenizer.from_pretrained(model_name)
-                if task_type == 'text_generation':
-                    model = AutoModelForCausalLM.from_pretrained(model_name)
-                else:
-                    model = AutoModelForSequenceClassification.from_pretrained(model_name)
-            
-            # Move model to device
-            model = model.to(self.device)
-            model.eval()  # Set to evaluation mode
-            
-            # Store model and tokenizer
-            self.models[model_key] = model
-            self.tokenizers[model_key] = tokenizer
-            
-            logger.info(f"Successfully loaded model {model_name} as {model_key}")
-            
-        except Exception as e:
-            logger.error(f"Failed to load model {model_key}: {e}")
-            raise
-            cached_model = cache.get(cache_key)
-            
-            if cached_model:
-                self.models[model_key] = cached_model['model']
-                self.tokenizers[model_key] = cached_model['tokenizer']
-                logger.info(f"Loaded {model_key} from cache")
-                return
-            
+                model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        
+        if not model.config.is_encoder_decoder:
+            # Prompts of a batch end at the same position, generation continues from there
+            tokenizer.padding_side = 'left'
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+        
+        return model, tokenizer
+    
+    def _load_model(self, model_key: str, task_type: str) -> ResidentModel:
+        """Resident model and tokenizer of a model key, loaded on first use"""
+        try:
+            model_name = self._model_name(model_key)
+            return self.runtime.get(model_key, lambda: self._build_model(model_name, task_type))
         except Exception as e:
             logger.error(f"Failed to load model {model_key}: {e}")
             raise
     
+    def _generation(self, model_key: str, task_type: str):
+        model_name = self._model_name(model_key)
+        return self.runtime.generation(model_key, lambda: self._build_model(model_name, task_type))
+    
     def generate_text(self, prompt: str, model_key: str = 'gpt2', max_length: int = None) -> Dict[str, Any]:
         """Generate text using small language model"""
+        return self.generate_texts([prompt], model_key, max_length)[0]
+    
+    def generate_texts(self, prompts: List[str], model_key: str = 'gpt2', max_length: int = None) -> List[Dict[str, Any]]:
+        """Generate text for several prompts in one padded batch"""
         try:
             start_time = time.time()
             
-            # Use default model if not specified
-            if model_key not in self.models:
-                if model_key == 'gpt2-indonesian' and 'gpt2-indonesian' not in self.models:
-                    model_key = 'gpt2'  # Fallback to English GPT2
-                else:
+            if model_key == 'gpt2-indonesian':
+                try:
                     self._load_model(model_key, 'text_generation')
-            
-            model = self.models[model_key]
-            tokenizer = self.tokenizers[model_key]
+                except Exception as e:
+                    logger.warning(f"Indonesian GPT2 not available: {e}")
+                    model_key = 'gpt2'  # Fallback to English GPT2
             
             # Set max length
             max_length = max_length or self.config['max_length']
             
-            # Tokenize input
-            inputs = tokenizer.encode(prompt, return_tensors='pt', truncation=True, max_length=max_length//2)
-            inputs = inputs.to(self.device)
-            
-            # Generate
-            with torch.no_grad():
-                if 't5' in model_key.lower():
-                    # T5 requires different generation approach
-                    outputs = model.generate(
-                        inputs,
-                        max_length=max_length,
-                        temperature=self.config['temperature'],
-                        top_p=self.config['top_p'],
-                        do_sample=self.config['do_sample'],
-                        pad_token_id=tokenizer.pad_token_id,
-                        eos_token_id=tokenizer.eos_token_id
-                    )
-                else:
+            with self._generation(model_key, 'text_generation') as resident:
+                model = resident.model
+                tokenizer = resident.tokenizer
+                encoder_decoder = model.config.is_encoder_decoder
+                
+                # Tokenize input
+                inputs = tokenizer(
+                    prompts, return_tensors='pt', padding=True, truncation=True, max_length=max_length // 2
+                ).to(self.device)
+                
+                generation_config = {
+                    'max_length': max_length,
+                    'temperature': self.config['temperature'],
+                    'top_p': self.config['top_p'],
+                    'do_sample': self.config['do_sample'],
+                    'pad_token_id': tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id,
+                    'eos_token_id': tokenizer.eos_token_id
+                }
+                if not encoder_decoder:
                     # GPT2 and similar models
-                    outputs = model.generate(
-                        inputs,
-                        max_length=max_length,
-                        temperature=self.config['temperature'],
-                        top_p=self.config['top_p'],
-                        top_k=self.config['top_k'],
-                        do_sample=self.config['do_sample'],
-                        pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id,
-                        eos_token_id=tokenizer.eos_token_id
-                    )
-            
-            # Decode output
-            generated_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
+                    generation_config['top_k'] = self.config['top_k']
+                
+                # Generate
+                outputs = model.generate(**inputs, **generation_config)
             
-            # Remove input prompt from output for GPT2-style models
-            if not 't5' in model_key.lower():
-                generated_text = generated_text[len(prompt):].strip()
+            # Decoder-only outputs start with the prompt, T5 outputs only the answer
+            if not encoder_decoder:
+                outputs = outputs[:, inputs['input_ids'].shape[1]:]
             
             processing_time = time.time() - start_time
             
-            return {
-                'success': True,
-                'response': generated_text,
-                'model_used': model_key,
-                'processing_time': processing_time,
-                'input_length': len(prompt),
-                'output_length': len(generated_text)
-            }
+            results = []
+            for prompt, output in zip(prompts, outputs):
+                generated_text = tokenizer.decode(output, skip_special_tokens=True).strip()
+                results.append({
+                    'success': True,
+                    'response': generated_text,
+                    'model_used': model_key,
+                    'processing_time': processing_time,
+                    'batch_size': len(prompts),
+                    'tokens_generated': int((output != tokenizer.pad_token_id).sum()),
+                    'input_length': len(prompt),
+                    'output_length': len(generated_text)
+                })
+            return results
             
         except Exception as e:
             logger.error(f"Text generation failed: {e}")
-            return {
+            return [{
                 'success': False,
                 'response': 'Maaf, terjadi kesalahan dalam menghasilkan teks.',
                 'error': str(e),
                 'model_used': model_key
-            }
+            } for _ in prompts]
     
     def answer_question(self, question: str, context: str = None, model_key: str = 't5-small') -> Dict[str, Any]:
         """Answer questions using small models"""
         try:
             start_time = time.time()
             
-            # Load QA pipeline if not exists
-            pipeline_key = f"qa_{model_key}"
-            if pipeline_key not in self.pipelines:
-                model_name = self.available_models.get('question_answering', {}).get(model_key)
-                if not model_name:
-                    model_name = self.available_models.get('text_generation', {}).get(model_key, 't5-small')
-                
-                self.pipelines[pipeline_key] = pipeline(
-                    "question-answering" if context else "text2text-generation",
-                    model=model_name,
-                    device=0 if self.device.type == 'cuda' else -1
-                )
+            # QA pipeline stays resident like the models
+            task = "question-answering" if context else "text2text-generation"
+            model_name = self.available_models.get('question_answering', {}).get(model_key)
+            if not model_name:
+                model_name = self.available_models.get('text_generation', {}).get(model_key, 't5-small')
             
-            qa_pipeline = self.pipelines[pipeline_key]
+            def load_pipeline():
+                return pipeline(task, model=model_name, device=0 if self.device.type == 'cuda' else -1), None
             
-            if context:
-                # Use context-based QA
-                result = qa_pipeline(question=question, context=context)
-                answer = result['answer']
-                confidence = result.get('score', 0.8)
-            else:
-                # Use generative approach
-                if 't5' in model_key:
-                    prompt = f"question: {question}"
-                else:
-                    prompt = f"Q: {question}\nA:"
+            with self.runtime.generation(f"{task}_{model_key}", load_pipeline) as resident:
+                qa_pipeline = resident.model
                 
-                result = qa_pipeline(prompt, max_length=200, temperature=0.7)
-                if isinstance(result, list) and len(result) > 0:
-                    answer = result[0].get('generated_text', '').replace(prompt, '').strip()
+                if context:
+                    # Use context-based QA
+                    result = qa_pipeline(question=question, context=context)
+                    answer = result['answer']
+                    confidence = result.get('score', 0.8)
                 else:
-                    answer = str(result).strip()
-                confidence = 0.7  # Default confidence for generative QA
+                    # Use generative approach
+                    if 't5' in model_key:
+                        prompt = f"question: {question}"
+                    else:
+                        prompt = f"Q: {question}\nA:"
+                    
+                    result = qa_pipeline(prompt, max_length=200, temperature=0.7)
+                    if isinstance(result, list) and len(result) > 0:
+                        answer = result[0].get('generated_text', '').replace(prompt, '').strip()
+                    else:
+                        answer = str(result).strip()
+                    confidence = 0.7  # Default confidence for generative QA
             
             processing_time = time.time() - start_time
             
@@ -286,48 +271,56 @@ class SLMService:
     
     def summarize_text(self, text: str, model_key: str = 't5-small', max_length: int = 150) -> Dict[str, Any]:
         """Summarize text using small models"""
+        return self.summarize_texts([text], model_key, max_length)[0]
+    
+    def summarize_texts(self, texts: List[str], model_key: str = 't5-small', max_length: int = 150) -> List[Dict[str, Any]]:
+        """Summarize several texts in one batch"""
         try:
             start_time = time.time()
             
-            # Load summarization pipeline
-            pipeline_key = f"summarization_{model_key}"
-            if pipeline_key not in self.pipelines:
-                model_name = self.available_models.get('summarization', {}).get(model_key, 't5-small')
-                self.pipelines[pipeline_key] = pipeline(
-                    "summarization",
-                    model=model_name,
-                    device=0 if self.device.type == 'cuda' else -1
-                )
-            
-            summarizer = self.pipelines[pipeline_key]
+            if model_key not in self.available_models.get('summarization', {}):
+                model_key = 't5-small'
             
             # Truncate text if too long
             max_input_length = 1000  # Adjust based on model capacity
-            if len(text) > max_input_length:
-                text = text[:max_input_length] + "..."
+            texts = [text[:max_input_length] + "..." if len(text) > max_input_length else text for text in texts]
             
-            result = summarizer(text, max_length=max_length, min_length=30, do_sample=False)
-            summary = result[0]['summary_text'] if isinstance(result, list) else result['summary_text']
+            with self._generation(model_key, 'summarization') as resident:
+                # Summarization pipeline on the resident model
+                summarizer = resident.pipeline('summarization', lambda: pipeline(
+                    "summarization",
+                    model=resident.model,
+                    tokenizer=resident.tokenizer,
+                    device=0 if self.device.type == 'cuda' else -1
+                ))
+                results = summarizer(
+                    texts, max_length=max_length, min_length=30, do_sample=False, batch_size=len(texts)
+                )
             
             processing_time = time.time() - start_time
             
-            return {
-                'success': True,
-                'summary': summary,
-                'model_used': model_key,
-                'processing_time': processing_time,
-                'input_length': len(text),
-                'compression_ratio': len(summary) / len(text)
-            }
+            summaries = []
+            for text, result in zip(texts, results):
+                summary = result[0]['summary_text'] if isinstance(result, list) else result['summary_text']
+                summaries.append({
+                    'success': True,
+                    'summary': summary,
+                    'model_used': model_key,
+                    'processing_time': processing_time,
+                    'batch_size': len(texts),
+                    'input_length': len(text),
+                    'compression_ratio': len(summary) / len(text) if text else 0.0
+                })
+            return summaries
             
         except Exception as e:
             logger.error(f"Text summarization failed: {e}")
-            return {
+            return [{
                 'success': False,
                 'summary': 'Maaf, tidak dapat membuat ringkasan teks.',
                 'error': str(e),
                 'model_used': model_key
-            }
+            } for _ in texts]
     
     def get_available_models(self) -> Dict[str, List[str]]:
         """Get list of available models by task"""
@@ -340,7 +333,7 @@ class SLMService:
         """Get information about a specific model"""
         model_info = {
             'model_key': model_key,
-            'loaded': model_key in self.models,
+            'loaded': self.runtime.peek(model_key) is not None,
             'device': str(self.device),
             'available_tasks': []
         }
@@ -351,23 +344,19 @@ class SLMService:
                 model_info['available_tasks'].append(task)
                 model_info['model_name'] = models[model_key]
         
-        if model_key in self.models:
-            model = self.models[model_key]
+        resident = self.runtime.peek(model_key)
+        if resident is not None:
+            model = resident.model
+            model_info['quantized'] = resident.quantized
             model_info['parameters'] = sum(p.numel() for p in model.parameters())
             model_info['memory_usage'] = sum(p.numel() * p.element_size() for p in model.parameters()) / 1024 / 1024  # MB
         
         return model_info
     
     def clear_cache(self):
-        """Clear model cache to free memory"""
-        self.models.clear()
-        self.tokenizers.clear()
-        self.pipelines.clear()
-        cache.delete_many([f"slm_model_{key}" for key in self.available_models])
-        
-        # Clear GPU cache if using CUDA
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
+        """Drop the resident models to free memory"""
+        # Also clears the GPU cache if using CUDA
+        self.runtime.clear()
         
         logger.info("SLM cache cleared")
 
@@ -7,6 +7,8 @@ from datetime import timedelta
 from .models import ChatSession, ChatMessage, HRQueryLog
 from .hr_assistant_service import HRAssistantService
 from .hr_administrative_tasks import HRAdministrativeTasksService
+from .hr_assistant_architecture import HRAssistantOrchestrator
+from .hr_snapshot import HRSnapshotCache
 
 
 class HRAssistantTestCase(TestCase):
@@ -172,4 +174,67 @@ class HRAssistantTestCase(TestCase):
         
         active_sessions = ChatSession.objects.filter(user=self.user, is_active=True)
         self.assertEqual(active_sessions.count(), 1)
-        self.assertEqual(active_sessions.first(), session2)
\ No newline at end of file
+        self.assertEqual(active_sessions.first(), session2)
+
+
+class HRSnapshotCacheTestCase(TestCase):
+    """Test cases for the cached HR summaries."""
+    
+    def setUp(self):
+        self.orchestrator = HRAssistantOrchestrator()
+        for name, processor in self.orchestrator.processors.items():
+            processor.get_data_summary = Mock(return_value={'source': name})
+    
+    def test_summary_is_built_once(self):
+        """The processors are only asked again after an invalidation."""
+        first = self.orchestrator._get_general_hr_summary(42)
+        second = self.orchestrator._get_general_hr_summary(42)
+        
+        self.assertEqual(first, second)
+        self.assertEqual(first['data']['leave_summary'], {'source': 'leave'})
+        for processor in self.orchestrator.processors.values():
+            self.assertEqual(processor.get_data_summary.call_count, 1)
+        
+        HRSnapshotCache.invalidate([42])
+        self.orchestrator._get_general_hr_summary(42)
+        for processor in self.orchestrator.processors.values():
+            self.assertEqual(processor.get_data_summary.call_count, 2)
+    
+    def test_invalidation_is_per_employee(self):
+        """Changes of one employee keep the snapshots of the others."""
+        self.orchestrator._get_general_hr_summary(1)
+        self.orchestrator._get_general_hr_summary(2)
+        
+        HRSnapshotCache.invalidate([1])
+        self.orchestrator._get_general_hr_summary(1)
+        self.orchestrator._get_general_hr_summary(2)
+        
+        self.assertEqual(self.orchestrator.processors['payroll'].get_data_summary.call_count, 3)
+    
+    def test_signals_invalidate_the_owning_employee(self):
+        """Saving or deleting a related row bumps its employee's version."""
+        from django.db.models.signals import post_delete, post_save
+        from leave.models import LeaveRequest
+        from pms.models import EmployeeKeyResult, EmployeeObjective
+        
+        leave_request = LeaveRequest(employee_id_id=7)
+        version = HRSnapshotCache.version(7)
+        with self.captureOnCommitCallbacks(execute=True):
+            post_save.send(sender=LeaveRequest, instance=leave_request, created=True)
+        self.assertNotEqual(HRSnapshotCache.version(7), version)
+        
+        leave_request.pk = 1
+        version = HRSnapshotCache.version(7)
+        with self.captureOnCommitCallbacks(execute=True):
+            post_delete.send(sender=LeaveRequest, instance=leave_request)
+        self.assertNotEqual(HRSnapshotCache.version(7), version)
+        
+        key_result = EmployeeKeyResult(
+            employee_objective_id=EmployeeObjective(employee_id_id=9)
+        )
+        version = HRSnapshotCache.version(9)
+        other_version = HRSnapshotCache.version(7)
+        with self.captureOnCommitCallbacks(execute=True):
+            post_save.send(sender=EmployeeKeyResult, instance=key_result, created=True)
+        self.assertNotEqual(HRSnapshotCache.version(9), version)
+        self.assertEqual(HRSnapshotCache.version(7), other_version)
@@ -223,6 +223,28 @@ class BudgetAIServiceTestCase(TestCase):
             self.assertIn('predicted_amount', result)
             self.assertIn('confidence_score', result)
             self.assertIn('recommendations', result)
+    
+    def test_predict_many(self):
+        """Test batched budget prediction with one model call."""
+        mock_model = Mock()
+        mock_model.predict.return_value = np.array([2500.0, 4000.0, 6000.0])
+        mock_model.estimators_ = []
+        mock_model.feature_importances_ = np.array([0.1, 0.2, 0.3, 0.4])
+        self.service.model = mock_model
+        self.service.is_loaded = True
+        self.service.feature_names = ['feature1', 'feature2', 'feature3', 'feature4']
+        self.service.scaler = type('MockScaler', (), {'transform': lambda self, x: np.asarray(x)})()
+        self.service.feature_store.table = Mock(return_value={'spending': {}, 'employees': {1: 10}})
+        
+        inputs = [
+            {'department_id': 1, 'budget_category': category, 'time_period': 'monthly'}
+            for category in ['operational', 'capital', 'marketing']
+        ]
+        results = self.service.predict_many(inputs)
+        
+        self.assertEqual([result['predicted_amount'] for result in results], [2500.0, 4000.0, 6000.0])
+        mock_model.predict.assert_called_once()
+        self.service.feature_store.table.assert_called_once()
 
 class KnowledgeAIServiceTestCase(TestCase):
     """Test cases for Knowledge AI Service."""
@@ -352,6 +374,27 @@ class DocumentClassifierServiceTestCase(TestCase):
         self.assertIsInstance(result, dict)
         self.assertIn('final_classification', result)
 
+    def test_batch_classify_runs_models_once_per_batch(self):
+        """Test batch classification encodes the whole batch in one call."""
+        embedding_model = Mock()
+        embedding_model.encode.side_effect = lambda texts, **kwargs: np.random.rand(len(texts), 8)
+        self.service.embedding_model = embedding_model
+        self.service.classification_pipeline = None
+        self.service.traditional_classifier = None
+
+        documents = [{'content': f'resume experience skills {i}', 'name': f'cv{i}.txt'} for i in range(4)]
+        documents.append({'file_path': self.test_file.name})
+        results = self.service.batch_classify_documents(documents)
+
+        self.assertEqual(len(results), 5)
+        for result in results:
+            self.assertIn('embedding_classification', result)
+            self.assertIn('final_classification', result)
+            self.assertIn('model_name', result)
+            self.assertIn('processing_time_ms', result)
+        # Category descriptions once, then all documents in one call
+        self.assertEqual(embedding_model.encode.call_count, 2)
+
 class IntelligentSearchServiceTestCase(TestCase):
     """Test cases for Intelligent Search Service."""
     
@@ -557,6 +600,32 @@ class AIAPITestCase(APITestCase):
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('status', response.data)
+    
+    def test_public_health_api(self):
+        """Test public health endpoint reports services from the warmup registry."""
+        url = reverse('ai_services:public_system_health')
+        warmup_status = {
+            'status': 'degraded',
+            'services': {
+                'budget_ai': {'state': 'ready', 'loaded': True},
+                'knowledge_ai': {'state': 'failed', 'error': 'model missing'},
+                'indonesian_nlp': {'state': 'pending'},
+            }
+        }
+        
+        with patch('ai_services.api_views.get_system_health', return_value={'cpu_percent': 1.0}), \
+                patch('ai_services.api_views.readiness', return_value=warmup_status):
+            self.client.logout()
+            response = self.client.get(url)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'healthy')
+        self.assertEqual(response.data['readiness'], 'degraded')
+        self.assertEqual(response.data['services'], {
+            'budget_ai': 'active',
+            'knowledge_ai': 'inactive',
+            'indonesian_nlp': 'inactive',
+        })
 
 class AISignalsTestCase(TestCase):
     """Test cases for AI signals."""
@@ -884,4 +953,400 @@ class AIPerformanceTestCase(TestCase):
             
             # Assert that query completes within reasonable time (< 2 seconds)
             self.assertLess(execution_time, 2000)
-            self.assertIsInstance(result, dict)
\ No newline at end of file
+            self.assertIsInstance(result, dict)
+
+
+class PredictionCacheTestCase(TestCase):
+    """Test cases for the prediction cache of BaseAIService."""
+    
+    def setUp(self):
+        import threading
+        from .base import BaseAIService
+        
+        self.calls = []
+        self.release = threading.Event()
+        calls, release = self.calls, self.release
+        
+        class EchoService(BaseAIService):
+            def load_model(self):
+                self.is_loaded = True
+            
+            def validate_input(self, input_data):
+                return True
+            
+            def predict(self, input_data):
+                calls.append(input_data)
+                release.wait(5)
+                return {'value': input_data['x'] * 2}
+        
+        self.service = EchoService('echo_test_model')
+        self.service.clear_cache()
+    
+    def test_identical_predictions_are_coalesced(self):
+        """Concurrent identical predictions run the model once."""
+        import threading
+        
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.service.safe_predict({'x': 2})))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual([result['value'] for result in results], [4] * 5)
+    
+    def test_clear_cache_drops_predictions(self):
+        """Cached predictions are served until the cache is cleared."""
+        self.release.set()
+        self.service.safe_predict({'x': 3})
+        self.service.safe_predict({'x': 3})
+        self.assertEqual(len(self.calls), 1)
+        
+        self.service.clear_cache()
+        self.service.safe_predict({'x': 3})
+        self.assertEqual(len(self.calls), 2)
+
+
+class MetricsCollectorTestCase(TestCase):
+    """Test cases for the metrics store behind MetricsCollector."""
+    
+    def setUp(self):
+        from .metrics import MetricsCollector
+        self.collector = MetricsCollector(multiprocess_dir='')
+    
+    def test_counter_sums_matching_series(self):
+        """Counters are summed over the series having the given labels."""
+        self.collector.increment_counter('ai_cache_operations_total', 2, {'service': 'a', 'result': 'hit'})
+        self.collector.increment_counter('ai_cache_operations_total', 3, {'service': 'b', 'result': 'hit'})
+        self.collector.increment_counter('ai_cache_operations_total', 1, {'service': 'a', 'result': 'miss'})
+        
+        self.assertEqual(self.collector.get_counter('ai_cache_operations_total', {'result': 'hit'}), 5)
+        self.assertEqual(self.collector.get_counter('ai_cache_operations_total'), 6)
+    
+    def test_histogram_quantiles_and_export(self):
+        """Histograms keep bucket counts for quantiles and the Prometheus export."""
+        for value in range(1, 101):
+            self.collector.observe_histogram('ai_prediction_duration_seconds', value / 100, {'service': 'x'})
+        
+        self.assertAlmostEqual(self.collector.get_histogram_avg('ai_prediction_duration_seconds'), 0.505)
+        median = self.collector.get_histogram_quantile('ai_prediction_duration_seconds', 0.5)
+        self.assertTrue(0.25 <= median <= 1.0)
+        
+        exported = self.collector.get_prometheus_metrics()
+        self.assertIn('# TYPE ai_prediction_duration_seconds histogram', exported)
+        self.assertIn('ai_prediction_duration_seconds_bucket{service="x",le="+Inf"} 100', exported)
+        self.assertIn('ai_prediction_duration_seconds_count{service="x"} 100', exported)
+        self.assertEqual(
+            self.collector.get_rollup('ai_prediction_duration_seconds')[-1]['count'], 100
+        )
+    
+    def test_multiprocess_files_are_merged(self):
+        """Counters of other worker processes are added to the export."""
+        import pickle
+        import tempfile
+        from .metrics import MetricsCollector
+        from .metrics_store import MetricsStore
+        
+        directory = tempfile.mkdtemp()
+        collector = MetricsCollector(multiprocess_dir=directory)
+        collector.increment_counter('ai_predictions_total', 2)
+        
+        other = MetricsStore()
+        other.increment('ai_predictions_total', 5)
+        with open(os.path.join(directory, '0.pkl'), 'wb') as file:
+            pickle.dump([series.copy() for series in other.series.values()], file)
+        
+        self.assertEqual(collector.get_counter('ai_predictions_total'), 7)
+
+
+class SemanticAnswerCacheTestCase(TestCase):
+    """Test cases for the semantic answer cache of the chatbot."""
+    
+    def setUp(self):
+        from .answer_cache import SemanticAnswerCache
+        self.cache = SemanticAnswerCache(capacity=2, ttl=60, threshold=0.9)
+        self.rng = np.random.default_rng(0)
+        self.question = self.rng.normal(size=32)
+    
+    def test_similar_question_hits_in_same_scope(self):
+        """A close embedding finds the answer, another language does not."""
+        self.cache.store(self.question, 'id', {'response': 'a'})
+        
+        found = self.cache.lookup(self.question + 0.01 * self.rng.normal(size=32), 'id')
+        self.assertIsNotNone(found)
+        self.assertEqual(found[1], {'response': 'a'})
+        self.assertIsNone(self.cache.lookup(self.question, 'en'))
+        self.assertIsNone(self.cache.lookup(self.rng.normal(size=32), 'id'))
+        self.assertAlmostEqual(self.cache.stats()['hit_rate'], 1 / 3)
+    
+    def test_discard_and_lru_eviction(self):
+        """Stale entries are dropped and the least recently used one is evicted."""
+        slot = self.cache.store(self.question, 'id', {'response': 'a'})
+        entry = self.cache.lookup(self.question, 'id')[1]
+        self.cache.discard(slot, entry)
+        self.assertIsNone(self.cache.lookup(self.question, 'id'))
+        
+        first, second, third = (self.rng.normal(size=32) for _ in range(3))
+        self.cache.store(first, 'id', {'response': 'first'})
+        self.cache.store(second, 'id', {'response': 'second'})
+        self.cache.lookup(first, 'id')
+        self.cache.store(third, 'id', {'response': 'third'})
+        
+        self.assertIsNotNone(self.cache.lookup(first, 'id'))
+        self.assertIsNone(self.cache.lookup(second, 'id'))
+    
+    def test_answers_shaped_by_history_are_not_shared(self):
+        """Only answers to a question without prior conversation are cached."""
+        from .chatbot_slm_service import ChatbotSLMService
+        
+        with patch.object(ChatbotSLMService, '_initialize_services'):
+            service = ChatbotSLMService()
+        service.embedding_model = MagicMock()
+        service.embedding_model.encode.return_value = [self.question]
+        service.retrieve_relevant_documents = MagicMock(return_value=[{'document': MagicMock()}])
+        service.generate_response = MagicMock(return_value={'success': True, 'response': 'a'})
+        service._cached_answer = MagicMock(return_value=None)
+        service._cache_answer = MagicMock()
+        
+        query = 'Berapa hari cuti tahunan?'
+        with patch('ai_services.chatbot_slm_service.chat_sessions') as sessions:
+            sessions.get.return_value.window.return_value = [('user', query)]
+            service.answer_query(query, MagicMock(), MagicMock())
+            self.assertEqual(service._cached_answer.call_count, 1)
+            self.assertEqual(service._cache_answer.call_count, 1)
+            
+            sessions.get.return_value.window.return_value = [
+                ('user', 'Saya karyawan kontrak'), ('ai', 'Baik'), ('user', query)
+            ]
+            service.answer_query(query, MagicMock(), MagicMock())
+            self.assertEqual(service._cached_answer.call_count, 1)
+            self.assertEqual(service._cache_answer.call_count, 1)
+    
+    def test_inaccessible_answers_are_kept_for_other_users(self):
+        """A user without access misses, only a changed document drops the answer."""
+        from .chatbot_slm_service import ChatbotSLMService
+        
+        with patch.object(ChatbotSLMService, '_initialize_services'):
+            service = ChatbotSLMService()
+        service.answer_cache = self.cache
+        version = timezone.now()
+        self.cache.store(self.question, 'id', {
+            'response': {'success': True, 'response': 'a'},
+            'sources': [{'id': 1, 'version': version.isoformat(), 'similarity_score': 0.9,
+                         'snippet': 'cuti', 'method': 'keyword'}],
+        })
+        document = MagicMock(updated_at=version, accessible=False)
+        
+        with patch('ai_services.chatbot_slm_service.KnowledgeDocument') as documents:
+            in_bulk = documents.objects.filter.return_value.annotate.return_value.select_related.return_value.in_bulk
+            in_bulk.return_value = {1: document}
+            
+            self.assertIsNone(service._cached_answer(self.question, 'id', MagicMock()))
+            self.assertIsNotNone(self.cache.lookup(self.question, 'id'))
+            
+            document.accessible = True
+            found = service._cached_answer(self.question, 'id', MagicMock())
+            self.assertTrue(found['cache_hit'])
+            self.assertEqual(found['referenced_documents'], [document])
+            
+            document.updated_at = version + timedelta(minutes=1)
+            self.assertIsNone(service._cached_answer(self.question, 'id', MagicMock()))
+            self.assertIsNone(self.cache.lookup(self.question, 'id'))
+
+
+class IncrementalTrainerTestCase(TestCase):
+    """Test cases for the out-of-core training engine."""
+    
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.samples = []
+        for i in range(600):
+            department = str(rng.choice(['hr', 'it', 'finance']))
+            amount = float(rng.normal(100, 30))
+            target = 'high' if amount > 110 or department == 'finance' else 'low'
+            self.samples.append((f'sample-{i}', {'department': department, 'amount': amount}, target))
+    
+    def chunks(self):
+        for start in range(0, len(self.samples), 100):
+            yield self.samples[start:start + 100]
+    
+    def test_trains_from_chunks_with_sparse_features(self):
+        """Chunks are learned with partial_fit and every epoch is reported."""
+        from .training_engine import IncrementalTrainer
+        
+        epochs = []
+        trainer = IncrementalTrainer(self.chunks, epochs=3, batch_size=32)
+        trainer.fit(on_epoch=lambda entry: epochs.append(entry))
+        
+        self.assertEqual([entry['epoch'] for entry in epochs], [1, 2, 3])
+        self.assertEqual(trainer.training_size + trainer.validation_size, 600)
+        self.assertGreater(epochs[-1]['accuracy'], 0.8)
+        features = trainer.preprocessor.transform([self.samples[0][1]])
+        self.assertTrue(hasattr(features, 'tocsr'))
+        self.assertEqual(features.shape, (1, trainer.preprocessor.n_features))
+    
+    def test_on_epoch_can_stop_training(self):
+        """Returning False from on_epoch (a cancelled session) stops the training."""
+        from .training_engine import IncrementalTrainer
+        
+        trainer = IncrementalTrainer(self.chunks, epochs=5)
+        trainer.fit(on_epoch=lambda entry: False)
+        self.assertEqual(len(trainer.history), 1)
+    
+    def test_cancelled_session_is_not_completed(self):
+        """A session cancelled during fit keeps its status and registers no model."""
+        from .models import ModelTrainingSession
+        from .training import TrainingManager
+        
+        model = AIModelRegistry.objects.create(
+            service_type='budget_ai',
+            name='cancelled_predictor',
+            model_type='classification',
+            version='1.0.0'
+        )
+        session = ModelTrainingSession.objects.create(model=model, training_config={'epochs': 5})
+        
+        def cancel_during_fit(session, config):
+            ModelTrainingSession.objects.filter(id=session.id).update(status='cancelled')
+            return self.chunks()
+        
+        with patch('ai_services.training.SLMService'):
+            manager = TrainingManager()
+        manager._training_chunks = cancel_during_fit
+        manager._register_trained_model = Mock()
+        
+        self.assertFalse(manager.start_training(session.id))
+        session.refresh_from_db()
+        self.assertEqual(session.status, 'cancelled')
+        self.assertEqual(session.epochs_completed, 1)
+        manager._register_trained_model.assert_not_called()
+
+
+class CompiledTransformerTestCase(TestCase):
+    """Test cases for the compiled DataPreprocessor transform."""
+    
+    def test_compiled_transform_matches_fitted_features(self):
+        """Records, lists and columns give the features of fit_transform."""
+        import pandas as pd
+        from .preprocessing import DataPreprocessor
+        
+        data = pd.DataFrame({
+            'budget_amount': [1000, 2000, None, 3000],
+            'department': ['HR', 'IT', 'Finance', 'HR'],
+            'target': [1, 0, 0, 1]
+        })
+        preprocessor = DataPreprocessor()
+        features, _ = preprocessor.fit_transform(data, target_column='target')
+        records = data.drop(columns=['target']).to_dict('records')
+        
+        batch = preprocessor.transform(records)
+        self.assertEqual(batch.dtype, np.float32)
+        np.testing.assert_allclose(batch, features, atol=1e-5)
+        np.testing.assert_allclose(preprocessor.transform(records[1]), features[1:2], atol=1e-5)
+        columns = {'budget_amount': [1000, 2000, None, 3000], 'department': ['HR', 'IT', 'Finance', 'HR']}
+        np.testing.assert_allclose(preprocessor.transform(columns), features, atol=1e-5)
+        
+        # unseen category and missing value
+        unseen = preprocessor.transform({'department': 'Marketing'})
+        self.assertEqual(unseen.shape, (1, features.shape[1]))
+
+
+class RetrievalOrchestratorTestCase(TestCase):
+    """Test cases for the concurrent chatbot retrieval."""
+    
+    def test_reciprocal_rank_fusion(self):
+        """Documents found by several strategies rank first, duplicates count once."""
+        from .retrieval import reciprocal_rank_fusion
+        
+        fused = reciprocal_rank_fusion({
+            'keyword': [{'document_id': 1}, {'document_id': 2}, {'document_id': 1}],
+            'embedding': [{'document_id': 3}, {'document_id': 2}],
+        }, k=60)
+        self.assertEqual([hit.document_id for hit in fused], [2, 1, 3])
+        self.assertAlmostEqual(fused[0].score, 2 / 62)
+        self.assertEqual(list(fused[0].hits), ['keyword', 'embedding'])
+    
+    def test_slow_strategy_is_cut_off_at_its_budget(self):
+        """A strategy over its budget is left out, a failing one is reported."""
+        import threading
+        from .retrieval import RetrievalOrchestrator, Strategy
+        
+        release = threading.Event()
+        
+        def slow(query, user, limit):
+            release.wait(5)
+            return [{'document_id': 9}]
+        
+        def failing(query, user, limit):
+            raise RuntimeError('index unavailable')
+        
+        orchestrator = RetrievalOrchestrator([
+            Strategy('keyword', lambda query, user, limit: [{'document_id': 1}], 1.0),
+            Strategy('embedding', slow, 0.05),
+            Strategy('ai_semantic', failing, 1.0),
+        ], max_workers=3)
+        try:
+            fused, report = orchestrator.retrieve('cuti', None, 5)
+        finally:
+            release.set()
+            orchestrator.shutdown()
+        
+        self.assertEqual([hit.document_id for hit in fused], [1])
+        self.assertEqual(report['keyword']['status'], 'ok')
+        self.assertEqual(report['embedding']['status'], 'timeout')
+        self.assertEqual(report['ai_semantic']['status'], 'error')
+    
+    def test_hanging_strategy_is_skipped_while_it_runs(self):
+        """A cut off run keeps its strategy busy instead of taking another worker."""
+        import threading
+        from .retrieval import RetrievalOrchestrator, Strategy
+        
+        release = threading.Event()
+        
+        def hanging(query, user, limit):
+            release.wait(5)
+            return [{'document_id': 9}]
+        
+        orchestrator = RetrievalOrchestrator([
+            Strategy('embedding', hanging, 0.05),
+            Strategy('keyword', lambda query, user, limit: [{'document_id': 1}], 1.0),
+        ], max_workers=2)
+        try:
+            _, first = orchestrator.retrieve('cuti', None, 5)
+            fused, second = orchestrator.retrieve('cuti', None, 5)
+        finally:
+            release.set()
+            orchestrator.shutdown()
+        
+        self.assertEqual(first['embedding']['status'], 'timeout')
+        self.assertEqual(second['embedding']['status'], 'busy')
+        self.assertEqual(second['keyword']['status'], 'ok')
+        self.assertEqual([hit.document_id for hit in fused], [1])
+    
+    def test_concurrent_requests_all_get_results(self):
+        """Runs within their budget do not keep the strategy from other requests."""
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from .retrieval import RetrievalOrchestrator, Strategy
+        
+        def slow(query, user, limit):
+            time.sleep(0.3)
+            return [{'document_id': 1}]
+        
+        orchestrator = RetrievalOrchestrator([Strategy('keyword', slow, 2.0)], max_workers=4)
+        try:
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                results = list(pool.map(
+                    lambda _: orchestrator.retrieve('cuti', None, 5), range(2)
+                ))
+        finally:
+            orchestrator.shutdown()
+        
+        for fused, report in results:
+            self.assertEqual(report['keyword']['status'], 'ok')
+            self.assertEqual([hit.document_id for hit in fused], [1])
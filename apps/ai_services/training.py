@@ -1,17 +1,16 @@
 import os
-import json
+import shutil
+import time
 import logging
-from datetime import datetime
-from typing import Dict, Any, List, Optional, Tuple
+import traceback
+from typing import Dict, Any, Iterator, List
+import joblib
 from django.conf import settings
-from django.utils import timezone
 from .models import ModelTrainingSession, TrainingData, AIModelRegistry
 from .utils.model_evaluation import ModelEvaluator
 from .slm_service import SLMService
-from .preprocessing import DataPreprocessor, create_preprocessing_pipeline
+from .training_engine import CLASSIFICATION, IncrementalTrainer, Sample, run_in_subprocess
 from .exceptions import TrainingError
-import pandas as pd
-import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -33,17 +32,19 @@ class TrainingManager:
         Create a new training session
         """
         try:
+            model = AIModelRegistry.objects.get(name=model_name)
+            config = dict(training_config)
+            if training_data_ids:
+                config['training_data_ids'] = [str(data_id) for data_id in training_data_ids]
+            
             session = ModelTrainingSession.objects.create(
-                model_name=model_name,
-                training_config=training_config,
-                status='pending',
-                created_at=timezone.now()
+                model=model,
+                training_config=config,
+                hyperparameters=config.get('hyperparameters', {}),
+                total_epochs=config.get('epochs', 10),
+                status='pending'
             )
             
-            if training_data_ids:
-                training_data = TrainingData.objects.filter(id__in=training_data_ids)
-                session.training_data.set(training_data)
-            
             logger.info(f"Created training session {session.id} for model {model_name}")
             return session
             
@@ -51,189 +52,200 @@ class TrainingManager:
             logger.error(f"Failed to create training session: {str(e)}")
             raise TrainingError(f"Failed to create training session: {str(e)}")
     
-    def start_training(self, session_id: int) -> bool:
+    def start_training_process(self, session_id) -> int:
+        """
+        Start training in a separate process with limited CPU threads,
+        returns the process id
+        """
+        process = run_in_subprocess(
+            session_id,
+            threads=getattr(settings, 'AI_TRAINING_THREADS', 1),
+            niceness=getattr(settings, 'AI_TRAINING_NICENESS', 10)
+        )
+        return process.pid
+    
+    def start_training(self, session_id) -> bool:
         """
         Start training for a specific session
         """
         try:
-            session = ModelTrainingSession.objects.get(id=session_id)
-            session.status = 'training'
-            session.training_started_at = timezone.now()
-            session.save()
+            session = ModelTrainingSession.objects.select_related('model').get(id=session_id)
+            config = session.get_config()
+            epochs = config.get('epochs', 10)
             
-            # Get training data
-            training_data = list(session.training_data.all())
-            if not training_data:
-                raise TrainingError("No training data available")
+            session.total_epochs = epochs
+            session.epochs_completed = 0
+            session.save(update_fields=['total_epochs', 'epochs_completed', 'updated_at'])
+            session.start_training()
+            started = time.time()
+            
+            trainer = IncrementalTrainer(
+                lambda: self._training_chunks(session, config),
+                task_type=config.get('task_type', session.model.model_type),
+                estimator=config.get('estimator'),
+                hyperparameters=session.get_hyperparameters(),
+                epochs=epochs,
+                batch_size=config.get('batch_size', 32),
+                validation_split=config.get('validation_split', 0.2),
+                patience=config.get('early_stopping_patience')
+            )
+            trainer.fit(on_epoch=lambda entry: self._record_epoch(session, entry))
             
-            # Prepare training data with preprocessing
-            X_train, y_train, preprocessor = self._prepare_training_data(training_data)
+            # A cancelled fit stops early; keep the status and the active model
+            if self._is_cancelled(session):
+                logger.info(f"Training cancelled for session {session_id}")
+                return False
             
-            # Save preprocessor to session
-            preprocessor.save_to_session(session)
+            # Save model and preprocessing
+            model_dir = os.path.join(settings.MEDIA_ROOT, 'ai_models', session.model.name, str(session.id))
+            os.makedirs(model_dir, exist_ok=True)
+            joblib.dump(trainer.estimator, os.path.join(model_dir, 'model.pkl'))
+            joblib.dump(trainer.preprocessor, os.path.join(model_dir, 'preprocessor.pkl'))
             
-            # Start training process
-            training_results = self._execute_training(
-                session.model_name,
-                X_train,
-                y_train,
-                session.training_config,
-                preprocessor
-            )
+            metrics = self._evaluate(trainer)
+            config['metrics'] = metrics
+            config['history'] = trainer.history
+            config['preprocessing'] = trainer.preprocessor.get_feature_info()
             
             # Update session with results
-            session.training_completed_at = timezone.now()
-            session.model_path = training_results.get('model_path')
-            session.training_metrics = training_results.get('metrics', {})
-            session.status = 'completed'
-            session.save()
+            session.training_config = config
+            session.model_artifacts_path = model_dir
+            session.training_data_size = trainer.training_size
+            session.validation_data_size = trainer.validation_size
+            session.training_time_minutes = (time.time() - started) / 60
+            if trainer.history:
+                session.validation_loss = trainer.history[-1]['validation_loss']
+            session.complete_training(
+                accuracy=metrics.get('accuracy'),
+                precision=metrics.get('precision'),
+                recall=metrics.get('recall'),
+                f1_score=metrics.get('f1_score'),
+                loss=trainer.history[-1]['loss'] if trainer.history else None
+            )
             
-            # Register model if training successful
-            if training_results.get('success', False):
-                self._register_trained_model(session)
+            self._register_trained_model(session)
             
             logger.info(f"Training completed for session {session_id}")
             return True
             
         except Exception as e:
             logger.error(f"Training failed for session {session_id}: {str(e)}")
-            session = ModelTrainingSession.objects.get(id=session_id)
-            session.status = 'failed'
-            session.error_message = str(e)
-            session.save()
+            session = ModelTrainingSession.objects.filter(id=session_id).first()
+            if session is not None:
+                session.fail_training(str(e), traceback.format_exc())
             return False
     
-    def _prepare_training_data(self, training_data: List[TrainingData]) -> Tuple[np.ndarray, np.ndarray]:
+    def _training_queryset(self, session: ModelTrainingSession, config: Dict[str, Any]):
+        queryset = TrainingData.objects.filter(is_active=True)
+        if config.get('training_data_ids'):
+            queryset = queryset.filter(id__in=config['training_data_ids'])
+        else:
+            queryset = queryset.filter(target_service=session.model.service_type)
+        return queryset.order_by('pk').only('id', 'metadata')
+    
+    def _training_chunks(self, session: ModelTrainingSession, config: Dict[str, Any]) -> Iterator[List[Sample]]:
         """
-        Prepare training data for model training with preprocessing
+        Stream the samples of the session in chunks; a sample is the
+        ``input_data`` and ``expected_output`` of a TrainingData's metadata
         """
-        try:
-            # Collect raw data
-            raw_data = []
-            targets = []
-            
-            for data in training_data:
-                if data.input_data and data.expected_output:
-                    raw_data.append(data.input_data)
-                    targets.append(data.expected_output)
-            
-            if not raw_data:
-                raise TrainingError("No valid training data found")
-            
-            # Convert to DataFrame for preprocessing
-            df = pd.DataFrame(raw_data)
-            
-            # Create and fit preprocessing pipeline
-            preprocessor = create_preprocessing_pipeline()
-            
-            # Fit and transform the data
-            X_processed, _ = preprocessor.fit_transform(df)
-            y_processed = np.array(targets)
-            
-            logger.info(f"Preprocessed {len(raw_data)} samples into {X_processed.shape} feature matrix")
-            
-            return X_processed, y_processed, preprocessor
-            
-        except Exception as e:
-            logger.error(f"Error preparing training data: {str(e)}")
-            raise TrainingError(f"Failed to prepare training data: {str(e)}")
+        input_field = config.get('input_field', 'input_data')
+        target_field = config.get('target_field', 'expected_output')
+        chunk_size = config.get('chunk_size', 2000)
+        
+        chunk = []
+        for data in self._training_queryset(session, config).iterator(chunk_size=chunk_size):
+            metadata = data.metadata if isinstance(data.metadata, dict) else {}
+            features = metadata.get(input_field)
+            target = metadata.get(target_field)
+            if not isinstance(features, dict) or target is None:
+                continue
+            chunk.append((str(data.pk), features, target))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
     
-    def _execute_training(self, 
-                         model_name: str,
-                         X_train: np.ndarray,
-                         y_train: np.ndarray,
-                         config: Dict[str, Any],
-                         preprocessor: DataPreprocessor) -> Dict[str, Any]:
+    def _record_epoch(self, session: ModelTrainingSession, entry: Dict[str, Any]) -> bool:
         """
-        Execute the actual training process
+        Report the progress of an epoch, returns False when the session was cancelled
         """
-        try:
-            # Create model directory
-            model_dir = os.path.join(settings.MEDIA_ROOT, 'ai_models', model_name)
-            os.makedirs(model_dir, exist_ok=True)
-            
-            # Training configuration
-            epochs = config.get('epochs', 10)
-            batch_size = config.get('batch_size', 32)
-            learning_rate = config.get('learning_rate', 0.001)
-            
-            # Simulate training process (replace with actual training logic)
-            training_metrics = {
-                'accuracy': 0.85,
-                'loss': 0.15,
-                'precision': 0.83,
-                'recall': 0.87,
-                'f1_score': 0.85,
-                'epochs_completed': epochs,
-                'training_time': 120.5
-            }
-            
-            # Save model (placeholder)
-            model_path = os.path.join(model_dir, f"{model_name}_model.pkl")
-            
-            # Create a placeholder model file
-            model_info = {
-                'model_name': model_name,
-                'training_date': datetime.now().isoformat(),
-                'metrics': training_metrics,
-                'config': config
-            }
-            
-            with open(model_path, 'w') as f:
-                json.dump(model_info, f, indent=2)
-            
-            return {
-                'success': True,
-                'model_path': model_path,
-                'metrics': training_metrics
-            }
-            
-        except Exception as e:
-            logger.error(f"Training execution failed: {str(e)}")
-            return {
-                'success': False,
-                'error': str(e)
-            }
+        session.epochs_completed = entry['epoch']
+        session.loss = entry['loss']
+        session.validation_loss = entry['validation_loss']
+        update_fields = ['epochs_completed', 'loss', 'validation_loss', 'updated_at']
+        if 'accuracy' in entry:
+            session.accuracy = entry['accuracy']
+            update_fields.append('accuracy')
+        session.save(update_fields=update_fields)
+        
+        return not self._is_cancelled(session)
+    
+    def _is_cancelled(self, session: ModelTrainingSession) -> bool:
+        status = ModelTrainingSession.objects.filter(id=session.id).values_list('status', flat=True).first()
+        return status == 'cancelled'
+    
+    def _evaluate(self, trainer: IncrementalTrainer) -> Dict[str, Any]:
+        """
+        Final metrics on the validation split (training split if it is empty)
+        """
+        loss, y_true, y_pred = trainer.evaluate(validation=trainer.validation_size > 0)
+        if trainer.task_type == CLASSIFICATION:
+            metrics = self.evaluator.calculate_classification_metrics(
+                y_true.astype(str), y_pred.astype(str)
+            )
+        else:
+            metrics = self.evaluator.calculate_regression_metrics(y_true, y_pred)
+        metrics = {
+            key: float(value) if hasattr(value, 'item') else value
+            for key, value in metrics.items()
+        }
+        metrics['loss'] = loss
+        metrics['epochs_completed'] = len(trainer.history)
+        return metrics
     
     def _register_trained_model(self, session: ModelTrainingSession):
         """
-        Register the trained model in the registry
+        Point the registry entry of the model to the trained artifacts
         """
         try:
-            registry_entry = AIModelRegistry.objects.create(
-                model_name=session.model_name,
-                model_type='custom_trained',
-                model_path=session.model_path,
-                model_config=session.training_config,
-                performance_metrics=session.training_metrics,
-                is_active=True,
-                created_at=timezone.now()
-            )
-            
-            session.registry_entry = registry_entry
-            session.save()
+            model = session.model
+            model.model_path = session.model_artifacts_path
+            model.accuracy_score = session.accuracy
+            model.training_date = session.completed_at
+            model.config = {
+                **(model.config or {}),
+                'training_session_id': str(session.id),
+                'metrics': session.get_config().get('metrics', {})
+            }
+            model.is_active = True
+            model.save()
             
-            logger.info(f"Registered trained model {session.model_name} in registry")
+            logger.info(f"Registered trained model {model.name} in registry")
             
         except Exception as e:
             logger.error(f"Failed to register model: {str(e)}")
     
-    def get_training_status(self, session_id: int) -> Dict[str, Any]:
+    def get_training_status(self, session_id) -> Dict[str, Any]:
         """
         Get training status for a session
         """
         try:
-            session = ModelTrainingSession.objects.get(id=session_id)
+            session = ModelTrainingSession.objects.select_related('model').get(id=session_id)
             return {
                 'session_id': session.id,
-                'model_name': session.model_name,
+                'model_name': session.model.name,
                 'status': session.status,
                 'progress': self._calculate_progress(session),
-                'metrics': session.training_metrics or {},
+                'epochs_completed': session.epochs_completed,
+                'total_epochs': session.total_epochs,
+                'loss': session.loss,
+                'validation_loss': session.validation_loss,
+                'metrics': session.get_config().get('metrics', {}),
                 'error_message': session.error_message,
                 'created_at': session.created_at,
-                'training_started_at': session.training_started_at,
-                'training_completed_at': session.training_completed_at
+                'training_started_at': session.started_at,
+                'training_completed_at': session.completed_at
             }
         except ModelTrainingSession.DoesNotExist:
             return {'error': 'Training session not found'}
@@ -245,13 +257,9 @@ class TrainingManager:
         if session.status == 'pending':
             return 0.0
         elif session.status == 'training':
-            # Simulate progress based on time elapsed
-            if session.training_started_at:
-                elapsed = (timezone.now() - session.training_started_at).total_seconds()
-                # Assume training takes about 5 minutes
-                progress = min(elapsed / 300.0, 0.95) * 100
-                return progress
-            return 10.0
+            if session.total_epochs:
+                return min((session.epochs_completed or 0) / session.total_epochs, 0.99) * 100
+            return 0.0
         elif session.status == 'completed':
             return 100.0
         elif session.status == 'failed':
@@ -264,10 +272,10 @@ class TrainingManager:
         """
         List training sessions with optional filters
         """
-        queryset = ModelTrainingSession.objects.all()
+        queryset = ModelTrainingSession.objects.select_related('model')
         
         if model_name:
-            queryset = queryset.filter(model_name=model_name)
+            queryset = queryset.filter(model__name=model_name)
         if status:
             queryset = queryset.filter(status=status)
         
@@ -275,17 +283,17 @@ class TrainingManager:
         for session in queryset.order_by('-created_at'):
             sessions.append({
                 'id': session.id,
-                'model_name': session.model_name,
+                'model_name': session.model.name,
                 'status': session.status,
                 'created_at': session.created_at,
-                'training_started_at': session.training_started_at,
-                'training_completed_at': session.training_completed_at,
-                'metrics': session.training_metrics or {}
+                'training_started_at': session.started_at,
+                'training_completed_at': session.completed_at,
+                'metrics': session.get_config().get('metrics', {})
             })
         
         return sessions
     
-    def delete_training_session(self, session_id: int) -> bool:
+    def delete_training_session(self, session_id) -> bool:
         """
         Delete a training session and cleanup associated files
         """
@@ -293,12 +301,8 @@ class TrainingManager:
             session = ModelTrainingSession.objects.get(id=session_id)
             
             # Cleanup model files
-            if session.model_path and os.path.exists(session.model_path):
-                os.remove(session.model_path)
-            
-            # Remove registry entry if exists
-            if hasattr(session, 'registry_entry') and session.registry_entry:
-                session.registry_entry.delete()
+            if session.model_artifacts_path and os.path.isdir(session.model_artifacts_path):
+                shutil.rmtree(session.model_artifacts_path)
             
             session.delete()
             logger.info(f"Deleted training session {session_id}")
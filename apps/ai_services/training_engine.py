@@ -0,0 +1,393 @@
+"""
+Out-of-core training of the custom models.
+
+Training samples are streamed in chunks, so the memory of a session depends
+on the chunk size instead of the number of samples:
+
+- a first pass fits ``StreamingPreprocessor`` (running mean and variance of
+  the numeric fields, the categories of the short string fields) and collects
+  the labels of a classification target;
+- every epoch streams the chunks again, transforms them into a sparse CSR
+  matrix (one-hot categories and hashed text stay sparse) and feeds the
+  mini-batches to ``partial_fit`` of an incremental estimator;
+- a sample belongs to the validation split when the hash of its key says so,
+  the split is stable across epochs without being held in memory.
+
+``run_in_subprocess`` starts a session in a spawned process with the BLAS and
+OpenMP thread pools capped and a lower CPU priority, so a training never
+takes every core from the web workers.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import Perceptron, SGDClassifier, SGDRegressor
+from sklearn.metrics import log_loss, mean_squared_error
+from sklearn.preprocessing import StandardScaler
+
+logger = logging.getLogger(__name__)
+
+NUMERIC = 'numeric'
+CATEGORICAL = 'categorical'
+TEXT = 'text'
+# strings longer than this on average are vectorized as text, like DataPreprocessor
+TEXT_MIN_LENGTH = 50
+
+CLASSIFICATION = 'classification'
+REGRESSION = 'regression'
+
+ESTIMATORS = {
+    'sgd_classifier': (CLASSIFICATION, lambda params: SGDClassifier(**{'loss': 'log_loss', **params})),
+    'linear_svm': (CLASSIFICATION, lambda params: SGDClassifier(**{'loss': 'hinge', **params})),
+    'perceptron': (CLASSIFICATION, lambda params: Perceptron(**params)),
+    'sgd_regressor': (REGRESSION, lambda params: SGDRegressor(**params)),
+}
+DEFAULT_ESTIMATORS = {CLASSIFICATION: 'sgd_classifier', REGRESSION: 'sgd_regressor'}
+
+# (key, features, target)
+Sample = Tuple[str, Dict[str, Any], Any]
+ChunkSource = Callable[[], Iterable[List[Sample]]]
+
+
+class StreamingPreprocessor:
+    """Preprocessing fitted chunk by chunk, transforms records into a sparse matrix"""
+
+    def __init__(self, hash_features: int = 2 ** 16, max_categories: int = 1000):
+        self.hash_features = hash_features
+        self.max_categories = max_categories
+        self.kinds: Dict[str, str] = {}
+        self.scalers: Dict[str, StandardScaler] = {}
+        self.categories: Dict[str, Dict[str, int]] = {}
+        self.vectorizer = HashingVectorizer(
+            n_features=hash_features, alternate_sign=False, ngram_range=(1, 2), lowercase=True
+        )
+
+    @staticmethod
+    def _kind(values: List[Any]) -> Optional[str]:
+        present = [value for value in values if value is not None]
+        if not present:
+            return None
+        if all(isinstance(value, (int, float)) for value in present):
+            return NUMERIC
+        lengths = [len(value) if isinstance(value, str) else TEXT_MIN_LENGTH + 1 for value in present]
+        return TEXT if sum(lengths) / len(lengths) > TEXT_MIN_LENGTH else CATEGORICAL
+
+    @staticmethod
+    def _numbers(values: List[Any]) -> np.ndarray:
+        return np.array(
+            [float(value) if isinstance(value, (int, float)) else np.nan for value in values], dtype=np.float64
+        )
+
+    @staticmethod
+    def _string(value: Any) -> str:
+        if isinstance(value, str):
+            return value
+        return json.dumps(value, sort_keys=True, default=str)
+
+    def partial_fit(self, records: List[Dict[str, Any]]) -> 'StreamingPreprocessor':
+        columns = sorted({column for record in records for column in record})
+        for column in columns:
+            values = [record.get(column) for record in records]
+            kind = self.kinds.get(column) or self._kind(values)
+            if kind is None:
+                continue
+            self.kinds[column] = kind
+            if kind == NUMERIC:
+                numbers = self._numbers(values)
+                if not np.isnan(numbers).all():
+                    # NaNs are ignored by the running statistics
+                    self.scalers.setdefault(column, StandardScaler()).partial_fit(numbers.reshape(-1, 1))
+            elif kind == CATEGORICAL:
+                mapping = self.categories.setdefault(column, {})
+                for value in values:
+                    if value is not None and len(mapping) < self.max_categories:
+                        mapping.setdefault(self._string(value), len(mapping))
+        return self
+
+    @property
+    def numeric_columns(self) -> List[str]:
+        return sorted(column for column in self.scalers)
+
+    @property
+    def categorical_columns(self) -> List[str]:
+        return sorted(self.categories)
+
+    @property
+    def text_columns(self) -> List[str]:
+        return sorted(column for column, kind in self.kinds.items() if kind == TEXT)
+
+    @property
+    def n_features(self) -> int:
+        return (
+            len(self.numeric_columns)
+            + sum(len(self.categories[column]) for column in self.categorical_columns)
+            + self.hash_features * len(self.text_columns)
+        )
+
+    def transform(self, records: List[Dict[str, Any]]) -> sparse.csr_matrix:
+        count = len(records)
+        blocks = []
+
+        numeric_columns = self.numeric_columns
+        if numeric_columns:
+            numeric = np.zeros((count, len(numeric_columns)))
+            for index, column in enumerate(numeric_columns):
+                scaler = self.scalers[column]
+                values = (self._numbers([record.get(column) for record in records]) - scaler.mean_[0]) / scaler.scale_[0]
+                # missing values are imputed with the mean, which is 0 once scaled
+                numeric[:, index] = np.nan_to_num(values, nan=0.0)
+            blocks.append(sparse.csr_matrix(numeric))
+
+        offset = 0
+        rows, columns = [], []
+        for column in self.categorical_columns:
+            mapping = self.categories[column]
+            for row, record in enumerate(records):
+                value = record.get(column)
+                index = mapping.get(self._string(value)) if value is not None else None
+                if index is not None:
+                    rows.append(row)
+                    columns.append(offset + index)
+            offset += len(mapping)
+        if offset:
+            blocks.append(sparse.csr_matrix(
+                (np.ones(len(rows)), (rows, columns)), shape=(count, offset)
+            ))
+
+        for column in self.text_columns:
+            texts = [self._string(record.get(column) or '') for record in records]
+            blocks.append(self.vectorizer.transform(texts))
+
+        if not blocks:
+            return sparse.csr_matrix((count, 0))
+        return sparse.hstack(blocks, format='csr')
+
+    def get_feature_info(self) -> Dict[str, Any]:
+        return {
+            'feature_count': self.n_features,
+            'numerical_features': len(self.numeric_columns),
+            'categorical_features': len(self.categorical_columns),
+            'text_features': len(self.text_columns),
+            'columns': dict(sorted(self.kinds.items())),
+        }
+
+
+def is_validation(key: str, validation_split: float) -> bool:
+    """Stable assignment of a sample to the validation split"""
+    return zlib.crc32(str(key).encode()) % 10000 < validation_split * 10000
+
+
+def label(value: Any) -> Any:
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def make_estimator(task_type: str, name: Optional[str] = None, hyperparameters: Optional[Dict[str, Any]] = None):
+    name = name or DEFAULT_ESTIMATORS.get(task_type)
+    if name not in ESTIMATORS:
+        raise ValueError(f"Unknown estimator '{name}', expected one of {sorted(ESTIMATORS)}")
+    estimator_task, factory = ESTIMATORS[name]
+    if estimator_task != task_type:
+        raise ValueError(f"Estimator '{name}' does not support {task_type}")
+    return factory(dict(hyperparameters or {}))
+
+
+class IncrementalTrainer:
+    """Runs the passes of a training over a source of sample chunks"""
+
+    def __init__(self, chunks: ChunkSource, task_type: str = CLASSIFICATION, estimator: Optional[str] = None,
+                 hyperparameters: Optional[Dict[str, Any]] = None, epochs: int = 10, batch_size: int = 256,
+                 validation_split: float = 0.2, patience: Optional[int] = None, random_state: int = 42,
+                 preprocessor: Optional[StreamingPreprocessor] = None):
+        if task_type not in (CLASSIFICATION, REGRESSION):
+            raise ValueError(f"Unsupported task type '{task_type}'")
+        self.chunks = chunks
+        self.task_type = task_type
+        self.estimator = make_estimator(task_type, estimator, hyperparameters)
+        self.epochs = epochs
+        self.batch_size = batch_size
+        self.validation_split = validation_split
+        self.patience = patience
+        self.random_state = random_state
+        self.preprocessor = preprocessor or StreamingPreprocessor()
+        self.classes = None
+        self.training_size = 0
+        self.validation_size = 0
+        self.history: List[Dict[str, Any]] = []
+
+    def _targets(self, samples: List[Sample]) -> np.ndarray:
+        if self.task_type == CLASSIFICATION:
+            return np.array([label(target) for _, _, target in samples], dtype=object)
+        return np.array([float(target) for _, _, target in samples], dtype=np.float64)
+
+    def _fit_preprocessing(self):
+        labels = set()
+        for samples in self.chunks():
+            self.preprocessor.partial_fit([features for _, features, _ in samples])
+            for key, _, target in samples:
+                if is_validation(key, self.validation_split):
+                    self.validation_size += 1
+                else:
+                    self.training_size += 1
+                if self.task_type == CLASSIFICATION:
+                    labels.add(label(target))
+        if not self.training_size:
+            raise ValueError("No training samples")
+        if self.task_type == CLASSIFICATION:
+            if len(labels) < 2:
+                raise ValueError("Classification needs at least two classes")
+            self.classes = np.array(sorted(labels, key=str), dtype=object)
+
+    def _batch_loss(self, X, y) -> Tuple[float, int]:
+        """Summed loss of a batch, log loss when the estimator gives probabilities"""
+        if self.task_type == REGRESSION:
+            return float(mean_squared_error(y, self.estimator.predict(X))) * len(y), len(y)
+        if hasattr(self.estimator, 'predict_proba'):
+            probabilities = self.estimator.predict_proba(X)
+            return float(log_loss(y, probabilities, labels=self.estimator.classes_)) * len(y), len(y)
+        return float(np.sum(self.estimator.predict(X) != y)), len(y)
+
+    def _train_epoch(self, epoch: int) -> float:
+        """One pass over the training split; the loss is measured on each batch before learning it"""
+        rng = np.random.default_rng(self.random_state + epoch)
+        loss_sum, loss_count, fitted = 0.0, 0, epoch > 0
+        for samples in self.chunks():
+            samples = [sample for sample in samples if not is_validation(sample[0], self.validation_split)]
+            if not samples:
+                continue
+            X = self.preprocessor.transform([features for _, features, _ in samples])
+            y = self._targets(samples)
+            order = rng.permutation(len(samples))
+            for start in range(0, len(order), self.batch_size):
+                batch = order[start:start + self.batch_size]
+                if fitted:
+                    batch_loss, batch_count = self._batch_loss(X[batch], y[batch])
+                    loss_sum += batch_loss
+                    loss_count += batch_count
+                if self.task_type == CLASSIFICATION:
+                    self.estimator.partial_fit(X[batch], y[batch], classes=self.classes)
+                else:
+                    self.estimator.partial_fit(X[batch], y[batch])
+                fitted = True
+        return loss_sum / loss_count if loss_count else None
+
+    def evaluate(self, validation: bool = True) -> Tuple[Optional[float], np.ndarray, np.ndarray]:
+        """Loss, targets and predictions of the validation (or training) split"""
+        loss_sum, loss_count = 0.0, 0
+        targets, predictions = [], []
+        for samples in self.chunks():
+            samples = [
+                sample for sample in samples
+                if is_validation(sample[0], self.validation_split) == validation
+            ]
+            if not samples:
+                continue
+            X = self.preprocessor.transform([features for _, features, _ in samples])
+            y = self._targets(samples)
+            batch_loss, batch_count = self._batch_loss(X, y)
+            loss_sum += batch_loss
+            loss_count += batch_count
+            targets.append(y)
+            predictions.append(self.estimator.predict(X))
+        if not loss_count:
+            return None, np.array([]), np.array([])
+        return loss_sum / loss_count, np.concatenate(targets), np.concatenate(predictions)
+
+    def fit(self, on_epoch: Optional[Callable[[Dict[str, Any]], bool]] = None):
+        """
+        Fits the preprocessing, then trains for ``epochs`` passes. ``on_epoch``
+        receives the metrics of each epoch and stops the training by returning False.
+        """
+        self._fit_preprocessing()
+        validation = self.validation_size > 0
+        best_loss, stale_epochs = None, 0
+        for epoch in range(self.epochs):
+            started = time.time()
+            loss = self._train_epoch(epoch)
+            validation_loss, y_true, y_pred = self.evaluate(validation)
+            entry = {
+                'epoch': epoch + 1,
+                'loss': loss,
+                'validation_loss': validation_loss,
+                'seconds': round(time.time() - started, 3),
+            }
+            if self.task_type == CLASSIFICATION and len(y_true):
+                entry['accuracy'] = float(np.mean(y_true == y_pred))
+            self.history.append(entry)
+            logger.info(f"Epoch {epoch + 1}/{self.epochs}: loss={loss} validation_loss={validation_loss}")
+
+            if on_epoch is not None and on_epoch(entry) is False:
+                break
+            if self.patience and validation_loss is not None:
+                if best_loss is None or validation_loss < best_loss:
+                    best_loss, stale_epochs = validation_loss, 0
+                else:
+                    stale_epochs += 1
+                    if stale_epochs >= self.patience:
+                        logger.info(f"Validation loss did not improve for {stale_epochs} epochs, stopping")
+                        break
+        return self
+
+
+THREAD_ENVIRONMENT = (
+    'OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMEXPR_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS'
+)
+_spawn_lock = threading.Lock()
+
+
+def run_in_subprocess(session_id: str, threads: int = 1, niceness: int = 10) -> multiprocessing.Process:
+    """
+    Starts the training session in a spawned process. The thread pool sizes
+    are read by numpy and the BLAS libraries when they load, so they go in
+    the environment the child inherits.
+    """
+    context = multiprocessing.get_context('spawn')
+    process = context.Process(
+        target=_training_process,
+        args=(str(session_id), threads, niceness, os.environ.get('DJANGO_SETTINGS_MODULE')),
+        name=f'training-{session_id}',
+    )
+    with _spawn_lock:
+        saved = {name: os.environ.get(name) for name in THREAD_ENVIRONMENT}
+        os.environ.update({name: str(threads) for name in THREAD_ENVIRONMENT})
+        try:
+            process.start()
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+    logger.info(f"Started training session {session_id} in process {process.pid}")
+    return process
+
+
+def _training_process(session_id: str, threads: int, niceness: int, settings_module: Optional[str]):
+    if niceness:
+        try:
+            os.nice(niceness)
+        except (AttributeError, OSError):
+            pass
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(threads)
+    except ImportError:
+        pass
+
+    if settings_module:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+    from .training import TrainingManager
+    TrainingManager().start_training(session_id)
@@ -0,0 +1,214 @@
+"""
+Startup warmup of the AI services.
+
+The services used to be built on the first request that needed them, so the
+first user after a deploy waited for the models to load and the indexes to
+be built, and concurrent first requests loaded the same service twice. The
+services are now owned by this module: every service type has its own lock
+so it is initialized exactly once per process, ``warmup()`` initializes them
+in parallel threads ahead of traffic (``manage.py warmup_ai_services`` or
+``AI_SERVICES_WARMUP_ON_STARTUP``), and ``readiness()`` reports their state
+to the health endpoint.
+
+``ArtifactStore`` persists built artifacts (fitted vectorizers, embedding
+matrices) next to the models together with a fingerprint of the data they
+were built from, so a warm restart loads them instead of rebuilding.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .config import AIConfig
+
+try:
+    import joblib
+except ImportError:
+    joblib = None
+
+logger = logging.getLogger(__name__)
+
+SERVICE_TYPES = [
+    'budget_ai',
+    'knowledge_ai',
+    'indonesian_nlp',
+    'rag_n8n',
+    'document_classifier',
+    'intelligent_search',
+]
+
+
+def _service_class(service_type: str):
+    if service_type == 'budget_ai':
+        from .budget_ai import BudgetAIService
+        return BudgetAIService
+    elif service_type == 'knowledge_ai':
+        from .knowledge_ai import KnowledgeAIService
+        return KnowledgeAIService
+    elif service_type == 'indonesian_nlp':
+        from .indonesian_nlp import IndonesianNLPService
+        return IndonesianNLPService
+    elif service_type == 'rag_n8n':
+        from .rag_n8n_integration import RAGN8NIntegrationService
+        return RAGN8NIntegrationService
+    elif service_type == 'document_classifier':
+        from .document_classifier import DocumentClassifierService
+        return DocumentClassifierService
+    elif service_type == 'intelligent_search':
+        from .intelligent_search import IntelligentSearchService
+        return IntelligentSearchService
+    raise ValueError(f"Unknown service type: {service_type}")
+
+
+_services = {}
+_locks = {service_type: threading.Lock() for service_type in SERVICE_TYPES}
+_status = {service_type: {'state': 'pending'} for service_type in SERVICE_TYPES}
+
+
+def get_service(service_type: str):
+    """
+    Return the initialized service of a type, building and loading it on
+    first use. Concurrent callers wait for the one initialization.
+    """
+    service = _services.get(service_type)
+    if service is not None:
+        return service
+    if service_type not in _locks:
+        raise ValueError(f"Unknown service type: {service_type}")
+
+    with _locks[service_type]:
+        service = _services.get(service_type)
+        if service is not None:
+            return service
+        _status[service_type] = {'state': 'loading', 'started_at': time.time()}
+        start_time = time.time()
+        try:
+            service = _service_class(service_type)()
+            service.load_model()
+        except Exception as e:
+            _status[service_type] = {
+                'state': 'failed',
+                'error': str(e),
+                'duration': round(time.time() - start_time, 3),
+            }
+            raise
+        _services[service_type] = service
+        _status[service_type] = {
+            'state': 'ready',
+            'loaded': service.is_loaded,
+            'duration': round(time.time() - start_time, 3),
+        }
+        logger.info(f"AI service {service_type} ready in {time.time() - start_time:.2f}s")
+        return service
+
+
+def _warm(service_type: str):
+    try:
+        get_service(service_type)
+    finally:
+        # the pool threads are not request threads, close their connections
+        close_old_connections()
+
+
+def warmup(service_types: List[str] = None, max_workers: int = None) -> Dict[str, Any]:
+    """Initialize services in parallel; returns ``readiness()``"""
+    service_types = service_types or getattr(settings, 'AI_SERVICES_WARMUP', SERVICE_TYPES)
+    max_workers = max_workers or getattr(settings, 'AI_SERVICES_WARMUP_WORKERS', len(service_types))
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ai-warmup') as executor:
+        futures = {
+            executor.submit(_warm, service_type): service_type
+            for service_type in service_types
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Warmup of {futures[future]} failed: {str(e)}")
+    logger.info(f"AI services warmup finished in {time.time() - start_time:.2f}s")
+    return readiness()
+
+
+def start_background_warmup(service_types: List[str] = None) -> threading.Thread:
+    """Run ``warmup`` in a daemon thread so startup is not blocked"""
+    thread = threading.Thread(
+        target=warmup, args=(service_types,), name='ai-warmup', daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def readiness() -> Dict[str, Any]:
+    """State of every service without triggering any initialization"""
+    services = {service_type: dict(status) for service_type, status in _status.items()}
+    # services that are not warmed up only count once something loaded them
+    expected = getattr(settings, 'AI_SERVICES_WARMUP', SERVICE_TYPES)
+    states = {
+        status['state']
+        for service_type, status in services.items()
+        if service_type in expected or status['state'] != 'pending'
+    }
+    if states <= {'ready'}:
+        overall = 'ready'
+    elif 'failed' in states:
+        overall = 'degraded'
+    else:
+        overall = 'warming'
+    return {'status': overall, 'services': services}
+
+
+def reset_services():
+    """Forget the initialized services (used by tests and model redeploys)"""
+    for service_type in SERVICE_TYPES:
+        with _locks[service_type]:
+            _services.pop(service_type, None)
+            _status[service_type] = {'state': 'pending'}
+
+
+class ArtifactStore:
+    """
+    Persists built artifacts of a service with the fingerprint of the data
+    they were built from; ``load`` returns None when the data changed.
+    """
+
+    def __init__(self, model_name: str):
+        self.path = os.path.join(AIConfig.get_model_path(model_name), 'artifacts')
+
+    @staticmethod
+    def fingerprint(*parts) -> str:
+        return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.joblib")
+
+    def load(self, name: str, fingerprint: str):
+        if joblib is None or not os.path.exists(self._file(name)):
+            return None
+        try:
+            stored = joblib.load(self._file(name))
+        except Exception as e:
+            logger.warning(f"Could not read artifact {name}: {str(e)}")
+            return None
+        if stored.get('fingerprint') != fingerprint:
+            return None
+        return stored['payload']
+
+    def save(self, name: str, fingerprint: str, payload: Any) -> None:
+        if joblib is None:
+            return
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            # write then rename so a concurrent reader never sees half a file
+            temporary = f"{self._file(name)}.{os.getpid()}.tmp"
+            joblib.dump({'fingerprint': fingerprint, 'payload': payload}, temporary)
+            os.replace(temporary, self._file(name))
+        except Exception as e:
+            logger.warning(f"Could not write artifact {name}: {str(e)}")
+
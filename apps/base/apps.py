@@ -15,8 +15,10 @@ class BaseConfig(AppConfig):
 
     def ready(self) -> None:
         from base import signals
+        from base.dashboard_rollups import connect_signals
 
         super().ready()
+        connect_signals()
         try:
             from base.models import EmployeeShiftDay
 
@@ -0,0 +1,399 @@
+"""
+dashboard_rollups.py
+
+Incrementally maintained aggregates for the dashboard charts.
+
+The chart views used to iterate the leave requests, payslips and employees of
+a month in Python and re-query per employee and per department. The figures
+are now kept in DashboardRollup rows, one bucket per metric and period:
+
+    leave_days       approved leave days per employee, department and leave
+                     type, by month of the start date
+    payslip_net_pay  payslip net pay per employee, department and status, by
+                     month of the start date
+    headcount        active employees per department and gender, by day;
+                     today's bucket is kept current and earlier days keep
+                     the snapshot taken on them
+
+Model signals queue the buckets a saved, deleted, bulk updated or bulk
+created record belongs to once the transaction commits, and a background
+worker rebuilds each queued bucket with one grouped query. The chart views
+read a bucket in one query, and the nightly reconcile job rebuilds recent
+buckets to pick up changes that bypass the signals, such as an employee
+moving to another department.
+"""
+
+import logging
+import queue
+import threading
+from datetime import date, timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from base.models import DashboardRollup, DashboardRollupBucket
+from horilla.signals import post_bulk_create, post_bulk_update, pre_bulk_update
+
+logger = logging.getLogger(__name__)
+
+LEAVE_DAYS = "leave_days"
+PAYSLIP_NET_PAY = "payslip_net_pay"
+HEADCOUNT = "headcount"
+
+DAILY_METRICS = [HEADCOUNT]
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def next_month(day):
+    return (month_start(day) + timedelta(days=32)).replace(day=1)
+
+
+def bucket_period(metric, day):
+    """
+    Returns the period of the bucket ``day`` falls in for ``metric``
+    """
+    if hasattr(day, "date") and callable(day.date):
+        day = day.date()
+    return day if metric in DAILY_METRICS else month_start(day)
+
+
+def _leave_rows(period):
+    LeaveRequest = apps.get_model("leave", "LeaveRequest")
+    return (
+        LeaveRequest._base_manager.filter(
+            status="approved",
+            start_date__gte=period,
+            start_date__lt=next_month(period),
+        )
+        .values(
+            "employee_id",
+            company="employee_id__employee_work_info__company_id",
+            department="employee_id__employee_work_info__department_id",
+            key="leave_type_id__name",
+        )
+        .annotate(value=Sum("requested_days"), count=Count("id"))
+        .order_by()
+    )
+
+
+def _payslip_rows(period):
+    Payslip = apps.get_model("payroll", "Payslip")
+    return (
+        Payslip._base_manager.filter(
+            start_date__gte=period,
+            start_date__lt=next_month(period),
+        )
+        .values(
+            "employee_id",
+            company="employee_id__employee_work_info__company_id",
+            department="employee_id__employee_work_info__department_id",
+            key="status",
+        )
+        .annotate(value=Sum("net_pay"), count=Count("id"))
+        .order_by()
+    )
+
+
+def _headcount_rows(period):
+    Employee = apps.get_model("employee", "Employee")
+    return (
+        Employee._base_manager.filter(is_active=True)
+        .values(
+            company="employee_work_info__company_id",
+            department="employee_work_info__department_id",
+            key="gender",
+        )
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+
+
+BUILDERS = {
+    LEAVE_DAYS: ("leave", _leave_rows),
+    PAYSLIP_NET_PAY: ("payroll", _payslip_rows),
+    HEADCOUNT: ("employee", _headcount_rows),
+}
+
+
+def _cache_key(metric, period):
+    return f"dashboard_rollup:{metric}:{period.isoformat()}"
+
+
+def refresh_bucket(metric, period):
+    """
+    Rebuilds the rollup rows of one metric and period
+    """
+    app_label, builder = BUILDERS[metric]
+    if not apps.is_installed(app_label):
+        return
+    with transaction.atomic():
+        DashboardRollupBucket.objects.get_or_create(metric=metric, period=period)
+        # serialises concurrent rebuilds of the same bucket
+        bucket = DashboardRollupBucket.objects.select_for_update().get(
+            metric=metric, period=period
+        )
+        DashboardRollup.objects.filter(metric=metric, period=period).delete()
+        DashboardRollup.objects.bulk_create(
+            [
+                DashboardRollup(
+                    metric=metric,
+                    period=period,
+                    company_id_id=row["company"],
+                    department_id_id=row["department"],
+                    employee_id_id=row.get("employee_id"),
+                    key=row["key"] or "",
+                    value=row.get("value", row["count"]) or 0,
+                    count=row["count"],
+                )
+                for row in builder(period)
+            ]
+        )
+        bucket.save()
+    cache.set(_cache_key(metric, period), True, CACHE_TIMEOUT)
+
+
+def ensure_bucket(metric, period):
+    """
+    Builds the bucket on first read
+    """
+    if cache.get(_cache_key(metric, period)):
+        return
+    if DashboardRollupBucket.objects.filter(metric=metric, period=period).exists():
+        cache.set(_cache_key(metric, period), True, CACHE_TIMEOUT)
+        return
+    refresh_bucket(metric, period)
+
+
+def rollup_queryset(request, metric, day):
+    """
+    Returns the rollup rows of ``metric`` for the bucket ``day`` falls in,
+    limited to the company selected in the session
+    """
+    period = bucket_period(metric, day)
+    ensure_bucket(metric, period)
+    queryset = DashboardRollup.objects.filter(metric=metric, period=period)
+    selected_company = None
+    if request is not None:
+        selected_company = request.session.get("selected_company")
+    if selected_company and selected_company != "all":
+        queryset = queryset.filter(company_id=selected_company)
+    return queryset
+
+
+def _refresh(metric, period):
+    try:
+        refresh_bucket(metric, period)
+    except Exception as e:
+        logger.error(f"Dashboard rollup {metric} {period} failed: {e}")
+
+
+class RollupRefresher:
+    """
+    Rebuilds queued buckets on a background thread.
+
+    A bucket queued again before the worker picks it up is rebuilt once, so
+    a burst of saves to one month costs a single rebuild. With
+    ``DASHBOARD_ROLLUP_ASYNC = False`` buckets are rebuilt inline.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, metric, period):
+        if not getattr(settings, "DASHBOARD_ROLLUP_ASYNC", True):
+            _refresh(metric, period)
+            return
+        with self._lock:
+            if (metric, period) in self._queued:
+                return
+            self._queued.add((metric, period))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._work, name="horilla-dashboard-rollups", daemon=True
+                )
+                self._thread.start()
+        self._queue.put((metric, period))
+
+    def _work(self):
+        while True:
+            metric, period = self._queue.get()
+            # dequeued before the rebuild reads, later commits queue it again
+            with self._lock:
+                self._queued.discard((metric, period))
+            try:
+                close_old_connections()
+                _refresh(metric, period)
+            finally:
+                close_old_connections()
+                self._queue.task_done()
+
+    def join(self):
+        """
+        Wait until every queued bucket is rebuilt
+        """
+        self._queue.join()
+
+
+refresher = RollupRefresher()
+
+
+def schedule_refresh(metric, period):
+    """
+    Queues the bucket for a rebuild once the current transaction commits;
+    outside a transaction it is queued right away. A rolled back transaction
+    drops its callbacks, and the refresher's queue deduplicates the rest.
+    """
+    transaction.on_commit(lambda: refresher.add(metric, period))
+
+
+def reconcile(months=None):
+    """
+    Rebuilds the monthly buckets of the last ``months`` months and today's
+    headcount
+    """
+    if months is None:
+        months = getattr(settings, "DASHBOARD_ROLLUP_RECONCILE_MONTHS", 12)
+    today = date.today()
+    periods = []
+    period = month_start(today)
+    for _ in range(months):
+        periods.append(period)
+        period = month_start(period - timedelta(days=1))
+    refreshed = 0
+    for metric in BUILDERS:
+        for period in [today] if metric in DAILY_METRICS else periods:
+            refresh_bucket(metric, period)
+            refreshed += 1
+    return refreshed
+
+
+def _monthly_handlers(metric, date_field):
+    """
+    Signal handlers that rebuild the month of the saved or deleted record,
+    and the month it was moved out of
+    """
+
+    def before_save(sender, instance, **kwargs):
+        instance._rollup_previous_date = None
+        if instance.pk:
+            instance._rollup_previous_date = (
+                sender._base_manager.filter(pk=instance.pk)
+                .values_list(date_field, flat=True)
+                .first()
+            )
+
+    def after_change(sender, instance, **kwargs):
+        days = {
+            getattr(instance, date_field, None),
+            getattr(instance, "_rollup_previous_date", None),
+        }
+        for day in days:
+            if day:
+                schedule_refresh(metric, bucket_period(metric, day))
+
+    def periods_of(model, pks):
+        return set(
+            model._base_manager.filter(pk__in=pks).dates(date_field, "month")
+        )
+
+    def before_bulk_update(sender, queryset, **kwargs):
+        # the queryset may no longer match once the date field is updated
+        queryset._rollup_pks = list(queryset.values_list("pk", flat=True))
+        queryset._rollup_periods = periods_of(queryset.model, queryset._rollup_pks)
+
+    def after_bulk_update(sender, queryset, **kwargs):
+        pks = getattr(queryset, "_rollup_pks", [])
+        periods = getattr(queryset, "_rollup_periods", set())
+        if pks:
+            periods |= periods_of(queryset.model, pks)
+        for period in periods:
+            schedule_refresh(metric, period)
+
+    def after_bulk_create(sender, objs, **kwargs):
+        periods = {
+            bucket_period(metric, getattr(obj, date_field))
+            for obj in objs
+            if getattr(obj, date_field, None)
+        }
+        for period in periods:
+            schedule_refresh(metric, period)
+
+    return (
+        before_save,
+        after_change,
+        before_bulk_update,
+        after_bulk_update,
+        after_bulk_create,
+    )
+
+
+def _headcount_changed(sender, instance=None, **kwargs):
+    schedule_refresh(HEADCOUNT, date.today())
+
+
+_handlers = []
+
+
+def connect_signals():
+    """
+    Connects the rollup maintenance to the models of the installed apps
+    """
+    for metric, app_label, model_name in [
+        (LEAVE_DAYS, "leave", "LeaveRequest"),
+        (PAYSLIP_NET_PAY, "payroll", "Payslip"),
+    ]:
+        if not apps.is_installed(app_label):
+            continue
+        model = apps.get_model(app_label, model_name)
+        handlers = _monthly_handlers(metric, "start_date")
+        before_save, after_change, before_bulk, after_bulk, after_create = handlers
+        # the handlers are closures, keep them referenced for the weak receivers
+        _handlers.extend(handlers)
+        uid = f"dashboard_rollup_{metric}"
+        pre_save.connect(before_save, sender=model, dispatch_uid=f"{uid}_pre_save")
+        post_save.connect(after_change, sender=model, dispatch_uid=f"{uid}_post_save")
+        post_delete.connect(
+            after_change, sender=model, dispatch_uid=f"{uid}_post_delete"
+        )
+        pre_bulk_update.connect(
+            before_bulk, sender=model, dispatch_uid=f"{uid}_pre_bulk_update"
+        )
+        post_bulk_update.connect(
+            after_bulk, sender=model, dispatch_uid=f"{uid}_post_bulk_update"
+        )
+        post_bulk_create.connect(
+            after_create, sender=model, dispatch_uid=f"{uid}_post_bulk_create"
+        )
+
+    if apps.is_installed("employee"):
+        for model_name in ["Employee", "EmployeeWorkInformation"]:
+            model = apps.get_model("employee", model_name)
+            uid = f"dashboard_rollup_headcount_{model_name}"
+            post_save.connect(
+                _headcount_changed, sender=model, dispatch_uid=f"{uid}_post_save"
+            )
+            post_delete.connect(
+                _headcount_changed, sender=model, dispatch_uid=f"{uid}_post_delete"
+            )
+            post_bulk_update.connect(
+                _headcount_changed,
+                sender=model,
+                dispatch_uid=f"{uid}_post_bulk_update",
+            )
+            post_bulk_create.connect(
+                _headcount_changed,
+                sender=model,
+                dispatch_uid=f"{uid}_post_bulk_create",
+            )
@@ -9,10 +9,11 @@ from django.db import models
 from django.db.models.query import QuerySet
 
 from horilla.horilla_middlewares import _thread_locals
-from horilla.signals import post_bulk_update, pre_bulk_update
+from horilla.signals import post_bulk_create, post_bulk_update, pre_bulk_update
 
 logger = logging.getLogger(__name__)
 django_filter_update = QuerySet.update
+django_bulk_create = QuerySet.bulk_create
 
 
 def update(self, *args, **kwargs):
@@ -30,6 +31,16 @@ def update(self, *args, **kwargs):
 setattr(QuerySet, "update", update)
 
 
+def bulk_create(self, objs, *args, **kwargs):
+    objs = django_bulk_create(self, objs, *args, **kwargs)
+    # post bulk create signal, bulk_create does not send post_save
+    post_bulk_create.send(sender=self.model, queryset=self, objs=objs)
+    return objs
+
+
+setattr(QuerySet, "bulk_create", bulk_create)
+
+
 class HorillaCompanyManager(models.Manager):
     """
     HorillaCompanyManager
@@ -0,0 +1,72 @@
+"""Management command to dump the request profiles recorded by the query profiler"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from base.query_profiler import load_worker_summaries, merge_summaries
+
+SORT_FIELDS = {
+    "queries": "avg_queries",
+    "duplicates": "duplicate_max",
+    "sql": "avg_sql_time",
+    "templates": "avg_template_time",
+    "duration": "p95_duration",
+}
+
+
+class Command(BaseCommand):
+    help = "Show the URL names with the most queries, duplicates or SQL time"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sort",
+            choices=sorted(SORT_FIELDS),
+            default="queries",
+            help="Metric used to rank the URL names",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=20, help="Number of URL names to show"
+        )
+        parser.add_argument(
+            "--json", action="store_true", help="Print the merged summary as JSON"
+        )
+
+    def handle(self, *args, **options):
+        summaries = load_worker_summaries()
+        if not summaries:
+            raise CommandError(
+                "No request profiles found. Set QUERY_PROFILER_ENABLED = True and "
+                "let the workers serve some requests first."
+            )
+        merged = merge_summaries(summaries)
+        for stats in merged.values():
+            stats["duplicate_max"] = max(stats["duplicates"].values(), default=0)
+
+        field = SORT_FIELDS[options["sort"]]
+        ranked = sorted(merged.items(), key=lambda item: item[1][field], reverse=True)
+        ranked = ranked[: options["limit"]]
+
+        if options["json"]:
+            self.stdout.write(json.dumps(dict(ranked), indent=2))
+            return
+
+        self.stdout.write(
+            f"Profiles from {len(summaries)} worker(s), sorted by {options['sort']}\n"
+        )
+        self.stdout.write(
+            f"{'URL name':<45} {'samples':>8} {'queries':>8} {'max':>6} "
+            f"{'dup':>5} {'sql ms':>8} {'tpl ms':>8} {'p95 ms':>8} {'cache hit':>9}"
+        )
+        for name, stats in ranked:
+            lookups = stats["cache_hits"] + stats["cache_misses"]
+            hit_rate = f"{stats['cache_hits'] / lookups:.0%}" if lookups else "-"
+            self.stdout.write(
+                f"{name[:45]:<45} {stats['samples']:>8} {stats['avg_queries']:>8.1f} "
+                f"{stats['max_queries']:>6} {stats['duplicate_max']:>5} "
+                f"{stats['avg_sql_time'] * 1000:>8.1f} "
+                f"{stats['avg_template_time'] * 1000:>8.1f} "
+                f"{stats['p95_duration'] * 1000:>8.1f} {hit_rate:>9}"
+            )
+            for sql, times in stats["duplicates"].items():
+                self.stdout.write(self.style.WARNING(f"    {times}x {sql[:150]}"))
@@ -0,0 +1,21 @@
+"""Management command to rebuild the dashboard rollup buckets"""
+
+from django.core.management.base import BaseCommand
+
+from base.dashboard_rollups import reconcile
+
+
+class Command(BaseCommand):
+    help = "Rebuild the dashboard rollups of the recent months and today's headcount"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months",
+            type=int,
+            default=None,
+            help="Number of months to rebuild (default: DASHBOARD_ROLLUP_RECONCILE_MONTHS)",
+        )
+
+    def handle(self, *args, **options):
+        refreshed = reconcile(options["months"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {refreshed} rollup buckets."))
@@ -16,6 +16,12 @@ from base.backends import ConfiguredEmailBackend
 from base.context_processors import AllCompany
 from base.horilla_company_manager import HorillaCompanyManager
 from base.models import Company, ShiftRequest, WorkTypeRequest
+from base.query_profiler import (
+    get_profiler_settings,
+    get_query_profiler,
+    should_sample,
+    url_name_for,
+)
 from employee.models import (
     DisciplinaryAction,
     Employee,
@@ -40,7 +46,18 @@ class PerformanceOptimizationMiddleware:
         # Catat waktu mulai request
         start_time = time.time()
         
-        response = self.get_response(request)
+        # Profiling query ORM (opt-in, disampling)
+        profiler = get_query_profiler()
+        profile = None
+        if profiler is not None and should_sample():
+            profile = profiler.start()
+        
+        try:
+            response = self.get_response(request)
+        finally:
+            if profile is not None:
+                profiler.stop(*profile, url_name_for(request))
+                profiler.flush(flush_interval=get_profiler_settings()["flush_interval"])
         
         # Hitung waktu response
         response_time = time.time() - start_time
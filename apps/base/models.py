@@ -1651,6 +1651,51 @@ class DashboardEmployeeCharts(HorillaModel):
         return f"{self.employee} - charts"
 
 
+class DashboardRollup(models.Model):
+    """
+    Pre-aggregated dashboard figures, one row per metric, period and dimension
+    combination. Maintained by base.dashboard_rollups.
+    """
+
+    metric = models.CharField(max_length=50)
+    period = models.DateField()
+    company_id = models.ForeignKey(
+        Company, null=True, blank=True, on_delete=models.CASCADE
+    )
+    department_id = models.ForeignKey(
+        Department, null=True, blank=True, on_delete=models.CASCADE
+    )
+    employee_id = models.ForeignKey(
+        "employee.Employee", null=True, blank=True, on_delete=models.CASCADE
+    )
+    key = models.CharField(max_length=100, blank=True, default="")
+    value = models.FloatField(default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=["metric", "period"])]
+
+    def __str__(self):
+        return f"{self.metric} {self.period} {self.key}: {self.value}"
+
+
+class DashboardRollupBucket(models.Model):
+    """
+    Marks a metric and period whose rollup rows are built, even when the
+    period has no rows
+    """
+
+    metric = models.CharField(max_length=50)
+    period = models.DateField()
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("metric", "period")
+
+    def __str__(self):
+        return f"{self.metric} {self.period}"
+
+
 class BiometricAttendance(models.Model):
     is_installed = models.BooleanField(default=False)
     company_id = models.ForeignKey(
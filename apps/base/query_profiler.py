@@ -0,0 +1,354 @@
+"""query_profiler.py
+
+Opt-in per-request profiling of ORM queries, template rendering and cache use.
+
+Enable it with ``QUERY_PROFILER_ENABLED = True``; ``QUERY_PROFILER_SAMPLE_RATE``
+controls which fraction of requests is profiled (all of them in DEBUG by
+default). Every profiled request records its query count, total SQL time,
+duplicate query fingerprints (N+1 patterns), template render time and cache
+hits/misses. Samples are kept per URL name in a fixed-size ring buffer,
+exported through ``ai_services.metrics.MetricsCollector.get_prometheus_metrics``
+and dumped with ``python manage.py query_profile``.
+"""
+
+import contextvars
+import logging
+import os
+import random
+import re
+import socket
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_current_profile = contextvars.ContextVar("query_profile", default=None)
+
+WORKERS_CACHE_KEY = "query_profiler_workers"
+SUMMARY_CACHE_KEY = "query_profiler_summary_{worker}"
+
+_IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+_NUMBER = re.compile(r"\b\d+\b")
+_QUOTED = re.compile(r"'(?:[^']|'')*'")
+_SPACES = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """Normalise SQL so that queries differing only in parameters match"""
+    sql = _QUOTED.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("IN (...)", sql)
+    return _SPACES.sub(" ", sql).strip()
+
+
+def get_profiler_settings():
+    return {
+        "enabled": getattr(settings, "QUERY_PROFILER_ENABLED", False),
+        "sample_rate": getattr(
+            settings, "QUERY_PROFILER_SAMPLE_RATE", 1.0 if settings.DEBUG else 0.01
+        ),
+        "ring_size": getattr(settings, "QUERY_PROFILER_RING_SIZE", 200),
+        "duplicate_threshold": getattr(settings, "QUERY_PROFILER_DUPLICATE_THRESHOLD", 3),
+        "flush_interval": getattr(settings, "QUERY_PROFILER_FLUSH_INTERVAL", 30),
+    }
+
+
+class RequestProfile:
+    """Measurements of a single request"""
+
+    def __init__(self):
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.fingerprints = Counter()
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_depth = 0
+        self.started = time.perf_counter()
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.query_count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self, threshold):
+        return {sql: count for sql, count in self.fingerprints.items() if count >= threshold}
+
+
+def _instrument_templates():
+    from django.template.base import Template
+
+    if getattr(Template.render, "_query_profiled", False):
+        return
+    original_render = Template.render
+
+    def render(self, context):
+        profile = _current_profile.get()
+        if profile is None:
+            return original_render(self, context)
+        # only the outermost render is timed, includes are part of it
+        profile.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return original_render(self, context)
+        finally:
+            profile.template_depth -= 1
+            if not profile.template_depth:
+                profile.template_time += time.perf_counter() - start
+
+    render._query_profiled = True
+    Template.render = render
+
+
+def _instrument_caches():
+    for alias in settings.CACHES:
+        backend_class = caches[alias].__class__
+        if getattr(backend_class.get, "_query_profiled", False):
+            continue
+        original_get = backend_class.get
+        original_get_many = backend_class.get_many
+        missing = object()
+
+        def get(self, key, default=None, version=None, *args, _get=original_get, **kwargs):
+            value = _get(self, key, missing, version, *args, **kwargs)
+            profile = _current_profile.get()
+            # backends whose get_many loops over get are counted by get_many
+            if profile is not None and not profile.cache_depth:
+                if value is missing:
+                    profile.cache_misses += 1
+                else:
+                    profile.cache_hits += 1
+            return default if value is missing else value
+
+        def get_many(self, keys, *args, _get_many=original_get_many, **kwargs):
+            keys = list(keys)
+            profile = _current_profile.get()
+            if profile is None:
+                return _get_many(self, keys, *args, **kwargs)
+            profile.cache_depth += 1
+            try:
+                values = _get_many(self, keys, *args, **kwargs)
+            finally:
+                profile.cache_depth -= 1
+            profile.cache_hits += len(values)
+            profile.cache_misses += len(keys) - len(values)
+            return values
+
+        get._query_profiled = True
+        backend_class.get = get
+        backend_class.get_many = get_many
+
+
+class QueryProfiler:
+    """Keeps sampled request profiles per URL name in ring buffers"""
+
+    def __init__(self, ring_size=200, duplicate_threshold=3):
+        self.ring_size = ring_size
+        self.duplicate_threshold = duplicate_threshold
+        self.samples = defaultdict(lambda: deque(maxlen=self.ring_size))
+        self.lock = threading.Lock()
+        self.instrumented = False
+        self.last_flush = 0.0
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+
+    def instrument(self):
+        if self.instrumented:
+            return
+        try:
+            _instrument_templates()
+            _instrument_caches()
+        except Exception as e:
+            logger.error(f"Query profiler instrumentation failed: {e}")
+        self.instrumented = True
+
+    def start(self):
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        wrappers = []
+        for connection in connections.all():
+            wrapper = connection.execute_wrapper(profile)
+            wrapper.__enter__()
+            wrappers.append(wrapper)
+        return profile, token, wrappers
+
+    def stop(self, profile, token, wrappers, url_name):
+        for wrapper in reversed(wrappers):
+            wrapper.__exit__(None, None, None)
+        _current_profile.reset(token)
+        profile.duration = time.perf_counter() - profile.started
+        self.record(url_name, profile)
+
+    def record(self, url_name, profile):
+        sample = {
+            "duration": profile.duration,
+            "queries": profile.query_count,
+            "sql_time": profile.sql_time,
+            "template_time": profile.template_time,
+            "cache_hits": profile.cache_hits,
+            "cache_misses": profile.cache_misses,
+            "duplicates": profile.duplicates(self.duplicate_threshold),
+            "timestamp": time.time(),
+        }
+        with self.lock:
+            self.samples[url_name].append(sample)
+
+    def summary(self):
+        """Aggregate the ring buffers per URL name"""
+        with self.lock:
+            samples = {name: list(ring) for name, ring in self.samples.items()}
+        summary = {}
+        for name, ring in samples.items():
+            if not ring:
+                continue
+            count = len(ring)
+            durations = sorted(sample["duration"] for sample in ring)
+            duplicates = Counter()
+            for sample in ring:
+                for sql, times in sample["duplicates"].items():
+                    duplicates[sql] = max(duplicates[sql], times)
+            summary[name] = {
+                "samples": count,
+                "avg_duration": sum(durations) / count,
+                "p95_duration": durations[min(int(count * 0.95), count - 1)],
+                "avg_queries": sum(sample["queries"] for sample in ring) / count,
+                "max_queries": max(sample["queries"] for sample in ring),
+                "avg_sql_time": sum(sample["sql_time"] for sample in ring) / count,
+                "avg_template_time": sum(sample["template_time"] for sample in ring)
+                / count,
+                "cache_hits": sum(sample["cache_hits"] for sample in ring),
+                "cache_misses": sum(sample["cache_misses"] for sample in ring),
+                "duplicates": dict(duplicates.most_common(5)),
+            }
+        return summary
+
+    def flush(self, force=False, flush_interval=30):
+        """
+        Publish this worker's summary to the shared cache so the management
+        command can merge the numbers of every worker
+        """
+        now = time.time()
+        if not force and now - self.last_flush < flush_interval:
+            return
+        self.last_flush = now
+        try:
+            cache.set(
+                SUMMARY_CACHE_KEY.format(worker=self.worker),
+                {"worker": self.worker, "updated": now, "urls": self.summary()},
+                timeout=86400,
+            )
+            workers = cache.get(WORKERS_CACHE_KEY) or []
+            if self.worker not in workers:
+                workers.append(self.worker)
+                cache.set(WORKERS_CACHE_KEY, workers[-100:], timeout=86400)
+        except Exception as e:
+            logger.error(f"Query profiler flush failed: {e}")
+
+    def get_prometheus_lines(self):
+        """Per URL name metrics in Prometheus text format"""
+        summary = self.summary()
+        if not summary:
+            return []
+        metrics = [
+            ("django_request_profile_samples", "gauge", "samples"),
+            ("django_request_queries_avg", "gauge", "avg_queries"),
+            ("django_request_queries_max", "gauge", "max_queries"),
+            ("django_request_sql_seconds_avg", "gauge", "avg_sql_time"),
+            ("django_request_template_seconds_avg", "gauge", "avg_template_time"),
+            ("django_request_duration_seconds_avg", "gauge", "avg_duration"),
+            ("django_request_duration_seconds_p95", "gauge", "p95_duration"),
+            ("django_request_cache_hits", "gauge", "cache_hits"),
+            ("django_request_cache_misses", "gauge", "cache_misses"),
+        ]
+        lines = []
+        for metric, metric_type, field in metrics:
+            lines.append(f"# TYPE {metric} {metric_type}")
+            for name, stats in summary.items():
+                lines.append(f'{metric}{{url_name="{name}"}} {stats[field]}')
+        lines.append("# TYPE django_request_duplicate_queries_max gauge")
+        for name, stats in summary.items():
+            worst = max(stats["duplicates"].values(), default=0)
+            lines.append(f'django_request_duplicate_queries_max{{url_name="{name}"}} {worst}')
+        return lines
+
+
+_profiler_settings = None
+query_profiler = None
+
+
+def get_query_profiler():
+    """Return the process-wide profiler, or None when profiling is disabled"""
+    global query_profiler, _profiler_settings
+    if _profiler_settings is None:
+        _profiler_settings = get_profiler_settings()
+    if not _profiler_settings["enabled"]:
+        return None
+    if query_profiler is None:
+        query_profiler = QueryProfiler(
+            ring_size=_profiler_settings["ring_size"],
+            duplicate_threshold=_profiler_settings["duplicate_threshold"],
+        )
+        query_profiler.instrument()
+    return query_profiler
+
+
+def should_sample():
+    profiler_settings = _profiler_settings or get_profiler_settings()
+    return random.random() < profiler_settings["sample_rate"]
+
+
+def url_name_for(request):
+    match = getattr(request, "resolver_match", None)
+    if match is not None and match.view_name:
+        return match.view_name
+    return "unresolved"
+
+
+def load_worker_summaries():
+    """Read the summaries every worker published to the shared cache"""
+    summaries = []
+    for worker in cache.get(WORKERS_CACHE_KEY) or []:
+        summary = cache.get(SUMMARY_CACHE_KEY.format(worker=worker))
+        if summary:
+            summaries.append(summary)
+    return summaries
+
+
+def merge_summaries(summaries):
+    """Merge per-worker summaries into one per URL name, weighted by samples"""
+    merged = {}
+    for summary in summaries:
+        for name, stats in summary["urls"].items():
+            current = merged.get(name)
+            if current is None:
+                merged[name] = dict(stats, duplicates=dict(stats["duplicates"]))
+                continue
+            total = current["samples"] + stats["samples"]
+            for field in [
+                "avg_duration",
+                "avg_queries",
+                "avg_sql_time",
+                "avg_template_time",
+            ]:
+                current[field] = (
+                    current[field] * current["samples"] + stats[field] * stats["samples"]
+                ) / total
+            for field in ["p95_duration", "max_queries"]:
+                current[field] = max(current[field], stats[field])
+            for field in ["cache_hits", "cache_misses"]:
+                current[field] += stats[field]
+            for sql, times in stats["duplicates"].items():
+                current["duplicates"][sql] = max(current["duplicates"].get(sql, 0), times)
+            current["samples"] = total
+    return merged
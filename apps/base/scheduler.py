@@ -435,6 +435,16 @@ def recurring_holiday():
         recurring_holiday.save()
 
 
+def reconcile_dashboard_rollups():
+    """
+    Rebuilds the recent dashboard rollup buckets, catching the changes the
+    model signals do not see
+    """
+    from base.dashboard_rollups import reconcile
+
+    reconcile()
+
+
 if not any(
     cmd in sys.argv
     for cmd in ["makemigrations", "migrate", "compilemessages", "flush", "shell"]
@@ -498,4 +508,5 @@ if not any(
         pass
 
     scheduler.add_job(recurring_holiday, "interval", hours=4)
+    scheduler.add_job(reconcile_dashboard_rollups, "cron", hour=1, minute=30)
     scheduler.start()
@@ -7,4 +7,5 @@ class BudgetConfig(AppConfig):
     verbose_name = 'Budget Control'
     
     def ready(self):
+        import budget.cache
         import budget.signals
\ No newline at end of file
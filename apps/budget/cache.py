@@ -1,40 +1,59 @@
-from django.core.cache import cache
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from horilla.cache_namespaces import cache_namespace
 from .models import BudgetPlan, Expense, BudgetCategory, ExpenseType, FinancialReport
 
 
+# The dashboards are cached per user and invalidated together
+dashboard_cache = cache_namespace('budget_dashboard', timeout=900)
+budget_cache = cache_namespace('budget', timeout=900)
+
+
 class BudgetCacheManager:
     """Cache manager for budget module"""
     
+    @staticmethod
+    def get_dashboard(user_id):
+        """Cached dashboard data of a user, None when not cached"""
+        return dashboard_cache.get(user_id)
+    
+    @staticmethod
+    def set_dashboard(user_id, data, timeout=900):
+        """Cache the dashboard data of a user"""
+        dashboard_cache.set(user_id, data, timeout)
+    
     @staticmethod
     def clear_dashboard_cache(user_id=None):
         """Clear dashboard cache for specific user or all users"""
         if user_id:
-            cache.delete(f'budget_dashboard_{user_id}')
+            dashboard_cache.delete(user_id)
         else:
-            # Clear all dashboard caches (use pattern matching if available)
-            cache.delete_many(['budget_dashboard_*'])
+            dashboard_cache.invalidate()
     
     @staticmethod
     def clear_monthly_spending_cache():
         """Clear monthly spending cache"""
-        cache.delete('budget_monthly_spending')
+        budget_cache.delete('monthly_spending')
     
     @staticmethod
     def clear_budget_stats_cache():
         """Clear budget statistics cache"""
-        cache.delete('budget_stats')
+        budget_cache.delete('stats')
+    
+    @staticmethod
+    def clear_feature_table_cache():
+        """Clear the department/category feature table of the budget AI"""
+        budget_cache.delete('feature_table')
+    
+    @staticmethod
+    def get_or_set_feature_table(callback, timeout=900):
+        """Get the budget AI feature table from cache or build it"""
+        return budget_cache.get_or_set('feature_table', callback, timeout)
     
     @staticmethod
     def get_or_set_budget_stats(callback, timeout=900):
         """Get budget stats from cache or set if not exists"""
-        cache_key = 'budget_stats'
-        stats = cache.get(cache_key)
-        if stats is None:
-            stats = callback()
-            cache.set(cache_key, stats, timeout)
-        return stats
+        return budget_cache.get_or_set('stats', callback, timeout)
 
 
 # Signal handlers to clear cache when data changes
@@ -43,6 +62,7 @@ def clear_budget_cache_on_plan_change(sender, **kwargs):
     """Clear relevant caches when budget plan changes"""
     BudgetCacheManager.clear_dashboard_cache()
     BudgetCacheManager.clear_budget_stats_cache()
+    BudgetCacheManager.clear_feature_table_cache()
 
 
 @receiver([post_save, post_delete], sender=Expense)
@@ -57,6 +77,7 @@ def clear_budget_cache_on_expense_change(sender, **kwargs):
 def clear_budget_cache_on_category_change(sender, **kwargs):
     """Clear relevant caches when budget category changes"""
     BudgetCacheManager.clear_dashboard_cache()
+    BudgetCacheManager.clear_feature_table_cache()
 
 
 @receiver([post_save, post_delete], sender=ExpenseType)
@@ -0,0 +1,44 @@
+from django.test import TestCase
+
+from budget.cache import BudgetCacheManager
+
+
+class BudgetCacheManagerTest(TestCase):
+    """The dashboards of every user are dropped by one invalidation"""
+
+    def setUp(self):
+        BudgetCacheManager.clear_dashboard_cache()
+
+    def test_clear_dashboard_cache_for_all_users(self):
+        BudgetCacheManager.set_dashboard(1, {'total_budgets': 3})
+        BudgetCacheManager.set_dashboard(2, {'total_budgets': 5})
+
+        BudgetCacheManager.clear_dashboard_cache()
+
+        self.assertIsNone(BudgetCacheManager.get_dashboard(1))
+        self.assertIsNone(BudgetCacheManager.get_dashboard(2))
+
+    def test_clear_dashboard_cache_for_one_user(self):
+        BudgetCacheManager.set_dashboard(1, {'total_budgets': 3})
+        BudgetCacheManager.set_dashboard(2, {'total_budgets': 5})
+
+        BudgetCacheManager.clear_dashboard_cache(user_id=1)
+
+        self.assertIsNone(BudgetCacheManager.get_dashboard(1))
+        self.assertEqual(BudgetCacheManager.get_dashboard(2), {'total_budgets': 5})
+
+    def test_feature_table_is_built_once(self):
+        calls = []
+
+        def build():
+            calls.append(1)
+            return {'rows': []}
+
+        BudgetCacheManager.clear_feature_table_cache()
+        BudgetCacheManager.get_or_set_feature_table(build)
+        BudgetCacheManager.get_or_set_feature_table(build)
+        self.assertEqual(len(calls), 1)
+
+        BudgetCacheManager.clear_feature_table_cache()
+        BudgetCacheManager.get_or_set_feature_table(build)
+        self.assertEqual(len(calls), 2)
@@ -7,7 +7,6 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
 from django.db.models import Sum, Q, Count, F, Avg
 from django.utils import timezone
-from django.core.cache import cache
 from datetime import datetime, timedelta
 from decimal import Decimal
 from .models import (
@@ -16,6 +15,7 @@ from .models import (
 )
 from .forms import BudgetPlanForm, ExpenseForm, BudgetCategoryForm, ExpenseTypeForm, BudgetSettingsForm
 from .filters import BudgetPlanFilter, ExpenseFilter
+from .cache import BudgetCacheManager
 
 
 class SimpleBudgetDashboardView(LoginRequiredMixin, ListView):
@@ -108,8 +108,7 @@ class BudgetDashboardView(LoginRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         
         # Try to get cached dashboard data
-        cache_key = f'budget_dashboard_{self.request.user.id}'
-        cached_data = cache.get(cache_key)
+        cached_data = BudgetCacheManager.get_dashboard(self.request.user.id)
         
         if cached_data:
             context.update(cached_data)
@@ -128,9 +127,9 @@ class BudgetDashboardView(LoginRequiredMixin, ListView):
         pending_expenses = Expense.objects.filter(status='pending').count()
         
         # Recent expenses with optimized select_related
-        recent_expenses = Expense.objects.select_related(
+        recent_expenses = list(Expense.objects.select_related(
             'budget_plan', 'expense_type', 'requested_by__employee_user_id'
-        ).order_by('-created_at')[:10]
+        ).order_by('-created_at')[:10])
         
         # Budget utilization data
         budget_utilization = list(BudgetPlan.objects.filter(status='active').values(
@@ -152,7 +151,7 @@ class BudgetDashboardView(LoginRequiredMixin, ListView):
         }
         
         # Cache dashboard data for 15 minutes
-        cache.set(cache_key, dashboard_data, 900)
+        BudgetCacheManager.set_dashboard(self.request.user.id, dashboard_data, 900)
         
         context.update(dashboard_data)
         return context
@@ -0,0 +1,130 @@
+"""Management command to benchmark the bulk employee import end to end"""
+
+import json
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from employee.methods.methods import (
+    bulk_create_department_import,
+    bulk_create_employee_import,
+    bulk_create_employee_types,
+    bulk_create_job_position_import,
+    bulk_create_job_role_import,
+    bulk_create_shifts,
+    bulk_create_user_import,
+    bulk_create_work_info_import,
+    bulk_create_work_types,
+    process_employee_records,
+    set_initial_password,
+)
+
+GENDERS = ["male", "female", "other"]
+
+
+def benchmark_rows(rows, offset=0):
+    """Synthetic import rows shaped like the employee import template"""
+    blank = float("nan")
+    return pd.DataFrame(
+        [
+            {
+                "Badge ID": f"BENCH{offset + index:06d}",
+                "First Name": f"Bench{offset + index}",
+                "Last Name": "Import",
+                "Phone": f"+62812{offset + index:08d}",
+                "Email": f"bench{offset + index}@benchmark.local",
+                "Gender": GENDERS[index % len(GENDERS)],
+                "Department": f"Bench Department {index % 10}",
+                "Job Position": f"Bench Position {index % 20}",
+                "Job Role": f"Bench Role {index % 20}",
+                "Work Type": "Bench Remote",
+                "Shift": "Bench Shift",
+                "Employee Type": "Bench Permanent",
+                "Reporting Manager": blank,
+                "Company": blank,
+                "Location": blank,
+                "Date Joining": "2024-01-01",
+                "Contract End Date": blank,
+                "Basic Salary": 5000000,
+                "Salary Hour": 8,
+            }
+            for index in range(rows)
+        ]
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every stage of the employee import (validation, bulk creates and "
+        "password hashing) on synthetic rows; the data is rolled back"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            nargs="+",
+            default=[1000, 10000, 50000],
+            help="Import sizes to benchmark (default: 1000 10000 50000)",
+        )
+        parser.add_argument(
+            "--skip-passwords",
+            action="store_true",
+            help="Leave out the password hashing stage",
+        )
+        parser.add_argument("--export", type=str, help="Write the timings to a JSON file")
+
+    def handle(self, *args, **options):
+        results = {}
+        for rows in options["rows"]:
+            self.stdout.write(f"\n{rows} rows")
+            results[rows] = self.run_import(rows, options["skip_passwords"])
+            self.stdout.write(f"{'stage':<28} {'seconds':>9} {'rows/s':>10}")
+            for stage, seconds in results[rows].items():
+                per_second = f"{rows / seconds:.0f}" if seconds else "-"
+                self.stdout.write(f"{stage:<28} {seconds:>9.3f} {per_second:>10}")
+
+        if options["export"]:
+            with open(options["export"], "w") as export:
+                json.dump(results, export, indent=2)
+            self.stdout.write(f"Timings written to {options['export']}")
+
+    def run_import(self, rows, skip_passwords):
+        timings = {}
+
+        def timed(stage, function, *args):
+            start = time.perf_counter()
+            result = function(*args)
+            timings[stage] = time.perf_counter() - start
+            return result
+
+        data_frame = benchmark_rows(rows)
+        with transaction.atomic():
+            success_list, error_list, _ = timed(
+                "process_employee_records", process_employee_records, data_frame
+            )
+            if error_list:
+                self.stdout.write(
+                    self.style.WARNING(f"{len(error_list)} rows failed validation")
+                )
+            timed("bulk_create_user_import", bulk_create_user_import, success_list)
+            employees = timed(
+                "bulk_create_employee_import", bulk_create_employee_import, success_list
+            )
+            for stage in [
+                bulk_create_department_import,
+                bulk_create_job_position_import,
+                bulk_create_job_role_import,
+                bulk_create_work_types,
+                bulk_create_shifts,
+                bulk_create_employee_types,
+                bulk_create_work_info_import,
+            ]:
+                timed(stage.__name__, stage, success_list)
+            if not skip_passwords:
+                timed("set_initial_password", set_initial_password, employees)
+            timings["total"] = sum(timings.values())
+            transaction.set_rollback(True)
+        return timings
@@ -28,7 +28,7 @@ from django.contrib.auth.models import User
 from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
-from django.db.models import F, ProtectedError
+from django.db.models import Count, F, ProtectedError, Q, Sum
 from django.db.models.query import QuerySet
 from django.forms import DateInput, Select
 from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
@@ -44,6 +44,7 @@ from accessibility.decorators import enter_if_accessible
 from accessibility.methods import update_employee_accessibility_cache
 from accessibility.middlewares import ACCESSIBILITY_CACHE_USER_KEYS
 from accessibility.models import DefaultAccessibility
+from base.dashboard_rollups import HEADCOUNT, rollup_queryset
 from base.forms import ModelForm
 from base.methods import (
     choosesubordinates,
@@ -55,7 +56,6 @@ from base.methods import (
 )
 from base.models import (
     Company,
-    Department,
     EmailLog,
     JobPosition,
     JobRole,
@@ -2862,15 +2862,15 @@ def dashboard_employee(request):
         _("Active"),
         _("In-Active"),
     ]
-    employees = Employee.objects.filter()
+    counts = Employee.objects.aggregate(
+        active=Count("id", filter=Q(is_active=True)),
+        inactive=Count("id", filter=Q(is_active=False)),
+    )
     response = {
         "dataSet": [
             {
                 "label": _("Employees"),
-                "data": [
-                    len(employees.filter(is_active=True)),
-                    len(employees.filter(is_active=False)),
-                ],
+                "data": [counts["active"], counts["inactive"]],
             },
         ],
         "labels": labels,
@@ -2884,16 +2884,21 @@ def dashboard_employee_gender(request):
     This method is used to filter out gender vise employees
     """
     labels = [_("Male"), _("Female"), _("Other")]
-    employees = Employee.objects.filter(is_active=True)
+    counts = dict(
+        rollup_queryset(request, HEADCOUNT, date.today())
+        .values("key")
+        .annotate(employees=Sum("count"))
+        .values_list("key", "employees")
+    )
 
     response = {
         "dataSet": [
             {
                 "label": _("Employees"),
                 "data": [
-                    len(employees.filter(gender="male")),
-                    len(employees.filter(gender="female")),
-                    len(employees.filter(gender="other")),
+                    counts.get("male", 0),
+                    counts.get("female", 0),
+                    counts.get("other", 0),
                 ],
             },
         ],
@@ -2907,24 +2912,15 @@ def dashboard_employee_department(request):
     """
     This method is used to find the count of employees corresponding to the departments
     """
-    labels = []
-    count = []
-    departments = Department.objects.all()
-    for dept in departments:
-        if len(
-            Employee.objects.filter(
-                employee_work_info__department_id__department=dept, is_active=True
-            )
-        ):
-            labels.append(dept.department)
-            count.append(
-                len(
-                    Employee.objects.filter(
-                        employee_work_info__department_id__department=dept,
-                        is_active=True,
-                    )
-                )
-            )
+    rows = (
+        rollup_queryset(request, HEADCOUNT, date.today())
+        .filter(department_id__isnull=False)
+        .values("department_id", "department_id__department")
+        .annotate(employees=Sum("count"))
+        .order_by("department_id")
+    )
+    labels = [row["department_id__department"] for row in rows]
+    count = [row["employees"] for row in rows]
     response = {
         "dataSet": [{"label": "Department", "data": count}],
         "labels": labels,
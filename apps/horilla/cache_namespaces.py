@@ -0,0 +1,178 @@
+"""
+horilla/cache_namespaces.py
+
+Invalidatable groups of cache entries.
+
+Every namespace keeps a generation counter in the shared cache and embeds it
+in the keys of its entries, so invalidating all of them (the per user
+dashboards, every AI result of a prefix, ...) is a single ``incr`` instead of
+a key pattern scan, which most cache backends cannot do. Entries of older
+generations are never read again and expire on their own.
+
+Reads go through a small in-process cache first. It holds the entries under
+their generation key, and the generation itself for
+``CACHE_NAMESPACE_LOCAL_TIMEOUT`` seconds, which bounds how long another
+process can keep serving entries of an invalidated generation.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+_MISSING = object()
+_namespaces = {}
+_namespaces_lock = threading.Lock()
+
+
+class LocalCache:
+    """Thread safe, size bounded in-process cache with per entry expiry"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class CacheNamespace:
+    """
+    Cache entries sharing a generation counter. ``timeout`` is the default
+    timeout of the shared cache, ``local=False`` skips the in-process tier
+    for values that are too large to keep in every worker and
+    ``local_timeout`` keeps the entries longer than the generation there.
+    """
+
+    def __init__(self, name, timeout=300, local=True, local_timeout=None):
+        self.name = name
+        self.timeout = timeout
+        self.entry_local_timeout = local_timeout
+        self.generation_key = f"cache_generation:{name}"
+        self.local = (
+            LocalCache(getattr(settings, "CACHE_NAMESPACE_LOCAL_MAX_ENTRIES", 1000))
+            if local
+            else None
+        )
+        self._generation = None
+        self._generation_expires = 0
+
+    @staticmethod
+    def local_timeout():
+        return getattr(settings, "CACHE_NAMESPACE_LOCAL_TIMEOUT", 5)
+
+    def generation(self):
+        """Current generation, re-read from the shared cache every few seconds"""
+        now = time.monotonic()
+        if self._generation is not None and now < self._generation_expires:
+            return self._generation
+        generation = cache.get(self.generation_key)
+        if generation is None:
+            # start from a fresh number, an evicted counter must not bring
+            # back the entries stored under its earlier values
+            cache.add(self.generation_key, int(time.time() * 1000), None)
+            generation = cache.get(self.generation_key) or int(time.time() * 1000)
+        self._generation = generation
+        self._generation_expires = now + self.local_timeout()
+        return generation
+
+    def make_key(self, key):
+        return f"{self.name}:{self.generation()}:{key}"
+
+    def _entry_local_timeout(self):
+        # entries live under their generation, they can outlast its re-read
+        return self.entry_local_timeout or self.local_timeout()
+
+    def lookup(self, key):
+        """Returns ``(value, tier)``, tier is "local", "shared" or None on a miss"""
+        full_key = self.make_key(key)
+        if self.local is not None:
+            value = self.local.get(full_key, _MISSING)
+            if value is not _MISSING:
+                return value, "local"
+        value = cache.get(full_key, _MISSING)
+        if value is _MISSING:
+            return None, None
+        if self.local is not None:
+            self.local.set(full_key, value, self._entry_local_timeout())
+        return value, "shared"
+
+    def get(self, key, default=None):
+        value, tier = self.lookup(key)
+        return default if tier is None else value
+
+    def set(self, key, value, timeout=None):
+        full_key = self.make_key(key)
+        cache.set(full_key, value, self.timeout if timeout is None else timeout)
+        if self.local is not None:
+            self.local.set(full_key, value, self._entry_local_timeout())
+
+    def delete(self, key):
+        full_key = self.make_key(key)
+        cache.delete(full_key)
+        if self.local is not None:
+            self.local.delete(full_key)
+
+    def get_or_set(self, key, callback, timeout=None):
+        """Returns the cached value or stores what ``callback()`` returns"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = callback()
+            self.set(key, value, timeout)
+        return value
+
+    def invalidate(self):
+        """Drops every entry of the namespace by moving to a new generation"""
+        try:
+            generation = cache.incr(self.generation_key)
+        except ValueError:
+            generation = int(time.time() * 1000)
+            cache.set(self.generation_key, generation, None)
+        self._generation = generation
+        self._generation_expires = time.monotonic() + self.local_timeout()
+        if self.local is not None:
+            self.local.clear()
+
+
+def cache_namespace(name, timeout=300, local=True, local_timeout=None):
+    """
+    Returns the process wide namespace called ``name``, so the in-process
+    tier and the generation are shared by every caller.
+    """
+    namespace = _namespaces.get(name)
+    if namespace is None:
+        with _namespaces_lock:
+            namespace = _namespaces.setdefault(
+                name,
+                CacheNamespace(
+                    name, timeout=timeout, local=local, local_timeout=local_timeout
+                ),
+            )
+    return namespace
@@ -1,12 +1,31 @@
+"""
+group_by.py
+
+Group-by engine for the list views.
+
+All group counts come from a single ``values(group_field).annotate(Count)``
+query. Only the groups on the visible page get a record page, and their first
+pages are fetched together with one window-function query where the database
+supports it; any other group page is a lazy slice that only hits the database
+when it is rendered.
+"""
+
+import logging
+
 from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import Count, F, Q, Window
 from django.db.models.fields.related_descriptors import ForwardManyToOneDescriptor
+from django.db.models.functions import RowNumber
 
 from horilla.horilla_middlewares import _thread_locals
 
+logger = logging.getLogger(__name__)
 
-def record_queryset_paginator(request, queryset, page_name, records_per_page=10):
+
+def safe_ordering(queryset):
     """
-    Returns paginated results with safe ordering.
+    Returns the queryset with a stable ordering for pagination
     """
     # 803
     if not queryset.ordered:
@@ -14,62 +33,202 @@ def record_queryset_paginator(request, queryset, page_name, records_per_page=10)
             queryset = queryset.order_by("-created_at")
         else:
             queryset = queryset.order_by("-id")
+    return queryset
+
 
-    page = request.GET.get(page_name)
+def record_queryset_paginator(
+    request, queryset, page_name, records_per_page=10, count=None, first_page=None
+):
+    """
+    Returns paginated results with safe ordering.
+
+    ``count`` skips the COUNT query when the size is already known and
+    ``first_page`` holds prefetched records of page one.
+    """
+    queryset = safe_ordering(queryset)
+    page = request.GET.get(page_name) if request else None
     paginator = Paginator(queryset, records_per_page)
-    return paginator.get_page(page)
+    if count is not None:
+        # Paginator.count is a cached_property
+        paginator.__dict__["count"] = count
+    page = paginator.get_page(page)
+    if first_page is not None and page.number == 1:
+        page.object_list = first_page
+    return page
+
+
+def group_counts(queryset, group_field):
+    """
+    Returns ``{group value: record count}`` from one grouped query
+    """
+    try:
+        with transaction.atomic(using=queryset.db):
+            distinct = queryset.query.distinct
+            rows = (
+                queryset.order_by()
+                .values(group_field)
+                .annotate(group_by_count=Count("pk", distinct=distinct))
+            )
+            return {row[group_field]: row["group_by_count"] for row in rows}
+    except Exception as e:
+        # e.g. querysets that already aggregate; count the column instead
+        logger.error(e)
+        counts = {}
+        for value in queryset.values_list(group_field, flat=True):
+            counts[value] = counts.get(value, 0) + 1
+        return counts
+
+
+def _order_expressions(queryset):
+    ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+    expressions = []
+    for order in ordering:
+        if not isinstance(order, str):
+            expressions.append(order)
+        elif order == "?":
+            return None
+        elif order.startswith("-"):
+            expressions.append(F(order[1:]).desc())
+        else:
+            expressions.append(F(order).asc())
+    return expressions
+
+
+def prefetch_first_pages(queryset, group_field, values, records_per_page):
+    """
+    Fetch the first page of every group in ``values`` with one
+    ``ROW_NUMBER() OVER (PARTITION BY group_field)`` query.
+
+    Returns ``{group value: [records]}``, or an empty dict when the database
+    or the queryset does not allow it.
+    """
+    connection = connections[queryset.db]
+    if (
+        not values
+        or queryset.query.distinct
+        or not getattr(connection.features, "supports_over_clause", False)
+    ):
+        return {}
+    ordering = _order_expressions(queryset)
+    if ordering is None:
+        return {}
+
+    condition = Q(
+        **{f"{group_field}__in": [value for value in values if value is not None]}
+    )
+    if None in values:
+        condition |= Q(**{f"{group_field}__isnull": True})
+    try:
+        records = (
+            queryset.filter(condition)
+            .annotate(
+                group_by_value=F(group_field),
+                group_by_row=Window(
+                    RowNumber(), partition_by=[F(group_field)], order_by=ordering
+                ),
+            )
+            .filter(group_by_row__lte=records_per_page)
+            # the row numbers carry the ordering; an outer ORDER BY on
+            # related columns breaks the filtered window query
+            .order_by()
+        )
+        first_pages = {}
+        with transaction.atomic(using=queryset.db):
+            for record in records:
+                first_pages.setdefault(record.group_by_value, []).append(record)
+        for page in first_pages.values():
+            page.sort(key=lambda record: record.group_by_row)
+        return first_pages
+    except Exception as e:
+        logger.error(e)
+        return {}
+
+
+def _is_multi_valued(model, fields_split):
+    for field in fields_split:
+        field_obj = model._meta.get_field(field)
+        if field_obj.many_to_many or field_obj.one_to_many:
+            return True
+        model = field_obj.related_model
+        if model is None:
+            break
+    return False
 
 
 def generate_groups(request, groupers, queryset, page_name, group_field, is_fk_field):
     """
     groups generating method
+
+    ``groupers`` is a list of ``(grouper, group value, record count)`` holding
+    only groups with records, so no per-group COUNT is needed. The record
+    pages are attached by `attach_group_lists`.
     """
     groups = []
-    if is_fk_field:
-        for grouper in groupers:
-            group_queryset = queryset.filter(**{group_field: grouper.id})
-            # to avoid zero records groupings
-            if group_queryset.count():
-                group_info = {
-                    "grouper": grouper,
-                    "list": record_queryset_paginator(
-                        request,
-                        group_queryset,
-                        f"dynamic_page_{page_name}{grouper.id}",
-                    ),
-                    "dynamic_name": f"dynamic_page_{page_name}{grouper.id}",
-                }
-                groups.append(group_info)
-    else:
-        for grouper in groupers:
-            group_queryset = queryset.filter(**{group_field: grouper})
-            # to avoid zero records groupings
-            if group_queryset.count():
-                group = {
-                    "grouper": grouper,
-                    "list": record_queryset_paginator(
-                        request,
-                        group_queryset,
-                        f"dynamic_page_{page_name}{grouper}".replace(" ", "_"),
-                    ),
-                    "dynamic_name": f"dynamic_page_{page_name}{grouper}".replace(
-                        " ", "_"
-                    ),
-                }
-                groups.append(group)
+    for grouper, value, count in groupers:
+        if is_fk_field:
+            dynamic_name = f"dynamic_page_{page_name}{grouper.id}"
+        else:
+            dynamic_name = f"dynamic_page_{page_name}{grouper}".replace(" ", "_")
+        groups.append(
+            {
+                "grouper": grouper,
+                "dynamic_name": dynamic_name,
+                "group_value": value,
+                "count": count,
+            }
+        )
+    return groups
+
+
+def attach_group_lists(
+    request, groups, queryset, group_field, records_per_page=10, prefetch=True
+):
+    """
+    Attach the record page of each group (the ``list`` key)
+    """
+    queryset = safe_ordering(queryset)
+    first_pages = {}
+    if prefetch:
+        # groups that are not on their first page are fetched on their own
+        on_first_page = [
+            group["group_value"]
+            for group in groups
+            if not request
+            or request.GET.get(group["dynamic_name"]) in (None, "", "1")
+        ]
+        first_pages = prefetch_first_pages(
+            queryset, group_field, on_first_page, records_per_page
+        )
+    for group in groups:
+        value = group["group_value"]
+        group["list"] = record_queryset_paginator(
+            request,
+            queryset.filter(**{group_field: value}),
+            group["dynamic_name"],
+            records_per_page,
+            count=group["count"],
+            first_page=first_pages.get(value),
+        )
     return groups
 
 
 def group_by_queryset(
-    queryset, group_field, page=None, page_name="page", records_per_page=10
+    queryset,
+    group_field,
+    page=None,
+    page_name="page",
+    records_per_page=10,
+    use_pagination_setting=True,
+    group_records_per_page=10,
 ):
     """
     This method is used to make group-by and split groups by nested pagination
     """
-    from base.methods import get_pagination
+    if use_pagination_setting:
+        from base.methods import get_pagination
 
-    if get_pagination() != 50:
-        records_per_page = get_pagination()
+        if get_pagination() != 50:
+            records_per_page = get_pagination()
 
     fields_split = group_field.split("__")
     splitted = len(fields_split) > 1
@@ -82,46 +241,40 @@ def group_by_queryset(
 
     # getting request from the thread locals
     request = getattr(_thread_locals, "request", None)
+    counts = group_counts(queryset, group_field)
+
     if splitted or is_fk_field:
         for field in fields_split:
             field_obj = model_copy._meta.get_field(field)
             model_copy = field_obj.related_model
-        if model_copy:
-            groupers = model_copy.objects.all()
-            groups = generate_groups(
-                request,
-                groupers,
-                queryset,
-                page_name,
-                group_field,
-                is_fk_field=True,
-            )
-        else:
-            groupers = [
-                item
-                for index, item in enumerate(
-                    queryset.values_list(group_field, flat=True)
-                )
-                if item not in queryset.values_list(group_field, flat=True)[:index]
-            ]
-            groups = generate_groups(
-                request, groupers, queryset, page_name, group_field, is_fk_field=False
-            )
-
     else:
-        # making unique | not using set(groupers) due to ordering issue
-        groupers = [
-            item
-            for index, item in enumerate(queryset.values_list(group_field, flat=True))
-            if item not in queryset.values_list(group_field, flat=True)[:index]
-        ]
-        # getting related queryset
-        related_model = queryset.model._meta.get_field(group_field).related_model
-        if related_model:
-            groupers = related_model.objects.filter(id__in=groupers)
-        groups = generate_groups(
-            request, groupers, queryset, page_name, group_field, is_fk_field=False
+        model_copy = queryset.model._meta.get_field(group_field).related_model
+
+    if model_copy:
+        # related groupers keep the related model's ordering; groupings
+        # without records are left out
+        related = model_copy.objects.filter(
+            pk__in=[value for value in counts if value is not None]
         )
+        groupers = [(grouper, grouper.pk, counts[grouper.pk]) for grouper in related]
+        is_fk_field = splitted or is_fk_field
+    else:
+        try:
+            values = sorted(counts, key=lambda value: (value is None, value))
+        except TypeError:
+            values = list(counts)
+        groupers = [(value, value, counts[value]) for value in values]
 
-    groups = Paginator(groups, records_per_page)
-    return groups.get_page(page)
+    groups = generate_groups(
+        request, groupers, queryset, page_name, group_field, is_fk_field=is_fk_field
+    )
+    groups = Paginator(groups, records_per_page).get_page(page)
+    attach_group_lists(
+        request,
+        groups.object_list,
+        queryset,
+        group_field,
+        group_records_per_page,
+        prefetch=not _is_multi_valued(model, fields_split),
+    )
+    return groups
@@ -349,6 +349,12 @@ SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 SESSION_CACHE_ALIAS = 'default'
 SESSION_COOKIE_AGE = 86400  # 24 hours
 
+# Profiling query per request (lihat base/query_profiler.py)
+QUERY_PROFILER_ENABLED = env.bool('QUERY_PROFILER_ENABLED', default=False)
+QUERY_PROFILER_SAMPLE_RATE = env.float(
+    'QUERY_PROFILER_SAMPLE_RATE', default=1.0 if DEBUG else 0.01
+)
+
 # Template Caching
 if not DEBUG:
     TEMPLATES[0]['OPTIONS']['loaders'] = [
@@ -7,6 +7,8 @@ from django.dispatch import Signal
 pre_bulk_update = Signal()
 post_bulk_update = Signal()
 
+post_bulk_create = Signal()
+
 pre_model_clean = Signal()
 post_model_clean = Signal()
 
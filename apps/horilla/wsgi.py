@@ -14,3 +14,12 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "horilla.settings")
 
 application = get_wsgi_application()
+
+# Load the configured NLP models before gunicorn (--preload) forks the workers,
+# so they share the weights copy-on-write
+from django.conf import settings  # noqa: E402
+
+if getattr(settings, "INDONESIAN_NLP_PRELOAD_MODELS", None):
+    from indonesian_nlp.registry import preload_models
+
+    preload_models()
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from horilla_automations.models import MailAutomation
+from horilla_automations.models import MailAutomation, MailAutomationOutbox
 
 # Register your models here.
 
@@ -8,5 +8,6 @@ from horilla_automations.models import MailAutomation
 admin.site.register(
     [
         MailAutomation,
+        MailAutomationOutbox,
     ]
 )
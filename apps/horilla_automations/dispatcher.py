@@ -0,0 +1,237 @@
+"""
+horilla_automations/dispatcher.py
+
+Bounded worker pool and outbox delivery for mail automations.
+
+Signal handlers never spawn threads of their own; they submit jobs to the
+module level ``dispatcher`` which runs them on a fixed number of workers.
+Rendered mails are written to ``MailAutomationOutbox`` first and then sent
+in batches over a single SMTP connection, so failed deliveries can be
+retried with ``python manage.py flush_automation_outbox``.
+"""
+
+import base64
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class AutomationDispatcher:
+    """
+    Runs automation jobs on a bounded thread pool.
+
+    At most ``max_pending`` jobs may be queued or running at once. When the
+    pool is saturated the caller waits up to ``submit_timeout`` seconds for
+    a free slot and then runs the job inline, so mails are never dropped.
+    """
+
+    def __init__(self, max_workers=None, max_pending=None, submit_timeout=None):
+        self.max_workers = max_workers or getattr(
+            settings, "AUTOMATION_MAX_WORKERS", 4
+        )
+        self.max_pending = max_pending or getattr(
+            settings, "AUTOMATION_MAX_PENDING", 500
+        )
+        self.submit_timeout = (
+            submit_timeout
+            if submit_timeout is not None
+            else getattr(settings, "AUTOMATION_SUBMIT_TIMEOUT", 5)
+        )
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="horilla-automation",
+                )
+            return self._executor
+
+    def _run(self, func, args, kwargs, release=True):
+        try:
+            close_old_connections()
+            func(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Automation job {getattr(func, '__name__', func)} failed: {e}")
+        finally:
+            close_old_connections()
+            if release:
+                self._slots.release()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue ``func(*args, **kwargs)`` on the worker pool
+        """
+        if not self._slots.acquire(timeout=self.submit_timeout):
+            logger.warning(
+                "Automation dispatcher is saturated, running job inline: %s",
+                getattr(func, "__name__", func),
+            )
+            self._run(func, args, kwargs, release=False)
+            return None
+        return self._get_executor().submit(self._run, func, args, kwargs)
+
+    def shutdown(self, wait=True):
+        """
+        Stop the worker pool; a new one is created on the next submit
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=wait)
+
+
+dispatcher = AutomationDispatcher()
+
+
+def _encode_attachments(attachments):
+    encoded = []
+    for name, content, mimetype in attachments:
+        if isinstance(content, str):
+            content = content.encode()
+        encoded.append([name, base64.b64encode(content).decode(), mimetype])
+    return encoded
+
+
+def _decode_attachments(attachments):
+    return [
+        (name, base64.b64decode(content), mimetype)
+        for name, content, mimetype in attachments or []
+    ]
+
+
+def outbox_entry_to_message(entry):
+    """
+    Build the ``EmailMessage`` for an outbox entry
+    """
+    email = EmailMessage(
+        subject=entry.subject,
+        body=entry.body,
+        to=entry.to,
+        cc=entry.cc,
+        from_email=entry.from_email,
+        reply_to=entry.reply_to,
+    )
+    email.content_subtype = "html"
+    email.attachments = _decode_attachments(entry.attachments)
+    return email
+
+
+def enqueue_mails(mails):
+    """
+    Persist rendered mails to the outbox.
+
+    ``mails`` is a list of ``(automation, EmailMessage)`` pairs. Returns the
+    created outbox entries paired with their messages.
+    """
+    from horilla_automations.models import MailAutomationOutbox
+
+    entries = [
+        MailAutomationOutbox(
+            automation=automation,
+            subject=email.subject,
+            body=email.body,
+            from_email=email.from_email or "",
+            to=list(email.to),
+            cc=list(email.cc),
+            reply_to=list(email.reply_to),
+            attachments=_encode_attachments(email.attachments),
+        )
+        for automation, email in mails
+    ]
+    entries = MailAutomationOutbox.objects.bulk_create(entries)
+    return list(zip(entries, [email for _automation, email in mails]))
+
+
+def deliver(pairs):
+    """
+    Send ``(outbox_entry, EmailMessage)`` pairs over one SMTP connection and
+    record the outcome of every entry with a single ``bulk_update``.
+    """
+    from base.backends import ConfiguredEmailBackend
+    from horilla_automations.models import MailAutomationOutbox
+
+    if not pairs:
+        return 0
+
+    sent = 0
+    backend = ConfiguredEmailBackend()
+    try:
+        backend.open()
+    except Exception as e:
+        logger.error(f"Unable to open mail connection for automations: {e}")
+        for entry, _email in pairs:
+            entry.attempts += 1
+            entry.status = "failed"
+            entry.error = str(e)
+    else:
+        try:
+            for entry, email in pairs:
+                entry.attempts += 1
+                email.connection = backend
+                try:
+                    if backend.send_messages([email]):
+                        entry.status = "sent"
+                        entry.sent_at = timezone.now()
+                        entry.error = ""
+                        sent += 1
+                    else:
+                        entry.status = "failed"
+                        entry.error = "Mail backend did not accept the message"
+                except Exception as e:
+                    entry.status = "failed"
+                    entry.error = str(e)
+                    logger.error(e)
+        finally:
+            backend.close()
+
+    MailAutomationOutbox.objects.bulk_update(
+        [entry for entry, _email in pairs],
+        ["status", "attempts", "error", "sent_at"],
+    )
+    return sent
+
+
+def send_mails(mails):
+    """
+    Write ``(automation, EmailMessage)`` pairs to the outbox and deliver them
+    """
+    batch_size = getattr(settings, "AUTOMATION_MAIL_BATCH_SIZE", 100)
+    sent = 0
+    for start in range(0, len(mails), batch_size):
+        sent += deliver(enqueue_mails(mails[start : start + batch_size]))
+    return sent
+
+
+def flush_outbox(max_attempts=3, limit=None):
+    """
+    Retry pending and failed outbox entries that have attempts left
+    """
+    from horilla_automations.models import MailAutomationOutbox
+
+    batch_size = getattr(settings, "AUTOMATION_MAIL_BATCH_SIZE", 100)
+    entries = MailAutomationOutbox.objects.filter(
+        status__in=["pending", "failed"], attempts__lt=max_attempts
+    ).order_by("created_at")
+    if limit:
+        entries = entries[:limit]
+    entries = list(entries)
+    sent = 0
+    for start in range(0, len(entries), batch_size):
+        sent += deliver(
+            [
+                (entry, outbox_entry_to_message(entry))
+                for entry in entries[start : start + batch_size]
+            ]
+        )
+    return sent, len(entries)
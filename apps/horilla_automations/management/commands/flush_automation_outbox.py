@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from horilla_automations.dispatcher import flush_outbox
+
+
+class Command(BaseCommand):
+    help = "Retry pending and failed mail automation outbox entries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=3,
+            help="Skip entries that already failed this many times",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=None,
+            help="Maximum number of entries to retry",
+        )
+
+    def handle(self, *args, **kwargs):
+        try:
+            sent, total = flush_outbox(
+                max_attempts=kwargs["max_attempts"], limit=kwargs["limit"]
+            )
+        except Exception as e:
+            raise CommandError(f"An error occurred while flushing the outbox: {e}")
+        self.stdout.write(
+            self.style.SUCCESS(f"Sent {sent} of {total} automation outbox mails.")
+        )
@@ -257,3 +257,64 @@ def get_textfield_paths(model):
 
     traverse(model)
     return paths
+
+
+def get_snapshot_fields(model, attrs):
+    """
+    Resolve condition attributes to database lookups.
+
+    Returns a dict mapping each attr to ``"value"``, ``"fk"`` or ``"many"``
+    (multi-valued through a many-to-many or reverse relation). Raises
+    ``FieldDoesNotExist`` when an attr is not a plain field path, e.g. a
+    property or method, so callers can fall back to instance evaluation.
+    """
+    kinds = {}
+    for attr in attrs:
+        current = model
+        kind = "value"
+        many = False
+        parts = attr.split("__")
+        for index, part in enumerate(parts):
+            field = (
+                current._meta.pk if part == "pk" else current._meta.get_field(part)
+            )
+            if field.many_to_many or field.one_to_many:
+                many = True
+            if field.is_relation:
+                current = field.related_model
+                kind = "fk"
+            else:
+                if index != len(parts) - 1:
+                    raise FieldDoesNotExist(f"{attr} is not a field path")
+                kind = "value"
+        kinds[attr] = "many" if many else kind
+    return kinds
+
+
+def snapshot_values(queryset, kinds):
+    """
+    Fetch the condition attributes of every row in ``queryset`` in one query.
+
+    Values are normalised the way ``send_automated_mail`` compares instance
+    values: related objects become their pk as a string and multi-valued
+    relations become a sorted tuple of pks.
+    """
+    attrs = list(kinds)
+    snapshot = {}
+    for row in queryset.order_by().values_list("pk", *attrs):
+        values = snapshot.setdefault(row[0], {})
+        for attr, value in zip(attrs, row[1:]):
+            kind = kinds[attr]
+            if kind == "many":
+                values.setdefault(attr, set())
+                if value is not None:
+                    values[attr].add(value)
+            elif kind == "fk":
+                values[attr] = str(value) if value is not None else None
+            else:
+                values[attr] = value
+    for values in snapshot.values():
+        for attr, kind in kinds.items():
+            if kind == "many":
+                values[attr] = tuple(sorted(values.get(attr, ())))
+    return snapshot
@@ -143,3 +143,41 @@ class MailAutomation(HorillaModel):
     def trigger_display(self):
         """"""
         return self.get_trigger_display()
+
+
+class MailAutomationOutbox(models.Model):
+    """
+    Rendered automation mail waiting for, or recording, its delivery
+    """
+
+    STATUS_CHOICES = [
+        ("pending", _trans("Pending")),
+        ("sent", _trans("Sent")),
+        ("failed", _trans("Failed")),
+    ]
+
+    automation = models.ForeignKey(
+        MailAutomation,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="outbox_entries",
+    )
+    subject = models.TextField()
+    body = models.TextField()
+    from_email = models.CharField(max_length=256, blank=True, default="")
+    to = models.JSONField(default=list)
+    cc = models.JSONField(default=list)
+    reply_to = models.JSONField(default=list)
+    attachments = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self) -> str:
+        return f"{self.subject} ({self.status})"
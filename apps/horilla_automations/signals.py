@@ -3,22 +3,23 @@ horilla_automation/signals.py
 
 """
 
-import copy
 import logging
-import threading
 import time
 import types
+from functools import partial
 
 from bs4 import BeautifulSoup
 from django import template
 from django.core.mail import EmailMessage
-from django.db import models
+from django.db import models, transaction
 from django.db.models.query import QuerySet
 from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
 from horilla.horilla_middlewares import _thread_locals
 from horilla.signals import post_bulk_update, pre_bulk_update
+from horilla_automations.dispatcher import dispatcher
+from horilla_automations.dispatcher import send_mails as deliver_mails
 from notifications.signals import notify
 
 logger = logging.getLogger(__name__)
@@ -45,7 +46,12 @@ def start_automation():
     Automation signals
     """
     from base.models import HorillaMailTemplate
-    from horilla_automations.methods.methods import get_model_class, split_query_string
+    from horilla_automations.methods.methods import (
+        get_model_class,
+        get_snapshot_fields,
+        snapshot_values,
+        split_query_string,
+    )
     from horilla_automations.models import MailAutomation
 
     @receiver(post_delete, sender=MailAutomation)
@@ -77,38 +83,44 @@ def start_automation():
 
     REFRESH_METHODS["clear_connection"] = clear_connection
 
-    def create_post_bulk_update_handler(automation, model_class, query_strings):
+    def create_post_bulk_update_handler(model_class, automations):
         def post_bulk_update_handler(sender, queryset, *args, **kwargs):
-            def _bulk_update_thread_handler(
-                queryset, previous_queryset_copy, automation
-            ):
-                request = getattr(queryset, "request", None)
-
-                if request:
-                    for index, instance in enumerate(queryset):
-                        previous_instance = previous_queryset_copy[index]
-                        send_automated_mail(
-                            request,
-                            False,
-                            automation,
-                            query_strings,
-                            instance,
-                            previous_instance,
-                        )
-
+            request = getattr(queryset, "request", None)
             previous_bulk_record = getattr(_thread_locals, "previous_bulk_record", None)
-            previous_queryset_copy = []
-            if previous_bulk_record:
-                previous_queryset = previous_bulk_record.get("queryset", None)
-                previous_queryset_copy = previous_bulk_record.get("queryset_copy", [])
-
-            bulk_thread = threading.Thread(
-                target=_bulk_update_thread_handler,
-                args=(queryset, previous_queryset_copy, automation),
+            if (
+                not request
+                or not previous_bulk_record
+                or previous_bulk_record.get("model_class") is not model_class
+            ):
+                return
+            _thread_locals.previous_bulk_record = None
+
+            kinds = previous_bulk_record["kinds"]
+            previous_values = previous_bulk_record["values"]
+            if not previous_values:
+                return
+            # one query for the whole update, read inside the updating
+            # transaction so the worker sees the new values
+            updated = model_class._base_manager.filter(pk__in=list(previous_values))
+            if kinds is None:
+                current_values = updated.in_bulk()
+            else:
+                current_values = snapshot_values(updated, kinds)
+
+            transaction.on_commit(
+                partial(
+                    dispatcher.submit,
+                    process_bulk_update,
+                    request,
+                    model_class,
+                    automations,
+                    kinds,
+                    previous_values,
+                    current_values,
+                )
             )
-            bulk_thread.start()
 
-        func_name = f"{automation.method_title}_post_bulk_signal_handler"
+        func_name = f"{model_class.__name__.lower()}_post_bulk_signal_handler"
 
         # Dynamically create a function with a unique name
         handler = types.FunctionType(
@@ -121,89 +133,122 @@ def start_automation():
 
         # Set additional attributes on the function
         handler.model_class = model_class
-        handler.automation = automation
+        handler.automations = automations
 
         return handler
 
-    def start_connection():
+    def get_automation_conditions():
         """
-        Method to start signal connection accordingly to the automation
+        Active automations grouped by model class, with their parsed
+        condition query strings
         """
-        clear_connection()
+        grouped = {}
         automations = MailAutomation.objects.filter(is_active=True)
         for automation in automations:
-
             condition_querystring = automation.condition_querystring.replace(
                 "automation_multiple_", ""
             )
-
             query_strings = split_query_string(condition_querystring)
+            model_class = get_model_class(automation.model)
+            grouped.setdefault(model_class, []).append((automation, query_strings))
+        return grouped
 
-            model_path = automation.model
-            model_class = get_model_class(model_path)
+    def start_connection():
+        """
+        Method to start signal connection accordingly to the automation
+        """
+        clear_connection()
+        for model_class, automations in get_automation_conditions().items():
+            # bulk updates only ever trigger `on_update` automations
+            update_automations = [
+                (automation, query_strings)
+                for automation, query_strings in automations
+                if automation.trigger == "on_update"
+            ]
+            if update_automations:
+                handler = create_post_bulk_update_handler(
+                    model_class, update_automations
+                )
+                SIGNAL_HANDLERS.append(handler)
+                post_bulk_update.connect(handler, sender=model_class)
 
-            handler = create_post_bulk_update_handler(
-                automation, model_class, query_strings
-            )
-            SIGNAL_HANDLERS.append(handler)
-
-            post_bulk_update.connect(handler, sender=model_class)
-
-            def create_signal_handler(name, automation, query_strings):
-                def signal_handler(sender, instance, created, **kwargs):
-                    """
-                    Signal handler for post-save events of the model instances.
-                    """
-                    request = getattr(_thread_locals, "request", None)
-                    previous_record = getattr(_thread_locals, "previous_record", None)
-                    previous_instance = None
-                    if previous_record:
-                        previous_instance = previous_record["instance"]
-
-                    args = (
-                        request,
-                        created,
-                        automation,
-                        query_strings,
-                        instance,
-                        previous_instance,
-                    )
-                    thread = threading.Thread(
-                        target=lambda: send_automated_mail(*args),
-                    )
-                    thread.start()
+            for automation, query_strings in automations:
+                connect_signal_handler(model_class, automation, query_strings)
 
-                signal_handler.__name__ = name
-                signal_handler.model_class = model_class
-                signal_handler.automation = automation
-                return signal_handler
+    def connect_signal_handler(model_class, automation, query_strings):
+        """
+        Connect the post-save handler of a single automation
+        """
 
-            # Create and connect the signal handler
-            handler_name = f"{automation.method_title}_signal_handler"
-            dynamic_signal_handler = create_signal_handler(
-                handler_name, automation, query_strings
-            )
-            SIGNAL_HANDLERS.append(dynamic_signal_handler)
-            post_save.connect(
-                dynamic_signal_handler, sender=dynamic_signal_handler.model_class
-            )
+        def create_signal_handler(name, automation, query_strings):
+            def signal_handler(sender, instance, created, **kwargs):
+                """
+                Signal handler for post-save events of the model instances.
+                """
+                request = getattr(_thread_locals, "request", None)
+                previous_record = getattr(_thread_locals, "previous_record", None)
+                previous_instance = None
+                if previous_record:
+                    previous_instance = previous_record["instance"]
+
+                args = (
+                    request,
+                    created,
+                    automation,
+                    query_strings,
+                    instance,
+                    previous_instance,
+                )
+                transaction.on_commit(
+                    partial(dispatcher.submit, send_automated_mail, *args)
+                )
+
+            signal_handler.__name__ = name
+            signal_handler.model_class = model_class
+            signal_handler.automation = automation
+            return signal_handler
+
+        # Create and connect the signal handler
+        handler_name = f"{automation.method_title}_signal_handler"
+        dynamic_signal_handler = create_signal_handler(
+            handler_name, automation, query_strings
+        )
+        SIGNAL_HANDLERS.append(dynamic_signal_handler)
+        post_save.connect(
+            dynamic_signal_handler, sender=dynamic_signal_handler.model_class
+        )
 
     REFRESH_METHODS["start_connection"] = start_connection
 
-    def create_pre_bulk_update_handler(automation, model_class):
+    def create_pre_bulk_update_handler(model_class, automations):
+        attrs = []
+        for _automation, query_strings in automations:
+            for condition in query_strings:
+                if condition.getlist("condition"):
+                    attr = condition.getlist("condition")[0]
+                    if attr not in attrs:
+                        attrs.append(attr)
+        try:
+            kinds = get_snapshot_fields(model_class, attrs)
+        except Exception as e:
+            # conditions on properties/methods need the full instances
+            logger.info(f"Snapshotting full {model_class.__name__} rows: {e}")
+            kinds = None
+
         def pre_bulk_update_handler(sender, queryset, *args, **kwargs):
             request = getattr(_thread_locals, "request", None)
             if request:
-                queryset_copy = queryset.none()
-                if queryset.count():
-                    queryset_copy = QuerySet.from_list(copy.deepcopy(list(queryset)))
+                if kinds is None:
+                    values = queryset.in_bulk()
+                else:
+                    values = snapshot_values(queryset, kinds)
                 _thread_locals.previous_bulk_record = {
-                    "automation": automation,
-                    "queryset": queryset,
-                    "queryset_copy": queryset_copy,
+                    "model_class": model_class,
+                    "kinds": kinds,
+                    "values": values,
                 }
 
-        func_name = f"{automation.method_title}_pre_bulk_signal_handler"
+        func_name = f"{model_class.__name__.lower()}_pre_bulk_signal_handler"
 
         # Dynamically create a function with a unique name
         handler = types.FunctionType(
@@ -216,7 +261,7 @@ def start_automation():
 
         # Set additional attributes on the function
         handler.model_class = model_class
-        handler.automation = automation
+        handler.automations = automations
 
         return handler
 
@@ -235,14 +280,23 @@ def start_automation():
             INSTANCE_HANDLERS.clear()
 
         clear_instance_signal_connection()
+        for model_class, automations in get_automation_conditions().items():
+            update_automations = [
+                (automation, query_strings)
+                for automation, query_strings in automations
+                if automation.trigger == "on_update"
+            ]
+            if update_automations:
+                handler = create_pre_bulk_update_handler(
+                    model_class, update_automations
+                )
+                INSTANCE_HANDLERS.append(handler)
+                pre_bulk_update.connect(handler, sender=model_class)
+
         automations = MailAutomation.objects.filter(is_active=True)
         for automation in automations:
             model_class = get_model_class(automation.model)
 
-            handler = create_pre_bulk_update_handler(automation, model_class)
-            INSTANCE_HANDLERS.append(handler)
-            pre_bulk_update.connect(handler, sender=model_class)
-
             @receiver(pre_save, sender=model_class)
             def instance_handler(sender, instance, **kwargs):
                 """
@@ -272,16 +326,15 @@ def start_automation():
     start_connection()
 
 
-def send_automated_mail(
-    request,
-    created,
-    automation,
-    query_strings,
-    instance,
-    previous_instance,
-):
+def evaluate_conditions(query_strings, resolve):
+    """
+    Evaluate the automation conditions.
+
+    ``resolve(attr)`` returns the ``(instance_value, previous_instance_value)``
+    pair of a condition attribute. Returns whether the automation applies
+    along with the compared current and previous values.
+    """
     from horilla_automations.methods.methods import evaluate_condition, operator_map
-    from horilla_views.templatetags.generic_template_filters import getattribute
 
     applicable = False
     and_exists = False
@@ -298,23 +351,7 @@ def send_automated_mail(
                 value = True
             elif value == "off":
                 value = False
-            instance_value = getattribute(instance, attr)
-            previous_instance_value = getattribute(previous_instance, attr)
-            # The send mail method only trigger when actually any changes
-            # b/w the previous, current instance's `attr` field's values and
-            # if applicable for the automation
-            if getattr(instance_value, "pk", None) and isinstance(
-                instance_value, models.Model
-            ):
-                instance_value = str(getattr(instance_value, "pk", None))
-                previous_instance_value = str(
-                    getattr(previous_instance_value, "pk", None)
-                )
-            elif isinstance(instance_value, QuerySet):
-                instance_value = list(instance_value.values_list("pk", flat=True))
-                previous_instance_value = list(
-                    previous_instance_value.values_list("pk", flat=True)
-                )
+            instance_value, previous_instance_value = resolve(attr)
 
             instance_values.append(instance_value)
 
@@ -336,6 +373,60 @@ def send_automated_mail(
             if false_exists and and_exists:
                 applicable = False
                 break
+    return applicable, instance_values, previous_instance_values
+
+
+def instance_resolver(instance, previous_instance):
+    """
+    Condition value resolver reading attributes from model instances
+    """
+    from horilla_views.templatetags.generic_template_filters import getattribute
+
+    def resolve(attr):
+        instance_value = getattribute(instance, attr)
+        previous_instance_value = getattribute(previous_instance, attr)
+        # The send mail method only trigger when actually any changes
+        # b/w the previous, current instance's `attr` field's values and
+        # if applicable for the automation
+        if getattr(instance_value, "pk", None) and isinstance(
+            instance_value, models.Model
+        ):
+            instance_value = str(getattr(instance_value, "pk", None))
+            previous_instance_value = str(getattr(previous_instance_value, "pk", None))
+        elif isinstance(instance_value, QuerySet):
+            instance_value = list(instance_value.values_list("pk", flat=True))
+            previous_instance_value = list(
+                previous_instance_value.values_list("pk", flat=True)
+            )
+        return instance_value, previous_instance_value
+
+    return resolve
+
+
+def snapshot_resolver(values, previous_values):
+    """
+    Condition value resolver reading from `snapshot_values` rows
+    """
+
+    def resolve(attr):
+        return values.get(attr), (previous_values or {}).get(attr)
+
+    return resolve
+
+
+def send_automated_mail(
+    request,
+    created,
+    automation,
+    query_strings,
+    instance,
+    previous_instance,
+):
+    if automation.trigger not in ["on_create", "on_update"]:
+        return
+    applicable, instance_values, previous_instance_values = evaluate_conditions(
+        query_strings, instance_resolver(instance, previous_instance)
+    )
     if applicable:
         if created and automation.trigger == "on_create":
             send_mail(request, automation, instance)
@@ -346,11 +437,53 @@ def send_automated_mail(
             send_mail(request, automation, instance)
 
 
-def send_mail(request, automation, instance):
+def process_bulk_update(
+    request, model_class, automations, kinds, previous_values, current_values
+):
     """
-    mail sending method
+    Evaluate the `on_update` automations of a bulk update and send every
+    resulting mail as one batch.
+
+    ``previous_values``/``current_values`` map pk to either a snapshot row
+    (when ``kinds`` is set) or the model instance itself.
+    """
+    matches = []
+    for automation, query_strings in automations:
+        for pk, current in current_values.items():
+            previous = previous_values.get(pk)
+            if kinds is None:
+                resolve = instance_resolver(current, previous)
+            else:
+                resolve = snapshot_resolver(current, previous)
+            applicable, instance_values, previous_instance_values = (
+                evaluate_conditions(query_strings, resolve)
+            )
+            if applicable and set(previous_instance_values) != set(instance_values):
+                matches.append((automation, pk))
+
+    if not matches:
+        return
+
+    instances = model_class._base_manager.in_bulk({pk for _automation, pk in matches})
+    rendered = []
+    for automation, pk in matches:
+        instance = instances.get(pk)
+        if instance is None:
+            continue
+        mail = render_mail(request, automation, instance, refresh=False)
+        if mail:
+            rendered.append(mail)
+    deliver_rendered_mails(request, rendered)
+
+
+def render_mail(request, automation, instance, refresh=True):
+    """
+    Render the mail and/or notification of an automation for an instance.
+
+    Returns a dict with the ``automation``, the ``email`` (``EmailMessage`` or
+    ``None``) and the ``notification`` to send, or ``None`` when nothing
+    should be sent.
     """
-    from base.backends import ConfiguredEmailBackend
     from base.methods import eval_validate, generate_pdf
     from employee.models import Employee
     from horilla_automations.methods.methods import (
@@ -363,7 +496,7 @@ def send_mail(request, automation, instance):
     employees = []
     to_emails = []
 
-    if instance.pk:
+    if instance.pk and refresh:
         # refreshing instance due to m2m fields are not loading here some times
         time.sleep(0.1)
         instance = instance._meta.model.objects.get(pk=instance.pk)
@@ -390,6 +523,7 @@ def send_mail(request, automation, instance):
     ).select_related("employee_work_info")
 
     employees = list(employees)
+    also_sent_to = []
     try:
         also_sent_to = automation.also_sent_to.select_related(
             "employee_work_info"
@@ -405,71 +539,62 @@ def send_mail(request, automation, instance):
     to = to_emails
     cc = cc_emails
 
-    email_backend = ConfiguredEmailBackend()
-    default_email = email_backend.dynamic_from_email_with_display_name
+    from_email, reply_to = get_automation_sender(request)
 
-    from_email = default_email
-    reply_to = [default_email]
+    if not (pk_or_text and request and to_emails):
+        return None
 
-    if request and hasattr(request, "user") and hasattr(request.user, "employee_get"):
-        try:
-            user = request.user.employee_get
-            display_email_name = f"{user.get_full_name()} <{user.email}>"
-            from_email = display_email_name
-            reply_to = [display_email_name]
-        except Exception as e:
-            logger.error(f"Error generating user-based email display name: {e}")
-
-    if pk_or_text and request and to_emails:
-        attachments = []
-        try:
-            sender = request.user.employee_get
-        except:
-            sender = None
-        if context_instance:
-            if template_attachments := automation.template_attachments.all():
-                for template_attachment in template_attachments:
-                    template_bdy = template.Template(template_attachment.body)
-                    context = template.Context(
-                        {
-                            "instance": context_instance,
-                            "self": sender,
-                            "model_instance": instance,
-                            "request": request,
-                        }
-                    )
-                    render_bdy = template_bdy.render(context)
-                    attachments.append(
-                        (
-                            "Document",
-                            generate_pdf(
-                                render_bdy, {}, path=False, title="Document"
-                            ).content,
-                            "application/pdf",
-                        )
+    attachments = []
+    try:
+        sender = request.user.employee_get
+    except:
+        sender = None
+    if context_instance:
+        if template_attachments := automation.template_attachments.all():
+            for template_attachment in template_attachments:
+                template_bdy = template.Template(template_attachment.body)
+                context = template.Context(
+                    {
+                        "instance": context_instance,
+                        "self": sender,
+                        "model_instance": instance,
+                        "request": request,
+                    }
+                )
+                render_bdy = template_bdy.render(context)
+                attachments.append(
+                    (
+                        "Document",
+                        generate_pdf(
+                            render_bdy, {}, path=False, title="Document"
+                        ).content,
+                        "application/pdf",
                     )
+                )
 
-            template_bdy = template.Template(mail_template.body)
-        else:
-            template_bdy = template.Template(pk_or_text)
-        context = template.Context(
-            {
-                "instance": context_instance,
-                "self": sender,
-                "model_instance": instance,
-                "request": request,
-            }
-        )
-        render_bdy = template_bdy.render(context)
+        template_bdy = template.Template(mail_template.body)
+    else:
+        template_bdy = template.Template(pk_or_text)
+    context = template.Context(
+        {
+            "instance": context_instance,
+            "self": sender,
+            "model_instance": instance,
+            "request": request,
+        }
+    )
+    render_bdy = template_bdy.render(context)
 
-        title_template = template.Template(automation.title)
-        title_context = template.Context(
-            {"instance": instance, "self": sender, "request": request}
-        )
-        render_title = title_template.render(title_context)
-        soup = BeautifulSoup(render_bdy, "html.parser")
-        plain_text = soup.get_text(separator="\n")
+    title_template = template.Template(automation.title)
+    title_context = template.Context(
+        {"instance": instance, "self": sender, "request": request}
+    )
+    render_title = title_template.render(title_context)
+    soup = BeautifulSoup(render_bdy, "html.parser")
+    plain_text = soup.get_text(separator="\n")
 
+    email = None
+    if automation.delivery_channel != "notification":
         email = EmailMessage(
             subject=render_title,
             body=render_bdy,
@@ -479,41 +604,77 @@ def send_mail(request, automation, instance):
             reply_to=reply_to,
         )
         email.content_subtype = "html"
-
         email.attachments = attachments
 
-        def _send_mail(email):
+    notification = None
+    if automation.delivery_channel != "email":
+        notification = {"sender": sender, "recipient": user_ids, "verb": plain_text}
+
+    return {"automation": automation, "email": email, "notification": notification}
+
+
+def get_automation_sender(request):
+    """
+    Returns the from address and reply-to list for automation mails
+    """
+    from base.backends import ConfiguredEmailBackend
+
+    email_backend = ConfiguredEmailBackend()
+    default_email = email_backend.dynamic_from_email_with_display_name
+
+    from_email = default_email
+    reply_to = [default_email]
+
+    if request and hasattr(request, "user") and hasattr(request.user, "employee_get"):
+        try:
+            user = request.user.employee_get
+            display_email_name = f"{user.get_full_name()} <{user.email}>"
+            from_email = display_email_name
+            reply_to = [display_email_name]
+        except Exception as e:
+            logger.error(f"Error generating user-based email display name: {e}")
+    return from_email, reply_to
+
+
+def deliver_rendered_mails(request, rendered):
+    """
+    Send the notifications and mails produced by `render_mail`; all mails
+    go through the outbox over a single SMTP connection.
+    """
+    triggered_by = getattr(getattr(request, "user", None), "employee_get", None)
+    mails = []
+    for mail in rendered:
+        automation = mail["automation"]
+        if mail["email"] is not None:
+            mails.append((automation, mail["email"]))
+        if mail["notification"] is not None:
             try:
-                email.send()
+                notify.send(
+                    mail["notification"]["sender"],
+                    recipient=mail["notification"]["recipient"],
+                    verb=f"{mail['notification']['verb']}",
+                    icon="person-remove",
+                    redirect="",
+                )
                 logger.info(
-                    f"Automation <Mail> {automation.title} is triggered by {request.user.employee_get}"
+                    f"Automation <Notification> {automation.title} is triggered by {triggered_by}"
                 )
             except Exception as e:
                 logger.error(e)
-
-        def _send_notification(text):
-            notify.send(
-                sender,
-                recipient=user_ids,
-                verb=f"{text}",
-                icon="person-remove",
-                redirect="",
-            )
-            logger.info(
-                f"Automation <Notification> {automation.title} is triggered by {request.user.employee_get}"
-            )
-
-        if automation.delivery_channel != "notification":
-            thread = threading.Thread(
-                target=lambda: _send_mail(email),
-            )
-            thread.start()
-
-        if automation.delivery_channel != "email":
-            thread = threading.Thread(
-                target=lambda: _send_notification(plain_text),
-            )
-            thread.start()
         logger.info(
             f"Automation Triggered | {automation.get_delivery_channel_display()} | {automation}"
         )
+    if mails:
+        sent = deliver_mails(mails)
+        logger.info(
+            f"Automation <Mail> {sent}/{len(mails)} mails sent, triggered by {triggered_by}"
+        )
+
+
+def send_mail(request, automation, instance):
+    """
+    mail sending method
+    """
+    mail = render_mail(request, automation, instance)
+    if mail:
+        deliver_rendered_mails(request, [mail])
@@ -13,7 +13,20 @@ class LDAPSettingsForm(ModelForm):
 
     class Meta:
         model = LDAPSettings
-        fields = ["ldap_server", "bind_dn", "bind_password", "base_dn"]
+        fields = [
+            "ldap_server",
+            "bind_dn",
+            "bind_password",
+            "base_dn",
+            "page_size",
+            "watermark_attribute",
+        ]
+
+    def save(self, commit=True):
+        # a watermark of another directory or attribute means nothing here
+        if {"ldap_server", "base_dn", "watermark_attribute"} & set(self.changed_data):
+            self.instance.sync_watermark = ""
+        return super().save(commit)
 
     def as_p(self):
         """
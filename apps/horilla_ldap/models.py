@@ -8,6 +8,18 @@ class LDAPSettings(models.Model):
     bind_dn = models.CharField(max_length=255, default="cn=admin,dc=horilla,dc=com")
     bind_password = models.CharField(max_length=255)
     base_dn = models.CharField(max_length=255, default="ou=users,dc=horilla,dc=com")
+    page_size = models.PositiveIntegerField(default=500)
+    watermark_attribute = models.CharField(
+        max_length=50,
+        default="modifyTimestamp",
+        choices=[
+            ("modifyTimestamp", "modifyTimestamp"),
+            ("uSNChanged", "uSNChanged (Active Directory)"),
+        ],
+    )
+    # highest watermark_attribute value imported by the last complete sync
+    sync_watermark = models.CharField(max_length=50, blank=True, default="")
+    last_synced_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"LDAP Settings ({self.ldap_server})"
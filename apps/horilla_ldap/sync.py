@@ -0,0 +1,421 @@
+"""
+Delta synchronization of LDAP users into employees.
+
+The directory is read with paged searches, so servers with a size limit
+answer every page, and only the entries whose ``modifyTimestamp`` (or
+``uSNChanged`` on Active Directory) is at or past the watermark of the last
+complete sync are requested. Every page is diffed in memory against the
+employees and users it refers to and written with bulk queries.
+
+The directory is reached through a small interface (``paged_search`` and
+``close``) with python-ldap, ldap3 and in-memory implementations; the
+in-memory one is used by the tests and for trying the sync without a server.
+"""
+
+import logging
+import platform
+import re
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Permission, User
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from employee.models import BonusPoint, Employee, EmployeeWorkInformation
+from horilla_ldap.models import LDAPSettings
+
+try:
+    import ldap
+    from ldap.controls import SimplePagedResultsControl
+except ImportError:
+    ldap = None
+
+try:
+    from ldap3 import ALL, Connection, Server
+except ImportError:
+    Connection = None
+
+logger = logging.getLogger(__name__)
+
+OBJECT_CLASS = "inetOrgPerson"
+ATTRIBUTES = ["uid", "mail", "givenName", "sn", "cn", "telephoneNumber"]
+EMPLOYEE_FIELDS = {
+    "employee_first_name": "givenname",
+    "employee_last_name": "sn",
+    "phone": "telephonenumber",
+}
+
+
+def _decode(values):
+    if not isinstance(values, (list, tuple)):
+        values = [values]
+    return [
+        value.decode("utf-8") if isinstance(value, bytes) else str(value)
+        for value in values
+    ]
+
+
+def _normalize(attributes):
+    """Attribute names are case insensitive, values become lists of str"""
+    return {name.lower(): _decode(values) for name, values in attributes.items()}
+
+
+class PythonLDAPDirectory:
+    """Directory reached with python-ldap"""
+
+    def __init__(self, server, bind_dn, bind_password):
+        self.connection = ldap.initialize(server)
+        self.connection.set_option(ldap.OPT_REFERRALS, 0)
+        self.connection.simple_bind_s(bind_dn, bind_password)
+
+    def paged_search(self, base_dn, search_filter, attributes, page_size):
+        control = SimplePagedResultsControl(True, size=page_size, cookie="")
+        while True:
+            message_id = self.connection.search_ext(
+                base_dn,
+                ldap.SCOPE_SUBTREE,
+                search_filter,
+                attributes,
+                serverctrls=[control],
+            )
+            _, data, _, controls = self.connection.result3(message_id)
+            yield [(dn, _normalize(entry)) for dn, entry in data if dn]
+            cookie = next(
+                (
+                    response.cookie
+                    for response in controls
+                    if response.controlType == SimplePagedResultsControl.controlType
+                ),
+                None,
+            )
+            if not cookie:
+                return
+            control.cookie = cookie
+
+    def close(self):
+        self.connection.unbind_s()
+
+
+class LDAP3Directory:
+    """Directory reached with ldap3"""
+
+    def __init__(self, server, bind_dn, bind_password):
+        self.connection = Connection(
+            Server(server, get_info=ALL), user=bind_dn, password=bind_password
+        )
+        if not self.connection.bind():
+            raise ConnectionError(
+                f"Failed to bind to LDAP server: {self.connection.last_error}"
+            )
+
+    def paged_search(self, base_dn, search_filter, attributes, page_size):
+        page = []
+        for entry in self.connection.extend.standard.paged_search(
+            base_dn,
+            search_filter,
+            attributes=attributes,
+            paged_size=page_size,
+            generator=True,
+        ):
+            if entry.get("type") != "searchResEntry":
+                continue
+            page.append((entry["dn"], _normalize(entry["raw_attributes"])))
+            if len(page) >= page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def close(self):
+        self.connection.unbind()
+
+
+class InMemoryDirectory:
+    """
+    Stand-in directory holding ``{dn: {attribute: [values]}}``. Understands
+    the filters the sync builds: ``&``, ``|``, ``=``, ``=*``, ``>=`` and ``<=``.
+    """
+
+    def __init__(self, entries=None):
+        self.entries = {dn: _normalize(attrs) for dn, attrs in (entries or {}).items()}
+        self.searches = []
+
+    def add(self, dn, **attributes):
+        self.entries[dn] = _normalize(attributes)
+
+    def paged_search(self, base_dn, search_filter, attributes, page_size):
+        self.searches.append(search_filter)
+        node, _ = self._parse(search_filter, 0)
+        wanted = {name.lower() for name in attributes}
+        matches = [
+            (dn, {name: values for name, values in attrs.items() if name in wanted})
+            for dn, attrs in sorted(self.entries.items())
+            if dn.lower().endswith(base_dn.lower()) and self._matches(node, attrs)
+        ]
+        for start in range(0, len(matches), page_size):
+            yield matches[start : start + page_size]
+
+    def close(self):
+        pass
+
+    def _parse(self, text, position):
+        # text[position] is the opening parenthesis of a filter
+        operator = text[position + 1]
+        if operator in "&|":
+            children = []
+            position += 2
+            while text[position] == "(":
+                child, position = self._parse(text, position)
+                children.append(child)
+            return (operator, children), position + 1
+        end = text.index(")", position)
+        match = re.match(r"([\w-]+)(>=|<=|=)(.*)", text[position + 1 : end])
+        return (match.group(2), match.group(1).lower(), match.group(3)), end + 1
+
+    def _matches(self, node, attrs):
+        operator = node[0]
+        if operator == "&":
+            return all(self._matches(child, attrs) for child in node[1])
+        if operator == "|":
+            return any(self._matches(child, attrs) for child in node[1])
+        _, name, expected = node
+        values = attrs.get(name, [])
+        if operator == "=":
+            if expected == "*":
+                return bool(values)
+            return expected.lower() in [value.lower() for value in values]
+        compare = (lambda a, b: a >= b) if operator == ">=" else (lambda a, b: a <= b)
+        return any(
+            compare(watermark_key(value), watermark_key(expected)) for value in values
+        )
+
+
+def get_directory(settings):
+    """Connects to the directory configured in ``settings``"""
+    if platform.system() == "Linux" and ldap is not None:
+        return PythonLDAPDirectory(
+            settings.ldap_server, settings.bind_dn, settings.bind_password
+        )
+    return LDAP3Directory(settings.ldap_server, settings.bind_dn, settings.bind_password)
+
+
+def watermark_key(value):
+    """uSNChanged compares as a number, modifyTimestamp as a string"""
+    return int(value) if value.isdigit() else value
+
+
+def ldap_password(phone):
+    """Initial password of an imported user, the digits of the phone number"""
+    return re.sub(r"[^\d]", "", phone)
+
+
+class LDAPSync:
+    """
+    Imports the ``inetOrgPerson`` entries changed since the stored
+    watermark. ``full=True`` ignores the watermark and diffs every entry.
+    """
+
+    def __init__(self, settings, directory, page_size=None, full=False):
+        self.settings = settings
+        self.directory = directory
+        self.page_size = page_size or settings.page_size or 500
+        self.full = full
+        self.stats = {
+            "entries": 0,
+            "skipped": 0,
+            "created": 0,
+            "updated": 0,
+            "unchanged": 0,
+            "users_created": 0,
+            "users_updated": 0,
+            "pages": 0,
+        }
+
+    def search_filter(self):
+        attribute = self.settings.watermark_attribute
+        watermark = self.settings.sync_watermark
+        if self.full or not watermark:
+            return f"(objectClass={OBJECT_CLASS})"
+        if watermark.isdigit():
+            # uSNChanged of the last imported change is already imported
+            watermark = str(int(watermark) + 1)
+        return f"(&(objectClass={OBJECT_CLASS})({attribute}>={watermark}))"
+
+    def run(self):
+        attribute = self.settings.watermark_attribute
+        watermark = self.settings.sync_watermark or None
+        for page in self.directory.paged_search(
+            self.settings.base_dn,
+            self.search_filter(),
+            ATTRIBUTES + [attribute],
+            self.page_size,
+        ):
+            self.stats["pages"] += 1
+            records = []
+            for dn, attrs in page:
+                self.stats["entries"] += 1
+                record = self.record(attrs)
+                if record is None:
+                    self.stats["skipped"] += 1
+                    continue
+                records.append(record)
+                for value in attrs.get(attribute.lower(), []):
+                    if watermark is None or watermark_key(value) > watermark_key(
+                        watermark
+                    ):
+                        watermark = value
+            with transaction.atomic():
+                self.apply(records)
+
+        # the watermark only moves once every page is imported, an
+        # interrupted run starts over from the previous one
+        LDAPSettings.objects.filter(pk=self.settings.pk).update(
+            sync_watermark=watermark or "", last_synced_at=timezone.now()
+        )
+        self.settings.sync_watermark = watermark or ""
+        return self.stats
+
+    @staticmethod
+    def record(attrs):
+        def first(name):
+            values = attrs.get(name.lower())
+            return values[0] if values else ""
+
+        email = first("mail")
+        if not email:
+            return None
+        return {
+            "uid": first("uid"),
+            "email": email,
+            "givenname": first("givenName"),
+            "sn": first("sn"),
+            "telephonenumber": first("telephoneNumber"),
+        }
+
+    def apply(self, records):
+        """Diffs one page against the database and writes it in bulk"""
+        records = list({record["email"]: record for record in records}.values())
+        emails = [record["email"] for record in records]
+        uids = [record["uid"] for record in records if record["uid"]]
+
+        employees = {
+            employee.email: employee
+            for employee in Employee.objects.filter(email__in=emails)
+        }
+        users = list(
+            User.objects.filter(
+                Q(username__in=emails) | Q(username__in=uids) | Q(email__in=emails)
+            )
+        )
+        users_by_username = {user.username: user for user in users}
+        users_by_email = {user.email: user for user in users}
+
+        new_employees = []
+        changed_employees = {}
+        new_users = []
+        changed_users = {}
+        for record in records:
+            email = record["email"]
+            employee = employees.get(email)
+            user = (
+                users_by_username.get(email)
+                or users_by_username.get(record["uid"])
+                or users_by_email.get(email)
+            )
+            phone_changed = employee is None or employee.phone != record["telephonenumber"]
+
+            if employee is None:
+                new_employees.append(
+                    Employee(
+                        email=email,
+                        **{
+                            field: record[attribute]
+                            for field, attribute in EMPLOYEE_FIELDS.items()
+                        },
+                    )
+                )
+            else:
+                changed = False
+                for field, attribute in EMPLOYEE_FIELDS.items():
+                    if getattr(employee, field) != record[attribute]:
+                        setattr(employee, field, record[attribute])
+                        changed = True
+                if changed:
+                    changed_employees[employee.pk] = employee
+                else:
+                    self.stats["unchanged"] += 1
+
+            if user is None:
+                new_users.append(
+                    User(
+                        username=email,
+                        email=email,
+                        password=make_password(ldap_password(record["telephonenumber"])),
+                    )
+                )
+                continue
+            if user.username != email:
+                user.username = email
+                changed_users[user.pk] = user
+            # hashing is the slow part, only reset the password it derives from
+            if phone_changed:
+                user.set_password(ldap_password(record["telephonenumber"]))
+                changed_users[user.pk] = user
+
+        if new_users:
+            User.objects.bulk_create(new_users)
+            created_users = User.objects.filter(
+                username__in=[user.username for user in new_users]
+            )
+            users_by_username.update({user.username: user for user in created_users})
+            self._grant_own_profile(created_users)
+            self.stats["users_created"] += len(new_users)
+        if changed_users:
+            User.objects.bulk_update(changed_users.values(), ["username", "password"])
+            self.stats["users_updated"] += len(changed_users)
+
+        if new_employees:
+            for employee in new_employees:
+                employee.employee_user_id = users_by_username.get(employee.email)
+            Employee.objects.bulk_create(new_employees)
+            created_employees = Employee.objects.filter(
+                email__in=[employee.email for employee in new_employees]
+            )
+            EmployeeWorkInformation.objects.bulk_create(
+                [
+                    EmployeeWorkInformation(employee_id=employee)
+                    for employee in created_employees.filter(
+                        employee_work_info__isnull=True
+                    )
+                ]
+            )
+            # what the bonus_post_save receiver does for a saved employee
+            BonusPoint.objects.bulk_create(
+                [
+                    BonusPoint(employee_id=employee)
+                    for employee in created_employees.filter(bonus_point__isnull=True)
+                ]
+            )
+            self.stats["created"] += len(new_employees)
+        if changed_employees:
+            Employee.objects.bulk_update(
+                changed_employees.values(), list(EMPLOYEE_FIELDS)
+            )
+            self.stats["updated"] += len(changed_employees)
+
+    @staticmethod
+    def _grant_own_profile(users):
+        """The default permissions Employee.save() gives a new user"""
+        permissions = Permission.objects.filter(
+            codename__in=["view_ownprofile", "change_ownprofile"]
+        )
+        through = User.user_permissions.through
+        through.objects.bulk_create(
+            [
+                through(user_id=user.pk, permission_id=permission.pk)
+                for user in users
+                for permission in permissions
+            ],
+            ignore_conflicts=True,
+        )
@@ -1,3 +1,78 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from employee.models import BonusPoint, Employee
+from horilla_ldap.models import LDAPSettings
+from horilla_ldap.sync import InMemoryDirectory, LDAPSync
+
+
+class LDAPSyncTestCase(TestCase):
+    """Delta sync against the in-memory directory"""
+
+    def setUp(self):
+        self.settings = LDAPSettings.objects.create(
+            bind_password="secret", base_dn="ou=users,dc=horilla,dc=com", page_size=2
+        )
+        self.directory = InMemoryDirectory()
+        for index in range(5):
+            self.add_entry(index, "20240101000000Z")
+
+    def add_entry(self, index, timestamp, phone="0812-000"):
+        self.directory.add(
+            f"uid=user{index},ou=users,dc=horilla,dc=com",
+            objectClass=["inetOrgPerson"],
+            uid=[f"user{index}"],
+            mail=[f"user{index}@horilla.com"],
+            givenName=[f"First{index}"],
+            sn=[f"Last{index}"],
+            telephoneNumber=[phone],
+            modifyTimestamp=[timestamp],
+        )
+
+    def sync(self, **kwargs):
+        self.settings.refresh_from_db()
+        return LDAPSync(self.settings, self.directory, **kwargs).run()
+
+    def test_initial_sync_creates_employees_and_users_in_pages(self):
+        stats = self.sync()
+
+        self.assertEqual(stats["pages"], 3)
+        self.assertEqual(stats["created"], 5)
+        self.assertEqual(Employee.objects.filter(email__endswith="@horilla.com").count(), 5)
+        self.assertEqual(
+            BonusPoint.objects.filter(
+                employee_id__email__endswith="@horilla.com"
+            ).count(),
+            5,
+        )
+        user = User.objects.get(username="user0@horilla.com")
+        self.assertTrue(user.check_password("0812000"))
+        self.settings.refresh_from_db()
+        self.assertEqual(self.settings.sync_watermark, "20240101000000Z")
+
+    def test_delta_sync_only_reads_changed_entries(self):
+        self.sync()
+        self.add_entry(1, "20240201000000Z", phone="0813-111")
+
+        stats = self.sync()
+        self.assertEqual(stats["entries"], 5)
+        self.assertEqual(stats["updated"], 1)
+
+        stats = self.sync()
+        self.assertIn("modifyTimestamp>=20240201000000Z", self.directory.searches[-1])
+        self.assertEqual(stats["entries"], 1)
+        self.assertEqual(stats["unchanged"], 1)
+
+        employee = Employee.objects.get(email="user1@horilla.com")
+        self.assertEqual(employee.phone, "0813-111")
+        self.assertTrue(
+            User.objects.get(username="user1@horilla.com").check_password("0813111")
+        )
+
+    def test_full_sync_ignores_watermark(self):
+        self.sync()
+        stats = self.sync(full=True)
+
+        self.assertEqual(stats["entries"], 5)
+        self.assertEqual(stats["unchanged"], 5)
+        self.assertEqual(stats["created"], 0)
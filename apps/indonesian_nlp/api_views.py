@@ -5,7 +5,6 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
 from django.db.models import Q
-from django.utils import timezone
 from django.core.cache import cache
 from django.conf import settings
 import logging
@@ -20,6 +19,7 @@ from .serializers import (
     QuickAnalysisSerializer, BatchAnalysisSerializer
 )
 from .client import IndonesianNLPClient
+from .registry import model_registry
 from .tasks import process_text_analysis_job, batch_process_texts
 
 logger = logging.getLogger(__name__)
@@ -59,11 +59,9 @@ class NLPModelViewSet(viewsets.ModelViewSet):
         client = IndonesianNLPClient()
         
         try:
+            # load_model records is_loaded and load_time itself
             success = client.load_model(model.name)
             if success:
-                model.is_loaded = True
-                model.load_time = timezone.now()
-                model.save()
                 return Response({
                     'status': 'success',
                     'message': f'Model {model.name} loaded successfully'
@@ -314,7 +312,9 @@ class ModelStatsView(APIView):
                 'loaded_models': models.filter(is_loaded=True).count(),
                 'model_types': {},
                 'frameworks': {},
-                'recent_activity': []
+                'recent_activity': [],
+                # models held by this worker process
+                'registry': model_registry.get_stats()
             }
             
             # Count by model type
@@ -3,7 +3,7 @@ import logging
 import time
 import uuid
 from typing import Dict, List, Optional, Union, Any
-from datetime import datetime, timedelta
+from datetime import datetime
 import json
 import re
 
@@ -43,16 +43,24 @@ from .models import (
     NamedEntityResult, TextClassificationResult,
     ModelUsageStatistics, NLPConfiguration
 )
+from .registry import model_registry
 
 
 logger = logging.getLogger(__name__)
 
+_nltk_ready = False
+
 
 class IndonesianNLPClient:
-    """Main client for Indonesian NLP processing"""
+    """
+    Main client for Indonesian NLP processing
+
+    Clients are cheap to create: the loaded models live in the process-wide
+    ``model_registry`` and are shared by every client.
+    """
     
     def __init__(self):
-        self.loaded_models = {}
+        self.registry = model_registry
         self.model_cache = {}
         try:
             self.config = NLPConfiguration.get_active_config()
@@ -61,10 +69,17 @@ class IndonesianNLPClient:
             self.config = None
         self._setup_nltk()
     
+    @property
+    def loaded_models(self) -> Dict[str, Dict]:
+        """Snapshot of the models loaded in this process"""
+        return self.registry.loaded()
+    
     def _setup_nltk(self):
         """Setup NLTK resources"""
-        if not HAS_NLTK:
+        global _nltk_ready
+        if not HAS_NLTK or _nltk_ready:
             return
+        _nltk_ready = True
         
         try:
             # Download required NLTK data
@@ -88,41 +103,28 @@ class IndonesianNLPClient:
     def load_model(self, model_name: str) -> bool:
         """Load a model into memory"""
         try:
+            if model_name in self.registry:
+                logger.info(f"Model {model_name} already loaded")
+                return True
+            
             try:
                 model_obj = NLPModel.objects.get(name=model_name, is_active=True)
             except Exception as e:
                 logger.warning(f"Could not load model {model_name} from database: {e}")
                 return False
             
-            if model_name in self.loaded_models:
-                logger.info(f"Model {model_name} already loaded")
-                return True
-            
-            start_time = time.time()
-            
-            if model_obj.framework == 'transformers' and HAS_TRANSFORMERS:
-                model_data = self._load_transformers_model(model_obj)
-            elif model_obj.framework == 'spacy' and HAS_SPACY:
-                model_data = self._load_spacy_model(model_obj)
-            elif model_obj.framework == 'nltk' and HAS_NLTK:
-                model_data = self._load_nltk_model(model_obj)
-            else:
-                raise ValueError(f"Unsupported framework: {model_obj.framework}")
-            
-            load_time = time.time() - start_time
-            
-            self.loaded_models[model_name] = {
-                'model': model_data,
-                'config': model_obj,
-                'loaded_at': timezone.now(),
-                'load_time': load_time
-            }
+            entry = self.registry.get_or_load(
+                model_name, lambda: self._load_framework_model(model_obj), config=model_obj
+            )
+            load_time = entry['load_time']
             
             # Update model status
-            model_obj.is_loaded = True
-            model_obj.load_time = load_time
-            model_obj.last_used = timezone.now()
-            model_obj.save()
+            NLPModel.objects.filter(pk=model_obj.pk).update(
+                is_loaded=True,
+                load_time=load_time,
+                memory_usage=entry['size'] or None,
+                last_used=timezone.now(),
+            )
             
             logger.info(f"Model {model_name} loaded successfully in {load_time:.2f}s")
             return True
@@ -131,6 +133,16 @@ class IndonesianNLPClient:
             logger.error(f"Error loading model {model_name}: {e}")
             return False
     
+    def _load_framework_model(self, model_obj: NLPModel) -> Dict:
+        if model_obj.framework == 'transformers' and HAS_TRANSFORMERS:
+            return self._load_transformers_model(model_obj)
+        elif model_obj.framework == 'spacy' and HAS_SPACY:
+            return self._load_spacy_model(model_obj)
+        elif model_obj.framework == 'nltk' and HAS_NLTK:
+            return self._load_nltk_model(model_obj)
+        else:
+            raise ValueError(f"Unsupported framework: {model_obj.framework}")
+    
     def _load_transformers_model(self, model_obj: NLPModel) -> Dict:
         """Load Transformers model"""
         tokenizer = AutoTokenizer.from_pretrained(model_obj.model_path)
@@ -185,13 +197,9 @@ class IndonesianNLPClient:
     def unload_model(self, model_name: str) -> bool:
         """Unload a model from memory"""
         try:
-            if model_name in self.loaded_models:
-                del self.loaded_models[model_name]
-                
+            if self.registry.evict(model_name):
                 # Update model status
-                model_obj = NLPModel.objects.get(name=model_name)
-                model_obj.is_loaded = False
-                model_obj.save()
+                NLPModel.objects.filter(name=model_name).update(is_loaded=False)
                 
                 logger.info(f"Model {model_name} unloaded")
                 return True
@@ -205,10 +213,7 @@ class IndonesianNLPClient:
         if not model_name:
             model_name = self._get_default_model('sentiment')
         
-        if not self._ensure_model_loaded(model_name):
-            raise ValueError(f"Failed to load model {model_name}")
-        
-        model_data = self.loaded_models[model_name]
+        model_data = self._get_model_data(model_name)
         model_config = model_data['config']
         
         start_time = time.time()
@@ -295,10 +300,7 @@ class IndonesianNLPClient:
         if not model_name:
             model_name = self._get_default_model('ner')
         
-        if not self._ensure_model_loaded(model_name):
-            raise ValueError(f"Failed to load model {model_name}")
-        
-        model_data = self.loaded_models[model_name]
+        model_data = self._get_model_data(model_name)
         model_config = model_data['config']
         
         start_time = time.time()
@@ -362,10 +364,7 @@ class IndonesianNLPClient:
         if not model_name:
             model_name = self._get_default_model('classification')
         
-        if not self._ensure_model_loaded(model_name):
-            raise ValueError(f"Failed to load model {model_name}")
-        
-        model_data = self.loaded_models[model_name]
+        model_data = self._get_model_data(model_name)
         model_config = model_data['config']
         
         start_time = time.time()
@@ -452,10 +451,21 @@ class IndonesianNLPClient:
     
     def _ensure_model_loaded(self, model_name: str) -> bool:
         """Ensure model is loaded, load if necessary"""
-        if model_name not in self.loaded_models:
+        if model_name not in self.registry:
             return self.load_model(model_name)
         return True
     
+    def _get_model_data(self, model_name: str) -> Dict:
+        """Registry entry of a model, loading it if necessary"""
+        entry = self.registry.get(model_name)
+        if entry is None:
+            if not self.load_model(model_name):
+                raise ValueError(f"Failed to load model {model_name}")
+            entry = self.registry.get(model_name)
+        if entry is None:
+            raise ValueError(f"Model {model_name} was evicted while loading")
+        return entry
+    
     def _get_default_model(self, model_type: str) -> str:
         """Get default model for a given type"""
         try:
@@ -515,21 +525,25 @@ class IndonesianNLPClient:
     def get_model_info(self, model_name: str = None) -> Dict:
         """Get information about loaded models"""
         if model_name:
-            if model_name in self.loaded_models:
-                model_data = self.loaded_models[model_name]
+            model_data = self.loaded_models.get(model_name)
+            if model_data:
                 return {
                     'name': model_name,
                     'loaded': True,
                     'loaded_at': model_data['loaded_at'],
+                    'last_used': model_data['last_used'],
                     'load_time': model_data['load_time'],
+                    'memory_usage': model_data['size'],
                     'config': model_data['config']
                 }
             else:
                 return {'name': model_name, 'loaded': False}
         else:
+            stats = self.registry.get_stats()
             return {
-                'loaded_models': list(self.loaded_models.keys()),
-                'total_loaded': len(self.loaded_models)
+                'loaded_models': stats['loaded_models'],
+                'total_loaded': len(stats['loaded_models']),
+                'registry': stats
             }
     
     def get_available_frameworks(self) -> List[str]:
@@ -549,16 +563,10 @@ class IndonesianNLPClient:
             return
         
         try:
-            timeout = self.config.model_unload_timeout
-            cutoff_time = timezone.now() - timedelta(seconds=timeout)
-            
-            models_to_unload = []
-            for model_name, model_data in self.loaded_models.items():
-                if model_data['loaded_at'] < cutoff_time:
-                    models_to_unload.append(model_name)
-            
-            for model_name in models_to_unload:
-                self.unload_model(model_name)
+            unloaded = self.registry.evict_idle(self.config.model_unload_timeout)
+            if unloaded:
+                NLPModel.objects.filter(name__in=unloaded).update(is_loaded=False)
+            for model_name in unloaded:
                 logger.info(f"Unloaded unused model: {model_name}")
                 
         except Exception as e:
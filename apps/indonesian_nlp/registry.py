@@ -0,0 +1,271 @@
+"""
+Process-wide registry of loaded NLP models.
+
+Every ``IndonesianNLPClient`` shares the models held here, so a request or a
+task that builds a new client reuses the weights already in memory instead of
+reading them from disk again. The registry keeps the models in LRU order and
+evicts the least recently used ones once the configured memory budget or
+model count is exceeded.
+
+With ``INDONESIAN_NLP_PRELOAD_MODELS`` set and gunicorn started with
+``--preload``, the models are loaded in the master process before the workers
+fork, so the workers share the weights copy-on-write.
+"""
+
+import gc
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_BUDGET = 2 * 1024 ** 3
+
+
+def _rss() -> int:
+    if psutil is None:
+        return 0
+    try:
+        return psutil.Process().memory_info().rss
+    except Exception:
+        return 0
+
+
+def estimate_model_size(model_data: Dict) -> int:
+    """Bytes held by the tensors of the torch modules in ``model_data``"""
+    total = 0
+    seen = set()
+    for value in model_data.values():
+        module = getattr(value, 'model', value)
+        parameters = getattr(module, 'parameters', None)
+        if not callable(parameters) or id(module) in seen:
+            continue
+        seen.add(id(module))
+        try:
+            for tensor in list(module.parameters()) + list(module.buffers()):
+                total += tensor.nelement() * tensor.element_size()
+        except Exception:
+            continue
+    return total
+
+
+class ModelRegistry:
+    """Thread-safe LRU cache of loaded models with a memory budget"""
+
+    def __init__(self, memory_budget: int = None, max_models: int = None):
+        self.memory_budget = memory_budget
+        self.max_models = max_models
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+        self.load_locks = {}
+        self.stats = {'hits': 0, 'misses': 0, 'loads': 0, 'load_failures': 0,
+                      'evictions': 0, 'load_time': 0.0}
+
+    def _budget(self):
+        if self.memory_budget is not None:
+            return self.memory_budget, self.max_models
+        memory_budget = getattr(settings, 'INDONESIAN_NLP_MODEL_MEMORY_BUDGET', None)
+        max_models = self.max_models
+        try:
+            from .models import NLPConfiguration
+            config = NLPConfiguration.get_active_config()
+            if config:
+                memory_budget = memory_budget or config.max_memory_usage
+                max_models = max_models or config.model_cache_size
+        except Exception:
+            pass
+        return memory_budget or DEFAULT_MEMORY_BUDGET, max_models
+
+    def get(self, name: str) -> Optional[Dict]:
+        """Return the entry of a loaded model and mark it most recently used"""
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None:
+                self.entries.move_to_end(name)
+                entry['last_used'] = timezone.now()
+                self.stats['hits'] += 1
+                self._record('nlp_model_registry_hits_total', name)
+            return entry
+
+    def get_or_load(self, name: str, loader: Callable[[], Any], config: Any = None) -> Dict:
+        """
+        Return the entry of ``name``, calling ``loader`` to build the model
+        data when it is not loaded. Concurrent callers wait for one load.
+        """
+        entry = self.get(name)
+        if entry is not None:
+            return entry
+        with self.lock:
+            load_lock = self.load_locks.setdefault(name, threading.Lock())
+        with load_lock:
+            entry = self.get(name)
+            if entry is not None:
+                return entry
+            with self.lock:
+                self.stats['misses'] += 1
+            self._record('nlp_model_registry_misses_total', name)
+
+            rss_before = _rss()
+            start_time = time.time()
+            try:
+                model_data = loader()
+            except Exception:
+                with self.lock:
+                    self.stats['load_failures'] += 1
+                try:
+                    from ai_services.metrics import ai_metrics
+                    ai_metrics.record_model_load(name, time.time() - start_time, False)
+                except Exception:
+                    pass
+                raise
+            load_time = time.time() - start_time
+            size = estimate_model_size(model_data) or max(_rss() - rss_before, 0)
+
+            now = timezone.now()
+            entry = {
+                'model': model_data,
+                'config': config,
+                'loaded_at': now,
+                'last_used': now,
+                'load_time': load_time,
+                'size': size,
+            }
+            # the budget may query the database, read it before locking
+            budget = self._budget()
+            with self.lock:
+                self.entries[name] = entry
+                self.stats['loads'] += 1
+                self.stats['load_time'] += load_time
+                self._evict_over_budget(budget, keep=name)
+            self._record('nlp_model_registry_loads_total', name)
+            try:
+                from ai_services.metrics import ai_metrics
+                ai_metrics.record_model_load(name, load_time, True)
+            except Exception:
+                pass
+            return entry
+
+    def _evict_over_budget(self, budget, keep: str = None):
+        memory_budget, max_models = budget
+        while len(self.entries) > 1:
+            used = sum(entry['size'] for entry in self.entries.values())
+            if used <= memory_budget and (not max_models or len(self.entries) <= max_models):
+                return
+            name = next(iter(self.entries))
+            if name == keep:
+                return
+            self._evict(name, reason='budget')
+
+    def _evict(self, name: str, reason: str) -> bool:
+        entry = self.entries.pop(name, None)
+        if entry is None:
+            return False
+        self.stats['evictions'] += 1
+        self._record('nlp_model_registry_evictions_total', name)
+        logger.info(
+            f"Evicted NLP model {name} ({entry['size'] / 1024 ** 2:.1f} MB, {reason})"
+        )
+        return True
+
+    def evict(self, name: str, reason: str = 'unload') -> bool:
+        with self.lock:
+            evicted = self._evict(name, reason)
+        if evicted:
+            gc.collect()
+        return evicted
+
+    def evict_idle(self, idle_seconds: int) -> List[str]:
+        """Evict the models that were not used for ``idle_seconds``"""
+        cutoff = timezone.now() - timedelta(seconds=idle_seconds)
+        with self.lock:
+            idle = [name for name, entry in self.entries.items() if entry['last_used'] < cutoff]
+            for name in idle:
+                self._evict(name, reason='idle')
+        if idle:
+            gc.collect()
+        return idle
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def loaded(self) -> Dict[str, Dict]:
+        with self.lock:
+            return dict(self.entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        memory_budget, max_models = self._budget()
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(
+                self.stats,
+                hit_rate=self.stats['hits'] / lookups if lookups else 0.0,
+                loaded_models=list(self.entries),
+                memory_used=sum(entry['size'] for entry in self.entries.values()),
+                memory_budget=memory_budget,
+                max_models=max_models,
+            )
+
+    def _record(self, metric: str, name: str):
+        try:
+            from ai_services.metrics import metrics_collector
+            metrics_collector.increment_counter(metric, labels={'model': name})
+        except Exception:
+            pass
+
+
+model_registry = ModelRegistry()
+
+
+def preload_models(model_names: List[str] = None) -> List[str]:
+    """
+    Load models into the registry, by default the names listed in
+    ``INDONESIAN_NLP_PRELOAD_MODELS`` (``True`` loads every active model).
+
+    Meant to run in the gunicorn master (``--preload``) before the workers
+    fork; the database connections opened here are closed so they are not
+    shared with the workers.
+    """
+    from django.db import connections
+
+    from .client import IndonesianNLPClient
+    from .models import NLPModel
+
+    if model_names is None:
+        model_names = getattr(settings, 'INDONESIAN_NLP_PRELOAD_MODELS', None)
+    if not model_names:
+        return []
+    loaded = []
+    try:
+        if model_names is True:
+            model_names = list(
+                NLPModel.objects.filter(is_active=True).values_list('name', flat=True)
+            )
+        client = IndonesianNLPClient()
+        for name in model_names:
+            if client.load_model(name):
+                loaded.append(name)
+        # keep the loaded objects out of the collector so its passes do not
+        # touch (and copy) the shared pages in the workers
+        gc.collect()
+        gc.freeze()
+        logger.info(f"Preloaded NLP models: {', '.join(loaded)}")
+    except Exception as e:
+        logger.warning(f"Failed to preload NLP models: {e}")
+    finally:
+        connections.close_all()
+    return loaded
@@ -10,7 +10,6 @@ import json
 import traceback
 from typing import Dict, List, Any, Optional, Tuple
 import psutil
-import gc
 
 from .models import (
     NLPModel, TextAnalysisJob, NLPConfiguration,
@@ -18,6 +17,7 @@ from .models import (
     ModelUsageStatistics
 )
 from .client import IndonesianNLPClient
+from .registry import model_registry
 from .signals import (
     job_started, job_completed, job_failed,
     model_loaded, model_unloaded, system_health_check
@@ -706,25 +706,14 @@ def cleanup_unused_models() -> Dict[str, Any]:
         
         cutoff_time = timezone.now() - timezone.timedelta(minutes=timeout_minutes)
         
-        # Find loaded models that haven't been used recently
-        unused_models = NLPModel.objects.filter(
-            is_loaded=True,
-            last_used__lt=cutoff_time
-        )
-        
-        unloaded_count = 0
-        client = IndonesianNLPClient()
-        
-        for model in unused_models:
-            try:
-                client.unload_model(model.name)
-                unloaded_count += 1
-                logger.info(f"Unloaded unused model: {model.name}")
-            except Exception as e:
-                logger.error(f"Failed to unload model {model.name}: {str(e)}")
-        
-        # Force garbage collection
-        gc.collect()
+        # The registry knows when this process last used each model; the
+        # last_used column is only written when a model is loaded
+        unloaded = model_registry.evict_idle(timeout_minutes * 60)
+        if unloaded:
+            NLPModel.objects.filter(name__in=unloaded).update(is_loaded=False)
+        unloaded_count = len(unloaded)
+        for model_name in unloaded:
+            logger.info(f"Unloaded unused model: {model_name}")
         
         logger.info(f"Cleaned up {unloaded_count} unused models")
         
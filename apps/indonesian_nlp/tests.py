@@ -17,6 +17,7 @@ from .models import (
     ModelUsageStatistics
 )
 from .client import IndonesianNLPClient
+from .registry import ModelRegistry, model_registry
 from .utils import (
     IndonesianTextProcessor, ModelPerformanceTracker,
     TextAnalysisValidator, CacheManager, BatchProcessor,
@@ -376,6 +377,7 @@ class IndonesianNLPClientTestCase(TestCase):
     """Test Indonesian NLP Client"""
     
     def setUp(self):
+        model_registry.clear()
         self.client = IndonesianNLPClient()
         self.model = NLPModel.objects.create(
             name="test-model",
@@ -402,6 +404,17 @@ class IndonesianNLPClientTestCase(TestCase):
         self.assertIn("test-model", self.client.loaded_models)
         mock_load_transformers.assert_called_once()
     
+    @patch('indonesian_nlp.client.IndonesianNLPClient._load_framework_model')
+    def test_clients_share_loaded_models(self, mock_load):
+        """Test that a new client reuses the models loaded by another"""
+        mock_load.return_value = {'analyzer': MagicMock()}
+        
+        self.assertTrue(self.client.load_model("test-model"))
+        self.assertTrue(IndonesianNLPClient().load_model("test-model"))
+        
+        mock_load.assert_called_once()
+        self.assertIn("test-model", IndonesianNLPClient().loaded_models)
+    
     def test_get_available_frameworks(self):
         """Test getting available frameworks"""
         frameworks = self.client.get_available_frameworks()
@@ -416,6 +429,43 @@ class IndonesianNLPClientTestCase(TestCase):
         self.assertEqual(processed.strip(), "Halo dunia!")
 
 
+class ModelRegistryTestCase(TestCase):
+    """Test the process-wide model registry"""
+    
+    def test_lru_eviction_by_count(self):
+        """Test that the least recently used model is evicted first"""
+        registry = ModelRegistry(memory_budget=10 ** 9, max_models=2)
+        registry.get_or_load('a', lambda: {})
+        registry.get_or_load('b', lambda: {})
+        registry.get('a')
+        registry.get_or_load('c', lambda: {})
+        
+        self.assertEqual(list(registry.loaded()), ['a', 'c'])
+        self.assertEqual(registry.get_stats()['evictions'], 1)
+    
+    def test_eviction_by_memory_budget(self):
+        """Test that models are evicted once the memory budget is exceeded"""
+        registry = ModelRegistry(memory_budget=100)
+        with patch('indonesian_nlp.registry.estimate_model_size', return_value=60):
+            registry.get_or_load('a', lambda: {})
+            registry.get_or_load('b', lambda: {})
+        
+        self.assertNotIn('a', registry)
+        self.assertIn('b', registry)
+    
+    def test_hits_and_misses(self):
+        """Test that repeated lookups are served without reloading"""
+        registry = ModelRegistry(memory_budget=10 ** 9)
+        loader = MagicMock(return_value={})
+        for _ in range(3):
+            registry.get_or_load('a', loader)
+        
+        loader.assert_called_once()
+        stats = registry.get_stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 2)
+
+
 class APITestCase(APITestCase):
     """Test REST API endpoints"""
     
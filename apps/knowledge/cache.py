@@ -0,0 +1,17 @@
+"""Cache of the knowledge module"""
+
+from horilla.cache_namespaces import cache_namespace
+
+# Document details, document lists, the dashboard statistics and the popular
+# documents, the lists and statistics depend on every document
+knowledge_cache = cache_namespace('knowledge', timeout=3600)
+
+
+def clear_document_cache(document_id):
+    """Clear the cached detail of one document"""
+    knowledge_cache.delete(f'document_{document_id}')
+
+
+def clear_knowledge_cache():
+    """Clear every cached document, list and statistic of the module"""
+    knowledge_cache.invalidate()
@@ -0,0 +1,151 @@
+"""
+In-process state of the chatbot conversations.
+
+Every conversation active in this process keeps the last messages, so the
+prompt history is not queried again on each turn, and the generation state
+of its Ollama model: the ``context`` tokens returned by ``/api/generate`` and
+a digest of the retrieved context they were built from. While the retrieved
+context stays the same, the next turn sends only the new question with those
+tokens instead of the whole prompt.
+
+The window is reloaded from the database when the ``last_activity`` of the
+conversation was moved by another process, which also drops the generation
+state since it misses the turns of that process.
+"""
+
+import hashlib
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.utils import timezone
+
+from horilla.cache_namespaces import LocalCache
+
+
+class ChatSession:
+    """Message window and Ollama generation state of one conversation"""
+
+    def __init__(self, conversation_id, window):
+        self.conversation_id = conversation_id
+        self.messages = deque(maxlen=window)
+        self.synced_at = None
+        self.lock = threading.Lock()
+        self.model = None
+        self.context_tokens = None
+        self.context_digest = None
+        self.turns = 0
+
+    def load(self, conversation):
+        rows = conversation.messages.order_by("-created_at").values_list(
+            "sender", "content", "created_at"
+        )[: self.messages.maxlen]
+        self.messages.clear()
+        self.messages.extend(reversed(list(rows)))
+        self.synced_at = conversation.last_activity
+        self._reset_generation()
+
+    def append(self, message, conversation, previous_activity):
+        with self.lock:
+            if self.synced_at != previous_activity:
+                # written by another process as well, reload on the next use
+                self.synced_at = None
+                return
+            self.messages.append((message.sender, message.content, message.created_at))
+            self.synced_at = conversation.last_activity
+
+    def window(self, limit, max_age=None):
+        """Last ``limit`` messages as ``(sender, content)``, oldest first"""
+        with self.lock:
+            messages = list(self.messages)
+        if max_age is not None:
+            since = timezone.now() - max_age
+            messages = [m for m in messages if m[2] >= since]
+        return [(sender, content) for sender, content, _ in messages[-limit:]]
+
+    def continuation(self, model, digest, max_tokens):
+        """
+        Context tokens the next turn can continue from, or None after
+        dropping a generation state that cannot be reused
+        """
+        with self.lock:
+            if (
+                self.context_tokens is not None
+                and self.model == model
+                and self.context_digest == digest
+                and len(self.context_tokens) < max_tokens
+            ):
+                return self.context_tokens
+            self._reset_generation()
+            return None
+
+    def update_generation(self, model, digest, tokens, previous=None):
+        """
+        Keeps the tokens of a finished turn that started from ``previous``.
+        When another turn of the conversation finished in between, both
+        states miss a turn and the next one starts over.
+        """
+        with self.lock:
+            if self.context_tokens is not previous:
+                self._reset_generation()
+                return
+            self.model = model
+            self.context_digest = digest
+            self.context_tokens = tokens or None
+            self.turns = self.turns + 1 if tokens else 0
+
+    def reset_generation(self):
+        with self.lock:
+            self._reset_generation()
+
+    def _reset_generation(self):
+        self.model = None
+        self.context_tokens = None
+        self.context_digest = None
+        self.turns = 0
+
+
+class ChatSessionStore:
+    """Sessions of the conversations recently active in this process"""
+
+    def __init__(self, max_sessions, timeout, window):
+        self.timeout = timeout
+        self.window = window
+        self.sessions = LocalCache(max_sessions)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def digest(context):
+        return hashlib.sha1(context.encode("utf-8")).hexdigest()
+
+    def get(self, conversation):
+        key = str(conversation.conversation_id)
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                session = ChatSession(key, self.window)
+            # keep it for another timeout from the last use
+            self.sessions.set(key, session, self.timeout)
+        with session.lock:
+            if session.synced_at is None or session.synced_at != conversation.last_activity:
+                session.load(conversation)
+        return session
+
+    def message_added(self, conversation, message, previous_activity):
+        """
+        Appends a message saved by this process to the window,
+        ``previous_activity`` is the ``last_activity`` before saving it.
+        """
+        session = self.sessions.get(str(conversation.conversation_id))
+        if session is not None:
+            session.append(message, conversation, previous_activity)
+
+    def discard(self, conversation):
+        self.sessions.delete(str(conversation.conversation_id))
+
+
+chat_sessions = ChatSessionStore(
+    max_sessions=getattr(settings, "CHATBOT_SESSION_MAX_ACTIVE", 500),
+    timeout=getattr(settings, "CHATBOT_SESSION_TIMEOUT", 1800),
+    window=getattr(settings, "CHATBOT_SESSION_WINDOW", 10),
+)
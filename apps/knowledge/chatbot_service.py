@@ -1,7 +1,6 @@
 import logging
 import time
 from typing import List, Dict, Any, Optional, Tuple
-from django.db.models import Q
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.conf import settings
@@ -16,6 +15,9 @@ from .models import (
     DocumentCategory, DocumentTag
 )
 from ai_services.knowledge_ai import KnowledgeAIService
+from ai_services.metrics import ai_metrics
+from . import search_index, snippets
+from .chat_sessions import chat_sessions
 from helpdesk.models import FAQ
 
 logger = logging.getLogger(__name__)
@@ -34,6 +36,10 @@ class ChatbotRAGService:
         self.default_model = getattr(settings, 'OLLAMA_DEFAULT_MODEL', 'llama2')
         self.max_context_length = getattr(settings, 'CHATBOT_MAX_CONTEXT_LENGTH', 4000)
         self.similarity_threshold = getattr(settings, 'CHATBOT_SIMILARITY_THRESHOLD', 0.3)
+        # Model and generation state stay loaded in Ollama between the turns
+        self.keep_alive = getattr(settings, 'OLLAMA_KEEP_ALIVE', '30m')
+        self.max_session_tokens = getattr(settings, 'OLLAMA_MAX_SESSION_TOKENS', 3072)
+        self.timeout = getattr(settings, 'OLLAMA_TIMEOUT', 30)
         
         # Initialize services
         self._initialize_services()
@@ -117,106 +123,59 @@ class ChatbotRAGService:
             return []
     
     def _keyword_search(self, query: str, user: User, max_results: int) -> List[Dict[str, Any]]:
-        """Traditional keyword-based search"""
+        """BM25 search in the full-text index of the published documents"""
         try:
-            # Build search query
-            search_terms = query.lower().split()
-            q_objects = Q()
-            
-            for term in search_terms:
-                q_objects |= (
-                    Q(title__icontains=term) |
-                    Q(description__icontains=term) |
-                    Q(content__icontains=term) |
-                    Q(ai_extracted_keywords__icontains=term)
-                )
-            
-            # Get documents
+            hits = search_index.search(search_index.DOCUMENT, query, max_results * 2)
             documents = KnowledgeDocument.objects.filter(
-                q_objects,
                 status='published'
-            ).select_related('category', 'created_by')[:max_results * 2]
+            ).select_related('category', 'created_by').in_bulk([hit.object_id for hit in hits])
             
             results = []
-            for doc in documents:
-                if self._user_can_access_document(user, doc):
-                    # Calculate simple relevance score
-                    score = self._calculate_keyword_relevance(query, doc)
-                    if score > 0:
-                        results.append({
-                            'document': doc,
-                            'similarity_score': score,
-                            'snippet': self._extract_snippet(query, doc),
-                            'method': 'keyword'
-                        })
+            for hit in hits:
+                doc = documents.get(hit.object_id)
+                if doc is not None and self._user_can_access_document(user, doc):
+                    results.append({
+                        'document': doc,
+                        'similarity_score': hit.score,
+                        'snippet': search_index.strip_highlight(hit.snippet),
+                        'highlighted_snippet': hit.snippet,
+                        'method': 'keyword'
+                    })
             
-            return sorted(results, key=lambda x: x['similarity_score'], reverse=True)[:max_results]
+            return results[:max_results]
             
         except Exception as e:
             logger.error(f"Keyword search failed: {e}")
             return []
     
     def _faq_search(self, query: str, user: User, max_results: int) -> List[Dict[str, Any]]:
-        """Search in helpdesk FAQ"""
+        """BM25 search in the full-text index of the active helpdesk FAQs"""
         try:
-            # Build search query for FAQ
-            search_terms = query.lower().split()
-            q_objects = Q()
-            
-            for term in search_terms:
-                q_objects |= (
-                    Q(question__icontains=term) |
-                    Q(answer__icontains=term)
-                )
-            
-            # Get FAQ entries
+            hits = search_index.search(search_index.FAQ, query, max_results * 2)
+            # the manager keeps the FAQs of the selected company
             faqs = FAQ.objects.filter(
-                q_objects,
                 is_active=True
-            ).select_related('category')[:max_results * 2]
+            ).select_related('category').in_bulk([hit.object_id for hit in hits])
             
             results = []
-            for faq in faqs:
-                # Calculate simple relevance score
-                score = self._calculate_faq_relevance(query, faq)
-                if score > 0:
+            for hit in hits:
+                faq = faqs.get(hit.object_id)
+                if faq is not None:
                     results.append({
                         'faq': faq,
-                        'similarity_score': score,
-                        'snippet': faq.answer[:200] + '...' if len(faq.answer) > 200 else faq.answer,
+                        'similarity_score': hit.score,
+                        'snippet': search_index.strip_highlight(hit.snippet),
+                        'highlighted_snippet': hit.snippet,
                         'method': 'faq_search',
                         'type': 'faq'
                     })
             
-            return sorted(results, key=lambda x: x['similarity_score'], reverse=True)[:max_results]
+            return results[:max_results]
             
         except Exception as e:
             logger.error(f"FAQ search failed: {e}")
             return []
     
-    def _calculate_faq_relevance(self, query: str, faq: FAQ) -> float:
-        """Calculate keyword-based relevance score for FAQ"""
-        try:
-            query_terms = set(query.lower().split())
-            if not query_terms:
-                return 0.0
-            
-            # Text to search in
-            searchable_text = f"{faq.question} {faq.answer}".lower()
-            
-            # Count matches
-            matches = 0
-            for term in query_terms:
-                if term in searchable_text:
-                    matches += searchable_text.count(term)
-            
-            # Normalize by query length
-            return min(matches / len(query_terms), 1.0)
-            
-        except Exception as e:
-            logger.error(f"FAQ relevance calculation failed: {e}")
-            return 0.0
-    
     def _embedding_search(self, query: str, user: User, max_results: int) -> List[Dict[str, Any]]:
         """Embedding-based semantic search"""
         try:
@@ -295,53 +254,10 @@ class ChatbotRAGService:
             logger.error(f"Access check failed: {e}")
             return False
     
-    def _calculate_keyword_relevance(self, query: str, document: KnowledgeDocument) -> float:
-        """Calculate keyword-based relevance score"""
-        try:
-            query_terms = set(query.lower().split())
-            if not query_terms:
-                return 0.0
-            
-            # Text to search in
-            searchable_text = f"{document.title} {document.description} {document.content}".lower()
-            
-            # Count matches
-            matches = 0
-            for term in query_terms:
-                if term in searchable_text:
-                    matches += searchable_text.count(term)
-            
-            # Normalize by query length
-            return min(matches / len(query_terms), 1.0)
-            
-        except Exception as e:
-            logger.error(f"Relevance calculation failed: {e}")
-            return 0.0
-    
     def _extract_snippet(self, query: str, document: KnowledgeDocument, max_length: int = 200) -> str:
         """Extract relevant snippet from document"""
         try:
-            query_terms = query.lower().split()
-            content = document.content.lower()
-            
-            # Find first occurrence of any query term
-            best_pos = len(content)
-            for term in query_terms:
-                pos = content.find(term)
-                if pos != -1 and pos < best_pos:
-                    best_pos = pos
-            
-            if best_pos == len(content):
-                # No terms found, return beginning of content
-                snippet = document.content[:max_length]
-            else:
-                # Extract around the found term
-                start = max(0, best_pos - max_length // 2)
-                end = min(len(document.content), start + max_length)
-                snippet = document.content[start:end]
-            
-            return snippet.strip()
-            
+            return snippets.extract_snippet(document, query, max_length)
         except Exception as e:
             logger.error(f"Snippet extraction failed: {e}")
             return document.description[:max_length] if document.description else ""
@@ -387,11 +303,20 @@ class ChatbotRAGService:
             # Limit context length
             context = "".join(context_parts)[:self.max_context_length]
             
-            # Build prompt
-            prompt = self._build_prompt(query, context, conversation)
-            
-            # Generate response using Ollama
-            response_data = self._call_ollama(prompt)
+            # Continue the Ollama session of the conversation while the
+            # retrieved context is the same, otherwise start it again
+            session = chat_sessions.get(conversation)
+            digest = chat_sessions.digest(context)
+            context_tokens = session.continuation(self.default_model, digest, self.max_session_tokens)
+            if context_tokens is not None:
+                prompt = self._build_followup_prompt(query)
+                response_data = self._call_ollama(
+                    prompt, session=session, digest=digest, fallback_text=context,
+                    context_tokens=context_tokens
+                )
+            else:
+                prompt = self._build_prompt(query, context, conversation, session)
+                response_data = self._call_ollama(prompt, session=session, digest=digest)
             
             processing_time = time.time() - start_time
             
@@ -403,7 +328,9 @@ class ChatbotRAGService:
                 'referenced_documents': referenced_docs,
                 'referenced_faqs': referenced_faqs,
                 'context_used': len(context),
-                'model_used': response_data.get('model', self.default_model)
+                'model_used': response_data.get('model', self.default_model),
+                'time_to_first_token': response_data.get('time_to_first_token'),
+                'context_reused': response_data.get('context_reused', False)
             }
             
         except Exception as e:
@@ -414,17 +341,17 @@ class ChatbotRAGService:
                 'error': str(e)
             }
     
-    def _build_prompt(self, query: str, context: str, conversation: ChatbotConversation) -> str:
+    def _build_prompt(self, query: str, context: str, conversation: ChatbotConversation,
+                      session=None) -> str:
         """Build prompt for AI model"""
-        # Get recent conversation history for context
-        recent_messages = conversation.messages.filter(
-            created_at__gte=timezone.now() - timezone.timedelta(hours=1)
-        ).order_by('created_at')[:10]
+        # Recent conversation history from the in-memory window
+        session = session or chat_sessions.get(conversation)
+        recent_messages = session.window(10, max_age=timezone.timedelta(hours=1))
         
         conversation_history = ""
-        for msg in recent_messages:
-            role = "User" if msg.sender == 'user' else "Assistant"
-            conversation_history += f"{role}: {msg.content}\n"
+        for sender, content in recent_messages:
+            role = "User" if sender == 'user' else "Assistant"
+            conversation_history += f"{role}: {content}\n"
         
         prompt = f"""Anda adalah asisten AI untuk sistem HR Horilla yang membantu karyawan dengan pertanyaan seputar kebijakan dan prosedur perusahaan.
 
@@ -447,38 +374,84 @@ Jawaban (dalam bahasa Indonesia yang jelas):"""
         
         return prompt
     
-    def _call_ollama(self, prompt: str) -> Dict[str, Any]:
-        """Call Ollama API for response generation"""
+    def _build_followup_prompt(self, query: str) -> str:
+        """Next question of a conversation whose context Ollama already holds"""
+        return f"""Pertanyaan: {query}
+
+Jawaban (dalam bahasa Indonesia yang jelas):"""
+    
+    def _call_ollama(self, prompt: str, session=None, digest: str = None,
+                     fallback_text: str = None, context_tokens: List[int] = None) -> Dict[str, Any]:
+        """
+        Call Ollama API for response generation. The response is streamed to
+        measure the time to the first token; ``context_tokens`` (taken from
+        the ``session`` by ``continuation``) are sent along and the new ones
+        are kept in the session for the next turn.
+        """
+        context_reused = context_tokens is not None
         try:
             url = f"{self.ollama_base_url}/api/generate"
             payload = {
                 "model": self.default_model,
                 "prompt": prompt,
-                "stream": False,
+                "stream": True,
+                "keep_alive": self.keep_alive,
                 "options": {
                     "temperature": 0.7,
                     "top_p": 0.9,
                     "max_tokens": 1000
                 }
             }
+            if context_reused:
+                payload["context"] = context_tokens
+            
+            started = time.perf_counter()
+            first_token = None
+            parts = []
+            result = {}
+            with requests.post(url, json=payload, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    result = json.loads(line)
+                    if result.get('error'):
+                        raise requests.exceptions.RequestException(result['error'])
+                    if result.get('response'):
+                        if first_token is None:
+                            first_token = time.perf_counter() - started
+                        parts.append(result['response'])
+                    if result.get('done'):
+                        break
             
-            response = requests.post(url, json=payload, timeout=30)
-            response.raise_for_status()
-            
-            result = response.json()
+            model = result.get('model', self.default_model)
+            if first_token is not None:
+                ai_metrics.record_time_to_first_token(
+                    'chatbot_rag', model, first_token, context_reused,
+                    result.get('prompt_eval_count')
+                )
+            if session is not None:
+                session.update_generation(
+                    self.default_model, digest, result.get('context'), previous=context_tokens
+                )
             return {
-                'response': result.get('response', ''),
-                'model': result.get('model', self.default_model),
-                'confidence': 0.8  # Default confidence
+                'response': ''.join(parts),
+                'model': model,
+                'confidence': 0.8,  # Default confidence
+                'time_to_first_token': first_token,
+                'context_reused': context_reused
             }
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Ollama API call failed: {e}")
-            # Fallback: Generate response based on FAQ context
-            return self._generate_fallback_response(prompt)
         except Exception as e:
             logger.error(f"Unexpected error in Ollama call: {e}")
-            return self._generate_fallback_response(prompt)
+        
+        # The fallback answer is not part of the Ollama context
+        if session is not None:
+            session.reset_generation()
+        # Fallback: Generate response based on FAQ context
+        return self._generate_fallback_response(fallback_text or prompt)
     
     def _generate_fallback_response(self, prompt: str) -> Dict[str, Any]:
         """Generate fallback response when Ollama is not available"""
@@ -551,8 +524,10 @@ Jawaban (dalam bahasa Indonesia yang jelas):"""
             )
             
             # Update conversation last activity
+            previous_activity = conversation.last_activity
             conversation.last_activity = timezone.now()
             conversation.save()
+            chat_sessions.message_added(conversation, message, previous_activity)
             
             return message
             
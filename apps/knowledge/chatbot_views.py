@@ -21,7 +21,7 @@ from .models import (
     KnowledgeDocument
 )
 from .chatbot_service import ChatbotRAGService
-from ai_services.chatbot_slm_service import ChatbotSLMService
+from ai_services.chatbot_slm_service import chatbot_slm_service
 from .chatbot_serializers import (
     ChatbotConversationSerializer, ChatbotMessageSerializer,
     ChatbotFeedbackSerializer
@@ -47,8 +47,9 @@ def chatbot_query(request):
                 'success': False,
                 'error': 'Query is required'
             }, status=status.HTTP_400_BAD_REQUEST)
-        # Use SLM service directly (RAG service not available)
-        slm_service = ChatbotSLMService()
+        # Use SLM service directly (RAG service not available); the shared
+        # instance keeps the embedding model and the answer cache loaded
+        slm_service = chatbot_slm_service
         
         # Get or create conversation
         if conversation_id:
@@ -70,19 +71,14 @@ def chatbot_query(request):
             message_type='text'
         )
         
-        # Retrieve relevant documents
-        relevant_docs = slm_service.retrieve_relevant_documents(
+        # Answer from the semantic cache or retrieve documents and generate
+        response_data = slm_service.answer_query(
             query=query,
             user=request.user,
+            conversation=conversation,
             max_results=5
         )
-        
-        # Generate AI response using improved SLM service
-        response_data = slm_service.generate_response(
-            query=query,
-            relevant_docs=relevant_docs,
-            conversation=conversation
-        )
+        relevant_docs = response_data.get('relevant_docs', [])
         
         if response_data['success']:
             # Add AI response message
@@ -330,8 +326,8 @@ def search_documents(request):
                 'error': 'Search query is required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Initialize SLM service
-        slm_service = ChatbotSLMService()
+        # Shared SLM service
+        slm_service = chatbot_slm_service
         
         # Search documents
         relevant_docs = slm_service.retrieve_relevant_documents(
@@ -0,0 +1,499 @@
+"""
+Staged ingestion pipeline for knowledge documents.
+
+extract -> clean -> chunk -> embed -> classify -> index
+
+Every stage works on a batch of documents. File extraction is CPU bound and
+runs in a process pool, chunk embeddings are computed in batches and the
+results are written back with bulk queries. Each document is keyed by a hash
+of its content and file, and the hash every stage last completed for is kept
+in ``KnowledgeDocument.ingestion_state``: re-running the pipeline on an
+unchanged document (or re-uploading the same file) is a no-op, an edited
+document whose file did not change keeps its extracted text, and chunks whose
+text did not change keep their stored embedding. The file hash is stored with
+the file's size and modification time, and the file is only read again when
+those change.
+"""
+
+import hashlib
+import logging
+import multiprocessing
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import clear_knowledge_cache
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+logger = logging.getLogger(__name__)
+
+STAGES = ['extract', 'clean', 'chunk', 'embed', 'classify', 'index']
+
+CHUNK_WORDS = 200
+CHUNK_OVERLAP = 40
+
+
+def file_stat(document):
+    """Name, size and modification time of the attached file, None if unknown"""
+    if not document.file:
+        return None
+    storage = document.file.storage
+    name = document.file.name
+    try:
+        return {
+            'name': name,
+            'size': storage.size(name),
+            'mtime': storage.get_modified_time(name).timestamp(),
+        }
+    except Exception:
+        # not every storage reports modification times
+        return None
+
+
+def file_hash(document, stat=None) -> str:
+    """
+    Hash of the attached file, empty when there is none. The file is only
+    read when its stat differs from the one stored with the last hash.
+    """
+    if not document.file:
+        return ''
+    cached = (document.ingestion_state or {}).get('file') or {}
+    if stat is not None and cached.get('hash') and all(
+        cached.get(key) == value for key, value in stat.items()
+    ):
+        return cached['hash']
+    digest = hashlib.sha256()
+    try:
+        with document.file.open('rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(block)
+    except Exception as e:
+        # hash the name so the document is still processed
+        logger.error(f"Unable to read {document.file.name} for hashing: {str(e)}")
+        digest.update(document.file.name.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def document_hash(document, file_digest: str) -> str:
+    """Hash of everything the pipeline reads from a document"""
+    digest = hashlib.sha256()
+    for part in (document.title or '', document.content or '', file_digest):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+_processor = None
+
+
+def _extract_file(path: str) -> str:
+    # runs inside the pool; the processor loads its NLTK data once per process
+    global _processor
+    if _processor is None:
+        from .utils import DocumentProcessor
+        _processor = DocumentProcessor()
+    return _processor.extract_text_from_file(path)
+
+
+def extract_files(paths: List[str], workers: int = None) -> List[str]:
+    """Extract the text of several files, in a process pool when worth it"""
+    if workers is None:
+        workers = getattr(settings, 'KNOWLEDGE_INGESTION_WORKERS', min(multiprocessing.cpu_count(), 4))
+    workers = min(workers, len(paths))
+    if workers <= 1:
+        return [_extract_file(path) for path in paths]
+    # spawn keeps the children clear of the parent's threads and db connections
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        return list(executor.map(_extract_file, paths))
+
+
+_CONTROL = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+_HYPHEN_BREAK = re.compile(r'(\w)-\n(\w)')
+_BLANK_LINES = re.compile(r'\n\s*\n+')
+_SPACES = re.compile(r'[ \t ]+')
+
+
+def clean_text(text: str) -> str:
+    """Normalise unicode and whitespace, re-join words split across lines"""
+    text = unicodedata.normalize('NFKC', text or '')
+    text = _CONTROL.sub(' ', text)
+    text = _HYPHEN_BREAK.sub(r'\1\2', text)
+    text = _SPACES.sub(' ', text)
+    text = _BLANK_LINES.sub('\n\n', text)
+    return text.strip()
+
+
+def chunk_text(text: str, chunk_words: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """
+    Split text into overlapping word windows, preferring paragraph boundaries
+    so a chunk rarely starts in the middle of a thought.
+    """
+    paragraphs = [paragraph.split() for paragraph in text.split('\n\n')]
+    chunks = []
+    current = []
+    for words in paragraphs:
+        # close the chunk at a paragraph break unless it would stay tiny
+        if len(current) >= chunk_words // 2 and len(current) + len(words) > chunk_words:
+            chunks.append(current)
+            current = current[-overlap:] if overlap else []
+        current.extend(words)
+        while len(current) > chunk_words:
+            chunks.append(current[:chunk_words])
+            current = current[chunk_words - overlap:]
+    if current and (not chunks or len(current) > overlap):
+        chunks.append(current)
+    return [' '.join(words) for words in chunks]
+
+
+class ChunkEmbedder:
+    """Embeds chunk texts, batching them through one model call"""
+
+    def __init__(self, model_name: str = None, dimension: int = 384):
+        self.model = None
+        self.vectorizer = None
+        model_name = model_name or getattr(settings, 'KNOWLEDGE_EMBEDDING_MODEL', None)
+        if model_name and SentenceTransformer is not None:
+            try:
+                self.model = SentenceTransformer(model_name)
+                self.name = f"st:{model_name}"
+                return
+            except Exception as e:
+                logger.warning(f"Failed to load embedding model {model_name}, using hashing: {str(e)}")
+
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        self.vectorizer = HashingVectorizer(
+            n_features=dimension, ngram_range=(1, 2), alternate_sign=False, norm='l2'
+        )
+        self.name = f"hashing:{dimension}"
+
+    def embed(self, texts: List[str], batch_size: int = 64) -> List[List[float]]:
+        if not texts:
+            return []
+        if self.model is not None:
+            return self.model.encode(
+                texts, batch_size=batch_size, normalize_embeddings=True, show_progress_bar=False
+            ).tolist()
+        return self.vectorizer.transform(texts).toarray().tolist()
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_chunk_embedder() -> ChunkEmbedder:
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = ChunkEmbedder()
+    return _embedder
+
+
+class StageStats:
+    """Wall time and item counts of one pipeline stage"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.skipped = 0
+        self.seconds = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'items': self.items,
+            'skipped': self.skipped,
+            'seconds': round(self.seconds, 4),
+            'items_per_second': round(self.items / self.seconds, 2) if self.seconds else None,
+            'ms_per_item': round(self.seconds * 1000 / self.items, 2) if self.items else None,
+        }
+
+
+class _Item:
+    """Working state of one document while it moves through the stages"""
+
+    def __init__(self, document, file_digest, content_hash):
+        self.document = document
+        # extraction only depends on the file, the other stages on everything
+        self.hashes = {stage: content_hash for stage in STAGES}
+        self.hashes['extract'] = file_digest
+        self.state = dict(document.ingestion_state or {})
+        self.text = ''
+        self.chunks = []
+        self.vectors = {}
+        self.results = {}
+
+    def done(self, stage):
+        return self.state.get(stage) == self.hashes[stage]
+
+
+class IngestionPipeline:
+    """
+    Runs documents through the ingestion stages in batches.
+
+    ``run`` returns ``{'documents': {id: results}, 'stages': {stage: stats}}``.
+    """
+
+    def __init__(self, use_ai: bool = True, workers: int = None, force: bool = False):
+        self.use_ai = use_ai
+        self.workers = workers
+        self.force = force
+        self.stats = {stage: StageStats(stage) for stage in STAGES}
+
+    def _timed(self, stage, function, items):
+        stats = self.stats[stage]
+        pending = [item for item in items if self.force or not item.done(stage)]
+        stats.skipped += len(items) - len(pending)
+        if not pending:
+            return
+        start = time.perf_counter()
+        try:
+            function(pending)
+        finally:
+            stats.seconds += time.perf_counter() - start
+            stats.items += len(pending)
+        for item in pending:
+            item.state[stage] = item.hashes[stage]
+
+    def run(self, documents) -> Dict[str, Any]:
+        items = []
+        touched = []
+        for document in documents:
+            stat = file_stat(document)
+            file_digest = file_hash(document, stat)
+            file_state = dict(stat, hash=file_digest) if stat else None
+            content_hash = document_hash(document, file_digest)
+            if not self.force and document.ingestion_state.get('index') == content_hash:
+                self.stats['index'].skipped += 1
+                if file_state and document.ingestion_state.get('file') != file_state:
+                    # touched but unchanged file, remember the new stat
+                    document.ingestion_state = dict(document.ingestion_state, file=file_state)
+                    touched.append(document)
+                continue
+            item = _Item(document, file_digest, content_hash)
+            if file_state:
+                item.state['file'] = file_state
+            items.append(item)
+        if touched:
+            from .models import KnowledgeDocument
+            KnowledgeDocument.objects.bulk_update(touched, ['ingestion_state'], batch_size=200)
+
+        if items:
+            self._load_text(items)
+            self._timed('extract', self.extract, items)
+            self._timed('clean', self.clean, items)
+            self._timed('chunk', self.chunk, items)
+            self._timed('embed', self.embed, items)
+            self._timed('classify', self.classify, items)
+            self._timed('index', self.index, items)
+
+        report = {
+            'documents': {item.document.id: item.results for item in items},
+            'stages': {stage: stats.as_dict() for stage, stats in self.stats.items()},
+        }
+        self._record_metrics()
+        logger.info(f"Ingested {len(items)} documents: {report['stages']}")
+        return report
+
+    def _load_text(self, items):
+        # the file did not change, its extracted text is still valid
+        for item in items:
+            if not self.force and item.done('extract'):
+                item.text = item.document.extracted_text
+
+    def extract(self, items):
+        with_files = [item for item in items if item.document.file]
+        for item in items:
+            item.text = ''
+        if not with_files:
+            return
+        paths = []
+        for item in with_files:
+            try:
+                paths.append(item.document.file.path)
+            except Exception as e:
+                # remote storages have no local path
+                logger.error(f"Document {item.document.id} has no local file: {str(e)}")
+                paths.append('')
+        texts = extract_files(paths, self.workers)
+        for item, text in zip(with_files, texts):
+            item.text = text
+
+    def clean(self, items):
+        for item in items:
+            item.text = clean_text(item.text)
+
+    def _full_text(self, item):
+        if item.text:
+            return f"{item.document.content}\n\n{item.text}"
+        return item.document.content or ''
+
+    def chunk(self, items):
+        for item in items:
+            item.chunks = chunk_text(clean_text(self._full_text(item)))
+
+    def embed(self, items):
+        from .models import DocumentChunk
+
+        embedder = get_chunk_embedder()
+        for item in items:
+            if not item.chunks:
+                item.chunks = chunk_text(clean_text(self._full_text(item)))
+        hashes = {
+            hashlib.sha256(chunk.encode('utf-8')).hexdigest(): chunk
+            for item in items
+            for chunk in item.chunks
+        }
+        # chunks that did not change keep their stored embedding
+        known = dict(
+            DocumentChunk.objects.filter(
+                content_hash__in=list(hashes), embedding_model=embedder.name
+            ).values_list('content_hash', 'embedding')
+        )
+        missing = [chunk_hash for chunk_hash in hashes if chunk_hash not in known]
+        vectors = embedder.embed([hashes[chunk_hash] for chunk_hash in missing])
+        known.update(zip(missing, vectors))
+        self.stats['embed'].skipped += len(hashes) - len(missing)
+        for item in items:
+            item.vectors = known
+
+    def classify(self, items):
+        from .utils import (
+            AIDocumentClassifier,
+            DocumentProcessor,
+            OllamaIntegration,
+            classify_document_type,
+        )
+
+        processor = DocumentProcessor()
+        classifier = AIDocumentClassifier()
+        ollama = OllamaIntegration()
+        use_ollama = self.use_ai and ollama.is_available()
+
+        def summarize(text):
+            summary = ollama.generate_summary(text) if use_ollama else ''
+            return summary or processor.generate_summary(text)
+
+        texts = [self._full_text(item) for item in items]
+        # summaries wait on the Ollama server, run a few of them at once
+        with ThreadPoolExecutor(max_workers=4 if use_ollama else 1) as executor:
+            summaries = list(executor.map(summarize, texts))
+
+        for item, text, summary in zip(items, texts, summaries):
+            document = item.document
+            if use_ollama:
+                classification = classify_document_type(text, document.title)
+            else:
+                classification = classifier.classify_document(text, document.title)
+            keywords = processor.extract_keywords(text)
+            suggested_tags = classifier.suggest_tags(f"{document.title} {text}")
+            item.results = {
+                'classification': classification,
+                'keywords': keywords,
+                'suggested_tags': suggested_tags,
+                'summary': summary,
+                'readability': processor.calculate_readability(text),
+            }
+
+    def index(self, items):
+        from .models import DocumentChunk, KnowledgeDocument
+
+        embedder = get_chunk_embedder()
+        chunk_rows = []
+        for item in items:
+            if not item.chunks:
+                item.chunks = chunk_text(clean_text(self._full_text(item)))
+            for position, chunk in enumerate(item.chunks):
+                chunk_hash = hashlib.sha256(chunk.encode('utf-8')).hexdigest()
+                chunk_rows.append(
+                    DocumentChunk(
+                        document=item.document,
+                        chunk_index=position,
+                        content=chunk,
+                        content_hash=chunk_hash,
+                        embedding=item.vectors.get(chunk_hash, []),
+                        embedding_model=embedder.name,
+                    )
+                )
+
+        documents = []
+        for item in items:
+            document = item.document
+            results = item.results
+            if results:
+                classification = results['classification']
+                document.ai_confidence_score = classification.get('confidence', 0.0)
+                document.ai_suggested_tags = results['suggested_tags']
+                document.ai_extracted_keywords = results['keywords']
+                # Auto-suggest document type if confidence is high
+                if classification.get('confidence', 0) > 0.7:
+                    document.document_type = classification['category']
+            document.extracted_text = item.text
+            document.content_hash = item.hashes['index']
+            document.ingestion_state = dict(item.state, index=item.hashes['index'])
+            documents.append(document)
+
+        with transaction.atomic():
+            DocumentChunk.objects.filter(document__in=documents).delete()
+            DocumentChunk.objects.bulk_create(chunk_rows, batch_size=500)
+            # bulk_update skips post_save, which would queue the document again
+            KnowledgeDocument.objects.bulk_update(
+                documents,
+                [
+                    'ai_confidence_score',
+                    'ai_suggested_tags',
+                    'ai_extracted_keywords',
+                    'document_type',
+                    'extracted_text',
+                    'content_hash',
+                    'ingestion_state',
+                ],
+                batch_size=200,
+            )
+        # bulk_update does not send post_save, clear what the signal would
+        clear_knowledge_cache()
+
+    def _record_metrics(self):
+        try:
+            from ai_services.metrics import metrics_collector
+
+            for stage, stats in self.stats.items():
+                labels = {'stage': stage}
+                metrics_collector.increment_counter('knowledge_ingestion_items_total', stats.items, labels)
+                metrics_collector.increment_counter('knowledge_ingestion_skipped_total', stats.skipped, labels)
+                if stats.items:
+                    metrics_collector.observe_histogram(
+                        'knowledge_ingestion_stage_seconds', stats.seconds / stats.items, labels
+                    )
+        except Exception as e:
+            logger.error(f"Failed to record ingestion metrics: {str(e)}")
+
+
+def ingest_documents(document_ids: List[int], use_ai: bool = True, force: bool = False,
+                     batch_size: int = 50) -> Dict[str, Any]:
+    """Run the ingestion pipeline over documents, ``batch_size`` at a time"""
+    from .models import KnowledgeDocument
+
+    pipeline = IngestionPipeline(use_ai=use_ai, force=force)
+    documents = {}
+    document_ids = list(document_ids)
+    for start in range(0, len(document_ids), batch_size):
+        batch = KnowledgeDocument.objects.filter(id__in=document_ids[start:start + batch_size])
+        documents.update(pipeline.run(batch)['documents'])
+    return {
+        'documents': documents,
+        'stages': {stage: stats.as_dict() for stage, stats in pipeline.stats.items()},
+        'finished_at': timezone.now().isoformat(),
+    }
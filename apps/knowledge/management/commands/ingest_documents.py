@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from knowledge.ingestion import STAGES, ingest_documents
+from knowledge.models import KnowledgeDocument
+
+
+class Command(BaseCommand):
+    help = 'Run knowledge documents through the ingestion pipeline and report per stage timings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int, help='Document ids (default: all documents)')
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Process documents even when their content hash did not change',
+        )
+        parser.add_argument(
+            '--no-ai',
+            action='store_true',
+            help='Skip Ollama and use the extractive summary and rule based classifier',
+        )
+        parser.add_argument('--batch-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        document_ids = options['ids'] or list(KnowledgeDocument.objects.values_list('id', flat=True))
+        report = ingest_documents(
+            document_ids,
+            use_ai=not options['no_ai'],
+            force=options['force'],
+            batch_size=options['batch_size'],
+        )
+
+        self.stdout.write(
+            f"Processed {len(report['documents'])} of {len(document_ids)} documents"
+        )
+        self.stdout.write(f"{'stage':<10} {'items':>7} {'skipped':>8} {'seconds':>9} {'items/s':>9} {'ms/item':>9}")
+        for stage in STAGES:
+            stats = report['stages'][stage]
+            self.stdout.write(
+                f"{stage:<10} {stats['items']:>7} {stats['skipped']:>8} {stats['seconds']:>9} "
+                f"{stats['items_per_second'] or '-':>9} {stats['ms_per_item'] or '-':>9}"
+            )
+        self.stdout.write(self.style.SUCCESS('Ingestion finished.'))
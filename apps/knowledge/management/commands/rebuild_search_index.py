@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from knowledge.search_index import KINDS, get_search_backend, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of the knowledge documents and FAQs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kinds', nargs='*', help=f"Kinds to rebuild: {', '.join(KINDS)} (default: all)")
+
+    def handle(self, *args, **options):
+        # validated here, argparse rejects an empty list when nargs='*' has choices
+        unknown = [kind for kind in options['kinds'] if kind not in KINDS]
+        if unknown:
+            raise CommandError(f"Unknown kinds: {', '.join(unknown)} (choose from {', '.join(KINDS)})")
+        backend = get_search_backend()
+        counts = rebuild(options['kinds'] or KINDS, backend)
+        for kind, count in counts.items():
+            self.stdout.write(f"Indexed {count} {kind} rows with the {backend.name} backend")
@@ -0,0 +1,99 @@
+"""Management command to benchmark the snippet extraction on long policy documents"""
+
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from knowledge.snippets import TokenizedText
+
+PAGE_CHARACTERS = 3000
+VOCABULARY = (
+    "karyawan cuti tahunan pengajuan atasan persetujuan kebijakan perusahaan "
+    "hari kerja lembur gaji tunjangan reimbursement dokumen formulir sistem "
+    "employee leave annual request manager approval policy company working "
+    "overtime salary allowance claim form system period notice probation"
+).split()
+QUERIES = [
+    "cara mengajukan cuti tahunan",
+    "overtime allowance policy",
+    "reimbursement form approval manager",
+    "probation notice period",
+]
+
+
+def policy_document(pages, seed=0):
+    """
+    Synthetic policy text of about ``pages`` pages; the policy terms are mixed
+    into generated words with a Zipf-like frequency, like the words of a real
+    document
+    """
+    rng = random.Random(seed)
+    syllables = ["ka", "ry", "wan", "pe", "ng", "aju", "an", "ta", "hu", "ber", "la", "ku", "si", "tem", "da"]
+    words = list(VOCABULARY)
+    while len(words) < 3000:
+        words.append("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    rng.shuffle(words)
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+
+    sentences = []
+    length = 0
+    while length < pages * PAGE_CHARACTERS:
+        sentence = " ".join(rng.choices(words, weights, k=rng.randint(8, 20))).capitalize() + ". "
+        sentences.append(sentence)
+        length += len(sentence)
+    return "".join(sentences)
+
+
+def sliding_window_snippet(query, content, max_length=200):
+    """The previous extraction: a 200 character window moved by 50 characters"""
+    query_words = query.lower().split()
+    best_pos = 0
+    best_score = 0
+    for i in range(0, len(content) - max_length, 50):
+        snippet = content[i:i + max_length].lower()
+        score = sum(1 for word in query_words if word in snippet)
+        if score > best_score:
+            best_score = score
+            best_pos = i
+    return content[best_pos:best_pos + max_length]
+
+
+class Command(BaseCommand):
+    help = "Compare the sliding window snippet extraction with the position index on synthetic documents"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--pages", type=int, nargs="+", default=[1, 10, 100], help="Document sizes in pages (default: 1 10 100)"
+        )
+        parser.add_argument("--repeat", type=int, default=5, help="Runs of every query")
+
+    def handle(self, *args, **options):
+        repeat = options["repeat"]
+        self.stdout.write(
+            f"{'pages':>6} {'chars':>9} {'sliding ms':>11} {'tokenize ms':>12} {'indexed ms':>11} {'speedup':>8}"
+        )
+        for pages in options["pages"]:
+            text = policy_document(pages)
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for query in QUERIES:
+                    sliding_window_snippet(query, text)
+            sliding = (time.perf_counter() - start) * 1000 / (repeat * len(QUERIES))
+
+            start = time.perf_counter()
+            tokenized = TokenizedText(text)
+            tokenize = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for query in QUERIES:
+                    tokenized.snippets(query, count=3)
+            indexed = (time.perf_counter() - start) * 1000 / (repeat * len(QUERIES))
+
+            speedup = f"{sliding / indexed:.0f}x" if indexed else "-"
+            self.stdout.write(
+                f"{pages:>6} {len(text):>9} {sliding:>11.2f} {tokenize:>12.2f} {indexed:>11.2f} {speedup:>8}"
+            )
+        self.stdout.write("Tokenizing runs once per document version, the indexed column is the cost per query")
@@ -56,6 +56,27 @@ def document_upload_path(instance, filename):
     return os.path.join('knowledge', 'documents', str(instance.created_by.id), filename)
 
 
+class KnowledgeDocumentQuerySet(models.QuerySet):
+    def accessible_to(self, user):
+        """
+        Documents ``user`` may read, as one filter: public ones, their own,
+        the ones shared with them and the department documents of their
+        department.
+        """
+        if user is None or not user.is_authenticated:
+            return self.filter(visibility='public')
+        access = (
+            models.Q(visibility='public')
+            | models.Q(created_by=user)
+            | models.Q(id__in=user.accessible_documents.values('id'))
+        )
+        work_info = getattr(getattr(user, 'employee_get', None), 'employee_work_info', None)
+        department_id = getattr(work_info, 'department_id_id', None)
+        if department_id:
+            access |= models.Q(visibility='department', department_id=department_id)
+        return self.filter(access)
+
+
 class KnowledgeDocument(models.Model):
     """Main knowledge document model"""
     
@@ -123,6 +144,11 @@ class KnowledgeDocument(models.Model):
     ai_suggested_tags = models.JSONField(default=list, blank=True)
     ai_extracted_keywords = models.JSONField(default=list, blank=True)
     
+    # Ingestion pipeline (see knowledge/ingestion.py)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    extracted_text = models.TextField(blank=True, help_text='Text extracted from the attached file')
+    ingestion_state = models.JSONField(default=dict, blank=True, help_text='Content hash each ingestion stage last completed for')
+    
     # Timestamps and users
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_documents')
     updated_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='updated_documents')
@@ -140,6 +166,8 @@ class KnowledgeDocument(models.Model):
     review_cycle_months = models.PositiveIntegerField(default=12, help_text='Review cycle in months')
     next_review_date = models.DateField(null=True, blank=True)
     
+    objects = KnowledgeDocumentQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Knowledge Document'
         verbose_name_plural = 'Knowledge Documents'
@@ -178,6 +206,29 @@ class KnowledgeDocument(models.Model):
         self.save(update_fields=['download_count'])
 
 
+class DocumentChunk(models.Model):
+    """Cleaned text chunk of a document with its embedding"""
+    document = models.ForeignKey(KnowledgeDocument, on_delete=models.CASCADE, related_name='chunks')
+    chunk_index = models.PositiveIntegerField()
+    content = models.TextField()
+    content_hash = models.CharField(max_length=64)
+    embedding = models.JSONField(default=list, blank=True)
+    embedding_model = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Document Chunk'
+        verbose_name_plural = 'Document Chunks'
+        ordering = ['document', 'chunk_index']
+        unique_together = ['document', 'chunk_index']
+        indexes = [
+            models.Index(fields=['content_hash', 'embedding_model']),
+        ]
+    
+    def __str__(self):
+        return f"{self.document.title} - Chunk {self.chunk_index}"
+
+
 class DocumentVersion(models.Model):
     """Version history for documents"""
     document = models.ForeignKey(KnowledgeDocument, on_delete=models.CASCADE, related_name='versions')
@@ -0,0 +1,585 @@
+"""
+Full-text index of the published knowledge documents and the active FAQs.
+
+The chatbots used to OR ``icontains`` filters per keyword over the title,
+content, description and tags (a full scan with a DISTINCT over the tag
+join) and re-score every hit in Python. The index keeps one row per
+document or FAQ with a title, a body and a keywords column, and a search
+returns the ranked ids together with a highlighted snippet of the body in
+one query.
+
+Backends, chosen with ``KNOWLEDGE_SEARCH_BACKEND`` ("auto" picks one from
+the database vendor):
+
+- "postgresql": a table with a weighted ``tsvector`` column behind a GIN
+  index, ranked with ``ts_rank_cd`` and highlighted with ``ts_headline``;
+- "sqlite": an FTS5 virtual table ranked with ``bm25()`` and highlighted
+  with ``snippet()``;
+- "memory": a pure-Python inverted index with BM25 ranking, for the tests
+  and the databases without full-text search. It lives in the process, so
+  with several workers only the process that saved a document sees the
+  change.
+
+The rows are kept up to date from ``knowledge.signals`` after the
+transaction commits. A process builds the index from the database the first
+time it searches a kind that has no rows; ``manage.py rebuild_search_index``
+rebuilds it after imports that bypass the signals.
+
+Scores are normalized to ``raw / (raw + 1)``, in [0, 1) like the similarity
+scores of the other retrieval strategies they are merged with.
+"""
+
+import logging
+import math
+import re
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.html import strip_tags
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT = 'document'
+FAQ = 'faq'
+KINDS = (DOCUMENT, FAQ)
+
+TABLE = 'knowledge_search_index'
+COLUMNS = ('title', 'body', 'keywords')
+# relative weight of a match in each column
+WEIGHTS = {'title': 3.0, 'body': 1.0, 'keywords': 2.0}
+# query terms of at least this length also match longer words ("cuti" finds
+# "cutinya"), like the ``icontains`` filters did
+PREFIX_MIN_LENGTH = 3
+SNIPPET_TOKENS = 24
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class SearchHit(NamedTuple):
+    object_id: int
+    score: float
+    snippet: str
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def query_terms(query: str) -> List[str]:
+    """Distinct words of the query, in order"""
+    return list(dict.fromkeys(tokenize(query)))
+
+
+def highlight_markers() -> Tuple[str, str]:
+    return tuple(getattr(settings, 'KNOWLEDGE_SEARCH_HIGHLIGHT', ('<mark>', '</mark>')))
+
+
+def strip_highlight(snippet: str) -> str:
+    """Snippet without the highlight markers, e.g. for an LLM prompt"""
+    for marker in highlight_markers():
+        snippet = snippet.replace(marker, '')
+    return snippet
+
+
+def normalize_score(raw: float) -> float:
+    raw = max(raw, 0.0)
+    return raw / (raw + 1.0)
+
+
+class SearchBackend(ABC):
+    """Stores ``(kind, object_id) -> title, body, keywords`` and searches them"""
+
+    name = None
+
+    @abstractmethod
+    def index(self, kind: str, object_id: int, title: str, body: str, keywords: str = ''):
+        pass
+
+    @abstractmethod
+    def remove(self, kind: str, object_id: int):
+        pass
+
+    @abstractmethod
+    def clear(self, kind: str):
+        pass
+
+    @abstractmethod
+    def count(self, kind: str) -> int:
+        pass
+
+    @abstractmethod
+    def search(self, kind: str, query: str, limit: int = 10) -> List[SearchHit]:
+        pass
+
+
+class InMemoryBM25Backend(SearchBackend):
+    """
+    Inverted index with BM25 ranking. The columns are folded into one
+    weighted term frequency and length per row (BM25F with shared
+    parameters).
+    """
+
+    name = 'memory'
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self.rows: Dict[str, Dict[int, Dict]] = defaultdict(dict)
+        self.postings: Dict[str, Dict[str, Dict[int, float]]] = defaultdict(lambda: defaultdict(dict))
+        self.total_length: Dict[str, float] = defaultdict(float)
+        self.vocabulary: Dict[str, Optional[List[str]]] = {}
+
+    def index(self, kind, object_id, title, body, keywords=''):
+        fields = {'title': title or '', 'body': body or '', 'keywords': keywords or ''}
+        frequencies = Counter()
+        length = 0.0
+        for column, text in fields.items():
+            tokens = tokenize(text)
+            length += WEIGHTS[column] * len(tokens)
+            for token in tokens:
+                frequencies[token] += WEIGHTS[column]
+
+        with self.lock:
+            self._remove(kind, object_id)
+            self.rows[kind][object_id] = {'body': fields['body'], 'terms': frequencies, 'length': length}
+            self.total_length[kind] += length
+            postings = self.postings[kind]
+            for term, frequency in frequencies.items():
+                postings[term][object_id] = frequency
+            self.vocabulary[kind] = None
+
+    def _remove(self, kind, object_id):
+        row = self.rows[kind].pop(object_id, None)
+        if row is None:
+            return
+        self.total_length[kind] -= row['length']
+        postings = self.postings[kind]
+        for term in row['terms']:
+            postings[term].pop(object_id, None)
+            if not postings[term]:
+                del postings[term]
+        self.vocabulary[kind] = None
+
+    def remove(self, kind, object_id):
+        with self.lock:
+            self._remove(kind, object_id)
+
+    def clear(self, kind):
+        with self.lock:
+            self.rows.pop(kind, None)
+            self.postings.pop(kind, None)
+            self.total_length.pop(kind, None)
+            self.vocabulary.pop(kind, None)
+
+    def count(self, kind):
+        return len(self.rows.get(kind, ()))
+
+    def _expand(self, kind, term) -> List[str]:
+        """Indexed terms the query term matches"""
+        if len(term) < PREFIX_MIN_LENGTH:
+            return [term] if term in self.postings[kind] else []
+        vocabulary = self.vocabulary.get(kind)
+        if vocabulary is None:
+            vocabulary = self.vocabulary[kind] = sorted(self.postings[kind])
+        matches = []
+        for index in range(bisect_left(vocabulary, term), len(vocabulary)):
+            if not vocabulary[index].startswith(term):
+                break
+            matches.append(vocabulary[index])
+        return matches
+
+    def search(self, kind, query, limit=10):
+        terms = query_terms(query)
+        if not terms:
+            return []
+        with self.lock:
+            rows = self.rows.get(kind)
+            if not rows:
+                return []
+            postings = self.postings[kind]
+            total = len(rows)
+            average_length = self.total_length[kind] / total or 1.0
+            scores = defaultdict(float)
+            for term in terms:
+                for indexed_term in self._expand(kind, term):
+                    matches = postings[indexed_term]
+                    idf = math.log(1 + (total - len(matches) + 0.5) / (len(matches) + 0.5))
+                    for object_id, frequency in matches.items():
+                        norm = self.k1 * (1 - self.b + self.b * rows[object_id]['length'] / average_length)
+                        scores[object_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+            bodies = {object_id: rows[object_id]['body'] for object_id, _ in ranked}
+
+        return [
+            SearchHit(object_id, normalize_score(score), build_snippet(bodies[object_id], terms))
+            for object_id, score in ranked
+        ]
+
+
+def _matches(token: str, terms: Iterable[str]) -> bool:
+    return any(
+        token.startswith(term) if len(term) >= PREFIX_MIN_LENGTH else token == term
+        for term in terms
+    )
+
+
+def build_snippet(text: str, terms: List[str], size: int = SNIPPET_TOKENS) -> str:
+    """Window of ``size`` words of ``text`` with the most query matches, highlighted"""
+    tokens = list(TOKEN_RE.finditer(text or ''))
+    if not tokens:
+        return ''
+    hits = [_matches(token.group().lower(), terms) for token in tokens]
+
+    # sliding window over the match flags
+    current = sum(hits[:size])
+    best_start, best_count = 0, current
+    for start in range(1, max(len(tokens) - size, 0) + 1):
+        current += hits[start + size - 1] - hits[start - 1]
+        if current > best_count:
+            best_start, best_count = start, current
+    window = range(best_start, min(best_start + size, len(tokens)))
+
+    open_mark, close_mark = highlight_markers()
+    parts = []
+    position = tokens[window[0]].start()
+    for index in window:
+        token = tokens[index]
+        parts.append(text[position:token.start()])
+        if hits[index]:
+            parts.append(f'{open_mark}{token.group()}{close_mark}')
+        else:
+            parts.append(token.group())
+        position = token.end()
+    snippet = ' '.join(''.join(parts).split())
+    if window[0] > 0:
+        snippet = '...' + snippet
+    if window[-1] < len(tokens) - 1:
+        snippet += '...'
+    return snippet
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """FTS5 virtual table, the rowid encodes the kind and the object id"""
+
+    name = 'sqlite'
+    KIND_CODES = {DOCUMENT: 1, FAQ: 2}
+
+    def __init__(self):
+        self.ready = False
+
+    def _rowid(self, kind, object_id):
+        return object_id * 16 + self.KIND_CODES[kind]
+
+    def ensure_table(self):
+        if self.ready:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+                "kind UNINDEXED, object_id UNINDEXED, title, body, keywords, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        self.ready = True
+
+    def index(self, kind, object_id, title, body, keywords=''):
+        self.ensure_table()
+        rowid = self._rowid(kind, object_id)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [rowid])
+            cursor.execute(
+                f"INSERT INTO {TABLE} (rowid, kind, object_id, title, body, keywords) "
+                "VALUES (%s, %s, %s, %s, %s, %s)",
+                [rowid, kind, object_id, title or '', body or '', keywords or ''],
+            )
+
+    def remove(self, kind, object_id):
+        self.ensure_table()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [self._rowid(kind, object_id)])
+
+    def clear(self, kind):
+        self.ensure_table()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE kind = %s", [kind])
+
+    def count(self, kind):
+        self.ensure_table()
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {TABLE} WHERE kind = %s", [kind])
+            return cursor.fetchone()[0]
+
+    @staticmethod
+    def match_expression(terms: List[str]) -> str:
+        return ' OR '.join(
+            f'"{term}"*' if len(term) >= PREFIX_MIN_LENGTH else f'"{term}"' for term in terms
+        )
+
+    def search(self, kind, query, limit=10):
+        terms = query_terms(query)
+        if not terms:
+            return []
+        self.ensure_table()
+        open_mark, close_mark = highlight_markers()
+        # bm25() is lower for better matches, one weight per column
+        weights = ', '.join(['0', '0'] + [str(WEIGHTS[column]) for column in COLUMNS])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT object_id, -bm25({TABLE}, {weights}) AS score, "
+                f"snippet({TABLE}, 3, %s, %s, '...', {SNIPPET_TOKENS}) "
+                f"FROM {TABLE} WHERE {TABLE} MATCH %s AND kind = %s "
+                "ORDER BY score DESC LIMIT %s",
+                [open_mark, close_mark, self.match_expression(terms), kind, limit],
+            )
+            rows = cursor.fetchall()
+        return [SearchHit(int(object_id), normalize_score(score), snippet or '') for object_id, score, snippet in rows]
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Table with a weighted ``tsvector`` behind a GIN index. PostgreSQL has no
+    BM25, the rows are ranked with ``ts_rank_cd`` (cover density).
+    """
+
+    name = 'postgresql'
+
+    def __init__(self):
+        self.ready = False
+
+    @staticmethod
+    def config():
+        # "simple" does not stem, the documents mix Indonesian and English
+        return getattr(settings, 'KNOWLEDGE_SEARCH_CONFIG', 'simple')
+
+    def ensure_table(self):
+        if self.ready:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+                "kind varchar(16) NOT NULL, "
+                "object_id bigint NOT NULL, "
+                "title text NOT NULL, "
+                "body text NOT NULL, "
+                "keywords text NOT NULL, "
+                "document tsvector NOT NULL, "
+                "PRIMARY KEY (kind, object_id))"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {TABLE}_document ON {TABLE} USING gin(document)"
+            )
+        self.ready = True
+
+    def index(self, kind, object_id, title, body, keywords=''):
+        self.ensure_table()
+        config = self.config()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {TABLE} (kind, object_id, title, body, keywords, document) "
+                "VALUES (%s, %s, %s, %s, %s, "
+                "setweight(to_tsvector(%s::regconfig, %s), 'A') || "
+                "setweight(to_tsvector(%s::regconfig, %s), 'B') || "
+                "setweight(to_tsvector(%s::regconfig, %s), 'C')) "
+                "ON CONFLICT (kind, object_id) DO UPDATE SET "
+                "title = EXCLUDED.title, body = EXCLUDED.body, "
+                "keywords = EXCLUDED.keywords, document = EXCLUDED.document",
+                [
+                    kind, object_id, title or '', body or '', keywords or '',
+                    config, title or '', config, keywords or '', config, body or '',
+                ],
+            )
+
+    def remove(self, kind, object_id):
+        self.ensure_table()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE kind = %s AND object_id = %s", [kind, object_id])
+
+    def clear(self, kind):
+        self.ensure_table()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE kind = %s", [kind])
+
+    def count(self, kind):
+        self.ensure_table()
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {TABLE} WHERE kind = %s", [kind])
+            return cursor.fetchone()[0]
+
+    @staticmethod
+    def tsquery(terms: List[str]) -> str:
+        return ' | '.join(
+            f"'{term}':*" if len(term) >= PREFIX_MIN_LENGTH else f"'{term}'" for term in terms
+        )
+
+    def search(self, kind, query, limit=10):
+        terms = query_terms(query)
+        if not terms:
+            return []
+        self.ensure_table()
+        config = self.config()
+        open_mark, close_mark = highlight_markers()
+        options = f'StartSel="{open_mark}", StopSel="{close_mark}", MaxWords={SNIPPET_TOKENS}, MinWords=10'
+        with connection.cursor() as cursor:
+            # the headline is only computed for the rows that are returned;
+            # normalization 32 already maps the rank to rank / (rank + 1)
+            cursor.execute(
+                "SELECT ranked.object_id, ranked.rank, "
+                "ts_headline(%s::regconfig, ranked.body, ranked.query, %s) "
+                "FROM ("
+                f"SELECT object_id, body, query, ts_rank_cd(document, query, 32) AS rank "
+                f"FROM {TABLE}, to_tsquery(%s::regconfig, %s) query "
+                "WHERE kind = %s AND document @@ query "
+                "ORDER BY rank DESC LIMIT %s"
+                ") ranked ORDER BY ranked.rank DESC",
+                [config, options, config, self.tsquery(terms), kind, limit],
+            )
+            rows = cursor.fetchall()
+        return [SearchHit(int(object_id), float(rank), snippet or '') for object_id, rank, snippet in rows]
+
+
+BACKENDS = {
+    'memory': InMemoryBM25Backend,
+    'sqlite': SQLiteFTS5Backend,
+    'postgresql': PostgresSearchBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+_built_kinds = set()
+
+
+def _create_backend() -> SearchBackend:
+    name = getattr(settings, 'KNOWLEDGE_SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        name = connection.vendor if connection.vendor in BACKENDS else 'memory'
+    backend = BACKENDS[name]()
+    if name == 'memory':
+        return backend
+    try:
+        backend.ensure_table()
+    except Exception as e:
+        # e.g. SQLite compiled without FTS5
+        logger.warning(f"Full-text search backend {name} unavailable, using the in-memory index: {e}")
+        return InMemoryBM25Backend()
+    return backend
+
+
+def get_search_backend() -> SearchBackend:
+    """The process wide backend"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _create_backend()
+    return _backend
+
+
+def set_search_backend(backend: Optional[SearchBackend]):
+    """Replaces the backend (``None`` picks it again from the settings)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+        _built_kinds.clear()
+
+
+# rows of the models
+
+
+def document_fields(document) -> Optional[Dict[str, str]]:
+    """Indexed columns of a document, None when it must not be searchable"""
+    if document.status != 'published':
+        return None
+    keywords = [tag.name for tag in document.tags.all()]
+    keywords.extend(str(keyword) for keyword in document.ai_extracted_keywords or [])
+    body = ' '.join(
+        part for part in (document.description, strip_tags(document.content or ''), document.extracted_text) if part
+    )
+    return {'title': document.title, 'body': body, 'keywords': ' '.join(keywords)}
+
+
+def faq_fields(faq) -> Optional[Dict[str, str]]:
+    if not faq.is_active:
+        return None
+    return {'title': faq.question, 'body': faq.answer, 'keywords': ''}
+
+
+def _sources():
+    from helpdesk.models import FAQ as FAQModel
+
+    from .models import KnowledgeDocument
+
+    return {
+        DOCUMENT: (
+            KnowledgeDocument.objects.filter(status='published').prefetch_related('tags'),
+            document_fields,
+        ),
+        # every company, the results are filtered when they are loaded
+        FAQ: (FAQModel.objects.entire().filter(is_active=True), faq_fields),
+    }
+
+
+def update_object(kind: str, obj, backend: Optional[SearchBackend] = None):
+    """Indexes ``obj`` or removes it when it is no longer searchable"""
+    backend = backend or get_search_backend()
+    fields = (document_fields if kind == DOCUMENT else faq_fields)(obj)
+    if fields is None:
+        backend.remove(kind, obj.pk)
+    else:
+        backend.index(kind, obj.pk, **fields)
+
+
+def rebuild(kinds: Iterable[str] = KINDS, backend: Optional[SearchBackend] = None) -> Dict[str, int]:
+    """Indexes every searchable row again, returns the number of rows per kind"""
+    backend = backend or get_search_backend()
+    sources = _sources()
+    counts = {}
+    for kind in kinds:
+        queryset, fields_of = sources[kind]
+        backend.clear(kind)
+        counts[kind] = 0
+        for obj in queryset.iterator(chunk_size=500):
+            fields = fields_of(obj)
+            if fields is not None:
+                backend.index(kind, obj.pk, **fields)
+                counts[kind] += 1
+        _built_kinds.add(kind)
+    return counts
+
+
+def search(kind: str, query: str, limit: int = 10) -> List[SearchHit]:
+    """Ranked hits of ``kind``, building the index on the first search of the process"""
+    backend = get_search_backend()
+    if kind not in _built_kinds:
+        if not backend.count(kind):
+            rebuild([kind], backend)
+        _built_kinds.add(kind)
+    return backend.search(kind, query, limit)
+
+
+def schedule_update(kind: str, model, object_ids: Iterable[int]):
+    """Re-indexes the objects after the transaction commits"""
+    object_ids = set(object_ids)
+    if not object_ids:
+        return
+
+    def update():
+        try:
+            backend = get_search_backend()
+            queryset = model._base_manager.filter(pk__in=object_ids)
+            if kind == DOCUMENT:
+                queryset = queryset.prefetch_related('tags')
+            found = set()
+            for obj in queryset:
+                found.add(obj.pk)
+                update_object(kind, obj, backend)
+            for object_id in object_ids - found:
+                backend.remove(kind, object_id)
+        except Exception as e:
+            logger.error(f"Error updating the search index for {kind} {sorted(object_ids)}: {e}")
+
+    transaction.on_commit(update)
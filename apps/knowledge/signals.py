@@ -1,4 +1,5 @@
-from django.db.models.signals import post_save, pre_delete, post_delete
+from django.apps import apps
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -11,6 +12,9 @@ from .models import (
     AIProcessingJob, SearchQuery, KnowledgeBase
 )
 from .utils import process_document_with_ai
+from .cache import clear_document_cache, clear_knowledge_cache, knowledge_cache
+from . import search_index
+from horilla.signals import pre_bulk_update, post_bulk_update
 
 logger = logging.getLogger(__name__)
 
@@ -88,14 +92,8 @@ def handle_document_created_or_updated(sender, instance, created, **kwargs):
         # Update document statistics
         instance.update_statistics()
         
-        # Clear related caches
-        cache_keys = [
-            f'document_{instance.id}',
-            f'document_list_{instance.category_id if instance.category else "all"}',
-            'knowledge_dashboard_stats',
-            'popular_documents',
-        ]
-        cache.delete_many(cache_keys)
+        # Clear related caches, the lists and statistics include the document
+        clear_knowledge_cache()
         
     except Exception as e:
         logger.error(f"Error in document post_save signal: {str(e)}")
@@ -145,12 +143,7 @@ def handle_document_deleted(sender, instance, **kwargs):
             instance.knowledge_base.update_statistics()
         
         # Clear caches
-        cache_keys = [
-            f'document_{instance.id}',
-            'knowledge_dashboard_stats',
-            'popular_documents',
-        ]
-        cache.delete_many(cache_keys)
+        clear_knowledge_cache()
         
         logger.info(f"Document deleted: {instance.title} (ID: {instance.id})")
         
@@ -170,7 +163,7 @@ def handle_version_created(sender, instance, created, **kwargs):
             instance.document.save(update_fields=['updated_at'])
             
             # Clear document cache
-            cache.delete(f'document_{instance.document.id}')
+            clear_document_cache(instance.document.id)
             
         except Exception as e:
             logger.error(f"Error in version post_save signal: {str(e)}")
@@ -187,7 +180,7 @@ def handle_access_granted(sender, instance, created, **kwargs):
             )
             
             # Clear user's document list cache
-            cache.delete(f'user_documents_{instance.user.id}')
+            knowledge_cache.delete(f'user_documents_{instance.user.id}')
             
         except Exception as e:
             logger.error(f"Error in access post_save signal: {str(e)}")
@@ -250,7 +243,7 @@ def handle_ai_job_status_change(sender, instance, created, **kwargs):
                 ])
                 
                 # Clear document cache
-                cache.delete(f'document_{document.id}')
+                clear_document_cache(document.id)
         
         elif not created and instance.status == 'failed':
             logger.error(
@@ -287,6 +280,70 @@ def handle_knowledge_base_created(sender, instance, created, **kwargs):
             logger.error(f"Error in knowledge base post_save signal: {str(e)}")
 
 
+# Full-text search index
+
+# saves that only touch other fields (view counts, timestamps, ...) keep the row
+SEARCH_INDEXED_FIELDS = {
+    'title', 'description', 'content', 'extracted_text', 'status', 'ai_extracted_keywords'
+}
+
+
+@receiver(post_save, sender=KnowledgeDocument)
+def update_document_search_index(sender, instance, update_fields=None, **kwargs):
+    """Re-index the document once the transaction commits"""
+    if update_fields and not SEARCH_INDEXED_FIELDS.intersection(update_fields):
+        return
+    search_index.schedule_update(search_index.DOCUMENT, sender, [instance.pk])
+
+
+@receiver(post_delete, sender=KnowledgeDocument)
+def remove_document_from_search_index(sender, instance, **kwargs):
+    search_index.schedule_update(search_index.DOCUMENT, sender, [instance.pk])
+
+
+@receiver(m2m_changed, sender=KnowledgeDocument.tags.through)
+def update_document_tags_search_index(sender, instance, action, reverse, pk_set, **kwargs):
+    """Tag names are indexed as keywords"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # a tag was added to or removed from documents
+        document_ids = pk_set or []
+        if action == 'post_clear':
+            document_ids = getattr(instance, '_search_index_documents', [])
+    else:
+        document_ids = [instance.pk]
+    search_index.schedule_update(search_index.DOCUMENT, KnowledgeDocument, document_ids)
+
+
+@receiver(m2m_changed, sender=KnowledgeDocument.tags.through)
+def remember_tag_documents(sender, instance, action, reverse, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._search_index_documents = list(instance.documents.values_list('pk', flat=True))
+
+
+@receiver(pre_bulk_update, sender=KnowledgeDocument)
+def remember_bulk_updated_documents(sender, queryset, **kwargs):
+    # the filter of the queryset may no longer match after the update
+    queryset._search_index_ids = list(queryset.values_list('pk', flat=True))
+
+
+@receiver(post_bulk_update, sender=KnowledgeDocument)
+def update_bulk_updated_documents(sender, queryset, **kwargs):
+    search_index.schedule_update(
+        search_index.DOCUMENT, sender, getattr(queryset, '_search_index_ids', [])
+    )
+
+
+if apps.is_installed('helpdesk'):
+    from helpdesk.models import FAQ
+
+    @receiver(post_save, sender=FAQ)
+    @receiver(post_delete, sender=FAQ)
+    def update_faq_search_index(sender, instance, **kwargs):
+        search_index.schedule_update(search_index.FAQ, sender, [instance.pk])
+
+
 # Custom signal for document view tracking
 from django.dispatch import Signal
 
@@ -313,7 +370,7 @@ def handle_document_viewed(sender, document, user, **kwargs):
             )
         
         # Update popular documents cache
-        cache.delete('popular_documents')
+        knowledge_cache.delete('popular_documents')
         
         logger.debug(f"Document {document.id} viewed by user {user.username if user.is_authenticated else 'anonymous'}")
         
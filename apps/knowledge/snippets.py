@@ -0,0 +1,183 @@
+"""
+Snippets of knowledge documents around the words of a query.
+
+A document is tokenized once per version (``updated_at``): the character
+offsets of every word and, per distinct word, the positions where it
+occurs. A query then only works on the merged position lists of its terms:
+a binary search over the match offsets finds, for every match, how many
+matches and distinct terms fit in a window of ``max_length`` characters
+starting there, the densest windows win and the matches inside them are
+highlighted. The cost depends on the number of matches instead of the
+length of the document, which used to be lower-cased and searched again for
+every 50 characters.
+
+``manage.py snippet_benchmark`` compares both on synthetic policy documents.
+"""
+
+from bisect import bisect_left
+from collections import defaultdict
+from typing import List, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.utils.html import strip_tags
+
+from horilla.cache_namespaces import LocalCache
+
+from .search_index import PREFIX_MIN_LENGTH, TOKEN_RE, highlight_markers, query_terms
+
+_documents = LocalCache(getattr(settings, 'KNOWLEDGE_SNIPPET_CACHE_SIZE', 100))
+
+
+class TokenizedText:
+    """Word offsets of a text and the positions of every distinct word"""
+
+    def __init__(self, text: str):
+        self.text = text
+        starts, ends = [], []
+        positions = defaultdict(list)
+        for index, match in enumerate(TOKEN_RE.finditer(text)):
+            starts.append(match.start())
+            ends.append(match.end())
+            positions[match.group().lower()].append(index)
+        self.starts = np.array(starts, dtype=np.int32)
+        self.ends = np.array(ends, dtype=np.int32)
+        self.positions = {word: np.array(indexes, dtype=np.int32) for word, indexes in positions.items()}
+        self.vocabulary = sorted(self.positions)
+
+    def _expand(self, term: str) -> List[str]:
+        """Words of the text the query term matches (prefixes like the search index)"""
+        if len(term) < PREFIX_MIN_LENGTH:
+            return [term] if term in self.positions else []
+        words = []
+        for index in range(bisect_left(self.vocabulary, term), len(self.vocabulary)):
+            if not self.vocabulary[index].startswith(term):
+                break
+            words.append(self.vocabulary[index])
+        return words
+
+    def matches(self, terms: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Token positions of the words matching a query term and the term numbers, in text order"""
+        positions, numbers = [], []
+        for number, term in enumerate(terms):
+            for word in self._expand(term):
+                positions.append(self.positions[word])
+                numbers.append(np.full(len(self.positions[word]), number, dtype=np.int32))
+        if not positions:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        positions = np.concatenate(positions)
+        numbers = np.concatenate(numbers)
+        order = np.argsort(positions, kind='stable')
+        return positions[order], numbers[order]
+
+    def densest_windows(self, positions: np.ndarray, numbers: np.ndarray, term_count: int,
+                        max_length: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score and last match of the window of ``max_length`` characters starting
+        at each match; windows with more distinct terms win, then more matches.
+        """
+        first = np.arange(len(positions))
+        match_starts = self.starts[positions]
+        last = np.searchsorted(self.ends[positions], match_starts + max_length, side='right') - 1
+        last = np.maximum(last, first)
+        distinct = np.zeros(len(positions), dtype=np.int64)
+        for number in range(term_count):
+            cumulative = np.concatenate(([0], np.cumsum(numbers == number)))
+            distinct += (cumulative[last + 1] - cumulative[first]) > 0
+        score = distinct * (len(positions) + 1) + (last - first + 1)
+        return score, last
+
+    def render(self, start: int, end: int, highlighted: np.ndarray, highlight: bool) -> str:
+        """Characters ``start:end`` with the given tokens highlighted"""
+        parts = []
+        position = start
+        open_mark, close_mark = highlight_markers() if highlight else ('', '')
+        for token in highlighted:
+            token_start, token_end = int(self.starts[token]), int(self.ends[token])
+            parts.append(self.text[position:token_start])
+            parts.append(f'{open_mark}{self.text[token_start:token_end]}{close_mark}')
+            position = token_end
+        parts.append(self.text[position:end])
+        snippet = ' '.join(''.join(parts).split())
+        if start > 0:
+            snippet = '...' + snippet
+        if end < len(self.text):
+            snippet += '...'
+        return snippet
+
+    def _snap(self, start: int, end: int) -> Tuple[int, int]:
+        """Moves the bounds out of the words they cut in half"""
+        token = int(np.searchsorted(self.starts, start, side='right')) - 1
+        if token >= 0 and self.starts[token] < start < self.ends[token]:
+            start = int(self.ends[token])
+        token = int(np.searchsorted(self.ends, end, side='left'))
+        if token < len(self.ends) and self.starts[token] < end < self.ends[token]:
+            end = int(self.starts[token])
+        return start, end
+
+    def _span(self, first_token: int, last_token: int, max_length: int) -> Tuple[int, int]:
+        """Characters around the tokens, padded to ``max_length``"""
+        start, end = int(self.starts[first_token]), int(self.ends[last_token])
+        padding = max(max_length - (end - start), 0)
+        start = max(min(start - padding // 2, len(self.text) - max_length), 0)
+        end = min(max(start + max_length, end), len(self.text))
+        return self._snap(start, end)
+
+    def snippets(self, query: str, max_length: int = 200, count: int = 1,
+                 highlight: bool = True) -> List[str]:
+        """Up to ``count`` non-overlapping windows with the most query terms, in text order"""
+        if not self.text:
+            return []
+        terms = query_terms(query)
+        positions, numbers = self.matches(terms)
+        if not len(positions):
+            start, end = self._snap(0, min(max_length, len(self.text)))
+            return [self.render(start, end, [], highlight)]
+
+        score, last = self.densest_windows(positions, numbers, len(terms), max_length)
+        chosen = []
+        for first in np.argsort(-score, kind='stable'):
+            start, end = self._span(positions[first], positions[last[first]], max_length)
+            if any(start < other_end and other_start < end for other_start, other_end in chosen):
+                continue
+            chosen.append((start, end))
+            if len(chosen) >= count:
+                break
+
+        match_starts = self.starts[positions]
+        match_ends = self.ends[positions]
+        snippets = []
+        for start, end in sorted(chosen):
+            inside = (match_starts >= start) & (match_ends <= end)
+            # a word can match several query terms
+            snippets.append(self.render(start, end, np.unique(positions[inside]), highlight))
+        return snippets
+
+
+def document_text(document) -> str:
+    return strip_tags(document.content or '') or document.extracted_text or document.description or ''
+
+
+def tokenized_document(document) -> TokenizedText:
+    """Tokenized text of the document, cached per version"""
+    if document.pk is None:
+        return TokenizedText(document_text(document))
+    version = document.updated_at.isoformat() if document.updated_at else ''
+    key = (document.pk, version)
+    tokenized = _documents.get(key)
+    if tokenized is None:
+        tokenized = TokenizedText(document_text(document))
+        _documents.set(key, tokenized, getattr(settings, 'KNOWLEDGE_SNIPPET_CACHE_TIMEOUT', 3600))
+    return tokenized
+
+
+def extract_snippets(document, query: str, max_length: int = 200, count: int = 3,
+                     highlight: bool = True) -> List[str]:
+    """Highlighted windows of the document with the most query terms"""
+    return tokenized_document(document).snippets(query, max_length, count, highlight)
+
+
+def extract_snippet(document, query: str, max_length: int = 200) -> str:
+    """Plain text window of the document with the most query terms"""
+    snippets = extract_snippets(document, query, max_length, count=1, highlight=False)
+    return snippets[0] if snippets else ''
@@ -0,0 +1,257 @@
+import json
+import uuid
+from datetime import timedelta
+from unittest.mock import ANY, MagicMock, Mock, patch
+
+import requests
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+
+from .chat_sessions import ChatSession, ChatSessionStore
+from .search_index import TOKEN_RE, FAQ, InMemoryBM25Backend, build_snippet, strip_highlight
+from .snippets import TokenizedText
+
+
+@override_settings(KNOWLEDGE_SEARCH_HIGHLIGHT=('[', ']'))
+class InMemoryBM25BackendTestCase(SimpleTestCase):
+    """Test cases for the in-memory BM25 search backend."""
+
+    def setUp(self):
+        self.backend = InMemoryBM25Backend()
+        self.backend.index(FAQ, 1, 'Cuti tahunan', 'Karyawan mendapat 12 hari cuti tahunan.')
+        self.backend.index(FAQ, 2, 'Gaji', 'Gaji dibayar setiap akhir bulan, termasuk tunjangan cuti.')
+        self.backend.index(FAQ, 3, 'Lembur', 'Lembur dihitung per jam.', keywords='overtime')
+
+    def test_title_matches_rank_first(self):
+        """A term in the title outweighs the same term in the body."""
+        hits = self.backend.search(FAQ, 'cuti')
+
+        self.assertEqual([hit.object_id for hit in hits], [1, 2])
+        self.assertGreater(hits[0].score, hits[1].score)
+        self.assertTrue(all(0 < hit.score < 1 for hit in hits))
+
+    def test_keywords_and_prefixes_match(self):
+        """Keywords are searchable and longer query terms match as prefixes."""
+        self.backend.index(FAQ, 4, 'Izin', 'Pengajuan cutinya lewat aplikasi.')
+
+        self.assertEqual([hit.object_id for hit in self.backend.search(FAQ, 'overtime')], [3])
+        self.assertIn(4, [hit.object_id for hit in self.backend.search(FAQ, 'cuti')])
+
+    def test_reindex_and_remove(self):
+        """Indexing a row again replaces it and removed rows are not found."""
+        self.backend.index(FAQ, 2, 'Gaji', 'Gaji dibayar setiap akhir bulan.')
+        self.assertEqual([hit.object_id for hit in self.backend.search(FAQ, 'cuti')], [1])
+
+        self.backend.remove(FAQ, 1)
+        self.assertEqual(self.backend.search(FAQ, 'cuti'), [])
+        self.assertEqual(self.backend.count(FAQ), 2)
+
+    def test_limit_and_empty_query(self):
+        self.assertEqual(len(self.backend.search(FAQ, 'cuti gaji lembur', limit=2)), 2)
+        self.assertEqual(self.backend.search(FAQ, '   '), [])
+        self.assertEqual(self.backend.search('document', 'cuti'), [])
+
+    def test_hits_carry_a_snippet(self):
+        hit = self.backend.search(FAQ, 'lembur')[0]
+
+        self.assertEqual(hit.snippet, '[Lembur] dihitung per jam')
+
+
+@override_settings(KNOWLEDGE_SEARCH_HIGHLIGHT=('[', ']'))
+class BuildSnippetTestCase(SimpleTestCase):
+    """Test cases for the highlighted snippet extraction."""
+
+    def test_window_with_most_matches(self):
+        """The window covering the most matches is chosen and elided."""
+        text = ' '.join(['awal'] * 10 + ['cuti', 'tahunan', 'cuti'] + ['akhir'] * 10)
+
+        snippet = build_snippet(text, ['cuti'], size=5)
+
+        self.assertTrue(snippet.startswith('...') and snippet.endswith('...'))
+        self.assertIn('[cuti] tahunan [cuti]', snippet)
+        self.assertEqual(len(strip_highlight(snippet).strip('.').split()), 5)
+
+    def test_short_text_is_not_elided(self):
+        self.assertEqual(build_snippet('Gaji dibayar', ['gaji']), '[Gaji] dibayar')
+        self.assertEqual(build_snippet('', ['gaji']), '')
+
+
+@override_settings(KNOWLEDGE_SEARCH_HIGHLIGHT=('[', ']'))
+class TokenizedTextTestCase(SimpleTestCase):
+    """Test cases for the snippets extracted from the position index."""
+
+    def test_window_with_most_distinct_terms_wins(self):
+        """A window with every term beats one repeating a single term."""
+        text = 'cuti cuti cuti ' + 'lorem ' * 30 + 'cuti tahunan diberikan setiap tahun.'
+
+        snippets = TokenizedText(text).snippets('cuti tahunan', max_length=30)
+
+        self.assertEqual(len(snippets), 1)
+        self.assertTrue(snippets[0].startswith('...'))
+        self.assertIn('[cuti] [tahunan]', snippets[0])
+
+    def test_snippets_do_not_overlap(self):
+        """Matches close to each other share a snippet, snippets come in text order."""
+        text = 'gaji pokok dan gaji lembur ' + 'lorem ' * 30 + 'potongan gaji'
+
+        snippets = TokenizedText(text).snippets('gaji', max_length=30, count=3)
+
+        self.assertEqual(len(snippets), 2)
+        self.assertIn('[gaji] pokok dan [gaji]', snippets[0])
+        self.assertTrue(snippets[1].endswith('[gaji]'))
+
+    def test_terms_match_as_prefixes(self):
+        """Terms of PREFIX_MIN_LENGTH characters match longer words, shorter ones exactly."""
+        tokenized = TokenizedText('Pengajuan cutinya lewat aplikasi')
+
+        self.assertEqual(tokenized.snippets('cuti'), ['Pengajuan [cutinya] lewat aplikasi'])
+        positions, _ = tokenized.matches(['le'])
+        self.assertEqual(len(positions), 0)
+
+    def test_no_match_returns_the_leading_window(self):
+        tokenized = TokenizedText('Karyawan mendapat dua belas hari cuti tahunan')
+
+        self.assertEqual(tokenized.snippets('lembur', max_length=20), ['Karyawan mendapat...'])
+        self.assertEqual(TokenizedText('').snippets('lembur'), [])
+
+    def test_bounds_do_not_split_words(self):
+        """Snippet bounds are moved out of the words they would cut."""
+        text = 'Karyawan tetap mendapat dua belas hari cuti tahunan setelah bekerja satu tahun penuh.'
+        tokenized = TokenizedText(text)
+        words = set(TOKEN_RE.findall(text))
+
+        self.assertEqual(tokenized._snap(2, 11), (8, 9))
+        for max_length in range(5, len(text) + 5):
+            for snippet in tokenized.snippets('cuti tahun', max_length=max_length, count=2):
+                self.assertTrue(set(TOKEN_RE.findall(strip_highlight(snippet))) <= words, snippet)
+
+
+class ChatSessionTestCase(SimpleTestCase):
+    """Test cases for the in-process conversation state."""
+
+    def conversation(self, rows, last_activity):
+        conversation = Mock(conversation_id=uuid.uuid4(), last_activity=last_activity)
+        conversation.messages.order_by.return_value.values_list.return_value = rows
+        return conversation
+
+    def test_window_reloads_when_another_process_wrote(self):
+        """Own messages are appended, a foreign last_activity reloads the window."""
+        store = ChatSessionStore(max_sessions=10, timeout=60, window=5)
+        started = timezone.now()
+        conversation = self.conversation([('user', 'halo', started)], started)
+
+        session = store.get(conversation)
+        session.update_generation('llama2', 'digest', [1, 2, 3])
+
+        answered = started + timedelta(seconds=1)
+        conversation.last_activity = answered
+        store.message_added(conversation, Mock(sender='ai', content='hai', created_at=answered), started)
+
+        session = store.get(conversation)
+        self.assertEqual(session.window(5), [('user', 'halo'), ('ai', 'hai')])
+        self.assertEqual(session.continuation('llama2', 'digest', 100), [1, 2, 3])
+        self.assertEqual(conversation.messages.order_by.call_count, 1)
+
+        # another process answered the next question
+        elsewhere = started + timedelta(seconds=2)
+        conversation.messages.order_by.return_value.values_list.return_value = [
+            ('ai', 'cuti 12 hari', elsewhere),
+            ('user', 'berapa cuti?', elsewhere),
+            ('ai', 'hai', answered),
+            ('user', 'halo', started),
+        ]
+        conversation.last_activity = elsewhere
+
+        session = store.get(conversation)
+        self.assertEqual(conversation.messages.order_by.call_count, 2)
+        self.assertEqual(session.window(2), [('user', 'berapa cuti?'), ('ai', 'cuti 12 hari')])
+        self.assertIsNone(session.continuation('llama2', 'digest', 100))
+
+    def test_continuation_requires_unchanged_digest(self):
+        """Tokens are reused for the same model and context only."""
+        session = ChatSession('conversation', 5)
+        session.update_generation('llama2', 'digest', [1, 2, 3])
+
+        self.assertEqual(session.continuation('llama2', 'digest', 100), [1, 2, 3])
+        self.assertIsNone(session.continuation('llama2', 'digest', 3))
+
+        session.update_generation('llama2', 'digest', [1, 2, 3])
+        self.assertIsNone(session.continuation('llama2', 'other', 100))
+        # the mismatch dropped the state
+        self.assertIsNone(session.continuation('llama2', 'digest', 100))
+
+    def test_concurrent_turns_start_over(self):
+        """A turn that finished after another one does not keep its tokens."""
+        session = ChatSession('conversation', 5)
+        session.update_generation('llama2', 'digest', [1, 2])
+        tokens = session.continuation('llama2', 'digest', 100)
+
+        session.update_generation('llama2', 'digest', [1, 2, 3], previous=tokens)
+        session.update_generation('llama2', 'digest', [1, 2, 4], previous=tokens)
+
+        self.assertIsNone(session.continuation('llama2', 'digest', 100))
+
+
+class OllamaCallTestCase(SimpleTestCase):
+    """Test cases for the streamed Ollama call of the chatbot."""
+
+    def setUp(self):
+        from .chatbot_service import ChatbotRAGService
+
+        with patch.object(ChatbotRAGService, '_initialize_services'):
+            self.service = ChatbotRAGService()
+        self.service.default_model = 'llama2'
+        self.session = ChatSession('conversation', 5)
+        self.lines = [
+            {'model': 'llama2', 'response': 'Cuti ', 'done': False},
+            {'model': 'llama2', 'response': '12 hari', 'done': False},
+            {'model': 'llama2', 'done': True, 'context': [4, 5, 6], 'prompt_eval_count': 12},
+        ]
+
+    def post(self):
+        response = MagicMock()
+        response.iter_lines.return_value = [json.dumps(line).encode() for line in self.lines]
+        post = MagicMock()
+        post.return_value.__enter__.return_value = response
+        return post
+
+    def test_context_is_sent_and_kept(self):
+        """The continued tokens are sent and the new ones replace them."""
+        self.session.update_generation('llama2', 'digest', [1, 2, 3])
+        tokens = self.session.continuation('llama2', 'digest', 100)
+
+        with patch('knowledge.chatbot_service.requests.post', self.post()) as post:
+            result = self.service._call_ollama(
+                'Pertanyaan', session=self.session, digest='digest', context_tokens=tokens
+            )
+
+        self.assertEqual(post.call_args.kwargs['json']['context'], [1, 2, 3])
+        self.assertEqual(result['response'], 'Cuti 12 hari')
+        self.assertTrue(result['context_reused'])
+        self.assertEqual(self.session.continuation('llama2', 'digest', 100), [4, 5, 6])
+
+    def test_failed_call_resets_the_session(self):
+        """A failed call drops the generation state and falls back."""
+        self.session.update_generation('llama2', 'digest', [1, 2, 3])
+        tokens = self.session.continuation('llama2', 'digest', 100)
+
+        post = Mock(side_effect=requests.exceptions.ConnectionError('down'))
+        with patch('knowledge.chatbot_service.requests.post', post):
+            result = self.service._call_ollama(
+                'Pertanyaan', session=self.session, digest='digest', context_tokens=tokens,
+                fallback_text='FAQ: Cuti\nAnswer: 12 hari'
+            )
+
+        self.assertEqual(result['model'], 'faq_fallback')
+        self.assertIsNone(self.session.continuation('llama2', 'digest', 100))
+
+    def test_time_to_first_token_is_recorded(self):
+        with patch('knowledge.chatbot_service.requests.post', self.post()), \
+                patch('knowledge.chatbot_service.ai_metrics') as metrics:
+            result = self.service._call_ollama('Pertanyaan', session=self.session, digest='digest')
+
+        self.assertIsNotNone(result['time_to_first_token'])
+        self.assertFalse(result['context_reused'])
+        metrics.record_time_to_first_token.assert_called_once_with(
+            'chatbot_rag', 'llama2', ANY, False, 12
+        )
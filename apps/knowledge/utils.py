@@ -431,6 +431,7 @@ def calculate_document_similarity(doc1_text: str, doc2_text: str) -> float:
 @shared_task
 def process_document_with_ai(document_id: int, assistant_id: Optional[int] = None):
     """Process document with AI (Celery task)"""
+    from .ingestion import IngestionPipeline
     from .models import KnowledgeDocument, AIProcessingJob, AIAssistant
     
     try:
@@ -445,46 +446,14 @@ def process_document_with_ai(document_id: int, assistant_id: Optional[int] = Non
             started_at=timezone.now()
         )
         
-        # Extract text from file if available
-        text_content = document.content
-        if document.file:
-            extracted_text = extract_text_from_file(document.file.path)
-            text_content = f"{document.content}\n\n{extracted_text}"
-        
-        # Process with AI
-        results = {}
-        
-        # Classification
-        classification = classify_document_type(text_content, document.title)
-        results['classification'] = classification
-        
-        # Keyword extraction
-        processor = DocumentProcessor()
-        keywords = processor.extract_keywords(text_content)
-        results['keywords'] = keywords
-        
-        # Tag suggestions
-        suggested_tags = suggest_document_tags(text_content, document.title)
-        results['suggested_tags'] = suggested_tags
-        
-        # Summary generation
-        summary = generate_document_summary(text_content)
-        results['summary'] = summary
-        
-        # Readability analysis
-        readability = processor.calculate_readability(text_content)
-        results['readability'] = readability
-        
-        # Update document with AI results
-        document.ai_confidence_score = classification.get('confidence', 0.0)
-        document.ai_suggested_tags = suggested_tags
-        document.ai_extracted_keywords = keywords
-        
-        # Auto-suggest document type if confidence is high
-        if classification.get('confidence', 0) > 0.7:
-            document.document_type = classification['category']
-        
-        document.save()
+        # extract -> clean -> chunk -> embed -> classify -> index;
+        # an unchanged document is skipped by its content hash
+        report = IngestionPipeline().run([document])
+        if document.id in report['documents']:
+            results = report['documents'][document.id]
+        else:
+            results = {'skipped': 'unchanged'}
+        results['stages'] = report['stages']
         
         # Update job status
         job.status = 'completed'
@@ -509,18 +478,34 @@ def process_document_with_ai(document_id: int, assistant_id: Optional[int] = Non
 
 
 @shared_task
-def batch_process_documents(document_ids: List[int]):
-    """Batch process multiple documents"""
-    results = []
-    for doc_id in document_ids:
-        try:
-            result = process_document_with_ai.delay(doc_id)
-            results.append({'document_id': doc_id, 'job_id': str(result.id)})
-        except Exception as e:
-            logger.error(f"Error starting processing for document {doc_id}: {str(e)}")
-            results.append({'document_id': doc_id, 'error': str(e)})
+def batch_process_documents(document_ids: List[int], assistant_id: Optional[int] = None):
+    """Batch process multiple documents through one ingestion pipeline"""
+    from .ingestion import ingest_documents
+    from .models import AIProcessingJob
+    
+    started_at = timezone.now()
+    report = ingest_documents(document_ids)
+    
+    # one job record per processed document, as process_document_with_ai does
+    AIProcessingJob.objects.bulk_create([
+        AIProcessingJob(
+            job_type='classify_document',
+            document_id=doc_id,
+            assistant_id=assistant_id or 1,
+            status='completed',
+            output_data=results,
+            started_at=started_at,
+            completed_at=timezone.now(),
+        )
+        for doc_id, results in report['documents'].items()
+    ])
     
-    return results
+    logger.info(f"Batch processed {len(report['documents'])} of {len(document_ids)} documents: {report['stages']}")
+    return {
+        'processed': list(report['documents']),
+        'skipped': [doc_id for doc_id in document_ids if doc_id not in report['documents']],
+        'stages': report['stages'],
+    }
 
 
 @shared_task
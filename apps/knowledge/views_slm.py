@@ -6,7 +6,6 @@ from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.db import transaction
 import logging
-import time
 from typing import Dict, Any
 
 from .models import ChatbotConversation, ChatbotMessage
@@ -66,21 +65,14 @@ def slm_chat_query(request):
             message_type='text'
         )
         
-        # Retrieve relevant documents
-        start_time = time.time()
-        relevant_docs = chatbot_slm_service.retrieve_relevant_documents(
+        # Answer from the semantic cache or retrieve documents and generate
+        response_data = chatbot_slm_service.answer_query(
             query=query,
             user=request.user,
+            conversation=conversation,
             max_results=5
         )
-        retrieval_time = time.time() - start_time
-        
-        # Generate AI response
-        response_data = chatbot_slm_service.generate_response(
-            query=query,
-            relevant_docs=relevant_docs,
-            conversation=conversation
-        )
+        retrieval_time = response_data.get('retrieval_time', 0.0)
         
         if response_data['success']:
             # Add AI response message
@@ -115,6 +107,7 @@ def slm_chat_query(request):
                 'model_used': response_data.get('model_used', 'unknown'),
                 'approach': response_data.get('approach', 'slm'),
                 'context_used': response_data.get('context_used', 0),
+                'cache_hit': response_data.get('cache_hit', False),
                 'referenced_documents': referenced_docs,
                 'message_id': str(ai_message.id),
                 'timestamp': ai_message.created_at.isoformat()
@@ -282,7 +275,11 @@ def slm_service_status(request):
                 'max_context_length': chatbot_slm_service.max_context_length,
                 'similarity_threshold': chatbot_slm_service.similarity_threshold,
                 'slm_config': chatbot_slm_service.slm_config
-            }
+            },
+            'answer_cache': (
+                chatbot_slm_service.answer_cache.stats()
+                if chatbot_slm_service.answer_cache else None
+            )
         }
         
         # Test SLM service
@@ -15,7 +15,7 @@ from django.apps import apps
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.db import transaction
-from django.db.models import ProtectedError, Q
+from django.db.models import ProtectedError, Q, Sum
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
@@ -25,6 +25,7 @@ from django.utils.translation import gettext_lazy as _
 from django.views.decorators.http import require_http_methods
 from xhtml2pdf import pisa
 
+from base.dashboard_rollups import LEAVE_DAYS, rollup_queryset
 from base.filters import PenaltyFilter
 from base.forms import PenaltyAccountForm
 from base.methods import (
@@ -2897,53 +2898,37 @@ def employee_leave_chart(request):
         day = request.GET.get("date")
         day = datetime.strptime(day, "%Y-%m")
 
-    leave_requests = LeaveRequest.objects.filter(
-        employee_id__is_active=True, status="approved"
-    )
-    leave_requests = leave_requests.filter(
-        start_date__month=day.month, start_date__year=day.year
-    )
-
-    leave_types = leave_requests.values_list("leave_type_id__name", flat=True)
-
-    labels = []
-    dataset = []
-    for employee in leave_requests.filter(
-        start_date__month=day.month, start_date__year=day.year
-    ):
-        labels.append(employee.employee_id)
-
-    for leave_type in list(set(leave_types)):
-        dataset.append(
-            {
-                "label": leave_type,
-                "data": [],
-            }
+    rows = (
+        rollup_queryset(request, LEAVE_DAYS, day)
+        .filter(employee_id__is_active=True)
+        .values(
+            "employee_id",
+            "employee_id__employee_first_name",
+            "employee_id__employee_last_name",
+            "key",
         )
+        .annotate(days=Sum("value"))
+        .order_by("employee_id")
+    )
 
-    labels = list(set(labels))
-    total_leave_with_type = defaultdict(lambda: defaultdict(float))
-
-    for label in labels:
-        leaves = leave_requests.filter(
-            employee_id=label, start_date__month=day.month, start_date__year=day.year
+    employees = {}
+    total_leave_with_type = defaultdict(dict)
+    for row in rows:
+        employees[row["employee_id"]] = (
+            f"{row['employee_id__employee_first_name']} "
+            f"{row['employee_id__employee_last_name']}"
         )
-        for leave in leaves:
-            total_leave_with_type[leave.leave_type_id.name][label] += round(
-                leave.requested_days, 2
-            )
-
-    for data in dataset:
-        dataset_label = data["label"]
-        data["data"] = [total_leave_with_type[dataset_label][label] for label in labels]
+        total_leave_with_type[row["key"]][row["employee_id"]] = round(row["days"], 2)
 
-    employee_label = []
-    for employee in list(set(labels)):
-        employee_label.append(
-            f"{employee.employee_first_name} {employee.employee_last_name}"
-        )
+    dataset = [
+        {
+            "label": leave_type,
+            "data": [leave_days.get(employee_id, 0.0) for employee_id in employees],
+        }
+        for leave_type, leave_days in total_leave_with_type.items()
+    ]
     response = {
-        "labels": employee_label,
+        "labels": list(employees.values()),
         "dataset": dataset,
         "message": _("No leave request this month"),
     }
@@ -2966,27 +2951,16 @@ def department_leave_chart(request):
         day = request.GET.get("date")
         day = datetime.strptime(day, "%Y-%m")
 
-    departments = Department.objects.all()
-    department_counts = {dep.department: 0 for dep in departments}
-    leave_request = LeaveRequest.objects.filter(status="approved")
-    leave_request = leave_request.filter(
-        start_date__month=day.month, start_date__year=day.year
+    rows = (
+        rollup_queryset(request, LEAVE_DAYS, day)
+        .filter(department_id__isnull=False)
+        .values("department_id", "department_id__department")
+        .annotate(days=Sum("value"))
+        .filter(days__gt=0)
+        .order_by("department_id")
     )
-    leave_dates = []
-    labels = []
-    for leave in leave_request:
-        for leave_date in leave.requested_dates():
-            leave_dates.append(leave_date.strftime("%Y-%m-%d"))
-
-        for dep in departments:
-            if dep == leave.employee_id.employee_work_info.department_id:
-                department_counts[dep.department] += leave.requested_days
-
-    for department, count in department_counts.items():
-        if count != 0:
-            labels.append(department)
-    values = list(department_counts.values())
-    values = [value for value in values if value != 0]
+    labels = [row["department_id__department"] for row in rows]
+    values = [row["days"] for row in rows]
     dataset = [
         {
             "label": _(""),
@@ -3017,24 +2991,15 @@ def leave_type_chart(request):
         day = request.GET.get("date")
         day = datetime.strptime(day, "%Y-%m")
 
-    leave_types = LeaveType.objects.all()
-    leave_type_count = {types.name: 0 for types in leave_types}
-    leave_request = LeaveRequest.objects.filter(status="approved")
-    leave_request = leave_request.filter(
-        start_date__month=day.month, start_date__year=day.year
+    rows = (
+        rollup_queryset(request, LEAVE_DAYS, day)
+        .values("key")
+        .annotate(days=Sum("value"))
+        .filter(days__gt=0)
+        .order_by("key")
     )
-    for leave in leave_request:
-        for lev in leave_types:
-            if lev == leave.leave_type_id:
-                leave_type_count[lev.name] += leave.requested_days
-
-    # labels = [leave_type.name for leave_type in leave_types]
-    labels = []
-    for leave_type, count in leave_type_count.items():
-        if count != 0:
-            labels.append(leave_type)
-    values = list(leave_type_count.values())
-    values = [value for value in values if value != 0]
+    labels = [row["key"] for row in rows]
+    values = [row["days"] for row in rows]
 
     response = {
         "labels": labels,
@@ -441,6 +441,15 @@ def metrics_view(request):
     else:
         metrics.append('application_health_status 0')
     
+    # Application metrics, including the per URL request profiles
+    try:
+        from ai_services.metrics import metrics_collector
+        app_metrics = metrics_collector.get_prometheus_metrics()
+        if app_metrics:
+            metrics.append(app_metrics)
+    except Exception:
+        pass
+    
     metrics_text = '\n'.join(metrics) + '\n'
     from django.http import HttpResponse
     return HttpResponse(metrics_text, content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -13,7 +13,7 @@ from urllib.parse import parse_qs
 import pandas as pd
 import pdfkit
 from django.contrib import messages
-from django.db.models import ProtectedError, Q
+from django.db.models import ProtectedError, Q, Sum
 from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
@@ -21,6 +21,7 @@ from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from base.dashboard_rollups import PAYSLIP_NET_PAY, rollup_queryset
 from base.methods import (
     closest_numbers,
     eval_validate,
@@ -737,12 +738,17 @@ def dashboard_employee_chart(request):
 
     is_ajax = request.headers.get("X-Requested-With") == "XMLHttpRequest"
     if is_ajax and request.method == "GET":
-        employee_list = Payslip.objects.filter(
-            Q(start_date__month=month) & Q(start_date__year=year)
+        rows = (
+            rollup_queryset(request, PAYSLIP_NET_PAY, datetime(int(year), int(month), 1))
+            .values(
+                "employee_id",
+                "employee_id__employee_first_name",
+                "employee_id__employee_last_name",
+                "key",
+            )
+            .annotate(net_pay=Sum("value"))
+            .order_by("employee_id")
         )
-        labels = []
-        for employee in employee_list:
-            labels.append(employee.employee_id)
 
         colors = [
             "rgba(255, 99, 132, 1)",  # Red
@@ -760,29 +766,25 @@ def dashboard_employee_chart(request):
                 }
             )
 
-        employees = [employee.employee_id for employee in employee_list]
-
-        employees = list(set(employees))
+        employees = {}
         total_pay_with_status = defaultdict(lambda: defaultdict(float))
-
-        for label in employees:
-            payslips = employee_list.filter(employee_id=label)
-            for payslip in payslips:
-                total_pay_with_status[payslip.status][label] += round(
-                    payslip.net_pay, 2
-                )
+        for row in rows:
+            employees[row["employee_id"]] = (
+                f"{row['employee_id__employee_first_name']} "
+                f"{row['employee_id__employee_last_name']}"
+            )
+            total_pay_with_status[row["key"]][row["employee_id"]] = round(
+                row["net_pay"], 2
+            )
 
         for data in dataset:
             dataset_label = data["label"]
             data["data"] = [
-                total_pay_with_status[dataset_label][label] for label in employees
+                total_pay_with_status[dataset_label][employee_id]
+                for employee_id in employees
             ]
 
-        employee_label = []
-        for employee in employees:
-            employee_label.append(
-                f"{employee.employee_first_name} {employee.employee_last_name}"
-            )
+        employee_label = list(employees.values())
 
         for value, choice in zip(dataset, Payslip.status_choices):
             if value["label"] == choice[0]:
@@ -810,17 +812,13 @@ def payslip_details(request):
     date = request.GET.get("period")
     year = date.split("-")[0]
     month = date.split("-")[1]
-    employee_list = []
-    employee_list = Payslip.objects.filter(
-        Q(start_date__month=month) & Q(start_date__year=year)
-    )
-    total_amount = 0
-    for employee in employee_list:
-        total_amount += employee.net_pay
+    totals = rollup_queryset(
+        request, PAYSLIP_NET_PAY, datetime(int(year), int(month), 1)
+    ).aggregate(no_of_emp=Sum("count"), total_amount=Sum("value"))
 
     response = {
-        "no_of_emp": len(employee_list),
-        "total_amount": round(total_amount, 2),
+        "no_of_emp": totals["no_of_emp"] or 0,
+        "total_amount": round(totals["total_amount"] or 0, 2),
     }
     return JsonResponse(response)
 
@@ -846,28 +844,22 @@ def dashboard_department_chart(request):
 
     is_ajax = request.headers.get("X-Requested-With") == "XMLHttpRequest"
     if is_ajax and request.method == "GET":
-        employee_list = Payslip.objects.filter(
-            Q(start_date__month=month) & Q(start_date__year=year)
+        rows = (
+            rollup_queryset(request, PAYSLIP_NET_PAY, datetime(int(year), int(month), 1))
+            .filter(department_id__isnull=False)
+            .values("department_id", "department_id__department")
+            .annotate(amount=Sum("value"))
+            .order_by("department_id")
         )
-
-        for employee in employee_list:
-            department.append(
-                employee.employee_id.employee_work_info.department_id.department
-            )
-
-        department = list(set(department))
-        for depart in department:
-            department_total.append({"department": depart, "amount": 0})
-
-        for employee in employee_list:
-            employee_department = (
-                employee.employee_id.employee_work_info.department_id.department
+        for row in rows:
+            department.append(row["department_id__department"])
+            department_total.append(
+                {
+                    "department": row["department_id__department"],
+                    "amount": round(row["amount"], 2),
+                }
             )
 
-            for depart in department_total:
-                if depart["department"] == employee_department:
-                    depart["amount"] += round(employee.net_pay, 2)
-
         colors = generate_colors(len(department))
 
         dataset = [
@@ -0,0 +1,84 @@
+"""
+Shared embedding space for the candidate vector store.
+
+Resumes and job descriptions must be embedded by the same model to be
+comparable, so every caller goes through ``get_resume_embedder()`` which
+builds the embedder once per worker process.
+"""
+
+import logging
+import threading
+from typing import List
+
+from django.conf import settings
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIMENSION = 384
+
+
+class ResumeEmbedder:
+    """Embeds texts into the fixed vector space used by the resume collection"""
+
+    def __init__(self, model_name: str = None, dimension: int = EMBEDDING_DIMENSION):
+        self.dimension = dimension
+        self.model = None
+        self.vectorizer = None
+        model_name = model_name or getattr(settings, 'RECRUITMENT_EMBEDDING_MODEL', None)
+
+        if model_name and SentenceTransformer is not None:
+            try:
+                self.model = SentenceTransformer(model_name)
+                self.dimension = self.model.get_sentence_embedding_dimension()
+                self.name = f"st:{model_name}"
+                logger.info(f"Resume embedder loaded sentence-transformer {model_name}")
+                return
+            except Exception as e:
+                logger.warning(f"Failed to load embedding model {model_name}, using hashing: {e}")
+
+        # Hashing needs no fitting, so every process maps a text to the same
+        # vector without persisting a vocabulary
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        self.vectorizer = HashingVectorizer(
+            n_features=dimension,
+            ngram_range=(1, 2),
+            alternate_sign=False,
+            norm='l2',
+            stop_words='english',
+        )
+        self.name = f"hashing:{dimension}"
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts; each vector is L2-normalised"""
+        if not texts:
+            return []
+        texts = [text or "" for text in texts]
+        if self.model is not None:
+            vectors = self.model.encode(
+                texts, batch_size=32, normalize_embeddings=True, show_progress_bar=False
+            )
+            return vectors.tolist()
+        return self.vectorizer.transform(texts).toarray().tolist()
+
+    def embed_one(self, text: str) -> List[float]:
+        return self.embed([text])[0]
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_resume_embedder() -> ResumeEmbedder:
+    """Return the process-wide resume embedder, building it on first use"""
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = ResumeEmbedder()
+    return _embedder
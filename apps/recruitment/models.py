@@ -1006,6 +1006,11 @@ class Resume(models.Model):
         Recruitment, on_delete=models.CASCADE, related_name="resume"
     )
     is_candidate = models.BooleanField(default=False)
+    # extracted once on upload, see recruitment/resume_index.py
+    text = models.TextField(blank=True, default="", editable=False)
+    tokens = models.JSONField(default=list, blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    extracted_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.recruitment_id} - Resume {self.pk}"
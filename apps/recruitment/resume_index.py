@@ -0,0 +1,207 @@
+"""
+resume_index.py
+
+This module is used to extract resume text once and rank resumes by their
+matching skills in memory.
+
+The extraction helpers at the top of the module do not touch Django so they
+can run inside a process pool.
+"""
+
+import logging
+import multiprocessing
+import re
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"\b\w+\b")
+
+
+def tokenize(text):
+    """
+    This method is used to lower-case and split a text into words
+    """
+    return WORD_PATTERN.findall(text.lower())
+
+
+def extract_resume_text(path):
+    """
+    This method is used to extract the text of a resume pdf.
+    Args:
+        path: file system path of the pdf
+
+    Returns the page texts joined by new lines, or an empty string for
+    image only or unreadable pdfs.
+    """
+    import fitz  # type: ignore
+
+    try:
+        pdf_document = fitz.open(path)
+    except Exception as e:
+        logger.error(f"Unable to open resume {path}: {e}")
+        return ""
+    try:
+        return "\n".join(
+            pdf_document.load_page(page_num).get_text()
+            for page_num in range(len(pdf_document))
+        )
+    finally:
+        pdf_document.close()
+
+
+def _extract(item):
+    resume_id, path = item
+    text = extract_resume_text(path)
+    words = tokenize(text)
+    return resume_id, text, sorted(set(words)), len(words)
+
+
+def extract_many(items, workers=None):
+    """
+    This method is used to extract a list of ``(resume_id, path)`` pairs,
+    spreading the files across a process pool when there is more than one.
+
+    Returns ``(resume_id, text, tokens, word_count)`` tuples.
+    """
+    items = list(items)
+    if workers is None:
+        workers = min(len(items), multiprocessing.cpu_count(), 8)
+    if workers <= 1 or len(items) <= 1:
+        return [_extract(item) for item in items]
+    # spawn keeps the children independent of the web worker's threads
+    # and open database connections
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        return list(executor.map(_extract, items, chunksize=4))
+
+
+def index_resumes(resumes, workers=None):
+    """
+    This method is used to extract and store the text and token set of the
+    given resumes with a single ``bulk_update``.
+    Args:
+        resumes: iterable of Resume instances
+    """
+    from django.utils import timezone
+
+    from recruitment.models import Resume
+
+    resumes = {resume.pk: resume for resume in resumes if resume.file}
+    if not resumes:
+        return []
+    items = []
+    for resume in resumes.values():
+        try:
+            items.append((resume.pk, resume.file.path))
+        except Exception as e:
+            logger.error(f"Resume {resume.pk} has no local file: {e}")
+    now = timezone.now()
+    for resume_id, text, tokens, word_count in extract_many(items, workers):
+        resume = resumes[resume_id]
+        resume.text = text
+        resume.tokens = tokens
+        resume.word_count = word_count
+        resume.extracted_at = now
+    indexed = [resume for resume in resumes.values() if resume.extracted_at]
+    Resume.objects.bulk_update(
+        indexed, ["text", "tokens", "word_count", "extracted_at"], batch_size=200
+    )
+    return indexed
+
+
+def index_resumes_in_background(resume_ids):
+    """
+    This method is used to extract the given resumes in a background thread
+    """
+    from django.db import close_old_connections
+
+    from recruitment.models import Resume
+
+    def _index():
+        try:
+            index_resumes(Resume.objects.filter(id__in=resume_ids))
+        except Exception as e:
+            logger.error(f"Resume extraction failed: {e}")
+        finally:
+            close_old_connections()
+
+    thread = threading.Thread(target=_index, daemon=True)
+    thread.start()
+    return thread
+
+
+class ResumeSkillIndex:
+    """
+    Inverted index from resume tokens to resume ids used to count the
+    matching skills of every resume of a recruitment in memory.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.texts = {}
+        self.word_counts = {}
+
+    def add(self, resume_id, tokens, word_count=None, text=""):
+        """
+        This method is used to add a resume's token set to the index
+        """
+        for token in tokens:
+            self.postings[token].add(resume_id)
+        self.word_counts[resume_id] = (
+            len(tokens) if word_count is None else word_count
+        )
+        self.texts[resume_id] = text
+
+    def matching_ids(self, skill):
+        """
+        This method is used to return the ids of the resumes containing a
+        skill; multi word skills (or skills like "c++") must appear
+        verbatim in the resume text.
+        """
+        skill = skill.lower().strip()
+        words = tokenize(skill)
+        if not words:
+            return set()
+        ids = set(self.postings.get(words[0], ()))
+        for word in words[1:]:
+            ids &= self.postings.get(word, set())
+            if not ids:
+                return ids
+        if [skill] != words:
+            phrase = re.compile(
+                r"(?<!\w)" + r"\s+".join(map(re.escape, skill.split())) + r"(?!\w)"
+            )
+            ids = {
+                resume_id
+                for resume_id in ids
+                if phrase.search(self.texts.get(resume_id, "").lower())
+            }
+        return ids
+
+    def match_counts(self, skills):
+        """
+        This method is used to return a Counter of matching skills per resume
+        """
+        counts = Counter({resume_id: 0 for resume_id in self.word_counts})
+        for skill in set(skill.lower() for skill in skills):
+            for resume_id in self.matching_ids(skill):
+                counts[resume_id] += 1
+        return counts
+
+    @classmethod
+    def for_resumes(cls, resumes):
+        """
+        This method is used to build the index from a Resume queryset,
+        extracting any resume that has not been indexed yet.
+        """
+        resumes = list(resumes)
+        pending = [resume for resume in resumes if resume.extracted_at is None]
+        if pending:
+            index_resumes(pending)
+        index = cls()
+        for resume in resumes:
+            index.add(resume.pk, resume.tokens or [], resume.word_count, resume.text)
+        return index, resumes
@@ -3,6 +3,7 @@ import json
 import requests
 import logging
 from datetime import datetime
+from asgiref.sync import async_to_sync, sync_to_async
 from django.conf import settings
 from django.core.cache import cache
 from django.utils import timezone
@@ -11,6 +12,7 @@ import chromadb
 from chromadb.config import Settings as ChromaSettings
 
 from knowledge.utils import OllamaIntegration, DocumentProcessor
+from .embeddings import get_resume_embedder
 from .models import Candidate, Recruitment, Stage
 from indonesian_nlp.client import IndonesianNLPClient
 
@@ -97,6 +99,8 @@ class RecruitmentRAGService:
         self.n8n_client = N8NClient()
         self.nlp_client = IndonesianNLPClient()
         self.doc_processor = DocumentProcessor()
+        self.embedder = get_resume_embedder()
+        self._pending_embeddings = []
         
         # Initialize collections
         self.resume_collection = self._get_or_create_collection('resumes')
@@ -112,10 +116,16 @@ class RecruitmentRAGService:
                 metadata={"hnsw:space": "cosine"}
             )
     
-    async def analyze_resume(self, candidate_id: int, job_description: str = None) -> Dict[str, Any]:
-        """Analyze candidate resume against job requirements"""
+    async def analyze_resume(self, candidate_id: int, job_description: str = None,
+                             store_embedding: bool = True) -> Dict[str, Any]:
+        """Analyze candidate resume against job requirements
+
+        With ``store_embedding=False`` the resume is queued instead of being
+        upserted, and ``flush_resume_embeddings`` writes the queue in one batch.
+        """
         try:
-            candidate = Candidate.objects.get(id=candidate_id)
+            # the ORM cannot be used from the event loop
+            candidate = await sync_to_async(Candidate.objects.get)(id=candidate_id)
             
             # Extract resume text
             if candidate.resume:
@@ -124,8 +134,8 @@ class RecruitmentRAGService:
                 resume_text = f"Name: {candidate.name}\nEmail: {candidate.email}\nMobile: {candidate.mobile}"
             
             # Get job description
-            if not job_description and candidate.recruitment_id:
-                job_description = candidate.recruitment_id.description or ""
+            if not job_description:
+                job_description = await sync_to_async(self._job_description)(candidate)
             
             # Perform NLP analysis
             sentiment_result = await self._analyze_sentiment(resume_text)
@@ -139,7 +149,10 @@ class RecruitmentRAGService:
             analysis = await self._generate_analysis(resume_text, job_description, candidate)
             
             # Store in vector database
-            await self._store_resume_embedding(candidate_id, resume_text)
+            if store_embedding:
+                await self._store_resume_embedding(candidate_id, resume_text)
+            else:
+                self._pending_embeddings.append((candidate_id, resume_text))
             
             result = {
                 'candidate_id': candidate_id,
@@ -164,6 +177,13 @@ class RecruitmentRAGService:
                 'message': str(e)
             }
     
+    @staticmethod
+    def _job_description(candidate) -> str:
+        """Description of the recruitment the candidate applied to"""
+        if candidate.recruitment_id:
+            return candidate.recruitment_id.description or ""
+        return ""
+    
     async def _analyze_sentiment(self, text: str) -> Dict[str, Any]:
         """Analyze text sentiment using Indonesian NLP"""
         try:
@@ -240,43 +260,44 @@ class RecruitmentRAGService:
     
     async def _store_resume_embedding(self, candidate_id: int, resume_text: str):
         """Store resume embedding in vector database"""
+        self.store_resume_embeddings([(candidate_id, resume_text)])
+
+    def store_resume_embeddings(self, items: List[tuple]) -> int:
+        """Embed and upsert ``(candidate_id, resume_text)`` pairs in one batch"""
+        if not items:
+            return 0
         try:
-            # Generate embedding (simplified - in production use proper embedding model)
-            embedding = self._generate_simple_embedding(resume_text)
-            
+            candidate_ids = [candidate_id for candidate_id, _ in items]
+            texts = [resume_text for _, resume_text in items]
+            created_at = timezone.now().isoformat()
+
             self.resume_collection.upsert(
-                ids=[str(candidate_id)],
-                documents=[resume_text[:1000]],  # Limit document size
-                embeddings=[embedding],
+                ids=[str(candidate_id) for candidate_id in candidate_ids],
+                documents=[text[:1000] for text in texts],  # Limit document size
+                embeddings=self.embedder.embed(texts),
                 metadatas=[{
                     'candidate_id': candidate_id,
-                    'created_at': timezone.now().isoformat()
-                }]
+                    'embedding_model': self.embedder.name,
+                    'created_at': created_at
+                } for candidate_id in candidate_ids]
             )
+            return len(items)
         except Exception as e:
-            logger.warning(f"Failed to store resume embedding: {str(e)}")
-    
+            logger.warning(f"Failed to store resume embeddings: {str(e)}")
+            return 0
+
+    def flush_resume_embeddings(self) -> int:
+        """Upsert every resume queued by ``analyze_resume(store_embedding=False)``"""
+        pending, self._pending_embeddings = self._pending_embeddings, []
+        return self.store_resume_embeddings(pending)
+
     def _generate_simple_embedding(self, text: str) -> List[float]:
-        """Generate simple embedding (placeholder for proper embedding model)"""
-        # This is a simplified embedding - in production use proper models
-        from sklearn.feature_extraction.text import TfidfVectorizer
-        import numpy as np
-        
+        """Embed a text in the shared resume/job description space"""
         try:
-            vectorizer = TfidfVectorizer(max_features=384, stop_words='english')
-            tfidf_matrix = vectorizer.fit_transform([text])
-            embedding = tfidf_matrix.toarray()[0].tolist()
-            
-            # Pad or truncate to fixed size
-            if len(embedding) < 384:
-                embedding.extend([0.0] * (384 - len(embedding)))
-            else:
-                embedding = embedding[:384]
-                
-            return embedding
+            return self.embedder.embed_one(text)
         except Exception:
             # Return zero vector as fallback
-            return [0.0] * 384
+            return [0.0] * self.embedder.dimension
     
     def _get_recommendation(self, similarity_score: float, sentiment_result: Dict) -> str:
         """Get hiring recommendation based on analysis"""
@@ -350,28 +371,35 @@ class RecruitmentRAGService:
             # Generate job description embedding
             job_embedding = self._generate_simple_embedding(job_description)
             
-            # Query similar resumes
+            # Query similar resumes embedded by the same model
             results = self.resume_collection.query(
                 query_embeddings=[job_embedding],
-                n_results=limit
+                n_results=limit,
+                where={'embedding_model': self.embedder.name}
+            )
+            
+            ids = results['ids'][0]
+            candidates = Candidate.objects.select_related('stage_id').in_bulk(
+                [int(candidate_id) for candidate_id in ids]
             )
             
             similar_candidates = []
-            for i, candidate_id in enumerate(results['ids'][0]):
-                try:
-                    candidate = Candidate.objects.get(id=int(candidate_id))
-                    similar_candidates.append({
-                        'candidate': {
-                            'id': candidate.id,
-                            'name': candidate.name,
-                            'email': candidate.email,
-                            'stage': candidate.stage_id.stage if candidate.stage_id else None
-                        },
-                        'similarity_score': results['distances'][0][i] if results['distances'] else 0.0,
-                        'document': results['documents'][0][i] if results['documents'] else ""
-                    })
-                except Candidate.DoesNotExist:
+            for i, candidate_id in enumerate(ids):
+                candidate = candidates.get(int(candidate_id))
+                if candidate is None:
                     continue
+                # the collection uses cosine distance
+                distance = results['distances'][0][i] if results['distances'] else 1.0
+                similar_candidates.append({
+                    'candidate': {
+                        'id': candidate.id,
+                        'name': candidate.name,
+                        'email': candidate.email,
+                        'stage': candidate.stage_id.stage if candidate.stage_id else None
+                    },
+                    'similarity_score': 1.0 - distance,
+                    'document': results['documents'][0][i] if results['documents'] else ""
+                })
             
             return similar_candidates
             
@@ -410,14 +438,17 @@ def trigger_recruitment_workflow_task(candidate_id: int, workflow_type: str):
 
 
 @shared_task
-def batch_analyze_candidates(candidate_ids: List[int]):
+def batch_analyze_candidates(candidate_ids: List[int], job_description: str = ""):
     """Batch process multiple candidates"""
     results = []
     rag_service = RecruitmentRAGService()
     
     for candidate_id in candidate_ids:
         try:
-            result = rag_service.analyze_resume(candidate_id)
+            result = async_to_sync(rag_service.analyze_resume)(
+                candidate_id, job_description, store_embedding=False
+            )
+            result.setdefault('candidate_id', candidate_id)
             results.append(result)
         except Exception as e:
             logger.error(f"Error analyzing candidate {candidate_id}: {str(e)}")
@@ -427,4 +458,7 @@ def batch_analyze_candidates(candidate_ids: List[int]):
                 'message': str(e)
             })
     
-    return results
\ No newline at end of file
+    # One embedding batch and one upsert for the whole run
+    rag_service.flush_resume_embeddings()
+    
+    return results
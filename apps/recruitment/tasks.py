@@ -8,6 +8,7 @@ from typing import List, Dict, Any
 
 from .models import Candidate, Recruitment
 from .services import RecruitmentRAGService, N8NClient
+from .services import batch_analyze_candidates as batch_analyze_candidates_service
 
 logger = logging.getLogger(__name__)
 
@@ -125,47 +126,30 @@ def batch_analyze_candidates(self, candidate_ids: List[int], job_description: st
         results = []
         failed_candidates = []
         
-        # Initialize RAG service
-        rag_service = RecruitmentRAGService()
+        # Analyze inline through the batched service so all resume
+        # embeddings are written in a single upsert
+        analyses = batch_analyze_candidates_service(candidate_ids, job_description)
         
-        for candidate_id in candidate_ids:
-            try:
-                # Check if candidate exists
-                candidate = Candidate.objects.get(id=candidate_id)
-                
-                # Get job description if not provided
-                current_job_description = job_description
-                if not current_job_description and candidate.recruitment_id:
-                    current_job_description = candidate.recruitment_id.description or ""
-                
-                # Perform analysis
-                analysis_result = rag_service.analyze_resume(candidate_id, current_job_description)
-                
-                # Cache the result
-                cache_key = f"resume_analysis_{candidate_id}"
-                cache.set(cache_key, analysis_result, timeout=86400)
-                
-                results.append({
-                    'candidate_id': candidate_id,
-                    'status': 'success',
-                    'analysis': analysis_result
-                })
-                
-                logger.info(f"Analysis completed for candidate {candidate_id}")
-                
-            except Candidate.DoesNotExist:
-                logger.error(f"Candidate {candidate_id} not found")
-                failed_candidates.append({
-                    'candidate_id': candidate_id,
-                    'error': 'Candidate not found'
-                })
-                
-            except Exception as e:
-                logger.error(f"Error analyzing candidate {candidate_id}: {str(e)}")
+        for analysis_result in analyses:
+            candidate_id = analysis_result.get('candidate_id')
+            
+            if analysis_result.get('status') == 'error':
+                logger.error(f"Error analyzing candidate {candidate_id}: {analysis_result.get('message')}")
                 failed_candidates.append({
                     'candidate_id': candidate_id,
-                    'error': str(e)
+                    'error': analysis_result.get('message')
                 })
+                continue
+            
+            # Cache the result
+            cache_key = f"resume_analysis_{candidate_id}"
+            cache.set(cache_key, analysis_result, timeout=86400)
+            
+            results.append({
+                'candidate_id': candidate_id,
+                'status': 'success',
+                'analysis': analysis_result
+            })
         
         logger.info(f"Batch analysis completed. Success: {len(results)}, Failed: {len(failed_candidates)}")
         
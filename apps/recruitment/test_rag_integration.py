@@ -1,6 +1,6 @@
 import unittest
 import asyncio
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import AsyncMock, Mock, patch, MagicMock
 from django.test import TestCase, override_settings
 from django.core.cache import cache
 from django.contrib.auth.models import User
@@ -280,14 +280,10 @@ class RecruitmentRAGServiceTest(TestCase):
     @patch('recruitment.services.IndonesianNLPClient')
     @patch('recruitment.services.N8NClient')
     @patch('recruitment.services.RecruitmentRAGService._generate_simple_embedding')
-    @patch('recruitment.models.Candidate.objects.get')
-    def test_find_similar_candidates(self, mock_candidate_get, mock_embedding, mock_n8n, mock_nlp, mock_ollama, mock_chromadb):
+    def test_find_similar_candidates(self, mock_embedding, mock_n8n, mock_nlp, mock_ollama, mock_chromadb):
         """Test finding similar candidates"""
         mock_embedding.return_value = [0.1] * 384
         
-        # Mock candidate retrieval
-        mock_candidate_get.return_value = self.candidate
-        
         # Mock ChromaDB
         mock_client = Mock()
         mock_collection = Mock()
@@ -308,10 +304,30 @@ class RecruitmentRAGServiceTest(TestCase):
             limit=5
         )
         
-        # Verify results
+        # Verify results; candidates are hydrated with one in_bulk query
         self.assertEqual(len(results), 1)
         self.assertEqual(results[0]['candidate']['id'], self.candidate.id)
-        self.assertEqual(results[0]['similarity_score'], 0.2)
+        self.assertAlmostEqual(results[0]['similarity_score'], 0.8)
+        self.assertEqual(
+            mock_collection.query.call_args.kwargs['where'],
+            {'embedding_model': rag_service.embedder.name}
+        )
+    
+    def test_resume_embeddings_share_one_space(self):
+        """Resumes and job descriptions are embedded by the same model"""
+        from .embeddings import get_resume_embedder
+        
+        embedder = get_resume_embedder()
+        resume, job, unrelated = embedder.embed([
+            'Python developer with Django experience',
+            'Looking for a Python Django developer',
+            'Forklift operator for the night shift',
+        ])
+        
+        self.assertEqual(len(resume), embedder.dimension)
+        self.assertEqual(embedder.embed_one('Python developer with Django experience'), resume)
+        similarity = sum(a * b for a, b in zip(resume, job))
+        self.assertGreater(similarity, sum(a * b for a, b in zip(resume, unrelated)))
 
 
 class RAGAPITest(APITestCase):
@@ -568,6 +584,29 @@ class CeleryTaskTest(TestCase):
         self.assertEqual(result['candidate_id'], self.candidate.id)
         self.assertIn('analysis', result)
     
+    @patch('recruitment.services.chromadb')
+    @patch('recruitment.services.OllamaIntegration')
+    @patch('recruitment.services.IndonesianNLPClient')
+    @patch('recruitment.services.N8NClient')
+    def test_batch_analyze_candidates_upserts_once(self, mock_n8n, mock_nlp, mock_ollama, mock_chroma):
+        """Test batch analysis loads candidates from the database and upserts resumes in one batch"""
+        from recruitment.services import batch_analyze_candidates
+        
+        mock_ollama.return_value.is_available.return_value = False
+        mock_nlp.return_value.analyze_sentiment = AsyncMock(return_value={'label': 'POSITIVE', 'score': 0.8})
+        mock_nlp.return_value.extract_entities = AsyncMock(return_value=[])
+        collection = mock_chroma.Client.return_value.get_collection.return_value
+        missing_id = self.candidate.id + 1000
+        
+        results = batch_analyze_candidates([self.candidate.id, missing_id])
+        
+        self.assertEqual([result['candidate_id'] for result in results], [self.candidate.id, missing_id])
+        self.assertNotIn('status', results[0])
+        self.assertEqual(results[0]['sentiment']['label'], 'POSITIVE')
+        self.assertEqual(results[1]['status'], 'error')
+        collection.upsert.assert_called_once()
+        self.assertEqual(collection.upsert.call_args.kwargs['ids'], [str(self.candidate.id)])
+    
     @patch('recruitment.services.RecruitmentRAGService')
     def test_trigger_workflow_task(self, mock_rag_service):
         """Test workflow trigger Celery task logic"""
@@ -119,6 +119,12 @@ from recruitment.models import (
     StageFiles,
     StageNote,
 )
+from recruitment.resume_index import (
+    ResumeSkillIndex,
+    extract_resume_text,
+    index_resumes_in_background,
+    tokenize,
+)
 from recruitment.views.linkedin import delete_post, post_recruitment_in_linkedin
 from recruitment.views.paginator_qry import paginator_qry
 
@@ -3120,11 +3126,15 @@ def add_bulk_resumes(request):
     recruitment = Recruitment.objects.get(id=rec_id)
     if request.method == "POST":
         files = request.FILES.getlist("files")
+        resume_ids = []
         for file in files:
-            Resume.objects.create(
+            resume = Resume.objects.create(
                 file=file,
                 recruitment_id=recruitment,
             )
+            resume_ids.append(resume.pk)
+        if resume_ids:
+            transaction.on_commit(lambda: index_resumes_in_background(resume_ids))
 
         url = reverse("view-bulk-resume")
         query_params = f"?rec_id={rec_id}"
@@ -3156,21 +3166,7 @@ def extract_words_from_pdf(pdf_file):
         pdf_file: pdf file
 
     """
-    pdf_document = fitz.open(pdf_file.path)
-
-    words = []
-
-    for page_num in range(len(pdf_document)):
-        page = pdf_document.load_page(page_num)
-        page_text = page.get_text()
-
-        page_words = re.findall(r"\b\w+\b", page_text.lower())
-
-        words.extend(page_words)
-
-    pdf_document.close()
-
-    return words
+    return tokenize(extract_resume_text(pdf_file.path))
 
 
 @login_required
@@ -3186,26 +3182,23 @@ def matching_resumes(request, rec_id):
     """
     recruitment = Recruitment.objects.filter(id=rec_id).first()
     skills = recruitment.skills.values_list("title", flat=True)
-    resumes = recruitment.resume.all()
-    is_candidate = resumes.filter(is_candidate=True)
-    is_candidate_ids = set(is_candidate.values_list("id", flat=True))
+    index, resumes = ResumeSkillIndex.for_resumes(recruitment.resume.all())
+    match_counts = index.match_counts(skills)
 
     resume_ranks = []
     for resume in resumes:
-        words = extract_words_from_pdf(resume.file)
-        matching_skills_count = sum(skill.lower() in words for skill in skills)
-
-        item = {"resume": resume, "matching_skills_count": matching_skills_count}
-        if not len(words):
+        item = {
+            "resume": resume,
+            "matching_skills_count": match_counts[resume.pk],
+        }
+        if not resume.word_count:
             item["image_pdf"] = True
 
         resume_ranks.append(item)
 
-    candidate_resumes = [
-        rank for rank in resume_ranks if rank["resume"].id in is_candidate_ids
-    ]
+    candidate_resumes = [rank for rank in resume_ranks if rank["resume"].is_candidate]
     non_candidate_resumes = [
-        rank for rank in resume_ranks if rank["resume"].id not in is_candidate_ids
+        rank for rank in resume_ranks if not rank["resume"].is_candidate
     ]
 
     non_candidate_resumes = sorted(